@@ -3,6 +3,7 @@ from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager
+from werkzeug.middleware.proxy_fix import ProxyFix
 from .config import Config
 
 db = SQLAlchemy()
@@ -10,13 +11,21 @@ migrate = Migrate()
 jwt = JWTManager()
 
 
-def create_app():
+def create_app(test_config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if test_config:
+        app.config.update(test_config)
 
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # Behind reverse proxies request.remote_addr (the login throttle's key)
+    # is the last proxy; take the client from the headers they set
+    proxies = app.config.get('TRUSTED_PROXIES', 0)
+    if proxies:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
     # CORS configuration for local development
     # Allow the Nuxt.js frontend (localhost:3000) and common local origins.
     # In production, restrict origins to the real frontend domain.
@@ -53,8 +62,55 @@ def create_app():
 
     jwt.init_app(app)
 
+    from .services.hashing import init_hashing
+    init_hashing(app)
+
+    from .services.throttle import init_login_guard
+    init_login_guard(app)
+
+    from .services.response_cache import init_response_cache
+    init_response_cache(app)
+
+    from .services.user_store import init_user_files
+    init_user_files(app)
+
+    from .services.matching import init_trip_matcher
+    init_trip_matcher(app)
+
+    from .services.geocoding import init_geocoder
+    init_geocoder(app)
+
+    from .services.pricing import init_pricing
+    init_pricing(app)
+
+    from .services.tokens import init_token_store
+    init_token_store(app)
+
     from .routes import blueprints
     for bp in blueprints:
         app.register_blueprint(bp)
 
+    from .commands import commands
+    for command in commands:
+        app.cli.add_command(command)
+
+    if app.config['USER_STORE_BACKEND'] == 'dual' and app.config['USER_BACKFILL_IN_BACKGROUND']:
+        from .services.migration import BackfillWorker, migration_files
+        with app.app_context():
+            files = migration_files()
+        app.extensions['user_backfill'] = BackfillWorker(
+            app, files, app.config['USER_BACKFILL_CHECKPOINT'], app.config['USER_BACKFILL_BATCH_SIZE']
+        )
+        app.extensions['user_backfill'].start()
+
+    if (app.config['USER_STORE_BACKEND'] != 'sql' and app.config['USER_COMPACT_INTERVAL'] > 0
+            and not app.config.get('TESTING')):
+        from .services.compaction import Compactor
+        compactor = app.extensions['user_compactor'] = Compactor(
+            app, app.config['USER_COMPACT_INTERVAL'], app.config['USER_COMPACT_MIN_GARBAGE']
+        )
+        # Started by the first request served: CLI commands such as
+        # `flask db upgrade` never get a compaction thread
+        app.before_request(compactor.start_once)
+
     return app
\ No newline at end of file
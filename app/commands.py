@@ -0,0 +1,195 @@
+"""
+Flask CLI commands (``flask --app app <command>``).
+"""
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .services.user_store import school_file
+
+
+@click.command('import-json')
+@click.option('--batch-size', default=500, show_default=True, help='Rows per INSERT.')
+@with_appcontext
+def import_json_command(batch_size):
+    """Load drivers.json, passengers.json and schools.json into the database."""
+    from .services.migration import migration_files
+    from .services.sql_store import import_json_files
+
+    testing = bool(current_app.config.get('TESTING'))
+    files = migration_files()
+    result = import_json_files(
+        files['driver'], files['passenger'], school_file(testing), batch_size=batch_size
+    )
+    for table, (imported, skipped) in result.items():
+        click.echo(f'{table}: {imported} imported, {skipped} skipped')
+
+
+@click.command('backfill')
+@click.option('--batch-size', type=int, default=None, help='Lines per transaction.')
+@with_appcontext
+def backfill_command(batch_size):
+    """Copy JSON users into the database, resuming from the last checkpoint."""
+    from .services.migration import backfill, migration_files
+
+    result = backfill(
+        migration_files(),
+        current_app.config['USER_BACKFILL_CHECKPOINT'],
+        batch_size or current_app.config['USER_BACKFILL_BATCH_SIZE'],
+    )
+    for role, (copied, skipped) in result.items():
+        click.echo(f'{role}: {copied} copied, {skipped} skipped')
+
+
+@click.command('check-parity')
+@with_appcontext
+def check_parity_command():
+    """Compare JSON users with the database (counts and per-record hashes)."""
+    from .services.migration import check_parity, migration_files, parity_ok
+
+    report = check_parity(migration_files())
+    for role, r in report.items():
+        click.echo(f"{role}: {r['jsonl_count']} in JSON, {r['db_count']} in database")
+        for kind in ('missing', 'extra', 'mismatched'):
+            if r[kind]:
+                click.echo(f"  {kind}: {', '.join(r[kind])}")
+    if not parity_ok(report):
+        raise click.ClickException('JSON files and database differ')
+    click.echo('parity ok')
+
+
+@click.command('calibrate-hash')
+@click.option('--target-ms', default=100.0, show_default=True, help='Acceptable time per hash.')
+@click.option('--max-log2-n', default=17, show_default=True, help='Largest scrypt N to try (as a power of 2).')
+@click.option('--samples', default=3, show_default=True)
+def calibrate_hash_command(target_ms, max_log2_n, samples):
+    """Measure scrypt on this host and recommend PASSWORD_HASH_METHOD."""
+    from .services.hashing import calibrate
+
+    timings, recommended = calibrate(target_ms, max_log2_n=max_log2_n, samples=samples)
+    for method, ms in timings:
+        click.echo(f'{method:24} {ms:8.1f} ms')
+    click.echo(f'PASSWORD_HASH_METHOD={recommended}')
+
+
+@click.command('compact')
+@click.option('--min-garbage', default=0.0, show_default=True,
+              help='Skip files with a smaller share of superseded or deleted lines.')
+@with_appcontext
+def compact_command(min_garbage):
+    """Rewrite the JSON-Lines files down to their live records."""
+    from .services.compaction import compact_all
+
+    for path, result in compact_all(current_app, min_garbage).items():
+        if result is None:
+            click.echo(f'{path}: nothing to compact')
+        else:
+            click.echo(f'{path}: {result[0]} -> {result[1]} bytes')
+
+
+@click.command('reshard')
+@click.option('--shards', type=int, required=True, help='New number of user shards.')
+@click.option('--from', 'old_shards', type=int, default=None,
+              help='Current number of shards (default: USER_SHARDS).')
+@with_appcontext
+def reshard_command(shards, old_shards):
+    """Move the users to a different number of shard files. Stop the servers first."""
+    from .services.sharding import reshard
+
+    if shards < 1:
+        raise click.BadParameter('must be at least 1', param_hint='--shards')
+    testing = bool(current_app.config.get('TESTING'))
+    old_shards = old_shards or current_app.config.get('USER_SHARDS', 1)
+    result = reshard(testing, old_shards, shards)
+    for role, counts in result.items():
+        click.echo(f"{role}: {sum(counts)} users in {len(counts)} shard(s): "
+                   f"{', '.join(map(str, counts))}")
+    click.echo(f'set USER_SHARDS={shards} before starting the servers')
+
+
+@click.command('allocate-seats')
+@click.option('--since', type=click.DateTime(), default=None, help='Only requests created from this time.')
+@click.option('--until', type=click.DateTime(), default=None, help='Only requests created before this time.')
+@click.option('--max-detour', type=float, default=None, help='Kilometres (default MATCH_MAX_DETOUR_KM).')
+@with_appcontext
+def allocate_seats_command(since, until, max_detour):
+    """Assign the pending trip requests to open trips, respecting vehicle seats."""
+    from .services.allocation import allocate_pending
+
+    config = current_app.config
+    result = allocate_pending(
+        since, until,
+        max_detour_km=max_detour or config['MATCH_MAX_DETOUR_KM'],
+        cell_km=config['MATCH_CELL_KM'],
+        candidates=config['ALLOCATION_CANDIDATES'],
+    )
+    click.echo(f"{result['assigned']} of {result['requests']} requests assigned, "
+               f"{result['seats_used']} of {result['seats']} free seats used "
+               f"({result['utilisation']:.1%}) in {result['rounds']} rounds")
+    click.echo(f"load {result['load_seconds']:.2f} s, solve {result['solve_seconds']:.2f} s, "
+               f"write {result['write_seconds']:.2f} s")
+
+
+@click.command('plan-routes')
+@with_appcontext
+def plan_routes_command():
+    """Order the pickups of every trip with passengers (run after allocate-seats)."""
+    from .services.routing import plan_routes
+
+    result = plan_routes()
+    click.echo(f"{result['trips']} trips, {result['stops']} stops planned "
+               f"({'NumPy' if result['numpy'] else 'pure-Python'} distance matrices)")
+    click.echo(f"load {result['load_seconds']:.2f} s, plan {result['plan_seconds']:.2f} s, "
+               f"write {result['write_seconds']:.2f} s")
+
+
+@click.command('import-gazetteer')
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@with_appcontext
+def import_gazetteer_command(source):
+    """Build the offline gazetteer from a street/house-number extract (CSV or TSV, maybe gzipped).
+
+    Columns: street, housenumber, city, lat, lon.
+    """
+    from .services.geocoding import import_gazetteer
+
+    imported, skipped = import_gazetteer(source, current_app.config['GAZETTEER_PATH'])
+    click.echo(f"{imported} addresses imported, {skipped} skipped into {current_app.config['GAZETTEER_PATH']}")
+
+
+@click.command('geocode-schools')
+@with_appcontext
+def geocode_schools_command():
+    """Fill in the coordinates of the schools in the database that have none."""
+    from .services.geocoding import geocode_schools
+
+    geocoded, missing = geocode_schools()
+    click.echo(f'{geocoded} of {geocoded + len(missing)} schools geocoded')
+    for name in missing:
+        click.echo(f'  not found: {name}')
+
+
+@click.command('reconcile-ratings')
+@with_appcontext
+def reconcile_ratings_command():
+    """Recompute the drivers' ratings from the reviews and fix the ones that drifted."""
+    from .services.ratings import reconcile
+
+    result = reconcile()
+    click.echo(f"{result['drivers']} drivers checked, {result['corrected']} corrected")
+
+
+commands = [
+    import_json_command,
+    backfill_command,
+    check_parity_command,
+    calibrate_hash_command,
+    compact_command,
+    reshard_command,
+    allocate_seats_command,
+    plan_routes_command,
+    import_gazetteer_command,
+    geocode_schools_command,
+    reconcile_ratings_command,
+]
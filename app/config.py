@@ -1,5 +1,5 @@
 import os
-import os
+from datetime import timedelta
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,3 +10,115 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///app.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+    # Where users and schools live: 'jsonl' (drivers.json, passengers.json,
+    # schools.json), 'sql' (the tables behind app.models) or 'dual' while
+    # migrating (users written to both, JSON files stay authoritative)
+    USER_STORE_BACKEND = os.environ.get('USER_STORE_BACKEND') or 'jsonl'
+    # In 'dual' mode, serve logins and /api/users from the database. Only turn
+    # on once `flask check-parity` reports no differences.
+    USER_READS_FROM_DB = os.environ.get('USER_READS_FROM_DB', '').lower() in ('1', 'true', 'yes')
+    USER_BACKFILL_CHECKPOINT = os.environ.get('USER_BACKFILL_CHECKPOINT') or 'backfill_checkpoint.json'
+    USER_BACKFILL_BATCH_SIZE = int(os.environ.get('USER_BACKFILL_BATCH_SIZE') or 500)
+    # Run the backfill in a thread of the web process (single-worker deploys);
+    # otherwise run `flask backfill` next to the servers
+    USER_BACKFILL_IN_BACKGROUND = os.environ.get('USER_BACKFILL_IN_BACKGROUND', '').lower() in ('1', 'true', 'yes')
+    # Password hashing pool: scrypt runs on PASSWORD_HASH_WORKERS threads with
+    # at most PASSWORD_HASH_QUEUE_SIZE requests waiting; past that /api/login
+    # and /api/register answer 503 with Retry-After instead of queueing.
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1)
+    PASSWORD_HASH_QUEUE_SIZE = int(os.environ.get('PASSWORD_HASH_QUEUE_SIZE') or 32)
+    PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER') or 1)
+    # werkzeug method string for new password hashes. Hashes stored with other
+    # parameters are upgraded on the next successful login; pick a value
+    # with `flask calibrate-hash --target-ms 100`.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+    # /api/users paging
+    USERS_PAGE_SIZE = int(os.environ.get('USERS_PAGE_SIZE') or 100)
+    USERS_MAX_PAGE_SIZE = int(os.environ.get('USERS_MAX_PAGE_SIZE') or 1000)
+    # Serialised /api/users pages kept in memory (per worker), answered with
+    # strong ETags; 0 disables the cache
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE') or 256)
+    # Bloom filter over usernames/emails saved next to each user file
+    # (drivers.json.bloom): registrations whose identifiers are definitely new
+    # skip the index lookups. 0 disables it. The filter is resized when it
+    # holds more than its capacity.
+    USER_BLOOM_FP_RATE = float(os.environ.get('USER_BLOOM_FP_RATE') or 0.01)
+    USER_BLOOM_CAPACITY = int(os.environ.get('USER_BLOOM_CAPACITY') or 100_000)
+    # /api/login throttling: token buckets per client IP and per username
+    # (refilled at *_PER_MINUTE, holding at most *_BURST attempts; a rate of
+    # 0 disables the limit), kept for at most LOGIN_THROTTLE_MAX_KEYS keys
+    # each. Unknown usernames are remembered for LOGIN_UNKNOWN_TTL seconds.
+    # The IP is the client's as seen through TRUSTED_PROXIES reverse proxies
+    # (their X-Forwarded-For/-Proto entries are honoured, see ProxyFix); keep
+    # it 0 without a proxy, or every client could pick its own bucket.
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES') or 0)
+    LOGIN_IP_PER_MINUTE = float(os.environ.get('LOGIN_IP_PER_MINUTE') or 30)
+    LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST') or 30)
+    LOGIN_USER_PER_MINUTE = float(os.environ.get('LOGIN_USER_PER_MINUTE') or 5)
+    LOGIN_USER_BURST = int(os.environ.get('LOGIN_USER_BURST') or 10)
+    LOGIN_THROTTLE_MAX_KEYS = int(os.environ.get('LOGIN_THROTTLE_MAX_KEYS') or 10_000)
+    LOGIN_UNKNOWN_TTL = float(os.environ.get('LOGIN_UNKNOWN_TTL') or 5)
+    # fsync the JSON-Lines files after every batch of appends. Concurrent
+    # registrations share one write + fsync (group commit).
+    USER_FILE_FSYNC = os.environ.get('USER_FILE_FSYNC', '1').lower() in ('1', 'true', 'yes')
+    # Background compaction of the JSON-Lines files (superseded versions and
+    # deleted users): checked every USER_COMPACT_INTERVAL seconds (0 disables
+    # it; `flask compact` runs it by hand), a file is rewritten once at least
+    # USER_COMPACT_MIN_GARBAGE of it is garbage
+    USER_COMPACT_INTERVAL = float(os.environ.get('USER_COMPACT_INTERVAL') or 3600)
+    USER_COMPACT_MIN_GARBAGE = float(os.environ.get('USER_COMPACT_MIN_GARBAGE') or 0.3)
+    # Users are spread over USER_SHARDS pairs of files (drivers.N.json,
+    # passengers.N.json) by a hash of the username, each with its own lock
+    # and index; emails are claimed in emails.N.json. 1 keeps the single
+    # drivers.json/passengers.json. Change it only with `flask reshard`.
+    USER_SHARDS = int(os.environ.get('USER_SHARDS') or 1)
+    # Trip matching: trips are indexed in a grid of MATCH_CELL_KM cells; a
+    # trip matches when picking the passenger up costs at most
+    # MATCH_MAX_DETOUR_KM extra kilometres. At most MATCH_LIMIT trips are returned.
+    MATCH_CELL_KM = float(os.environ.get('MATCH_CELL_KM') or 1.0)
+    MATCH_MAX_DETOUR_KM = float(os.environ.get('MATCH_MAX_DETOUR_KM') or 5.0)
+    MATCH_LIMIT = int(os.environ.get('MATCH_LIMIT') or 20)
+    # Each worker's index re-reads the trips stamped (by the writer's clock,
+    # before its commit) up to MATCH_SYNC_MARGIN seconds before its last sync:
+    # longer than any trip transaction plus the clock skew between workers
+    MATCH_SYNC_MARGIN = float(os.environ.get('MATCH_SYNC_MARGIN') or 10.0)
+    # Seat allocation (`flask allocate-seats`): each pending request is
+    # offered its ALLOCATION_CANDIDATES cheapest trips per round
+    ALLOCATION_CANDIDATES = int(os.environ.get('ALLOCATION_CANDIDATES') or 8)
+    # Offline geocoding: the gazetteer built by `flask import-gazetteer`, the
+    # persistent cache of resolved addresses shared by the workers and the
+    # size of each worker's in-memory LRU
+    GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH') or 'gazetteer.db'
+    GEOCODE_CACHE_PATH = os.environ.get('GEOCODE_CACHE_PATH') or 'geocode_cache.db'
+    GEOCODE_CACHE_SIZE = int(os.environ.get('GEOCODE_CACHE_SIZE') or 10000)
+    # Fare quotes (POST /api/trips/quote): the QUOTE_MAX_CANDIDATES closest
+    # matching trips are priced, ETAs assume QUOTE_SPEED_KMH and the score
+    # weighs the driver's rating QUOTE_RATING_WEIGHT against the price. The
+    # quotes of a pickup point are kept QUOTE_CACHE_TTL seconds in an LRU of
+    # QUOTE_CACHE_SIZE entries per worker
+    QUOTE_MAX_CANDIDATES = int(os.environ.get('QUOTE_MAX_CANDIDATES') or 200)
+    QUOTE_SPEED_KMH = float(os.environ.get('QUOTE_SPEED_KMH') or 30.0)
+    QUOTE_RATING_WEIGHT = float(os.environ.get('QUOTE_RATING_WEIGHT') or 0.3)
+    QUOTE_CACHE_SIZE = int(os.environ.get('QUOTE_CACHE_SIZE') or 1024)
+    QUOTE_CACHE_TTL = float(os.environ.get('QUOTE_CACHE_TTL') or 60)
+    # Recurring trips: the windows of a schedule are local times of
+    # SCHEDULE_TIMEZONE; a listing of occurrences spans at most SCHEDULE_MAX_DAYS
+    SCHEDULE_TIMEZONE = os.environ.get('SCHEDULE_TIMEZONE') or 'Europe/Rome'
+    SCHEDULE_MAX_DAYS = int(os.environ.get('SCHEDULE_MAX_DAYS') or 62)
+    # Driver ratings: the reviews' mean stars smoothed towards
+    # RATING_PRIOR_MEAN as if every driver had RATING_PRIOR_WEIGHT more
+    # reviews of that value (`flask reconcile-ratings` applies a change)
+    RATING_PRIOR_MEAN = float(os.environ.get('RATING_PRIOR_MEAN') or 3.5)
+    RATING_PRIOR_WEIGHT = float(os.environ.get('RATING_PRIOR_WEIGHT') or 5)
+    # Tokens: /api/login answers with an access token valid
+    # ACCESS_TOKEN_MINUTES and a refresh token valid REFRESH_TOKEN_DAYS, traded
+    # at /api/refresh for a new pair (each refresh token works once). The
+    # current refresh token of every login lives in TOKEN_STORE_PATH, a
+    # SQLite file shared by the workers
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=float(os.environ.get('ACCESS_TOKEN_MINUTES') or 15))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=float(os.environ.get('REFRESH_TOKEN_DAYS') or 30))
+    TOKEN_STORE_PATH = os.environ.get('TOKEN_STORE_PATH') or 'tokens.db'
+    # Tokens revoked by /api/logout are refused at once by the worker that
+    # revoked them and within TOKEN_REVOCATION_SYNC seconds by the others
+    # (0: every request checks the file for other workers' logouts)
+    TOKEN_REVOCATION_SYNC = float(os.environ.get('TOKEN_REVOCATION_SYNC') or 1.0)
@@ -1,7 +1,10 @@
 from .. import db
 from .driver import Driver
 from .passenger import Passenger
+from .review import Review
 from .school import School
 from .trip import Trip
 from .trip_request import TripRequest
+from .trip_schedule import TripSchedule
+from .user_version import UserVersion
 from .vehicle import Vehicle
\ No newline at end of file
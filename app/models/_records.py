@@ -0,0 +1,18 @@
+from datetime import datetime
+
+
+def parse_age(value):
+    """Ages come from form fields, so JSON records hold both ints and strings."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
@@ -1,14 +1,62 @@
 from datetime import datetime
+from flask import current_app
 from . import db
+from ._records import parse_age, parse_datetime
+def _unreviewed_rating():
+    # The smoothed score of no reviews is the prior mean (see services.ratings)
+    return float(current_app.config['RATING_PRIOR_MEAN'])
+
+
 class Driver(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=True, nullable=False)
-    surname = db.Column(db.String(80), unique=True, nullable=False)
-    age = db.Column(db.Integer, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    phonenumber = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
-    licenseid = db.Column(db.String(120), unique=True, nullable=False)
-    rating = db.Column(db.Float, nullable=False)
-    priceperkm = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    name = db.Column(db.String(80), nullable=True)
+    surname = db.Column(db.String(80), nullable=True)
+    age = db.Column(db.Integer, nullable=True)
+    email = db.Column(db.String(120), unique=True, nullable=True)
+    phonenumber = db.Column(db.String(120), nullable=True)
+    password_hash = db.Column(db.String(255), nullable=False)
+    licenseid = db.Column(db.String(120), unique=True, nullable=True)
+    license_file = db.Column(db.String(255), nullable=True)
+    # Bayesian-smoothed mean of the reviews' stars, kept with their count and
+    # sum by services.ratings
+    rating = db.Column(db.Float, nullable=False, default=_unreviewed_rating)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    priceperkm = db.Column(db.Float, nullable=False, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        """Serialize in the same shape as a line of drivers.json."""
+        data = {
+            'username': self.username,
+            'email': self.email,
+            'password': self.password_hash,
+            'age': self.age,
+            'phonenumber': self.phonenumber,
+            'licenseid': self.licenseid,
+            'license_file': self.license_file,
+            'rating': self.rating,
+            'priceperkm': self.priceperkm,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+        return {key: value for key, value in data.items() if value is not None}
+
+    @staticmethod
+    def columns_from_dict(data):
+        """Map a drivers.json record to column values."""
+        return {
+            'username': data['username'],
+            'email': data.get('email'),
+            'password_hash': data['password'],
+            'age': parse_age(data.get('age')),
+            'phonenumber': data.get('phonenumber'),
+            'licenseid': data.get('licenseid'),
+            'license_file': data.get('license_file'),
+            'priceperkm': data.get('priceperkm', 0.0),
+            'created_at': parse_datetime(data.get('created_at')),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**cls.columns_from_dict(data))
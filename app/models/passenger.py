@@ -1,13 +1,45 @@
 from datetime import datetime
 from . import db
+from ._records import parse_age, parse_datetime
 class Passenger(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=True, nullable=False)
-    surname = db.Column(db.String(80), unique=True, nullable=False)
-    age = db.Column(db.Integer, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    phonenumber = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
-    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    name = db.Column(db.String(80), nullable=True)
+    surname = db.Column(db.String(80), nullable=True)
+    age = db.Column(db.Integer, nullable=True)
+    email = db.Column(db.String(120), unique=True, nullable=True)
+    phonenumber = db.Column(db.String(120), nullable=True)
+    password_hash = db.Column(db.String(255), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=True)
+    attending_school = db.Column(db.String(120), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    
\ No newline at end of file
+
+    def to_dict(self):
+        """Serialize in the same shape as a line of passengers.json."""
+        data = {
+            'username': self.username,
+            'email': self.email,
+            'password': self.password_hash,
+            'age': self.age,
+            'phonenumber': self.phonenumber,
+            'attending_school': self.attending_school,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+        return {key: value for key, value in data.items() if value is not None}
+
+    @staticmethod
+    def columns_from_dict(data):
+        """Map a passengers.json record to column values."""
+        return {
+            'username': data['username'],
+            'email': data.get('email'),
+            'password_hash': data['password'],
+            'age': parse_age(data.get('age')),
+            'phonenumber': data.get('phonenumber'),
+            'attending_school': data.get('attending_school'),
+            'created_at': parse_datetime(data.get('created_at')),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**cls.columns_from_dict(data))
@@ -0,0 +1,27 @@
+from datetime import datetime
+from . import db
+
+
+class Review(db.Model):
+    """A passenger's stars for the driver of a trip they rode (see services.ratings)."""
+    __table_args__ = (db.UniqueConstraint('trip_code', 'passenger_id', name='uq_review_trip_code_passenger_id'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    trip_code = db.Column(db.Integer, db.ForeignKey('trip.code'), nullable=False)
+    driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'), nullable=False, index=True)
+    passenger_id = db.Column(db.Integer, db.ForeignKey('passenger.id'), nullable=False)
+    # 1 to 5
+    stars = db.Column(db.Integer, nullable=False)
+    comment = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'trip_code': self.trip_code,
+            'driver_id': self.driver_id,
+            'passenger_id': self.passenger_id,
+            'stars': self.stars,
+            'comment': self.comment,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
@@ -3,6 +3,45 @@ class School(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
     address = db.Column(db.String(120), nullable=False)
+    city = db.Column(db.String(80), nullable=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     representative = db.Column(db.String(80), nullable=False)
-    mechanical_code = db.Column(db.String(80), unique=True, nullable=False)
\ No newline at end of file
+    mechanical_code = db.Column(db.String(80), unique=True, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    # Coordinates of the address, needed to match trips to the school
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+
+    def to_dict(self):
+        """Serialize in the same shape as a line of schools.json."""
+        data = {
+            'school_name': self.name,
+            'address': self.address,
+            'city': self.city,
+            'email': self.email,
+            'representative': self.representative,
+            'mechanical_code': self.mechanical_code,
+            'status': self.status,
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+        }
+        return {key: value for key, value in data.items() if value is not None}
+
+    @staticmethod
+    def columns_from_dict(data):
+        """Map a schools.json record to column values."""
+        return {
+            'name': data['school_name'],
+            'address': data['address'],
+            'city': data.get('city'),
+            'email': data['email'],
+            'representative': data['representative'],
+            'mechanical_code': data['mechanical_code'],
+            'status': data.get('status', 'pending'),
+            'latitude': data.get('latitude'),
+            'longitude': data.get('longitude'),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**cls.columns_from_dict(data))
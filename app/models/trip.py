@@ -1,6 +1,52 @@
 from datetime import datetime
 from . import db
 
+
+def _window(start, end):
+    if start is None or end is None:
+        return None
+    return {'from': start.isoformat(), 'until': end.isoformat()}
+
+
 class Trip(db.Model):
+    __table_args__ = (db.UniqueConstraint('schedule_id', 'occurs_on', name='uq_trip_schedule_id_occurs_on'),)
+
     code = db.Column(db.Integer, primary_key=True)
-    driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'), nullable=False)
\ No newline at end of file
+    driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'), nullable=False)
+    # Where the driver starts from; the trip ends at the school
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False)
+    origin_lat = db.Column(db.Float, nullable=False)
+    origin_lon = db.Column(db.Float, nullable=False)
+    # The vehicle driven; when unset, the driver's vehicle with most seats
+    licence_plate = db.Column(db.String(80), db.ForeignKey('vehicle.licence_plate'), nullable=True)
+    # 'open' trips take passengers and are the only ones matched
+    status = db.Column(db.String(20), nullable=False, default='open')
+    # Optional time windows (UTC) for leaving the origin and reaching the school
+    departure_from = db.Column(db.DateTime, nullable=True)
+    departure_until = db.Column(db.DateTime, nullable=True)
+    arrival_from = db.Column(db.DateTime, nullable=True)
+    arrival_until = db.Column(db.DateTime, nullable=True)
+    # Set on the occurrences of a TripSchedule that were materialised
+    schedule_id = db.Column(db.Integer, db.ForeignKey('trip_schedule.id'), nullable=True)
+    occurs_on = db.Column(db.Date, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Lets every worker notice changed trips (see services.matching)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    def to_dict(self, with_origin=False):
+        """The origin, usually the driver's home, only with ``with_origin`` (for the driver)."""
+        data = {
+            'code': self.code,
+            'driver_id': self.driver_id,
+            'school_id': self.school_id,
+            'licence_plate': self.licence_plate,
+            'status': self.status,
+            'departure': _window(self.departure_from, self.departure_until),
+            'arrival': _window(self.arrival_from, self.arrival_until),
+            'schedule_id': self.schedule_id,
+            'occurs_on': self.occurs_on.isoformat() if self.occurs_on else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
+        if with_origin:
+            data['origin'] = {'lat': self.origin_lat, 'lon': self.origin_lon}
+        return data
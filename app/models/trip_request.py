@@ -1,6 +1,42 @@
+from datetime import datetime
 from . import db
+from .trip import _window
 
 class TripRequest(db.Model):
-    trip_code = db.Column(db.Integer, db.ForeignKey('trip.code'), primary_key=True, nullable=False)
+    id = db.Column(db.Integer, primary_key=True)
+    # Set when the request gets a seat (see services.allocation)
+    trip_code = db.Column(db.Integer, db.ForeignKey('trip.code'), nullable=True, index=True)
     passenger_id = db.Column(db.Integer, db.ForeignKey('passenger.id'), nullable=False)
-    pickup_point = db.Column(db.String(120), nullable=False)
\ No newline at end of file
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False)
+    pickup_point = db.Column(db.String(120), nullable=True)
+    # Only requests with coordinates can be allocated
+    pickup_lat = db.Column(db.Float, nullable=True)
+    pickup_lon = db.Column(db.Float, nullable=True)
+    # Needs one of the vehicle's handicap_seats
+    handicap = db.Column(db.Boolean, nullable=False, default=False)
+    # Optional windows (UTC): only trips with an overlapping window of the same kind are offered
+    departure_from = db.Column(db.DateTime, nullable=True)
+    departure_until = db.Column(db.DateTime, nullable=True)
+    arrival_from = db.Column(db.DateTime, nullable=True)
+    arrival_until = db.Column(db.DateTime, nullable=True)
+    # 'pending' until the allocation job assigns it, then 'assigned'
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    # Position among the trip's pickups (see services.routing)
+    stop_order = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'trip_code': self.trip_code,
+            'passenger_id': self.passenger_id,
+            'school_id': self.school_id,
+            'pickup_point': self.pickup_point,
+            'pickup': {'lat': self.pickup_lat, 'lon': self.pickup_lon},
+            'handicap': self.handicap,
+            'departure': _window(self.departure_from, self.departure_until),
+            'arrival': _window(self.arrival_from, self.arrival_until),
+            'status': self.status,
+            'stop_order': self.stop_order,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+        }
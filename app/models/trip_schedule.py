@@ -0,0 +1,54 @@
+from datetime import datetime
+from . import db
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+
+def _window(start, end):
+    if start is None or end is None:
+        return None
+    return {'from': start.isoformat(timespec='minutes'), 'until': end.isoformat(timespec='minutes')}
+
+
+class TripSchedule(db.Model):
+    """A trip repeated on some weekdays between two dates (see services.recurrence).
+
+    Only the days that get a passenger or an exception are stored, as
+    ``Trip`` rows with ``schedule_id`` and ``occurs_on``.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    driver_id = db.Column(db.Integer, db.ForeignKey('driver.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False)
+    origin_lat = db.Column(db.Float, nullable=False)
+    origin_lon = db.Column(db.Float, nullable=False)
+    licence_plate = db.Column(db.String(80), db.ForeignKey('vehicle.licence_plate'), nullable=True)
+    # Bit i set: runs on WEEKDAYS[i] (Monday is bit 0, like date.weekday())
+    weekdays = db.Column(db.Integer, nullable=False)
+    starts_on = db.Column(db.Date, nullable=False)
+    ends_on = db.Column(db.Date, nullable=False)
+    # Local times (SCHEDULE_TIMEZONE) of the windows of every occurrence
+    departure_from = db.Column(db.Time, nullable=True)
+    departure_until = db.Column(db.Time, nullable=True)
+    arrival_from = db.Column(db.Time, nullable=True)
+    arrival_until = db.Column(db.Time, nullable=True)
+    # 'active' schedules are expanded; 'cancelled' ones no longer
+    status = db.Column(db.String(20), nullable=False, default='active')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, with_origin=False):
+        """The origin, usually the driver's home, only with ``with_origin`` (for the driver)."""
+        data = {
+            'id': self.id,
+            'driver_id': self.driver_id,
+            'school_id': self.school_id,
+            'licence_plate': self.licence_plate,
+            'weekdays': [day for i, day in enumerate(WEEKDAYS) if self.weekdays >> i & 1],
+            'starts_on': self.starts_on.isoformat(),
+            'ends_on': self.ends_on.isoformat(),
+            'departure': _window(self.departure_from, self.departure_until),
+            'arrival': _window(self.arrival_from, self.arrival_until),
+            'status': self.status,
+        }
+        if with_origin:
+            data['origin'] = {'lat': self.origin_lat, 'lon': self.origin_lon}
+        return data
@@ -0,0 +1,12 @@
+from . import db
+
+
+class UserVersion(db.Model):
+    """A single row counting the changes to existing drivers and passengers.
+
+    Bumped in the transaction of every such change (services.sql_store), so
+    every worker sees it move: inserts and deletions alone already show in
+    the row counts.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
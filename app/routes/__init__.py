@@ -1,5 +1,8 @@
 from .main import main_bp
 from .register import register_bp
 from .login import login_bp
+from .metrics import metrics_bp
+from .profile import profile_bp
+from .trips import trips_bp
 
-blueprints = [main_bp, register_bp, login_bp]
\ No newline at end of file
+blueprints = [main_bp, register_bp, login_bp, metrics_bp, profile_bp, trips_bp]
\ No newline at end of file
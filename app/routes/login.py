@@ -1,13 +1,13 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import (
-    create_access_token,
     jwt_required,
     get_jwt_identity,
     get_jwt,
 )
-from werkzeug.security import check_password_hash
-import json
-import os
+from ..services.hashing import HashingBusy, busy_response, get_hasher
+from ..services.throttle import LoginThrottled, get_login_guard, throttled_response
+from ..services.tokens import end_family, issue_tokens, refresh_tokens, revoke_session
+from ..services.user_store import get_user_store
 
 login_bp = Blueprint("login", __name__, url_prefix="/api")
 
@@ -24,68 +24,80 @@ def login():
         if not username or not password:
             return jsonify({'error': 'Username and password are required'}), 400
 
-        # Determine filenames based on testing config
-        testing = bool(current_app.config.get('TESTING'))
-        drivers_file = 'test_drivers.json' if testing else 'drivers.json'
-        passengers_file = 'test_passengers.json' if testing else 'passengers.json'
-
-        user_found = None
-        role = None
-
-        # Check drivers
-        if os.path.exists(drivers_file):
-            with open(drivers_file, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        try:
-                            user = json.loads(line)
-                            if user.get('username') == username:
-                                user_found = user
-                                role = 'driver'
-                                break
-                        except json.JSONDecodeError:
-                            continue
-
-        # Check passengers if not found in drivers
-        if not user_found and os.path.exists(passengers_file):
-            with open(passengers_file, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        try:
-                            user = json.loads(line)
-                            if user.get('username') == username:
-                                user_found = user
-                                role = 'passenger'
-                                break
-                        except json.JSONDecodeError:
-                            continue
+        guard = get_login_guard()
+        guard.check(request.remote_addr, username)
+
+        hasher = get_hasher()
+        user_found, role = None, None
+        if not guard.is_unknown(username):
+            user_found, role = get_user_store().find_by_username(username)
 
         if not user_found:
+            guard.unknown.add(username)
+            # Same cost as a wrong password, so unknown usernames do not stand out
+            hasher.check_dummy(password)
             return jsonify({'error': 'Invalid username or password'}), 401
 
         #use check_password_hash
-        if not check_password_hash(user_found.get('password'), password):
+        if not hasher.check(user_found.get('password'), password):
             return jsonify({'error': 'Invalid username or password'}), 401
 
-        # Return user info (excluding password) and access token
+        # Upgrade hashes made with outdated parameters while we know the password
+        if hasher.needs_rehash(user_found.get('password')):
+            try:
+                get_user_store().update(role, username, {'password': hasher.generate(password)})
+            except Exception:
+                current_app.logger.warning('rehash of %r failed', username, exc_info=True)
+
+        # Return user info (excluding password), access and refresh token
         user_data = user_found.copy()
         user_data.pop('password', None)
         user_data['role'] = role
 
-        access_token = create_access_token(identity=username, additional_claims={"role": role})
+        access_token, refresh_token = issue_tokens(username, role)
 
         return jsonify({
             'message': 'Login successful',
             'user': user_data,
-            'access_token': access_token
+            'access_token': access_token,
+            'refresh_token': refresh_token
         }), 200
 
+    except LoginThrottled as e:
+        return throttled_response(e)
+    except HashingBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@login_bp.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    """New access and refresh tokens for a refresh token, without the password hash."""
+    try:
+        claims = get_jwt()
+        # Logins of deleted users or users whose role changed end here
+        user_found, role = get_user_store().find_by_username(claims['sub'])
+        if not user_found or role != claims.get('role'):
+            if claims.get('fam'):
+                end_family(claims['fam'])
+            return jsonify({'error': 'Login again'}), 401
+
+        tokens = refresh_tokens(claims)
+        if tokens is None:
+            return jsonify({'error': 'Refresh token already used or revoked: login again'}), 401
+
+        access_token, refresh_token = tokens
+        return jsonify({'access_token': access_token, 'refresh_token': refresh_token}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @login_bp.route("/logout", methods=["POST"])
+@jwt_required(verify_type=False)
 def logout():
+    """Revoke the presented token (access or refresh) and every token of its login."""
     try:
+        revoke_session(get_jwt())
         return jsonify({'message': 'Logout successful'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
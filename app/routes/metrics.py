@@ -0,0 +1,11 @@
+from flask import Blueprint, jsonify
+from ..services.metrics import collect_metrics
+
+metrics_bp = Blueprint("metrics", __name__, url_prefix="/api")
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    try:
+        return jsonify(collect_metrics()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,131 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from ..services.hashing import HashingBusy, busy_response, get_hasher
+from ..services.response_cache import get_response_cache
+from ..services.tokens import end_user_sessions
+from ..services.user_listing import public_user
+from ..services.user_store import UserExists, UserInUse, get_user_store
+
+profile_bp = Blueprint("profile", __name__, url_prefix="/api")
+
+# Fields a user may change on their own profile, per role
+EDITABLE_FIELDS = {
+    'driver': {'email', 'phonenumber', 'age', 'licenseid'},
+    'passenger': {'email', 'phonenumber', 'age', 'attending_school'},
+}
+
+
+def _current_user():
+    """Return ``(username, role, record)`` of the token's user; record is None if deleted."""
+    username = get_jwt_identity()
+    role = get_jwt().get('role')
+    record, found_role = get_user_store().find_by_username(username)
+    if record is None or found_role != role:
+        return username, role, None
+    return username, role, record
+
+
+@profile_bp.route("/profile", methods=["GET"])
+@jwt_required()
+def get_profile():
+    try:
+        _, role, record = _current_user()
+        if record is None:
+            return jsonify({'error': 'User not found'}), 404
+        return jsonify({'user': public_user(role, record)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@profile_bp.route("/profile", methods=["PATCH"])
+@jwt_required()
+def update_profile():
+    """
+    Change the fields of the logged-in user's profile. A new password needs
+    'current_password' and ends every login of the user. The username and
+    role cannot be changed.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Expected a JSON object'}), 400
+
+        username, role, record = _current_user()
+        if record is None:
+            return jsonify({'error': 'User not found'}), 404
+
+        password = data.get('password')
+        current_password = data.get('current_password')
+        fields = set(data) - {'password', 'current_password'}
+        not_editable = fields - EDITABLE_FIELDS.get(role, set())
+        if not_editable:
+            return jsonify({'error': f'Fields cannot be changed: {", ".join(sorted(not_editable))}'}), 400
+
+        changes = {}
+        for field in fields:
+            value = data[field]
+            if not value:
+                return jsonify({'error': f'{field} cannot be empty'}), 400
+            changes[field] = value
+
+        if 'email' in changes:
+            if not isinstance(changes['email'], str):
+                return jsonify({'error': 'Email must be a string'}), 400
+            changes['email'] = changes['email'].strip()
+            if len(changes['email']) < 5:
+                return jsonify({'error': 'Email must be at least 3 characters'}), 400
+
+        hasher = get_hasher()
+        if password is not None:
+            if not isinstance(password, str) or not isinstance(current_password, (str, type(None))):
+                return jsonify({'error': 'Password must be a string'}), 400
+            if len(password) < 8:
+                return jsonify({'error': 'Password must be at least 8 characters'}), 400
+            if not current_password or not hasher.check(record.get('password'), current_password):
+                return jsonify({'error': 'Current password is incorrect'}), 403
+            changes['password'] = hasher.generate(password)
+
+        if not changes:
+            return jsonify({'error': 'No changes provided'}), 400
+
+        store = get_user_store()
+        try:
+            store.update(role, username, changes)
+        except KeyError:
+            return jsonify({'error': 'User not found'}), 404
+        except UserExists:
+            return jsonify({'error': 'Email already in use'}), 409
+        get_response_cache().invalidate()
+        if 'password' in changes:
+            # Tokens obtained with the old password, this one included, stop working
+            end_user_sessions(username)
+
+        record, _ = store.find_by_username(username)
+        return jsonify({'message': 'Profile updated', 'user': public_user(role, record)}), 200
+
+    except HashingBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@profile_bp.route("/profile", methods=["DELETE"])
+@jwt_required()
+def delete_profile():
+    try:
+        username, role, record = _current_user()
+        if record is None:
+            return jsonify({'error': 'User not found'}), 404
+        try:
+            get_user_store().delete(role, username)
+        except KeyError:
+            return jsonify({'error': 'User not found'}), 404
+        except UserInUse:
+            return jsonify({'error': 'Account has trips or requests and cannot be deleted'}), 409
+        get_response_cache().invalidate()
+        end_user_sessions(username)
+        return jsonify({'message': 'Account deleted'}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify, current_app
-from werkzeug.security import generate_password_hash
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from werkzeug.utils import secure_filename
 from datetime import datetime
+from ..services.geocoding import get_geocoder
+from ..services.hashing import HashingBusy, busy_response, get_hasher
+from ..services.response_cache import cached_response, get_response_cache
+from ..services.throttle import get_login_guard
+from ..services.user_listing import InvalidQuery, iter_listing, page, parse_fields, parse_roles, public_user
+from ..services.user_store import UserExists, get_school_store, get_user_store
+import itertools
 import json
 import os
 
@@ -57,6 +63,13 @@ def register():
         elif role == 'passenger':
             if not attending_school:
                 return jsonify({'error': 'Attending school is required for passengers'}), 400
+
+        # Usernames and emails are unique globally (drivers and passengers
+        # share the same namespace), the store checks both role files.
+        # Checked before hashing so duplicates never cost a scrypt call.
+        store = get_user_store()
+        if store.exists(username=username, email=email):
+            return jsonify({'error': 'User already exists'}), 409
         
         # Handle file upload for drivers
         license_file_path = None
@@ -80,7 +93,7 @@ def register():
         form_data = {
             'username': username,
             'email': email,
-            'password': generate_password_hash(password),
+            'password': get_hasher().generate(password),
             'age': age,
             'phonenumber': phonenumber,
             'created_at': datetime.utcnow().isoformat()
@@ -92,64 +105,21 @@ def register():
                 form_data['license_file'] = license_file_path
         elif role == 'passenger':
             form_data['attending_school'] = attending_school
-        
-        #TESTING
-        testing = bool(current_app.config.get('TESTING'))
-        primary_filename = (
-            'test_drivers.json' if role == 'driver' else 'test_passengers.json'
-        ) if testing else ('drivers.json' if role == 'driver' else 'passengers.json')
-        # Secondary/main file (always update for visibility)
-        secondary_filename = 'drivers.json' if role == 'driver' else 'passengers.json'
-        
-        # Read existing data
-        users = []
-        # Check across both primary and the other role file so usernames and emails are
-        # unique globally (drivers and passengers share the same namespace).
-        other_role = 'passenger' if role == 'driver' else 'driver'
-        other_primary = (
-            'test_drivers.json' if other_role == 'driver' else 'test_passengers.json'
-        ) if testing else ('drivers.json' if other_role == 'driver' else 'passengers.json')
-
-        files_to_check = {primary_filename, other_primary}
-        for fname in files_to_check:
-            if os.path.exists(fname):
-                with open(fname, 'r') as f:
-                    for line in f:
-                        if line.strip():
-                            try:
-                                users.append(json.loads(line))
-                            except json.JSONDecodeError:
-                                continue
-        
-        # Check if user already exists (by email or username)
-        if any(
-            user.get('email') == email or user.get('username') == username
-            for user in users
-        ):
-            return jsonify({'error': 'User already exists'}), 409
 
-        # Append new user to primary and secondary files as applicable
         try:
-            with open(primary_filename, 'a') as f:
-                json.dump(form_data, f)
-                f.write('\n')
-            # Also append to the main file so manual inspection uses the same
-            # filename as the original application.
-            if primary_filename != secondary_filename:
-                with open(secondary_filename, 'a') as f2:
-                    json.dump(form_data, f2)
-                    f2.write('\n')
-        except Exception:
-            # If appending to secondary fails, still consider the operation a
-            # success if the primary file was written; tests focus on primary
-            # behavior but many tests read the main file so we try both.
-            pass
+            store.add(role, form_data)
+        except UserExists:
+            return jsonify({'error': 'User already exists'}), 409
+        get_response_cache().invalidate()
+        get_login_guard().unknown.discard(username)
         
         return jsonify({
             'message': f'Successfully registered as {role}',
             'username': username
         }), 201
         
+    except HashingBusy as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -178,27 +148,22 @@ def register_school():
             'status': 'pending' # Default status for application
         }
 
-        # Save to schools.json
-        testing = bool(current_app.config.get('TESTING'))
-        filename = 'test_schools.json' if testing else 'schools.json'
-        
-        # Check if school already exists (by email or name)
-        if os.path.exists(filename):
-            with open(filename, 'r') as f:
-                for line in f:
-                    if line.strip():
-                        try:
-                            existing = json.loads(line)
-                            if (existing.get('email') == email or 
-                                existing.get('school_name') == school_name or
-                                existing.get('codice_meccanografico') == codice_meccanografico):
-                                return jsonify({'error': 'School already registered'}), 409
-                        except json.JSONDecodeError:
-                            continue
-
-        with open(filename, 'a') as f:
-            json.dump(school_data, f)
-            f.write('\n')
+        # Check if school already exists (by email, name or mechanical code)
+        store = get_school_store()
+        if store.exists(school_name=school_name, email=email, mechanical_code=mechanical_code):
+            return jsonify({'error': 'School already registered'}), 409
+
+        # Coordinates for trip matching, when the offline gazetteer knows the address
+        location = get_geocoder().geocode(address)
+        if location is not None:
+            school_data['latitude'] = location.lat
+            school_data['longitude'] = location.lon
+
+        try:
+            store.add(school_data)
+        except UserExists:
+            return jsonify({'error': 'School already registered'}), 409
+        get_response_cache().invalidate()
             
         return jsonify({'message': 'School application submitted successfully'}), 201
 
@@ -209,37 +174,58 @@ def register_school():
 @register_bp.route("/users", methods=["GET"])
 def list_users():
     """
-    Return all registered users (drivers and passengers) as a JSON list.
+    Return registered users (drivers and passengers), one page at a time.
     Each user object is augmented with a 'role' field.
+
+    Query parameters:
+      limit   page size (default USERS_PAGE_SIZE, at most USERS_MAX_PAGE_SIZE)
+      cursor  'next_cursor' of the previous page
+      fields  comma separated fields to return (e.g. username,role)
+      role    'driver' or 'passenger'
+      format  'ndjson' to stream every user (from cursor, up to limit if
+              given) as one JSON object per line
+
+    Pages carry a strong ETag and Last-Modified and honour If-None-Match /
+    If-Modified-Since with 304.
     """
     try:
-        testing = bool(current_app.config.get('TESTING'))
-
-        # Determine filenames for drivers and passengers
-        drivers_file = 'test_drivers.json' if testing else 'drivers.json'
-        passengers_file = 'test_passengers.json' if testing else 'passengers.json'
-
-        all_users = []
-
-        for filename, role in (
-            (drivers_file, 'driver'),
-            (passengers_file, 'passenger'),
-        ):
-            if os.path.exists(filename):
-                with open(filename, 'r') as f:
-                    for line in f:
-                        if not line.strip():
-                            continue
-                        try:
-                            user = json.loads(line)
-                        except json.JSONDecodeError:
-                            continue
-                        user_copy = user.copy()
-                        user_copy['role'] = role
-                        # Never expose password hashes
-                        user_copy.pop('password', None)
-                        all_users.append(user_copy)
-
-        return jsonify({'users': all_users}), 200
+        args = request.args
+        roles = parse_roles(args.get('role'))
+        fields = parse_fields(args.get('fields'))
+        max_limit = current_app.config['USERS_MAX_PAGE_SIZE']
+        ndjson = args.get('format') == 'ndjson' or (
+            request.accept_mimetypes.best == 'application/x-ndjson'
+        )
+        limit = None
+        if 'limit' in args:
+            limit = args.get('limit', type=int)
+            if limit is None or not 1 <= limit <= max_limit:
+                return jsonify({'error': f'limit must be between 1 and {max_limit}'}), 400
+
+        store = get_user_store()
+
+        if ndjson:
+            rows = iter_listing(store, roles, args.get('cursor'), limit)
+            if limit is not None:
+                rows = itertools.islice(rows, limit)
+
+            def generate():
+                for role, _, record in rows:
+                    yield json.dumps(public_user(role, record, fields)) + '\n'
+
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+        def build():
+            users, next_cursor = page(
+                store, roles, args.get('cursor'),
+                limit or current_app.config['USERS_PAGE_SIZE'], fields,
+            )
+            return json.dumps({'users': users, 'next_cursor': next_cursor}).encode('utf-8')
+
+        # Repeated polls are served from the cache, or with a 304 when the
+        # client already holds this version (If-None-Match / If-Modified-Since)
+        return cached_response(store.version(), build)
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,510 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, get_jwt
+from datetime import datetime
+from sqlalchemy import select, update
+from .. import db
+from ..models import Driver, Passenger, Review, School, Trip, TripRequest, TripSchedule
+from ..services.allocation import reserve_seat
+from ..services.geocoding import locate
+from ..services.matching import InvalidLocation, get_trip_matcher
+from ..services.pricing import quote
+from ..services.ratings import InvalidReview, add_review
+from ..services.recurrence import (
+    InvalidSchedule, materialise, occurrence_dict, occurrences, parse_clock_window, parse_date,
+    parse_weekdays, schedule_zone,
+)
+from ..services.routing import trip_route
+from ..services.schedule import InvalidWindow, TripWindows, parse_window, windows_fit, windows_of
+
+trips_bp = Blueprint("trips", __name__, url_prefix="/api")
+
+
+def _school(data):
+    school_id = data.get('school_id')
+    if not isinstance(school_id, int):
+        raise InvalidLocation('school_id is required')
+    return db.session.get(School, school_id)
+
+
+def _windows(data):
+    """The optional "departure" and "arrival" windows of a request body."""
+    windows = {kind: parse_window(data.get(kind)) for kind in TripWindows.KINDS}
+    return {kind: window for kind, window in windows.items() if window is not None}
+
+
+def _logged_driver():
+    return db.session.execute(
+        select(Driver).filter_by(username=get_jwt_identity())
+    ).scalar_one_or_none()
+
+
+def _logged_driver_id():
+    """Id of the logged-in driver, None for passengers: who may see a trip's origin."""
+    if get_jwt().get('role') != 'driver':
+        return None
+    driver = _logged_driver()
+    return driver.id if driver is not None else None
+
+
+def _cancel(trip):
+    """Close a trip and send its passengers' requests back to 'pending'."""
+    trip.status = 'cancelled'
+    db.session.execute(
+        update(TripRequest).where(TripRequest.trip_code == trip.code)
+        .values(trip_code=None, status='pending', stop_order=None)
+    )
+
+
+@trips_bp.route("/trips", methods=["POST"])
+@jwt_required()
+def create_trip():
+    """
+    Publish a trip of the logged-in driver: {"school_id": 1, "origin": {"lat": .., "lon": ..}}
+    (or an address string, resolved with the offline gazetteer), plus the
+    optional "departure" and "arrival" windows {"from": .., "until": ..}
+    (ISO 8601, UTC unless an offset is given).
+    Trips live in the database, so the driver must have been stored there
+    (USER_STORE_BACKEND 'sql', or 'dual' once backfilled).
+    """
+    try:
+        if get_jwt().get('role') != 'driver':
+            return jsonify({'error': 'Only drivers can publish trips'}), 403
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        origin = locate(data.get('origin'))
+        windows = _windows(data)
+        school = _school(data)
+        if school is None:
+            return jsonify({'error': 'School not found'}), 404
+        if school.latitude is None or school.longitude is None:
+            return jsonify({'error': 'School address has no coordinates yet'}), 409
+        driver = _logged_driver()
+        if driver is None:
+            return jsonify({'error': 'Driver not found in the database'}), 409
+
+        trip = Trip(driver_id=driver.id, school_id=school.id, origin_lat=origin[0], origin_lon=origin[1])
+        for kind, (start, end) in windows.items():
+            setattr(trip, f'{kind}_from', start)
+            setattr(trip, f'{kind}_until', end)
+        db.session.add(trip)
+        db.session.commit()
+        return jsonify({'trip': trip.to_dict(with_origin=True)}), 201
+    except (InvalidLocation, InvalidWindow) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/<int:code>", methods=["GET"])
+@jwt_required()
+def get_trip(code):
+    try:
+        trip = db.session.get(Trip, code)
+        if trip is None:
+            return jsonify({'error': 'Trip not found'}), 404
+        # Drivers' origins (usually their homes) are for themselves only
+        return jsonify({'trip': trip.to_dict(with_origin=trip.driver_id == _logged_driver_id())}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/<int:code>/route", methods=["GET"])
+@jwt_required()
+def get_trip_route(code):
+    """
+    Pickup order for the driver of the trip: origin, stops with their
+    request and coordinates, school and total distance_km (straight lines).
+    """
+    try:
+        trip = db.session.get(Trip, code)
+        if trip is None:
+            return jsonify({'error': 'Trip not found'}), 404
+        driver = db.session.get(Driver, trip.driver_id)
+        if get_jwt().get('role') != 'driver' or driver is None or driver.username != get_jwt_identity():
+            return jsonify({'error': 'Only the driver of the trip can see its route'}), 403
+        route = trip_route(code)
+        if route is None:
+            return jsonify({'error': 'School address has no coordinates yet'}), 409
+        return jsonify({'trip': code, 'route': route}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/<int:code>/cancel", methods=["POST"])
+@jwt_required()
+def cancel_trip(code):
+    """
+    Cancel a trip of the logged-in driver: it stops matching, and its
+    passengers' requests go back to 'pending' for the next allocation.
+    """
+    try:
+        trip = db.session.get(Trip, code)
+        if trip is None:
+            return jsonify({'error': 'Trip not found'}), 404
+        driver = db.session.get(Driver, trip.driver_id)
+        if get_jwt().get('role') != 'driver' or driver is None or driver.username != get_jwt_identity():
+            return jsonify({'error': 'Only the driver of the trip can cancel it'}), 403
+        if trip.status != 'open':
+            return jsonify({'error': f'Trip is {trip.status}'}), 409
+
+        _cancel(trip)
+        db.session.commit()
+        return jsonify({'trip': trip.to_dict(with_origin=True)}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/<int:code>/reviews", methods=["POST"])
+@jwt_required()
+def review_trip(code):
+    """
+    Rate the driver of a trip the logged-in passenger had a seat on:
+    {"stars": 1..5, "comment": ".."} (comment optional), once per trip.
+    Returns the review and the driver's new rating.
+    """
+    try:
+        if get_jwt().get('role') != 'passenger':
+            return jsonify({'error': 'Only passengers can review trips'}), 403
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        trip = db.session.get(Trip, code)
+        if trip is None:
+            return jsonify({'error': 'Trip not found'}), 404
+        passenger = db.session.execute(
+            select(Passenger).filter_by(username=get_jwt_identity())
+        ).scalar_one_or_none()
+        rode = passenger is not None and db.session.execute(
+            select(TripRequest.id).filter_by(trip_code=code, passenger_id=passenger.id, status='assigned')
+        ).first() is not None
+        if not rode:
+            return jsonify({'error': 'Only passengers of the trip can review it'}), 403
+        if db.session.execute(
+            select(Review.id).filter_by(trip_code=code, passenger_id=passenger.id)
+        ).first() is not None:
+            return jsonify({'error': 'Trip already reviewed'}), 409
+
+        review = add_review(trip, passenger.id, data.get('stars'), data.get('comment'))
+        db.session.commit()
+        driver = db.session.get(Driver, trip.driver_id)
+        return jsonify({'review': review.to_dict(), 'driver': {
+            'username': driver.username, 'rating': driver.rating, 'rating_count': driver.rating_count,
+        }}), 201
+    except InvalidReview as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/schedules", methods=["POST"])
+@jwt_required()
+def create_schedule():
+    """
+    Publish a recurring trip of the logged-in driver: {"school_id": 1,
+    "origin": .., "weekdays": ["MO", "TU", "WE", "TH", "FR"],
+    "starts_on": "2026-09-14", "ends_on": "2027-06-06"} plus optional daily
+    "departure"/"arrival" windows {"from": "07:30", "until": "07:45"} in
+    SCHEDULE_TIMEZONE. The days are not stored, see services.recurrence.
+    """
+    try:
+        if get_jwt().get('role') != 'driver':
+            return jsonify({'error': 'Only drivers can publish trips'}), 403
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        origin = locate(data.get('origin'))
+        weekdays = parse_weekdays(data.get('weekdays'))
+        starts_on, ends_on = parse_date(data.get('starts_on')), parse_date(data.get('ends_on'))
+        if ends_on < starts_on:
+            return jsonify({'error': 'ends_on must not be before starts_on'}), 400
+        windows = {kind: parse_clock_window(data.get(kind)) for kind in TripWindows.KINDS}
+        school = _school(data)
+        if school is None:
+            return jsonify({'error': 'School not found'}), 404
+        if school.latitude is None or school.longitude is None:
+            return jsonify({'error': 'School address has no coordinates yet'}), 409
+        driver = _logged_driver()
+        if driver is None:
+            return jsonify({'error': 'Driver not found in the database'}), 409
+
+        schedule = TripSchedule(
+            driver_id=driver.id, school_id=school.id, origin_lat=origin[0], origin_lon=origin[1],
+            weekdays=weekdays, starts_on=starts_on, ends_on=ends_on,
+        )
+        for kind, window in windows.items():
+            if window is not None:
+                setattr(schedule, f'{kind}_from', window[0])
+                setattr(schedule, f'{kind}_until', window[1])
+        db.session.add(schedule)
+        db.session.commit()
+        return jsonify({'schedule': schedule.to_dict(with_origin=True)}), 201
+    except (InvalidLocation, InvalidSchedule) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/schedules/<int:schedule_id>", methods=["GET"])
+@jwt_required()
+def get_schedule(schedule_id):
+    try:
+        schedule = db.session.get(TripSchedule, schedule_id)
+        if schedule is None:
+            return jsonify({'error': 'Schedule not found'}), 404
+        return jsonify({'schedule': schedule.to_dict(with_origin=schedule.driver_id == _logged_driver_id())}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/occurrences", methods=["GET"])
+@jwt_required()
+def list_occurrences():
+    """
+    The days of the recurring trips to a school in a date range:
+    ?school_id=1&from=2026-10-19&until=2026-10-25 (at most SCHEDULE_MAX_DAYS
+    days). Days not materialised yet have "code": null.
+    """
+    try:
+        school_id = request.args.get('school_id', type=int)
+        if school_id is None:
+            return jsonify({'error': 'school_id is required'}), 400
+        start, end = parse_date(request.args.get('from')), parse_date(request.args.get('until'))
+        if end < start:
+            return jsonify({'error': 'until must not be before from'}), 400
+        if (end - start).days >= current_app.config['SCHEDULE_MAX_DAYS']:
+            return jsonify({'error': f"At most {current_app.config['SCHEDULE_MAX_DAYS']} days at a time"}), 400
+
+        zone, driver_id = schedule_zone(), _logged_driver_id()
+        return jsonify({'trips': [
+            occurrence_dict(occurrence, zone, with_origin=occurrence.schedule.driver_id == driver_id)
+            for occurrence in occurrences(school_id, start, end)
+        ]}), 200
+    except InvalidSchedule as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/schedules/<int:schedule_id>/occurrences/<day>/cancel", methods=["POST"])
+@jwt_required()
+def cancel_occurrence(schedule_id, day):
+    """Cancel one day of a recurring trip of the logged-in driver (an exception)."""
+    try:
+        day = parse_date(day)
+        schedule = db.session.get(TripSchedule, schedule_id)
+        if schedule is None:
+            return jsonify({'error': 'Schedule not found'}), 404
+        driver = db.session.get(Driver, schedule.driver_id)
+        if get_jwt().get('role') != 'driver' or driver is None or driver.username != get_jwt_identity():
+            return jsonify({'error': 'Only the driver of the trip can cancel it'}), 403
+
+        trip = materialise(schedule, day, schedule_zone())
+        if trip.status != 'open':
+            db.session.rollback()
+            return jsonify({'error': f'Trip is {trip.status}'}), 409
+        _cancel(trip)
+        db.session.commit()
+        return jsonify({'trip': trip.to_dict(with_origin=True)}), 200
+    except InvalidSchedule as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/match", methods=["POST"])
+@jwt_required()
+def match_trips():
+    """
+    Open trips to a school that can pick a passenger up, smallest detour first.
+
+    Body: {"school_id": 1, "pickup": {"lat": .., "lon": ..}} plus optional
+    "max_detour_km" (default MATCH_MAX_DETOUR_KM), "limit" (default
+    MATCH_LIMIT) and "departure"/"arrival" windows {"from": .., "until": ..}:
+    only trips whose windows overlap them match. The drivers' origins are
+    not disclosed.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        pickup = locate(data.get('pickup'))
+        windows = _windows(data)
+        school = _school(data)
+        if school is None:
+            return jsonify({'error': 'School not found'}), 404
+        max_detour = data.get('max_detour_km', current_app.config['MATCH_MAX_DETOUR_KM'])
+        limit = data.get('limit', current_app.config['MATCH_LIMIT'])
+        if not isinstance(max_detour, (int, float)) or max_detour <= 0:
+            return jsonify({'error': 'max_detour_km must be a positive number'}), 400
+        if not isinstance(limit, int) or not 1 <= limit <= current_app.config['MATCH_LIMIT']:
+            return jsonify({'error': f"limit must be between 1 and {current_app.config['MATCH_LIMIT']}"}), 400
+
+        matches = get_trip_matcher().match(school.id, pickup, max_detour, limit, windows)
+        drivers = dict(db.session.execute(
+            select(Trip.code, Driver.username)
+            .join(Driver, Driver.id == Trip.driver_id)
+            .where(Trip.code.in_([code for _, code in matches]))
+        ).all())
+        return jsonify({'trips': [
+            {'code': code, 'driver': drivers.get(code), 'detour_km': round(detour, 3)}
+            for detour, code in matches
+        ]}), 200
+    except (InvalidLocation, InvalidWindow) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/quote", methods=["POST"])
+@jwt_required()
+def quote_trips():
+    """
+    Fares and ETAs of the open trips that can pick a passenger up, best score first.
+
+    Same body as /trips/match. Each quote has the trip code, the driver and
+    their rating, the fare (priceperkm times the distance_km from the pickup
+    to the school), the minutes from the trip's start to the pickup and to
+    the school, and a score in [0, 1] weighing rating against price.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        pickup = locate(data.get('pickup'))
+        windows = _windows(data)
+        school = _school(data)
+        if school is None:
+            return jsonify({'error': 'School not found'}), 404
+        if school.latitude is None or school.longitude is None:
+            return jsonify({'error': 'School address has no coordinates yet'}), 409
+        max_detour = data.get('max_detour_km', current_app.config['MATCH_MAX_DETOUR_KM'])
+        limit = data.get('limit', current_app.config['MATCH_LIMIT'])
+        if not isinstance(max_detour, (int, float)) or max_detour <= 0:
+            return jsonify({'error': 'max_detour_km must be a positive number'}), 400
+        if not isinstance(limit, int) or not 1 <= limit <= current_app.config['MATCH_LIMIT']:
+            return jsonify({'error': f"limit must be between 1 and {current_app.config['MATCH_LIMIT']}"}), 400
+
+        ride_km, quotes = quote(school.id, (school.latitude, school.longitude), pickup, max_detour, limit, windows)
+        return jsonify({'distance_km': round(ride_km, 3), 'quotes': quotes}), 200
+    except (InvalidLocation, InvalidWindow) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/requests", methods=["POST"])
+@jwt_required()
+def create_trip_request():
+    """
+    Ask for a seat to a school: {"school_id": 1, "pickup": {"lat": .., "lon": ..}}
+    plus optional "pickup_point" (address), "handicap" (needs an
+    accessible seat) and "departure"/"arrival" windows {"from": .., "until": ..}
+    (only trips whose windows overlap them are offered). Without "pickup"
+    the coordinates of "pickup_point" come from the offline gazetteer.
+    Requests stay 'pending' until `flask allocate-seats` assigns them to a
+    trip that has not left yet.
+
+    With "occurrence": {"schedule_id": 1, "date": "2026-10-19"} the request
+    books that day of a recurring trip instead (school_id is then the
+    schedule's): the day is materialised and the request assigned at once,
+    or 409 if the trip is full or cancelled or the passenger already has a
+    seat on it. The day must not be past in SCHEDULE_TIMEZONE and the
+    windows, if any, must overlap the trip's.
+    """
+    try:
+        if get_jwt().get('role') != 'passenger':
+            return jsonify({'error': 'Only passengers can request seats'}), 403
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        pickup_point = data.get('pickup_point')
+        pickup = locate(data['pickup'] if 'pickup' in data else pickup_point)
+        windows = _windows(data)
+        schedule = day = None
+        if data.get('occurrence') is not None:
+            occurrence = data['occurrence']
+            if not isinstance(occurrence, dict) or not isinstance(occurrence.get('schedule_id'), int):
+                raise InvalidSchedule('occurrence must be {"schedule_id": <id>, "date": "YYYY-MM-DD"}')
+            day = parse_date(occurrence.get('date'))
+            if day < datetime.now(schedule_zone()).date():
+                raise InvalidSchedule(f'{day.isoformat()} is in the past')
+            schedule = db.session.get(TripSchedule, occurrence['schedule_id'])
+            if schedule is None:
+                return jsonify({'error': 'Schedule not found'}), 404
+            data = {**data, 'school_id': schedule.school_id}
+        school = _school(data)
+        if school is None:
+            return jsonify({'error': 'School not found'}), 404
+        handicap = data.get('handicap', False)
+        if not isinstance(handicap, bool):
+            return jsonify({'error': 'handicap must be true or false'}), 400
+        passenger = db.session.execute(
+            select(Passenger).filter_by(username=get_jwt_identity())
+        ).scalar_one_or_none()
+        if passenger is None:
+            return jsonify({'error': 'Passenger not found in the database'}), 409
+
+        trip_request = TripRequest(
+            passenger_id=passenger.id, school_id=school.id, pickup_point=pickup_point,
+            pickup_lat=pickup[0], pickup_lon=pickup[1], handicap=handicap,
+        )
+        for kind, (start, end) in windows.items():
+            setattr(trip_request, f'{kind}_from', start)
+            setattr(trip_request, f'{kind}_until', end)
+        if schedule is not None:
+            trip = materialise(schedule, day, schedule_zone())
+            if not windows_fit(windows_of(trip), windows):
+                raise InvalidWindow('The trip of that day does not run within the requested windows')
+            if not reserve_seat(trip, handicap):
+                db.session.rollback()
+                return jsonify({'error': 'No seat left on this trip'}), 409
+            # After reserve_seat, which holds the trip row: two posts of the
+            # same passenger cannot both get past this check
+            booked = db.session.execute(
+                select(TripRequest.id).filter_by(passenger_id=passenger.id, trip_code=trip.code, status='assigned')
+            ).first()
+            if booked is not None:
+                db.session.rollback()
+                return jsonify({'error': 'You already have a seat on this trip'}), 409
+            trip_request.trip_code = trip.code
+            trip_request.status = 'assigned'
+        db.session.add(trip_request)
+        db.session.commit()
+        return jsonify({'request': trip_request.to_dict()}), 201
+    except (InvalidLocation, InvalidSchedule, InvalidWindow) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@trips_bp.route("/trips/requests/<int:request_id>", methods=["GET"])
+@jwt_required()
+def get_trip_request(request_id):
+    """A request of the logged-in passenger, with its trip once assigned."""
+    try:
+        trip_request = db.session.execute(
+            select(TripRequest)
+            .join(Passenger, Passenger.id == TripRequest.passenger_id)
+            .where(TripRequest.id == request_id, Passenger.username == get_jwt_identity())
+        ).scalar_one_or_none()
+        if trip_request is None:
+            return jsonify({'error': 'Request not found'}), 404
+        return jsonify({'request': trip_request.to_dict()}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
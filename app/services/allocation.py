@@ -0,0 +1,313 @@
+"""
+Batch seat allocation: pending trip requests to open trips.
+
+Run once over all the pending requests of a time window (``flask
+allocate-seats``), not request by request. A trip offers the passenger
+seats of its vehicle (``seats_number`` minus the driver), of which
+``handicap_seats`` are accessible; seats already assigned by earlier runs
+are subtracted. Trips whose departure or arrival window is over, or
+occurrences of a past day, are left out; a request with a departure or
+arrival window only gets a trip with an overlapping window of that kind,
+as in ``/api/trips/match``.
+
+:class:`SeatAllocator` is a capacity-aware greedy assignment on the detour
+of :mod:`.matching`: every request asks the :class:`TripIndex` for its
+``candidates`` cheapest trips, all the (detour, request, trip) pairs are
+sorted and taken in order while the trip has room. Full trips leave the
+index and the requests that lost their candidates ask again, until a
+round assigns nothing. Requests needing an accessible seat are served
+first, from the trips that still have one. Detours are computed per
+passenger on the driver's straight route, not for the whole stop list.
+"""
+
+import heapq
+import math
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import Integer, cast, func, or_, select, update
+
+from .. import db
+from ..models import School, Trip, TripRequest, Vehicle
+from .matching import KM_PER_DEGREE, TripIndex
+from .recurrence import schedule_zone
+from .schedule import windows_fit, windows_of
+
+# ``windows``: {kind: (start, end)} the trip's windows must overlap, or None
+Request = namedtuple('Request', 'id school_id pickup handicap windows', defaults=(None,))
+
+
+def passenger_seats(seats_number, handicap_seats):
+    """``(seats, accessible seats)`` a vehicle offers to passengers."""
+    seats = max((seats_number or 0) - 1, 0)
+    return seats, min(max(handicap_seats or 0, 0), seats)
+
+
+class SeatAllocator:
+    """Assigns requests to the trips added with :meth:`add_trip`.
+
+    The :class:`TripIndex` is queried once per block of nearby pending
+    requests, and detours are computed on a plane tangent at each school
+    (``km_x = lon * cos(school lat)``): at the scale of a school's
+    catchment area this differs from the great-circle detour by less than
+    a metre, at a fraction of the cost.
+    """
+
+    # Requests are grouped in blocks of about BLOCK_KM x BLOCK_KM, each
+    # asking the index once
+    BLOCK_KM = 4.0
+
+    def __init__(self, cell_km=1.0, candidates=8):
+        self.cell_km = cell_km
+        self.candidates = candidates
+        self.span = max(1, round(self.BLOCK_KM / cell_km))
+        # code -> (school_id, origin, school point)
+        self._trips = {}
+        # code -> (x, y, length) of the origin around the school, in km
+        self._planar = {}
+        # school_id -> (lat, lon, km per degree of longitude)
+        self._schools = {}
+        # code -> [free seats, free accessible seats]
+        self._free = {}
+        # code -> {kind: (start, end)} of the trips with windows
+        self._windows = {}
+        self._offered = 0
+        self.rounds = 0
+
+    def _project(self, school_id, point):
+        lat, lon, km_per_lon = self._schools[school_id]
+        return (point[1] - lon) * km_per_lon, (point[0] - lat) * KM_PER_DEGREE
+
+    def add_trip(self, code, school_id, origin, school, seats, accessible=0, windows=None):
+        """Offer ``seats`` free seats (``accessible`` of them accessible) on trip ``code``,
+        leaving and arriving within ``windows`` ({kind: (start, end)}) if given."""
+        if windows:
+            self._windows[code] = windows
+        if school_id not in self._schools:
+            self._schools[school_id] = (
+                school[0], school[1], KM_PER_DEGREE * math.cos(math.radians(school[0])))
+        x, y = self._project(school_id, origin)
+        self._trips[code] = (school_id, origin, school)
+        self._planar[code] = (x, y, math.hypot(x, y))
+        self._free[code] = [seats, min(accessible, seats)]
+        self._offered += seats
+
+    def _index(self, handicap):
+        index = TripIndex(self.cell_km)
+        for code, (school_id, origin, school) in self._trips.items():
+            if self._has_room(code, handicap):
+                index.add(code, school_id, origin, school)
+        return index
+
+    def _fits(self, code, windows):
+        """Whether the trip has a window of every kind in ``windows``, overlapping it."""
+        return windows_fit(self._windows.get(code, {}), windows)
+
+    def _has_room(self, code, handicap):
+        seats, accessible = self._free[code]
+        return seats > 0 and (accessible > 0 or not handicap)
+
+    def _take(self, code, handicap):
+        free = self._free[code]
+        free[0] -= 1
+        if handicap:
+            free[1] -= 1
+        # The last seats left may be the accessible ones
+        free[1] = min(free[1], free[0])
+
+    def _pairs(self, index, pending, max_detour_km):
+        """``([(detour, request id, code)], requests with a candidate)`` for one round."""
+        span = self.span
+        blocks = {}
+        for request in pending:
+            if request.school_id in self._schools:
+                x, y = index.cell(*request.pickup)
+                blocks.setdefault((request.school_id, x // span, y // span), []).append(request)
+        pairs = []
+        asking = []
+        planar = self._planar
+        for (school_id, bx, by), requests in blocks.items():
+            codes = index.cell_candidates(school_id, (bx * span, by * span), max_detour_km, span)
+            trips = [(code, *planar[code]) for code in codes]
+            if not trips:
+                continue
+            for request in requests:
+                px, py = self._project(school_id, request.pickup)
+                to_school = math.hypot(px, py)
+                found = [
+                    (detour, code)
+                    for detour, code in (
+                        (math.hypot(px - x, py - y) + to_school - length, code)
+                        for code, x, y, length in trips
+                    )
+                    if detour <= max_detour_km and (not request.windows or self._fits(code, request.windows))
+                ]
+                if found:
+                    asking.append(request)
+                    pairs.extend((max(detour, 0.0), request.id, code)
+                                 for detour, code in heapq.nsmallest(self.candidates, found))
+        return pairs, asking
+
+    def allocate(self, requests, max_detour_km):
+        """``{request id: (trip code, detour km)}`` for the ``requests`` that get a seat."""
+        assigned = {}
+        for handicap in (True, False):
+            pending = [request for request in requests if bool(request.handicap) == handicap]
+            index = self._index(handicap)
+            while pending:
+                self.rounds += 1
+                pairs, asking = self._pairs(index, pending, max_detour_km)
+                pairs.sort()
+                for detour, request_id, code in pairs:
+                    if request_id in assigned or not self._has_room(code, handicap):
+                        continue
+                    assigned[request_id] = (code, detour)
+                    self._take(code, handicap)
+                    if not self._has_room(code, handicap):
+                        index.remove(code)
+                # The cheapest pair is always taken: every round makes progress
+                pending = [request for request in asking if request.id not in assigned]
+        return assigned
+
+    def stats(self):
+        free = sum(seats for seats, _ in self._free.values())
+        return {
+            'trips': len(self._trips),
+            'seats': self._offered,
+            'seats_used': self._offered - free,
+            'utilisation': (self._offered - free) / self._offered if self._offered else 0.0,
+            'rounds': self.rounds,
+        }
+
+
+def _trip_seats():
+    """``{trip code: (seats, accessible)}`` of the open trips, before assignments."""
+    by_plate = {}
+    by_driver = {}
+    for driver_id, plate, seats_number, handicap_seats in db.session.execute(
+        select(Vehicle.driver_id, Vehicle.licence_plate, Vehicle.seats_number, Vehicle.handicap_seats)
+    ):
+        seats = passenger_seats(seats_number, handicap_seats)
+        by_plate[plate] = seats
+        by_driver[driver_id] = max(by_driver.get(driver_id, (0, 0)), seats)
+    capacity = {}
+    for code, driver_id, plate in db.session.execute(
+        select(Trip.code, Trip.driver_id, Trip.licence_plate).where(Trip.status == 'open')
+    ):
+        capacity[code] = by_plate.get(plate) if plate else by_driver.get(driver_id, (0, 0))
+    return capacity
+
+
+def free_seats(trip):
+    """``(seats, accessible)`` still free on one trip, as the allocation counts them."""
+    vehicles = select(Vehicle.seats_number, Vehicle.handicap_seats)
+    if trip.licence_plate:
+        vehicles = vehicles.where(Vehicle.licence_plate == trip.licence_plate)
+    else:
+        vehicles = vehicles.where(Vehicle.driver_id == trip.driver_id)
+    seats, accessible = max((passenger_seats(*row) for row in db.session.execute(vehicles)), default=(0, 0))
+    count, handicap = db.session.execute(
+        select(func.count(TripRequest.id), func.sum(cast(TripRequest.handicap, Integer)))
+        .where(TripRequest.trip_code == trip.code, TripRequest.status == 'assigned')
+    ).one()
+    seats -= count
+    return seats, max(min(accessible - (handicap or 0), seats), 0)
+
+
+def reserve_seat(trip, handicap=False):
+    """Whether one more passenger (``handicap``: on an accessible seat) fits on ``trip``.
+
+    First a conditional no-op ``UPDATE`` of the trip row: it checks the trip
+    is still open and holds the row (the database on SQLite) until the
+    caller's commit, so two concurrent bookings count the seats one after
+    the other and cannot both take the last one.
+    """
+    locked = db.session.execute(
+        update(Trip).where(Trip.code == trip.code, Trip.status == 'open')
+        # Leaves updated_at alone: nothing the matcher has to reload
+        .values(status='open', updated_at=Trip.updated_at)
+    ).rowcount
+    if not locked:
+        return False
+    seats, accessible = free_seats(trip)
+    return seats > 0 and (not handicap or accessible > 0)
+
+
+def allocate_pending(since=None, until=None, max_detour_km=5.0, cell_km=1.0, candidates=8, now=None):
+    """Assign the pending requests created in ``[since, until)`` and write the result back.
+
+    Only trips still to come at ``now`` (UTC, default the current time) are
+    offered. Returns the :meth:`SeatAllocator.stats` plus the number of
+    requests, of assignments and the seconds spent loading, solving and
+    writing.
+    """
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    today = now.replace(tzinfo=timezone.utc).astimezone(schedule_zone()).date()
+    allocator = SeatAllocator(cell_km, candidates)
+    taken = {
+        code: (count, handicap or 0)
+        for code, count, handicap in db.session.execute(
+            select(TripRequest.trip_code, func.count(TripRequest.id),
+                   func.sum(cast(TripRequest.handicap, Integer)))
+            .where(TripRequest.status == 'assigned')
+            .group_by(TripRequest.trip_code)
+        )
+    }
+    capacity = _trip_seats()
+    for row in db.session.execute(
+        select(Trip.code, Trip.school_id, Trip.origin_lat, Trip.origin_lon, School.latitude, School.longitude,
+               Trip.departure_from, Trip.departure_until, Trip.arrival_from, Trip.arrival_until)
+        .join(School, School.id == Trip.school_id)
+        .where(Trip.status == 'open', School.latitude.is_not(None), School.longitude.is_not(None),
+               # Not left nor arrived yet
+               or_(Trip.departure_until.is_(None), Trip.departure_until >= now),
+               or_(Trip.arrival_until.is_(None), Trip.arrival_until >= now),
+               or_(Trip.occurs_on.is_(None), Trip.occurs_on >= today))
+    ):
+        seats, accessible = capacity.get(row.code) or (0, 0)
+        count, handicap = taken.get(row.code, (0, 0))
+        seats -= count
+        accessible = min(accessible - handicap, seats)
+        if seats > 0:
+            allocator.add_trip(row.code, row.school_id, (row.origin_lat, row.origin_lon),
+                               (row.latitude, row.longitude), seats, max(accessible, 0), windows_of(row))
+
+    query = (
+        select(TripRequest.id, TripRequest.school_id, TripRequest.pickup_lat, TripRequest.pickup_lon,
+               TripRequest.handicap, TripRequest.departure_from, TripRequest.departure_until,
+               TripRequest.arrival_from, TripRequest.arrival_until)
+        .where(TripRequest.status == 'pending',
+               TripRequest.pickup_lat.is_not(None), TripRequest.pickup_lon.is_not(None))
+    )
+    if since is not None:
+        query = query.where(TripRequest.created_at >= since)
+    if until is not None:
+        query = query.where(TripRequest.created_at < until)
+    requests = [
+        Request(row.id, row.school_id, (row.pickup_lat, row.pickup_lon), row.handicap, windows_of(row) or None)
+        for row in db.session.execute(query)
+    ]
+    loaded = time.perf_counter()
+
+    assigned = allocator.allocate(requests, max_detour_km)
+    solved = time.perf_counter()
+
+    # One executemany UPDATE by primary key for the whole batch
+    if assigned:
+        db.session.execute(update(TripRequest), [
+            {'id': request_id, 'trip_code': code, 'status': 'assigned'}
+            for request_id, (code, _) in assigned.items()
+        ])
+    db.session.commit()
+    written = time.perf_counter()
+
+    return {
+        **allocator.stats(),
+        'requests': len(requests),
+        'assigned': len(assigned),
+        'load_seconds': loaded - started,
+        'solve_seconds': solved - loaded,
+        'write_seconds': written - solved,
+    }
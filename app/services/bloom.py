@@ -0,0 +1,45 @@
+"""
+Bloom filter used to answer "definitely not registered" without an index lookup.
+"""
+
+import hashlib
+import math
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings.
+
+    Sized for ``capacity`` items at a false-positive rate of ``fp_rate``;
+    past ``capacity`` the rate degrades (see :meth:`estimated_fp_rate`).
+    """
+
+    def __init__(self, capacity, fp_rate, bits=None, count=0):
+        self.capacity = max(1, int(capacity))
+        self.fp_rate = fp_rate
+        self.size = max(8, math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        nbytes = (self.size + 7) // 8
+        if bits is not None and len(bits) != nbytes:
+            raise ValueError('Bloom filter bits do not match its parameters')
+        self.bits = bytearray(bits) if bits is not None else bytearray(nbytes)
+        self.count = count
+
+    def _positions(self, item):
+        # Double hashing (Kirsch-Mitzenmacher): k positions from one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    def estimated_fp_rate(self):
+        """False-positive rate expected with the items added so far."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
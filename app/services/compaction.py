@@ -0,0 +1,109 @@
+"""
+Compaction of the append-only JSON-Lines files.
+
+Updates append a new version of a record and deletions append a tombstone,
+so the files only grow. :func:`compact_file` rewrites a file down to the
+latest live version of every record (dropping superseded lines, tombstones
+and lines that do not parse) and swaps it in with an atomic rename under
+the writer lock. The sidecar index and the Bloom filter of this process are
+rebuilt straight away; other workers notice the new inode on their next
+access and rebuild theirs.
+
+:class:`Compactor` runs it periodically in the background for the files
+whose garbage ratio (bytes not belonging to a live record) is at least
+``USER_COMPACT_MIN_GARBAGE``.
+"""
+
+import logging
+import threading
+
+from .jsonl_writer import get_writer
+from .sharding import CLAIM_KEYS, claim_files, shard_files
+from .user_store import (
+    DELETED,
+    SCHOOL_KEYS,
+    USER_KEYS,
+    get_index,
+    refresh_file,
+    school_file,
+    users_lock_path,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def compact_file(path, keys=USER_KEYS, lock_path=None, min_garbage=0.0, fsync=True):
+    """Rewrite ``path`` keeping only the live records.
+
+    Skipped (returns None) when less than ``min_garbage`` of the file is
+    garbage; otherwise returns ``(bytes_before, bytes_after)``.
+    """
+    index = get_index(path, keys)
+    primary = keys[0]
+
+    def plan():
+        # Under the writer lock, so no append can land between here and the rename
+        live = index.live_rows(primary)
+        version = index.version()
+        if version is None or not version[1]:
+            return None
+        garbage = 1 - sum(live.values()) / version[1]
+        if garbage <= 0 or garbage < min_garbage:
+            return None
+        return lambda offset, record: offset in live and not record.get(DELETED)
+
+    result = get_writer(path, lock_path, fsync).rewrite(plan)
+    if result is not None:
+        refresh_file(path)
+    return result
+
+
+def compact_all(app, min_garbage=0.0):
+    """Compact the user (and email claim) files and the school file of ``app``; return ``{path: result}``."""
+    testing = bool(app.config.get('TESTING'))
+    fsync = app.config.get('USER_FILE_FSYNC', True)
+    results = {}
+    shards = app.config.get('USER_SHARDS', 1)
+    for shard, files in shard_files(testing, shards):
+        for path in files.values():
+            results[path] = compact_file(
+                path, USER_KEYS, users_lock_path(path, shard), min_garbage, fsync
+            )
+    for path in claim_files(testing, shards):
+        results[path] = compact_file(path, CLAIM_KEYS, min_garbage=min_garbage, fsync=fsync)
+    path = school_file(testing)
+    results[path] = compact_file(path, SCHOOL_KEYS, min_garbage=min_garbage, fsync=fsync)
+    return results
+
+
+class Compactor(threading.Thread):
+    """Compacts the files of ``app`` every ``interval`` seconds."""
+
+    def __init__(self, app, interval, min_garbage):
+        super().__init__(name='jsonl-compactor', daemon=True)
+        self.app = app
+        self.interval = interval
+        self.min_garbage = min_garbage
+        self.stop_event = threading.Event()
+        self._launch_lock = threading.Lock()
+        self._launched = False
+
+    def start_once(self):
+        """Start the thread unless it already was; cheap enough to run on every request."""
+        if not self._launched:
+            with self._launch_lock:
+                if not self._launched:
+                    self._launched = True
+                    self.start()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                for path, result in compact_all(self.app, self.min_garbage).items():
+                    if result is not None:
+                        logger.info('compacted %s: %d -> %d bytes', path, *result)
+            except Exception:
+                logger.exception('compaction failed')
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,440 @@
+"""
+Offline geocoding of school addresses and pickup points.
+
+Addresses are resolved against a local gazetteer, never an external
+service: a SQLite file (``GAZETTEER_PATH``) built by ``flask
+import-gazetteer`` from a street / house-number extract (for example the
+``addr:*`` nodes of an OpenStreetMap extract), one row per house number.
+
+:func:`normalise` turns free text such as ``"P.le Macrelli 100, 47521
+Cesena (FC)"`` into ``Address('piazzale macrelli', 100, '', 'cesena')``:
+lower case, no accents or punctuation, common abbreviations expanded,
+postcode and province dropped. A lookup takes the exact house number,
+else interpolates between the closest numbers on the same side of the
+street, else falls back to the middle of the street.
+
+:class:`Geocoder` puts two caches in front of it: a bounded in-memory LRU
+and a SQLite file
+(``GEOCODE_CACHE_PATH``) shared by the workers and kept across restarts,
+so a pickup point seen before costs a dictionary lookup (the LRU is keyed
+by the text as given, the file by the normalised address). Misses are
+cached too. Both are emptied when a new gazetteer is imported.
+"""
+
+import csv
+import gzip
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, namedtuple
+
+from flask import current_app
+from sqlalchemy import select
+
+from .. import db
+from ..models import School
+from .matching import InvalidLocation, parse_point
+from .metrics import register_metrics
+
+Address = namedtuple('Address', 'street number suffix city')
+# precision: 'address' (house number found), 'interpolated' or 'street'
+Location = namedtuple('Location', 'lat lon precision')
+
+ABBREVIATIONS = {
+    'v': 'via', 'v.': 'via',
+    'v.le': 'viale', 'vle': 'viale',
+    'p.za': 'piazza', 'p.zza': 'piazza', 'pza': 'piazza', 'pzza': 'piazza',
+    'p.le': 'piazzale', 'ple': 'piazzale',
+    'c.so': 'corso', 'cso': 'corso',
+    'l.go': 'largo', 'lgo': 'largo',
+    'str.': 'strada', 'str': 'strada',
+    'loc.': 'localita', 'loc': 'localita',
+    'fraz.': 'frazione', 'fraz': 'frazione',
+}
+# "n. 51", "n° 51", "civico 51" in front of the house number
+_NUMBER_WORDS = {'n', 'n.', 'n°', 'nr', 'nr.', 'num', 'civico'}
+_HOUSE_NUMBER = re.compile(r'^(\d+)\s*(?:/?\s*([a-z]|bis|ter))?$')
+_POSTCODE = re.compile(r'\b\d{5}\b')
+_PROVINCE = re.compile(r'\([a-z]{2}\)')
+_SPACES = re.compile(r'\s+')
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+_GAZETTEER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS address (
+    city TEXT NOT NULL,
+    street TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    suffix TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    PRIMARY KEY (city, street, number, suffix)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS address_street ON address (street);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+# A cache: losing the last entries in a crash only costs new lookups
+_CACHE_SCHEMA = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous = OFF;
+CREATE TABLE IF NOT EXISTS location (
+    query TEXT PRIMARY KEY,
+    lat REAL,
+    lon REAL,
+    precision TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def _plain(text):
+    """Lower case, accents stripped (``Forlì`` -> ``forli``), spaces collapsed."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _SPACES.sub(' ', text).strip()
+
+
+def normalise_street(text):
+    words = []
+    for position, word in enumerate(_plain(text).split(' ')):
+        if position == 0:
+            # Only the street type is abbreviated ("Corso Carlo V" keeps its V)
+            word = ABBREVIATIONS.get(word, word)
+        word = _PUNCTUATION.sub(' ', word).strip()
+        if word:
+            words.append(word)
+    return ' '.join(' '.join(words).split())
+
+
+def normalise_city(text):
+    text = _PROVINCE.sub(' ', _POSTCODE.sub(' ', _plain(text)))
+    return ' '.join(_PUNCTUATION.sub(' ', text).split())
+
+
+def parse_house_number(text):
+    """``'100'`` -> ``(100, '')``, ``'12/A'`` -> ``(12, 'a')``; None if not a house number."""
+    match = _HOUSE_NUMBER.match(_plain(text))
+    if match is None:
+        return None
+    return int(match.group(1)), match.group(2) or ''
+
+
+def normalise(text):
+    """Split a free-text address into a normalised :class:`Address`; None if empty."""
+    if not isinstance(text, str):
+        return None
+    parts = [part for part in (p.strip() for p in _plain(text).split(',')) if part]
+    if not parts:
+        return None
+    street, number, suffix, city = parts[0], None, '', ''
+    rest = parts[1:]
+    # The house number ends the first part ("via roma 1") or is a part of its own ("via roma, 1")
+    words = street.split(' ')
+    for size in (2, 1):
+        if len(words) > size and parse_house_number(' '.join(words[-size:])):
+            number, suffix = parse_house_number(' '.join(words[-size:]))
+            words = words[:-size]
+            break
+    if words and words[-1] in _NUMBER_WORDS:
+        words = words[:-1]
+    if number is None and rest and parse_house_number(rest[0].split(' ')[-1]):
+        number, suffix = parse_house_number(rest[0].split(' ')[-1])
+        rest = rest[1:]
+    if rest:
+        city = normalise_city(rest[-1])
+    street = normalise_street(' '.join(words))
+    if not street:
+        return None
+    return Address(street, number, suffix, city)
+
+
+def _key(address):
+    return f'{address.street}|{address.number if address.number is not None else ""}' \
+           f'|{address.suffix}|{address.city}'
+
+
+def _open(path, schema):
+    db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    db.executescript(schema)
+    return db
+
+
+def _read_rows(source):
+    """Rows of a gazetteer extract: CSV (``.csv``) or TSV, optionally gzipped."""
+    name = source[:-3] if source.endswith('.gz') else source
+    delimiter = ',' if name.endswith('.csv') else '\t'
+    opener = gzip.open if source.endswith('.gz') else open
+    with opener(source, 'rt', encoding='utf-8', newline='') as f:
+        yield from csv.DictReader(f, delimiter=delimiter)
+
+
+def import_gazetteer(source, path, batch_size=10000):
+    """Build the gazetteer at ``path`` from an extract with columns street, housenumber, city, lat, lon.
+
+    The new file replaces the old one atomically. Returns ``(imported, skipped)``.
+    """
+    tmp = path + '.import'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = _open(tmp, _GAZETTEER_SCHEMA)
+    imported = skipped = 0
+    rows = []
+    try:
+        db.execute('BEGIN')
+        for row in _read_rows(source):
+            try:
+                number, suffix = parse_house_number(row['housenumber'] or '') or (None, '')
+                lat, lon = parse_point({'lat': row['lat'], 'lon': row['lon']})
+            except (KeyError, InvalidLocation):
+                number = None
+            street = normalise_street(row.get('street') or '')
+            if number is None or not street:
+                skipped += 1
+                continue
+            rows.append((normalise_city(row.get('city') or ''), street, number, suffix, lat, lon))
+            if len(rows) >= batch_size:
+                db.executemany('INSERT OR REPLACE INTO address VALUES (?, ?, ?, ?, ?, ?)', rows)
+                imported += len(rows)
+                rows = []
+        db.executemany('INSERT OR REPLACE INTO address VALUES (?, ?, ?, ?, ?, ?)', rows)
+        imported += len(rows)
+        # Lets the caches notice a new gazetteer
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (f'{time.time_ns()}',))
+        db.execute('COMMIT')
+    finally:
+        db.close()
+    os.replace(tmp, path)
+    return imported, skipped
+
+
+class Gazetteer:
+    """Read side of a gazetteer file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        self.version = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+    def _city(self, address):
+        """The city to search: the given one, or the only city having the street."""
+        if address.city:
+            return address.city
+        cities = self._db.execute(
+            'SELECT DISTINCT city FROM address WHERE street = ? LIMIT 2', (address.street,)
+        ).fetchall()
+        return cities[0][0] if len(cities) == 1 else None
+
+    def lookup(self, address):
+        """:class:`Location` of a normalised :class:`Address`, or None."""
+        city = self._city(address)
+        if city is None:
+            return None
+        db = self._db
+        if address.number is None:
+            row = db.execute(
+                'SELECT AVG(lat), AVG(lon) FROM address WHERE city = ? AND street = ?',
+                (city, address.street),
+            ).fetchone()
+            return Location(row[0], row[1], 'street') if row[0] is not None else None
+
+        row = db.execute(
+            'SELECT lat, lon FROM address WHERE city = ? AND street = ? AND number = ? '
+            'ORDER BY suffix != ?, suffix LIMIT 1',
+            (city, address.street, address.number, address.suffix),
+        ).fetchone()
+        if row is not None:
+            return Location(row[0], row[1], 'address')
+
+        # Closest numbers below and above, on the same side of the street if possible
+        neighbours = []
+        for parity in (address.number % 2, None):
+            same_side = '' if parity is None else 'AND number % 2 = ? '
+            args = (city, address.street, address.number) + (() if parity is None else (parity,))
+            below = db.execute(
+                f'SELECT number, lat, lon FROM address WHERE city = ? AND street = ? AND number < ? '
+                f'{same_side}ORDER BY number DESC LIMIT 1', args,
+            ).fetchone()
+            above = db.execute(
+                f'SELECT number, lat, lon FROM address WHERE city = ? AND street = ? AND number > ? '
+                f'{same_side}ORDER BY number LIMIT 1', args,
+            ).fetchone()
+            neighbours = [row for row in (below, above) if row is not None]
+            if neighbours:
+                break
+        if not neighbours:
+            return None
+        if len(neighbours) == 1:
+            return Location(neighbours[0][1], neighbours[0][2], 'interpolated')
+        (n1, lat1, lon1), (n2, lat2, lon2) = neighbours
+        t = (address.number - n1) / (n2 - n1)
+        return Location(lat1 + (lat2 - lat1) * t, lon1 + (lon2 - lon1) * t, 'interpolated')
+
+
+class Geocoder:
+    """Gazetteer lookups behind an in-memory LRU and a persistent cache."""
+
+    def __init__(self, gazetteer_path, cache_path=None, cache_size=10000):
+        self.gazetteer_path = gazetteer_path
+        self.cache_path = cache_path
+        self.cache_size = cache_size
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._gazetteer = None
+        self._gazetteer_stat = None
+        self._cache = None
+        self._hits = 0
+        self._cache_hits = 0
+        self._lookups = 0
+        self._not_found = 0
+
+    def _current_gazetteer(self):
+        """The gazetteer, reopened after an import replaced the file. Call under the lock."""
+        try:
+            st = os.stat(self.gazetteer_path)
+        except OSError:
+            st = None
+        stat = (st.st_ino, st.st_mtime_ns) if st else None
+        if stat != self._gazetteer_stat:
+            if self._gazetteer is not None:
+                self._gazetteer.close()
+            self._gazetteer = None
+            self._gazetteer_stat = stat
+            if stat is not None:
+                try:
+                    self._gazetteer = Gazetteer(self.gazetteer_path)
+                except (sqlite3.Error, TypeError):
+                    self._gazetteer = None
+            self._lru.clear()
+            self._attach_cache()
+        return self._gazetteer
+
+    def _attach_cache(self):
+        """Open the persistent cache, emptied if built from another gazetteer."""
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+        if not self.cache_path or self._gazetteer is None:
+            return
+        try:
+            cache = _open(self.cache_path, _CACHE_SCHEMA)
+            row = cache.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != self._gazetteer.version:
+                cache.execute('BEGIN')
+                cache.execute('DELETE FROM location')
+                cache.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (self._gazetteer.version,))
+                cache.execute('COMMIT')
+            self._cache = cache
+        except sqlite3.Error:
+            # Read-only directory, corrupt file...: the LRU alone still works
+            self._cache = None
+
+    def _remember(self, key, location):
+        self._lru[key] = location
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.cache_size:
+            self._lru.popitem(last=False)
+
+    def geocode(self, text):
+        """:class:`Location` of a free-text address, or None if it cannot be resolved."""
+        if not isinstance(text, str):
+            return None
+        with self._lock:
+            gazetteer = self._current_gazetteer()
+            # The LRU is keyed by the text as given: a repeat skips normalising too
+            if text in self._lru:
+                self._hits += 1
+                self._lru.move_to_end(text)
+                return self._lru[text]
+            address = normalise(text)
+            if address is None:
+                return None
+            key = _key(address)
+            if gazetteer is None:
+                self._not_found += 1
+                return None
+
+            row = None
+            if self._cache is not None:
+                try:
+                    row = self._cache.execute(
+                        'SELECT lat, lon, precision FROM location WHERE query = ?', (key,)
+                    ).fetchone()
+                except sqlite3.Error:
+                    row = None
+            if row is not None:
+                self._cache_hits += 1
+                location = Location(*row) if row[2] is not None else None
+            else:
+                self._lookups += 1
+                location = gazetteer.lookup(address)
+                if self._cache is not None:
+                    try:
+                        self._cache.execute(
+                            'INSERT OR REPLACE INTO location VALUES (?, ?, ?, ?)',
+                            (key, *(location or (None, None, None))),
+                        )
+                    except sqlite3.Error:
+                        pass
+            if location is None:
+                self._not_found += 1
+            self._remember(text, location)
+            return location
+
+    def stats(self):
+        with self._lock:
+            return {
+                'gazetteer': self._gazetteer is not None,
+                'entries': len(self._lru),
+                'max_entries': self.cache_size,
+                'hits': self._hits,
+                'cache_hits': self._cache_hits,
+                'lookups': self._lookups,
+                'not_found': self._not_found,
+            }
+
+
+def locate(value):
+    """``(lat, lon)`` of ``{'lat': .., 'lon': ..}`` or of an address string; InvalidLocation otherwise."""
+    if isinstance(value, str):
+        location = get_geocoder().geocode(value)
+        if location is None:
+            raise InvalidLocation(f'Address not found: {value}')
+        return location.lat, location.lon
+    return parse_point(value)
+
+
+def geocode_schools():
+    """Set the coordinates of the database schools lacking them: ``(geocoded, [names not found])``."""
+    schools = db.session.execute(
+        select(School).where(School.latitude.is_(None) | School.longitude.is_(None))
+    ).scalars().all()
+    geocoder = get_geocoder()
+    missing = []
+    for school in schools:
+        location = geocoder.geocode(f'{school.address}, {school.city}' if school.city else school.address)
+        if location is None:
+            missing.append(school.name)
+        else:
+            school.latitude, school.longitude = location.lat, location.lon
+    db.session.commit()
+    return len(schools) - len(missing), missing
+
+
+def init_geocoder(app):
+    geocoder = Geocoder(
+        app.config.get('GAZETTEER_PATH', 'gazetteer.db'),
+        app.config.get('GEOCODE_CACHE_PATH', 'geocode_cache.db'),
+        app.config.get('GEOCODE_CACHE_SIZE', 10000),
+    )
+    app.extensions['geocoder'] = geocoder
+    register_metrics(app, 'geocoder', geocoder.stats)
+    return geocoder
+
+
+def get_geocoder():
+    return current_app.extensions['geocoder']
@@ -0,0 +1,209 @@
+"""
+Password hashing off the request thread.
+
+scrypt costs tens of milliseconds of CPU per call. All hashing goes through a
+dedicated thread pool (``hashlib.scrypt`` releases the GIL, so the pool
+really runs in parallel) with a bounded number of admission slots: at most
+``PASSWORD_HASH_WORKERS`` hashes run and ``PASSWORD_HASH_QUEUE_SIZE`` wait.
+When every slot is taken the request is rejected straight away with
+:class:`HashingBusy` (503 + Retry-After) instead of piling up behind a login
+spike and stalling the cheap endpoints.
+
+New hashes use ``PASSWORD_HASH_METHOD`` (werkzeug method string, e.g.
+``scrypt:32768:8:1``). Stored hashes made with other parameters are detected
+by :meth:`PasswordHasher.needs_rehash` so login can upgrade them in place;
+``flask calibrate-hash`` measures the host to pick parameters.
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, jsonify
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+from .metrics import register_metrics
+
+LATENCY_WINDOW = 1024
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__('Password hashing queue is full')
+        self.retry_after = retry_after
+
+
+def busy_response(error):
+    response = jsonify({'error': 'Server busy, please retry shortly'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
+def canonical_method(method):
+    """Spell out the parameters werkzeug fills in, e.g. 'scrypt' -> 'scrypt:32768:8:1'.
+
+    The result is the prefix (before the first '$') of hashes made with ``method``.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args + ['32768', '8', '1'][len(args):]
+        return f'scrypt:{n}:{r}:{p}'
+    if name == 'pbkdf2':
+        hash_name, iterations = args + ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)][len(args):]
+        return f'pbkdf2:{hash_name}:{iterations}'
+    return method
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class PasswordHasher:
+    """Bounded executor for password hashing and verification."""
+
+    def __init__(self, workers=None, queue_size=32, retry_after=1, method=DEFAULT_METHOD):
+        self.workers = workers or os.cpu_count() or 1
+        self.method = method
+        self._prefix = canonical_method(method)
+        self.queue_size = queue_size
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='password-hash'
+        )
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._waits = deque(maxlen=LATENCY_WINDOW)
+        # Made at startup, off the admission slots: built on the first unknown
+        # username it would make that login cost two hashes
+        self._dummy_hash = self._executor.submit(
+            generate_password_hash, secrets.token_urlsafe(16), self.method
+        )
+
+    def run(self, fn, *args):
+        """Run ``fn(*args)`` on the pool and wait for its result."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy(self.retry_after)
+        queued_at = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def task():
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return fn(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._waits.append(started - queued_at)
+                    self._latencies.append(finished - started)
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(task)
+        except BaseException:
+            with self._lock:
+                self._queued -= 1
+            self._slots.release()
+            raise
+        return future.result()
+
+    def generate(self, password):
+        return self.run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash, password):
+        return self.run(check_password_hash, pwhash, password)
+
+    def check_dummy(self, password):
+        """Verify ``password`` against a throwaway hash and return False.
+
+        Costs the same as :meth:`check` on a real user, so rejecting an
+        unknown username is not faster than rejecting a wrong password.
+        """
+        self.check(self._dummy_hash.result(), password)
+        return False
+
+    def needs_rehash(self, pwhash):
+        """True if ``pwhash`` was not made with the configured method and parameters."""
+        return pwhash.split('$', 1)[0] != self._prefix
+
+    def stats(self):
+        with self._lock:
+            latencies = list(self._latencies)
+            waits = list(self._waits)
+            stats = {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'queue_depth': self._queued,
+                'running': self._running,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+        for name, values in (('hash_ms', latencies), ('wait_ms', waits)):
+            for label, fraction in (('p50', 0.5), ('p95', 0.95)):
+                value = _percentile(values, fraction)
+                stats[f'{name}_{label}'] = None if value is None else round(value * 1000, 2)
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def calibrate(target_ms, r=8, p=1, min_log2_n=14, max_log2_n=17, samples=3):
+    """Time scrypt on this host for each N in the range.
+
+    Returns ``(timings, recommended)`` where ``timings`` lists
+    ``(method, median_ms)`` and ``recommended`` is the costliest method whose
+    median stays within ``target_ms`` (the cheapest one if none does).
+    """
+    timings = []
+    for log2_n in range(min_log2_n, max_log2_n + 1):
+        method = f'scrypt:{2 ** log2_n}:{r}:{p}'
+        runs = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            generate_password_hash('calibration-password', method)
+            runs.append((time.perf_counter() - started) * 1000)
+        timings.append((method, sorted(runs)[len(runs) // 2]))
+    within = [method for method, ms in timings if ms <= target_ms]
+    return timings, within[-1] if within else timings[0][0]
+
+
+def init_hashing(app):
+    hasher = PasswordHasher(
+        workers=app.config.get('PASSWORD_HASH_WORKERS'),
+        queue_size=app.config.get('PASSWORD_HASH_QUEUE_SIZE', 32),
+        retry_after=app.config.get('PASSWORD_HASH_RETRY_AFTER', 1),
+        method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+    )
+    app.extensions['password_hasher'] = hasher
+    register_metrics(app, 'password_hashing', hasher.stats)
+    return hasher
+
+
+def get_hasher():
+    return current_app.extensions['password_hasher']
@@ -0,0 +1,76 @@
+"""
+Index-free lookups in a JSON-Lines file.
+
+The file is memory-mapped and searched backwards for the bytes a
+``"key": value`` pair serialises to (the encoded value, then the key in
+front of it), so only candidate lines are decoded instead of running
+``json.loads`` on every line. The bytes are built with ``json.dumps``
+like the lines themselves, which takes care of quotes, backslashes,
+control characters and non-ASCII text; the variants older writers may
+have produced (no space after the colon, raw UTF-8 instead of
+``\\uXXXX`` escapes) are searched as well. Every candidate line is decoded
+(checksum included) and its top-level ``key`` compared, so a match inside
+a nested object or a corrupt line is skipped, never returned.
+
+:class:`user_store.JsonlIndex` falls back to :func:`find_last` when its
+SQLite sidecar cannot be used.
+"""
+
+import json
+import mmap
+import os
+
+from .jsonl_writer import decode_line
+
+
+def _patterns(key, value):
+    """``[(value bytes, key prefixes)]``: how ``"key": value`` can appear on a line."""
+    variants = {}
+    for ensure_ascii in (True, False):
+        name = json.dumps(key, ensure_ascii=ensure_ascii).encode('utf-8')
+        encoded = json.dumps(value, ensure_ascii=ensure_ascii).encode('utf-8')
+        variants.setdefault(encoded, set()).update((name + b': ', name + b':'))
+    return list(variants.items())
+
+
+def _last_match(data, end, encoded, prefixes, key, value):
+    """``(line start, record)`` of the last line before ``end`` holding the pair."""
+    while True:
+        hit = data.rfind(encoded, 0, end)
+        if hit < 0:
+            return -1, None
+        start = data.rfind(b'\n', 0, hit) + 1
+        if not any(data[max(hit - len(prefix), 0):hit] == prefix for prefix in prefixes):
+            # The value under another key: the pair may still be earlier on the line
+            end = hit
+            continue
+        record = decode_line(data[start:data.find(b'\n', hit) + 1])
+        if record is not None and record.get(key) == value:
+            return start, record
+        # Nested object, look-alike or corrupt line: keep looking before it
+        end = start
+
+
+def find_last(path, key, value):
+    """Return the last complete line's record whose ``key`` equals ``value``, or None.
+
+    Tombstones are returned like any other record; deciding what is live is
+    up to the caller. A final line without its newline (still being
+    written) is ignored.
+    """
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            end = data.rfind(b'\n') + 1
+            # One search per encoding of the value (just one for ASCII values)
+            _, record = max(
+                (_last_match(data, end, encoded, prefixes, key, value)
+                 for encoded, prefixes in _patterns(key, value)),
+                key=lambda match: match[0],
+            )
+            return record
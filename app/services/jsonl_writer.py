@@ -0,0 +1,340 @@
+"""
+The single append path for the JSON-Lines files.
+
+Lines carry a CRC32 of the record as their last member::
+
+    {"username": "mario", ..., "_crc": "5d0b1f3a"}
+
+so a reader can tell a complete record from one torn by a crash or
+overwritten by garbage; :func:`decode_line` drops lines whose checksum does
+not match and strips the field from the rest. Lines written before the
+checksum was introduced are still accepted.
+
+:class:`JsonlWriter` serialises writers across threads and processes with
+an ``flock`` on a lock file and groups concurrent appends: while one thread
+writes and fsyncs a batch, the records that arrive meanwhile queue up and go
+out together in the next single ``write`` + ``fsync``. Each record can
+carry a ``check`` callback run under the lock right before it is written,
+which is how uniqueness is enforced without a window between the check and
+the write. :meth:`JsonlWriter.repair` truncates a torn trailing record and
+runs at startup and before every batch; :meth:`JsonlWriter.rewrite` swaps
+the file for a compacted copy under the same lock.
+"""
+
+import json
+import os
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of this process are serialised
+    fcntl = None
+
+LOCK_SUFFIX = '.lock'
+REWRITE_SUFFIX = '.rewrite'
+
+_CRC_PREFIX = b', "_crc": "'
+# ', "_crc": "' + 8 hex digits + '"}'
+_CRC_TAIL = len(_CRC_PREFIX) + 8 + 2
+
+
+def encode_line(record):
+    """Serialise ``record`` as one checksummed line (bytes, newline included)."""
+    body = json.dumps(record).encode('utf-8')
+    if body == b'{}':
+        return b'{}\n'
+    return b'%s%s%08x"}\n' % (body[:-1], _CRC_PREFIX, zlib.crc32(body))
+
+
+def decode_line(line):
+    """Return the record stored on ``line`` or None if it is blank, invalid or corrupt."""
+    if isinstance(line, str):
+        line = line.encode('utf-8')
+    line = line.rstrip(b'\r\n')
+    if not line.strip():
+        return None
+    if line[-_CRC_TAIL:-10] == _CRC_PREFIX and line.endswith(b'"}'):
+        body = line[:-_CRC_TAIL] + b'}'
+        try:
+            if int(line[-10:-2], 16) != zlib.crc32(body):
+                return None
+        except ValueError:
+            return None
+        line = body
+    try:
+        record = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def _fsync_dir(path):
+    """Make a rename in ``path`` durable (not possible on Windows)."""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class FileLock:
+    """Exclusive lock shared by the threads of this process and other processes."""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if fcntl is not None:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+
+class _Pending:
+    __slots__ = ('record', 'check', 'done', 'error')
+
+    def __init__(self, record, check):
+        self.record = record
+        self.check = check
+        self.done = False
+        self.error = None
+
+
+class JsonlWriter:
+    """Appends checksummed records to one file under ``lock`` with group commit."""
+
+    def __init__(self, path, lock, fsync=True):
+        self.path = path
+        self.lock = lock
+        self.fsync = fsync
+        self._cond = threading.Condition()
+        self._pending = []
+        self._flushing = False
+        self._batches = 0
+        self._records = 0
+        self._rejected = 0
+        self._largest_batch = 0
+        self._repaired = 0
+
+    def append(self, record, check=None):
+        """Append ``record`` durably and return once it is on disk.
+
+        ``check(record, accepted)`` runs under the lock before the write;
+        ``accepted`` lists the records of the same batch that precede it. If
+        it raises, ``record`` is not written and the exception propagates.
+        """
+        item = _Pending(record, check)
+        with self._cond:
+            self._pending.append(item)
+            while not item.done and self._flushing:
+                self._cond.wait()
+            if item.done:
+                if item.error is not None:
+                    raise item.error
+                return
+            # Leader: write everything queued so far, ours included
+            self._flushing = True
+            batch, self._pending = self._pending, []
+        try:
+            self._commit(batch)
+        finally:
+            with self._cond:
+                for pending in batch:
+                    pending.done = True
+                self._flushing = False
+                self._cond.notify_all()
+        if item.error is not None:
+            raise item.error
+
+    def _commit(self, batch):
+        try:
+            with self.lock:
+                self._repair()
+                accepted = []
+                lines = []
+                for item in batch:
+                    if item.check is not None:
+                        try:
+                            item.check(item.record, accepted)
+                        except Exception as e:
+                            item.error = e
+                            self._rejected += 1
+                            continue
+                    accepted.append(item.record)
+                    lines.append(encode_line(item.record))
+                if lines:
+                    fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                    try:
+                        data = b''.join(lines)
+                        written = os.write(fd, data)
+                        while written < len(data):
+                            written += os.write(fd, data[written:])
+                        if self.fsync:
+                            os.fsync(fd)
+                    finally:
+                        os.close(fd)
+        except Exception as e:
+            for item in batch:
+                if item.error is None:
+                    item.error = e
+            return
+        with self._cond:
+            self._batches += 1
+            self._records += len(lines)
+            self._largest_batch = max(self._largest_batch, len(lines))
+
+    def _repair(self):
+        """Truncate a torn trailing record (cut short, or a bad checksum). Call under the lock."""
+        try:
+            f = open(self.path, 'r+b')
+        except FileNotFoundError:
+            return False
+        with f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return False
+            # The last record starts after the previous newline
+            end = size
+            block = 4096
+            while True:
+                start = max(0, end - block)
+                f.seek(start)
+                chunk = f.read(size - start)
+                cut = chunk.rfind(b'\n', 0, len(chunk) - 1)
+                if cut >= 0 or start == 0:
+                    break
+                end = start
+            last_start = start + cut + 1
+            last = chunk[cut + 1:]
+            valid = decode_line(last) is not None
+            if last.endswith(b'\n'):
+                if valid or _CRC_PREFIX not in last:
+                    return False
+                f.truncate(last_start)
+            elif valid:
+                # A whole record missing only its newline: complete it
+                f.write(b'\n')
+            else:
+                f.truncate(last_start)
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._repaired += 1
+        return True
+
+    def rewrite(self, plan):
+        """Atomically replace the file with a subset of its records, under the lock.
+
+        ``plan()`` runs under the lock and returns ``keep(offset, record)``,
+        a predicate selecting the records to copy, or None to leave the file
+        alone. The copy is written next to the file, fsynced and renamed over
+        it. Returns ``(bytes_before, bytes_after)``, or None if skipped.
+        """
+        with self.lock:
+            self._repair()
+            keep = plan()
+            if keep is None or not os.path.exists(self.path):
+                return None
+            tmp = self.path + REWRITE_SUFFIX
+            offset = 0
+            with open(self.path, 'rb') as src, open(tmp, 'wb') as dst:
+                for line in src:
+                    record = decode_line(line)
+                    if record is not None and keep(offset, record):
+                        dst.write(encode_line(record))
+                    offset += len(line)
+                dst.flush()
+                if self.fsync:
+                    os.fsync(dst.fileno())
+                after = dst.tell()
+            os.replace(tmp, self.path)
+            if self.fsync:
+                _fsync_dir(os.path.dirname(os.path.abspath(self.path)))
+            return offset, after
+
+    def repair(self):
+        """Truncate a torn trailing record; True if the file was changed."""
+        if not os.path.exists(self.path):
+            # Nothing to repair: do not create the lock file for it
+            return False
+        with self.lock:
+            return self._repair()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'batches': self._batches,
+                'records': self._records,
+                'rejected': self._rejected,
+                'largest_batch': self._largest_batch,
+                'repaired': self._repaired,
+            }
+
+
+_writers = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def get_lock(path):
+    """Return the process-wide :class:`FileLock` for ``path``."""
+    path = os.path.abspath(path)
+    with _registry_lock:
+        lock = _locks.get(path)
+        if lock is None:
+            lock = _locks[path] = FileLock(path)
+        return lock
+
+
+def get_writer(path, lock_path=None, fsync=True):
+    """Return the process-wide :class:`JsonlWriter` for ``path``.
+
+    ``lock_path`` (default ``path + '.lock'``) must be the same for every
+    writer of a file; files sharing a lock are written one batch at a time.
+    """
+    path = os.path.abspath(path)
+    with _registry_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            lock_path = os.path.abspath(lock_path or path + LOCK_SUFFIX)
+            lock = _locks.get(lock_path)
+            if lock is None:
+                lock = _locks[lock_path] = FileLock(lock_path)
+            writer = _writers[path] = JsonlWriter(path, lock, fsync)
+        writer.fsync = fsync
+        return writer
+
+
+def writer_stats():
+    """Counters of the writers by file name: ``/api/metrics`` is public, paths stay private."""
+    with _registry_lock:
+        writers = dict(_writers)
+    stats = {}
+    for path, writer in writers.items():
+        name = os.path.basename(path)
+        counters = writer.stats()
+        if name in stats:
+            # The same name in another directory (a mirror): add them up
+            counters = {
+                key: max(value, counters[key]) if key == 'largest_batch' else value + counters[key]
+                for key, value in stats[name].items()
+            }
+        stats[name] = counters
+    return stats
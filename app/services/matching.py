@@ -0,0 +1,339 @@
+"""
+Matching passengers to open trips.
+
+A trip runs from the driver's origin straight to its school; picking a
+passenger up at P costs the detour ``d(O, P) + d(P, S) - d(O, S)``
+(great-circle distances). The points with a detour of at most ``D`` form
+an ellipse with foci O and S, which lies within
+``sqrt(D * (2L + D)) / 2`` of the segment O-S (``L`` its length), so only
+trips passing that close to the pickup point can match.
+
+:class:`TripIndex` keeps the open trips in a grid of
+``MATCH_CELL_KM`` cells, per school and per length class (lengths up to
+1, 2, 4, 8... cells, so the search radius fits the longest trip of each
+class, with cells twice as wide every third class): each trip is
+registered in every cell its segment crosses, and a
+query only looks at the cells around the pickup point, then computes the
+exact detour of the trips found there.
+:class:`TripMatcher` builds it from the database on first use and re-reads
+the trips changed since (by any worker), together with their time windows
+(:class:`schedule.TripWindows`), so a query can also ask for trips leaving
+or arriving within given times. ``updated_at`` is stamped by the clock of
+the writing process before its commit, so a trip committed after a sync can
+carry an earlier stamp: each sync re-reads the trips stamped from
+``MATCH_SYNC_MARGIN`` seconds before the previous one, and skips those whose
+stamp it has already applied. Only trips still to come are offered, as in
+:func:`allocation.allocate_pending`: a trip leaves the index once its
+departure or arrival window has closed or, for the trips of a schedule, its
+day is over in ``SCHEDULE_TIMEZONE``.
+"""
+
+import heapq
+import math
+import threading
+from datetime import datetime, time, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from .. import db
+from ..models import School, Trip
+from .metrics import register_metrics
+from .recurrence import schedule_zone
+from .schedule import TripWindows
+
+EARTH_RADIUS_KM = 6371.0088
+# Kilometres per degree of latitude
+KM_PER_DEGREE = 111.195
+
+
+class InvalidLocation(ValueError):
+    """Raised for coordinates out of range or missing."""
+
+
+def parse_point(value):
+    """``{'lat': .., 'lon': ..}`` -> ``(lat, lon)``; InvalidLocation if malformed."""
+    try:
+        lat, lon = float(value['lat']), float(value['lon'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidLocation('Location must be {"lat": <number>, "lon": <number>}')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise InvalidLocation('Location out of range')
+    return lat, lon
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points, in kilometres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def detour_km(origin, school, pickup):
+    """Extra kilometres a trip from ``origin`` to ``school`` drives to stop at ``pickup``."""
+    return (haversine_km(*origin, *pickup) + haversine_km(*pickup, *school)
+            - haversine_km(*origin, *school))
+
+
+class TripIndex:
+    """Grid index of trip segments, per school."""
+
+    def __init__(self, cell_km=1.0):
+        self.cell_km = cell_km
+        self.cell_deg = cell_km / KM_PER_DEGREE
+        # code -> (school_id, origin, school point)
+        self._trips = {}
+        # (school_id, length class, x, y) -> {code}
+        self._cells = {}
+        # school_id -> {length class: trips}
+        self._classes = {}
+        # code -> cells the trip is registered in
+        self._trip_cells = {}
+        self._queries = 0
+        self._candidates = 0
+
+    def __len__(self):
+        return len(self._trips)
+
+    def _cell(self, lat, lon, scale=1):
+        size = self.cell_deg * scale
+        return math.floor(lon / size), math.floor(lat / size)
+
+    @staticmethod
+    def _scale(length_class):
+        """Cells of longer trips are coarser, as their search radius is wider."""
+        return 2 ** (length_class // 3)
+
+    def _segment_cells(self, origin, school, scale=1):
+        """Cells touched by the segment: sampled every half cell, both ends included."""
+        steps = max(1, math.ceil(max(abs(school[0] - origin[0]), abs(school[1] - origin[1]))
+                                 / (self.cell_deg * scale / 2)))
+        cells = set()
+        for i in range(steps + 1):
+            t = i / steps
+            cells.add(self._cell(origin[0] + (school[0] - origin[0]) * t,
+                                 origin[1] + (school[1] - origin[1]) * t, scale))
+        return cells
+
+    def _length_class(self, length_km):
+        """Smallest ``k`` with ``length_km <= cell_km * 2**k``."""
+        return max(0, math.ceil(math.log2(max(length_km, 1e-9) / self.cell_km)))
+
+    def add(self, code, school_id, origin, school):
+        """Index (or re-index) trip ``code`` from ``origin`` to the ``school`` point."""
+        self.remove(code)
+        length_class = self._length_class(haversine_km(*origin, *school))
+        cells = [(school_id, length_class, x, y)
+                 for x, y in self._segment_cells(origin, school, self._scale(length_class))]
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(code)
+        classes = self._classes.setdefault(school_id, {})
+        classes[length_class] = classes.get(length_class, 0) + 1
+        self._trips[code] = (school_id, origin, school)
+        self._trip_cells[code] = cells
+
+    def remove(self, code):
+        cells = self._trip_cells.pop(code, None)
+        if cells is None:
+            return
+        for cell in cells:
+            codes = self._cells[cell]
+            codes.discard(code)
+            if not codes:
+                del self._cells[cell]
+        school_id, length_class = cells[0][:2]
+        classes = self._classes[school_id]
+        classes[length_class] -= 1
+        if not classes[length_class]:
+            del classes[length_class]
+            if not classes:
+                del self._classes[school_id]
+        del self._trips[code]
+
+    def cell(self, lat, lon):
+        """The grid cell ``(x, y)`` of a point."""
+        return self._cell(lat, lon)
+
+    def candidates(self, school_id, pickup, max_detour_km):
+        """Codes of the trips to ``school_id`` that may pick ``pickup`` up within ``max_detour_km``."""
+        return self.cell_candidates(school_id, self._cell(*pickup), max_detour_km)
+
+    def cell_candidates(self, school_id, cell, max_detour_km, span=1):
+        """Like :meth:`candidates`, for every point of the ``span`` x ``span`` cells from ``cell``."""
+        x, y = cell
+        # Cells are narrowest on the side farther from the equator
+        lat = max(abs(y), abs(y + span)) * self.cell_deg
+        cos_lat = max(math.cos(math.radians(min(lat, 90.0))), 0.01)
+        found = set()
+        cells = self._cells
+        for length_class in self._classes.get(school_id, ()):
+            length = self.cell_km * 2 ** length_class
+            radius = math.sqrt(max_detour_km * (2 * length + max_detour_km)) / 2
+            scale = self._scale(length_class)
+            size = self.cell_km * scale
+            # One extra ring: a segment is sampled, not traced exactly
+            dy = math.ceil(radius / size) + 1
+            dx = math.ceil(radius / (size * cos_lat)) + 1
+            # Floor division maps the base cell into the coarser grid
+            sx, sy = x // scale, y // scale
+            ex, ey = (x + span - 1) // scale, (y + span - 1) // scale
+            for cx in range(sx - dx, ex + dx + 1):
+                for cy in range(sy - dy, ey + dy + 1):
+                    codes = cells.get((school_id, length_class, cx, cy))
+                    if codes:
+                        found |= codes
+        return found
+
+    def match(self, school_id, pickup, max_detour_km, limit=20, allowed=None):
+        """``[(detour_km, code)]`` of the trips to ``school_id``, smallest detour first.
+
+        With ``allowed``, only the trips whose code is in it are considered.
+        """
+        codes = self.candidates(school_id, pickup, max_detour_km)
+        if allowed is not None:
+            codes = [code for code in codes if code in allowed]
+        self._queries += 1
+        self._candidates += len(codes)
+        matches = []
+        for code in codes:
+            _, origin, school = self._trips[code]
+            detour = detour_km(origin, school, pickup)
+            if detour <= max_detour_km:
+                matches.append((max(detour, 0.0), code))
+        matches.sort()
+        return matches[:limit]
+
+    def stats(self):
+        return {
+            'trips': len(self._trips),
+            'cells': len(self._cells),
+            'queries': self._queries,
+            'candidates_per_query': self._candidates / self._queries if self._queries else 0.0,
+        }
+
+
+def _window(start, end):
+    return (start, end) if start is not None and end is not None else None
+
+
+def _last_moment(row, zone):
+    """Last UTC time at which the trip is still to come, None if it has no end."""
+    ends = [end for end in (row.departure_until, row.arrival_until) if end is not None]
+    if row.occurs_on is not None:
+        midnight = datetime.combine(row.occurs_on + timedelta(days=1), time(), tzinfo=zone)
+        ends.append(midnight.astimezone(timezone.utc).replace(tzinfo=None) - timedelta(microseconds=1))
+    return min(ends, default=None)
+
+
+# Stamp of a trip not read yet (NULL is a valid stamp for pre-migration rows)
+_UNSEEN = object()
+
+
+class TripMatcher:
+    """The :class:`TripIndex` of one application, kept in step with the database.
+
+    Trips stamped (``updated_at``) since shortly before the last check are
+    re-read, so a new or closed trip costs one small query; the index is
+    reloaded from scratch when trips were deleted. Trips whose time is over
+    are dropped in order of their last moment, kept in a heap.
+    """
+
+    def __init__(self, cell_km=1.0, sync_margin=10.0):
+        self.cell_km = cell_km
+        self.sync_margin = timedelta(seconds=sync_margin)
+        self.index = TripIndex(cell_km)
+        self.windows = TripWindows()
+        self._synced = None
+        # code -> updated_at of the version indexed
+        self._known = {}
+        # code -> last moment of the indexed trips that have one, the same as a heap
+        self._ends = {}
+        self._ending = []
+        self._reloads = 0
+        self._lock = threading.Lock()
+
+    def _load(self, now, since=None):
+        query = (
+            select(Trip.code, Trip.updated_at, Trip.status, Trip.school_id, Trip.origin_lat,
+                   Trip.origin_lon, School.latitude, School.longitude, Trip.departure_from,
+                   Trip.departure_until, Trip.arrival_from, Trip.arrival_until, Trip.occurs_on)
+            .join(School, School.id == Trip.school_id, isouter=True)
+        )
+        if since is not None:
+            query = query.where(Trip.updated_at >= since)
+        zone = schedule_zone()
+        for row in db.session.execute(query):
+            if self._known.get(row.code, _UNSEEN) == row.updated_at:
+                # Re-read within the margin, unchanged
+                continue
+            self._known[row.code] = row.updated_at
+            last = _last_moment(row, zone)
+            self._ends.pop(row.code, None)
+            if (row.status == 'open' and row.latitude is not None and row.longitude is not None
+                    and (last is None or last >= now)):
+                if last is not None:
+                    self._ends[row.code] = last
+                    heapq.heappush(self._ending, (last, row.code))
+                self.index.add(row.code, row.school_id, (row.origin_lat, row.origin_lon),
+                               (row.latitude, row.longitude))
+                self.windows.add(row.code, row.school_id, {
+                    'departure': _window(row.departure_from, row.departure_until),
+                    'arrival': _window(row.arrival_from, row.arrival_until),
+                })
+            else:
+                self.index.remove(row.code)
+                self.windows.remove(row.code)
+
+    def _expire(self, now):
+        """Drop the trips whose last moment is before ``now``. Call under the lock."""
+        ending = self._ending
+        while ending and ending[0][0] < now:
+            last, code = heapq.heappop(ending)
+            # Entries of trips since changed or closed are stale
+            if self._ends.get(code) == last:
+                del self._ends[code]
+                self.index.remove(code)
+                self.windows.remove(code)
+
+    def _sync(self, now):
+        """Bring the index up to date. Call under the lock."""
+        started = datetime.utcnow()
+        count = db.session.execute(select(func.count(Trip.code))).scalar_one()
+        if self._synced is not None:
+            self._load(now, since=self._synced - self.sync_margin)
+        if self._synced is None or len(self._known) != count:
+            # First use, or trips were deleted: start over
+            self.index = TripIndex(self.cell_km)
+            self.windows = TripWindows()
+            self._known = {}
+            self._ends = {}
+            self._ending = []
+            self._reloads += 1
+            self._load(now)
+        self._expire(now)
+        self._synced = started
+
+    def match(self, school_id, pickup, max_detour_km, limit=20, windows=None, now=None):
+        """Like :meth:`TripIndex.match`; ``windows`` maps ``'departure'`` and/or
+        ``'arrival'`` to ``(start, end)`` the trip's window must overlap. Only
+        trips still to come at ``now`` (UTC, default the current time) match."""
+        with self._lock:
+            self._sync(now or datetime.utcnow())
+            allowed = self.windows.overlapping(school_id, windows) if windows else None
+            return self.index.match(school_id, pickup, max_detour_km, limit, allowed)
+
+    def stats(self):
+        with self._lock:
+            return {**self.index.stats(), 'scheduled': len(self.windows), 'reloads': self._reloads}
+
+
+def init_trip_matcher(app):
+    matcher = TripMatcher(app.config.get('MATCH_CELL_KM', 1.0), app.config.get('MATCH_SYNC_MARGIN', 10.0))
+    app.extensions['trip_matcher'] = matcher
+    register_metrics(app, 'trip_index', matcher.stats)
+    return matcher
+
+
+def get_trip_matcher():
+    return current_app.extensions['trip_matcher']
@@ -0,0 +1,18 @@
+"""
+Tiny registry of metric providers exposed on ``GET /api/metrics``.
+
+Services register a callable returning a JSON-serialisable dict; the
+endpoint calls every provider on each request, so values are always live.
+It needs no login, so providers return counters only: files are named by
+their base name, never by path.
+"""
+
+from flask import current_app
+
+
+def register_metrics(app, name, provider):
+    app.extensions.setdefault('metrics', {})[name] = provider
+
+
+def collect_metrics():
+    return {name: provider() for name, provider in current_app.extensions.get('metrics', {}).items()}
@@ -0,0 +1,305 @@
+"""
+Online migration of drivers and passengers from the JSON-Lines files to the
+database.
+
+With ``USER_STORE_BACKEND = 'dual'`` every registration is written to both
+stores, the JSON files staying authoritative. The backfill copies the
+historical lines in batches, checkpointing the byte offset reached in each
+file (with the file's inode, since compaction swaps in a new file whose
+offsets mean other records) after every committed batch so it can be
+stopped and resumed at will.
+Once :func:`check_parity` reports no differences ``USER_READS_FROM_DB`` can be
+switched on to serve logins and the user list from the database.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from .. import db
+from ..models import School
+from .sharding import shard_files
+from .sql_store import MODELS, SqlUserStore, _latest_by, _read_records, bump_user_version
+from .user_store import DELETED, ROLES, UserExists, _parse_line, user_files
+
+
+class DualWriteUserStore:
+    """Writes go to the JSON files and the database, reads to one of them."""
+
+    def __init__(self, jsonl_store, sql_store, read_from_db=False):
+        self.jsonl = jsonl_store
+        self.sql = sql_store
+        self.reader = sql_store if read_from_db else jsonl_store
+
+    def find_by_username(self, username):
+        return self.reader.find_by_username(username)
+
+    def exists(self, username=None, email=None):
+        # Until the backfill is complete only the JSON files know every user
+        return self.jsonl.exists(username=username, email=email)
+
+    def add(self, role, record):
+        self.jsonl.add(role, record)
+        try:
+            self.sql.add(role, record)
+        except (UserExists, SQLAlchemyError):
+            # The JSON line is the source of truth, the backfill and the
+            # parity check pick up whatever the database missed.
+            db.session.rollback()
+            current_app.logger.warning(
+                'dual write: %s %r not stored in the database', role, record.get('username'),
+                exc_info=True,
+            )
+
+    def update(self, role, username, changes):
+        self.jsonl.update(role, username, changes)
+        try:
+            self.sql.update(role, username, changes)
+        except (KeyError, UserExists, SQLAlchemyError):
+            db.session.rollback()
+            current_app.logger.warning(
+                'dual write: update of %s %r not stored in the database', role, username,
+                exc_info=True,
+            )
+
+    def delete(self, role, username):
+        # The database goes first here: a user its trips or requests still
+        # refer to must not disappear from the JSON files either
+        try:
+            self.sql.delete(role, username)
+        except (KeyError, SQLAlchemyError):
+            db.session.rollback()
+            current_app.logger.warning(
+                'dual write: deletion of %s %r not stored in the database', role, username,
+                exc_info=True,
+            )
+        self.jsonl.delete(role, username)
+
+    def scan_users(self, role, after=None, limit=None):
+        return self.reader.scan_users(role, after, limit)
+
+    def scan_generation(self, role):
+        return self.reader.scan_generation(role)
+
+    def iter_users(self):
+        return self.reader.iter_users()
+
+    def version(self):
+        return self.reader.version()
+
+
+def _load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _upsert(model, records):
+    """Insert, update or delete ``records`` (latest line per username wins); return the skipped count."""
+    latest = {record['username']: record for record in records}
+    existing = {
+        user.username: user
+        for user in db.session.execute(
+            select(model).where(model.username.in_(latest))
+        ).scalars()
+    }
+    school_ids = {}
+    skipped = 0
+    for username, record in latest.items():
+        if record.get(DELETED):
+            if username in existing:
+                db.session.delete(existing[username])
+            continue
+        columns = model.columns_from_dict(record)
+        if 'attending_school' in columns:
+            name = columns['attending_school']
+            if name not in school_ids:
+                school_ids[name] = db.session.execute(
+                    select(School.id).filter_by(name=name)
+                ).scalar_one_or_none()
+            columns['school_id'] = school_ids[name]
+        user = existing.get(username)
+        try:
+            with db.session.begin_nested():
+                if user is None:
+                    db.session.add(model(**columns))
+                else:
+                    for column, value in columns.items():
+                        setattr(user, column, value)
+        except SQLAlchemyError:
+            skipped += 1
+            current_app.logger.warning('backfill: %r not copied', username, exc_info=True)
+    if existing:
+        bump_user_version()
+    db.session.commit()
+    return skipped
+
+
+def backfill(files, checkpoint_path, batch_size=500, stop=None):
+    """Copy the JSON lines past the checkpoint into the database.
+
+    ``files`` maps roles to a JSON-Lines file or a list of them (shards).
+    ``stop`` is an optional :class:`threading.Event` checked between
+    batches. Returns ``{role: (copied, skipped)}`` for this run.
+    """
+    checkpoint = _load_checkpoint(checkpoint_path)
+    result = {}
+    for role in ROLES:
+        paths = files[role]
+        copied = skipped = 0
+        for path in [paths] if isinstance(paths, str) else paths:
+            if not os.path.exists(path):
+                continue
+            key = os.path.abspath(path)
+            with open(path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                saved = checkpoint.get(key)
+                offset = 0
+                if isinstance(saved, dict) and saved.get('inode') == st.st_ino and saved['offset'] <= st.st_size:
+                    offset = saved['offset']
+                # Otherwise the file was rewritten (compacted) since the last
+                # run: start over, copying the same records again is harmless
+                f.seek(offset)
+                while not (stop is not None and stop.is_set()):
+                    batch = []
+                    end = offset
+                    for line in f:
+                        if not line.endswith(b'\n'):
+                            break
+                        end += len(line)
+                        record = _parse_line(line)
+                        if record and record.get('username') and (
+                            record.get('password') or record.get(DELETED)
+                        ):
+                            batch.append(record)
+                        if len(batch) >= batch_size:
+                            break
+                    if end == offset:
+                        break
+                    skipped += _upsert(MODELS[role], batch)
+                    copied += len(batch)
+                    offset = end
+                    checkpoint[key] = {'inode': st.st_ino, 'offset': end}
+                    _save_checkpoint(checkpoint_path, checkpoint)
+        result[role] = (copied, skipped)
+    return result
+
+
+class BackfillWorker(threading.Thread):
+    """Runs :func:`backfill` in the background inside an application context."""
+
+    def __init__(self, app, files, checkpoint_path, batch_size=500):
+        super().__init__(name='user-backfill', daemon=True)
+        self.app = app
+        self.files = files
+        self.checkpoint_path = checkpoint_path
+        self.batch_size = batch_size
+        self.stop_event = threading.Event()
+        self.result = None
+
+    def run(self):
+        with self.app.app_context():
+            self.result = backfill(
+                self.files, self.checkpoint_path, self.batch_size, stop=self.stop_event
+            )
+            db.session.remove()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def _digest(columns):
+    return hashlib.sha256(
+        json.dumps(columns, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def _compared_columns(model):
+    # Ids only exist in the database, school_id is derived from attending_school,
+    # the JSON records carry no name/surname and ratings come from the reviews
+    # stored in the database
+    return [
+        column.name for column in model.__table__.columns
+        if column.name not in ('id', 'school_id', 'name', 'surname', 'rating', 'rating_count', 'rating_sum')
+    ]
+
+
+def check_parity(files):
+    """Compare the JSON files with the database, record by record.
+
+    Returns ``{role: report}`` where every report holds the two row counts and
+    the usernames missing from the database, only in the database, or whose
+    per-record hashes differ.
+    """
+    report = {}
+    for role in ROLES:
+        model = MODELS[role]
+        columns = _compared_columns(model)
+        expected = {}
+        for record in _latest_by(_read_records(files[role]), 'username'):
+            if not record.get('password'):
+                continue
+            values = model.columns_from_dict(record)
+            if values.get('created_at') is None:
+                # The database stamps rows the JSON line carries no date for
+                values.pop('created_at', None)
+            expected[record['username']] = {c: values[c] for c in columns if c in values}
+        mismatched = []
+        actual = set()
+        for user in db.session.execute(select(model)).scalars():
+            actual.add(user.username)
+            values = expected.get(user.username)
+            if values is not None and _digest(values) != _digest(
+                {c: getattr(user, c) for c in values}
+            ):
+                mismatched.append(user.username)
+        report[role] = {
+            'jsonl_count': len(expected),
+            'db_count': len(actual),
+            'missing': sorted(expected.keys() - actual),
+            'extra': sorted(actual - expected.keys()),
+            'mismatched': sorted(mismatched),
+        }
+    return report
+
+
+def parity_ok(report):
+    return all(
+        r['jsonl_count'] == r['db_count'] and not (r['missing'] or r['extra'] or r['mismatched'])
+        for r in report.values()
+    )
+
+
+def migration_files():
+    """The JSON files the migration reads for the current application.
+
+    ``{role: path}``, or ``{role: [path per shard]}`` with ``USER_SHARDS`` > 1.
+    """
+    testing = bool(current_app.config.get('TESTING'))
+    shards = current_app.config.get('USER_SHARDS', 1)
+    if shards <= 1:
+        return user_files(testing)
+    layout = shard_files(testing, shards)
+    return {role: [files[role] for _, files in layout] for role in ROLES}
+
+
+def dual_write_store(jsonl_store):
+    return DualWriteUserStore(
+        jsonl_store, SqlUserStore(), read_from_db=bool(current_app.config.get('USER_READS_FROM_DB'))
+    )
@@ -0,0 +1,188 @@
+"""
+Fare quotes for a pickup point across the candidate trips.
+
+The passenger pays ``Driver.priceperkm`` for the kilometres from the
+pickup point to the school. ETAs assume the driver leaves the origin at
+the trip's start and drives at ``QUOTE_SPEED_KMH`` (straight lines, like
+the matching). Each quote gets a score in [0, 1], higher is better:
+``QUOTE_RATING_WEIGHT`` of it comes from the driver's rating (out of 5)
+and the rest from the price relative to the cheapest quote.
+
+:func:`quote_columns` computes all of this for every candidate at once,
+on column arrays: with NumPy installed in one vectorised pass, otherwise
+with one list comprehension per column, same results. :class:`QuoteCache`
+keeps the quotes of a pickup point (rounded to about 10 m) and candidate
+set for ``QUOTE_CACHE_TTL`` seconds, so a passenger typing a pickup
+address does not recompute them on every keystroke.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import select
+
+from .. import db
+from ..models import Driver, Trip
+from .matching import EARTH_RADIUS_KM, get_trip_matcher, haversine_km
+from .metrics import register_metrics
+
+try:
+    import numpy as np
+except ImportError:  # Pure-Python columns, same results
+    np = None
+
+# Rounding of the pickup point in cache keys (4 decimals: about 10 m)
+KEY_DECIMALS = 4
+# Keeps the price score finite for free rides
+_PRICE_EPSILON = 0.01
+
+
+def _haversine_np(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def _columns_numpy(pickup, school, origins, prices, ratings, speed_kmh, rating_weight):
+    origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+    prices = np.asarray(prices, dtype=float)
+    ratings = np.asarray(ratings, dtype=float)
+    ride_km = haversine_km(*pickup, *school)
+    to_pickup = _haversine_np(origins[:, 0], origins[:, 1], pickup[0], pickup[1])
+    fares = np.round(prices * ride_km, 2)
+    price_score = (fares.min() + _PRICE_EPSILON) / (fares + _PRICE_EPSILON)
+    scores = rating_weight * np.clip(ratings, 0, 5) / 5 + (1 - rating_weight) * price_score
+    return {
+        'fare': fares.tolist(),
+        'pickup_minutes': (to_pickup / speed_kmh * 60).tolist(),
+        'arrival_minutes': ((to_pickup + ride_km) / speed_kmh * 60).tolist(),
+        'score': scores.tolist(),
+    }
+
+
+def _columns_python(pickup, school, origins, prices, ratings, speed_kmh, rating_weight):
+    ride_km = haversine_km(*pickup, *school)
+    to_pickup = [haversine_km(lat, lon, *pickup) for lat, lon in origins]
+    fares = [round(price * ride_km, 2) for price in prices]
+    cheapest = min(fares)
+    return {
+        'fare': fares,
+        'pickup_minutes': [km / speed_kmh * 60 for km in to_pickup],
+        'arrival_minutes': [(km + ride_km) / speed_kmh * 60 for km in to_pickup],
+        'score': [
+            rating_weight * min(max(rating, 0), 5) / 5
+            + (1 - rating_weight) * (cheapest + _PRICE_EPSILON) / (fare + _PRICE_EPSILON)
+            for fare, rating in zip(fares, ratings)
+        ],
+    }
+
+
+def quote_columns(pickup, school, origins, prices, ratings, speed_kmh=30.0, rating_weight=0.3):
+    """Fare, pickup/arrival minutes and score of each candidate, as lists in input order.
+
+    ``origins`` are the trips' ``(lat, lon)``; ``prices`` and ``ratings``
+    their drivers' ``priceperkm`` and ``rating``.
+    """
+    if not origins:
+        return {'fare': [], 'pickup_minutes': [], 'arrival_minutes': [], 'score': []}
+    columns = _columns_numpy if np is not None else _columns_python
+    return columns(pickup, school, origins, prices, ratings, speed_kmh, rating_weight)
+
+
+class QuoteCache:
+    """LRU of quote lists with a time to live."""
+
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key, quotes):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, quotes)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+            }
+
+
+def quote(school_id, school, pickup, max_detour_km, limit=20, windows=None):
+    """``(ride km, quotes)`` for a pickup point, best score first.
+
+    Candidates are the open trips :class:`matching.TripMatcher` finds
+    within ``max_detour_km`` (and ``windows``, if given).
+    """
+    config = current_app.config
+    matches = get_trip_matcher().match(school_id, pickup, max_detour_km, config['QUOTE_MAX_CANDIDATES'], windows)
+    ride_km = haversine_km(*pickup, *school)
+    if not matches:
+        return ride_km, []
+    codes = tuple(sorted(code for _, code in matches))
+    key = (school_id, round(pickup[0], KEY_DECIMALS), round(pickup[1], KEY_DECIMALS), codes)
+    cache = get_quote_cache()
+    quotes = cache.get(key)
+    if quotes is None:
+        rows = db.session.execute(
+            select(Trip.code, Trip.origin_lat, Trip.origin_lon, Driver.username, Driver.priceperkm, Driver.rating)
+            .join(Driver, Driver.id == Trip.driver_id)
+            .where(Trip.code.in_(codes))
+        ).all()
+        columns = quote_columns(
+            pickup, school,
+            [(row.origin_lat, row.origin_lon) for row in rows],
+            [row.priceperkm or 0.0 for row in rows],
+            [row.rating or 0.0 for row in rows],
+            config['QUOTE_SPEED_KMH'], config['QUOTE_RATING_WEIGHT'],
+        )
+        quotes = sorted((
+            {
+                'code': row.code,
+                'driver': row.username,
+                'rating': row.rating,
+                'fare': fare,
+                'pickup_minutes': round(pickup_minutes, 1),
+                'arrival_minutes': round(arrival_minutes, 1),
+                'score': round(score, 4),
+            }
+            for row, fare, pickup_minutes, arrival_minutes, score in zip(
+                rows, columns['fare'], columns['pickup_minutes'], columns['arrival_minutes'], columns['score'])
+        ), key=lambda q: (-q['score'], q['fare'], q['code']))
+        cache.put(key, quotes)
+    return ride_km, quotes[:limit]
+
+
+def init_pricing(app):
+    cache = QuoteCache(app.config.get('QUOTE_CACHE_SIZE', 1024), app.config.get('QUOTE_CACHE_TTL', 60.0))
+    app.extensions['quote_cache'] = cache
+    register_metrics(app, 'quote_cache', cache.stats)
+    return cache
+
+
+def get_quote_cache():
+    return current_app.extensions['quote_cache']
@@ -0,0 +1,102 @@
+"""
+Driver ratings from passenger reviews.
+
+Every driver row keeps the count and the sum of the stars received and
+the Bayesian-smoothed score ``(C * m + sum) / (C + count)`` in
+``Driver.rating``: a prior of ``RATING_PRIOR_WEIGHT`` (C) reviews of
+``RATING_PRIOR_MEAN`` (m) stars, so a single 5-star review does not put a
+new driver above one with a hundred 4.8s, and a driver without reviews
+starts at the prior mean rather than below every reviewed one. Reading the score costs nothing
+more than reading the driver (quotes rank on it, see services.pricing).
+
+:func:`add_review` stores a review and updates the three columns with one
+``UPDATE ... SET rating_count = rating_count + 1, ...`` in the caller's
+transaction: O(1), and concurrent reviews of the same driver cannot lose
+each other's increments. :func:`reconcile` (``flask reconcile-ratings``)
+recomputes the aggregates from the reviews with one grouped query and
+rewrites the drivers whose columns drifted, e.g. after reviews were
+deleted by hand or the prior was changed.
+"""
+
+from flask import current_app
+from sqlalchemy import func, select, update
+
+from .. import db
+from ..models import Driver, Review
+from .sql_store import bump_user_version
+
+MIN_STARS, MAX_STARS = 1, 5
+
+
+class InvalidReview(ValueError):
+    """Raised for stars out of range or comments too long."""
+
+
+def smoothed(stars_sum, count, prior_mean, prior_weight):
+    """Bayesian average of ``count`` reviews adding up to ``stars_sum``."""
+    return (prior_weight * prior_mean + stars_sum) / (prior_weight + count)
+
+
+def _prior():
+    # Floats, so that SQL never divides integers
+    config = current_app.config
+    return float(config['RATING_PRIOR_MEAN']), float(config['RATING_PRIOR_WEIGHT'])
+
+
+def add_review(trip, passenger_id, stars, comment=None):
+    """Add a review of ``trip``'s driver and update the driver's aggregates.
+
+    Flushed, not committed: the review and the new score are committed
+    together by the caller.
+    """
+    if isinstance(stars, bool) or not isinstance(stars, int) or not MIN_STARS <= stars <= MAX_STARS:
+        raise InvalidReview(f'stars must be an integer from {MIN_STARS} to {MAX_STARS}')
+    if comment is not None and (not isinstance(comment, str) or len(comment) > 500):
+        raise InvalidReview('comment must be a text of at most 500 characters')
+    review = Review(trip_code=trip.code, driver_id=trip.driver_id, passenger_id=passenger_id,
+                    stars=stars, comment=comment)
+    db.session.add(review)
+    db.session.flush()
+    prior_mean, prior_weight = _prior()
+    # The right-hand sides read the values before the update
+    db.session.execute(
+        update(Driver).where(Driver.id == trip.driver_id).values(
+            rating_count=Driver.rating_count + 1,
+            rating_sum=Driver.rating_sum + stars,
+            rating=(prior_weight * prior_mean + Driver.rating_sum + stars) / (prior_weight + Driver.rating_count + 1),
+        )
+    )
+    # The rating is part of the driver's record in /api/users
+    bump_user_version()
+    return review
+
+
+def reconcile():
+    """Recompute every driver's aggregates from the reviews; fix the ones that drifted.
+
+    Returns ``{'drivers': checked, 'corrected': rewritten}``.
+    """
+    prior_mean, prior_weight = _prior()
+    totals = {
+        driver_id: (count, stars_sum)
+        for driver_id, count, stars_sum in db.session.execute(
+            select(Review.driver_id, func.count(Review.id), func.sum(Review.stars)).group_by(Review.driver_id)
+        )
+    }
+    corrections = []
+    checked = 0
+    for driver_id, count, stars_sum, rating in db.session.execute(
+        select(Driver.id, Driver.rating_count, Driver.rating_sum, Driver.rating)
+    ):
+        checked += 1
+        true_count, true_sum = totals.get(driver_id, (0, 0))
+        # Drivers without reviews get the prior mean
+        true_rating = smoothed(true_sum, true_count, prior_mean, prior_weight)
+        if (count, stars_sum) != (true_count, true_sum) or abs(rating - true_rating) > 1e-9:
+            corrections.append({'id': driver_id, 'rating_count': true_count,
+                                'rating_sum': true_sum, 'rating': true_rating})
+    if corrections:
+        db.session.execute(update(Driver), corrections)
+        bump_user_version()
+    db.session.commit()
+    return {'drivers': checked, 'corrected': len(corrections)}
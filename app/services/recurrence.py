@@ -0,0 +1,188 @@
+"""
+Recurring trips, expanded lazily.
+
+A :class:`TripSchedule` runs on some weekdays (like an RRULE
+``FREQ=WEEKLY;BYDAY=MO,TU,..``) between two dates, with its windows as
+local times of ``SCHEDULE_TIMEZONE``. Nothing is stored per day:
+:func:`occurrences` walks only the queried date range, one generator per
+schedule merged by date, and reads only the ``Trip`` rows of that range
+that were materialised. :func:`materialise` stores a day as a ``Trip``
+(``schedule_id``, ``occurs_on``) when a passenger books it or the driver
+records an exception (a cancelled day); the stored row then overrides the
+schedule for that day, and as an open trip it is matched like the others.
+"""
+
+import heapq
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from ..models import Trip, TripSchedule
+from ..models.trip_schedule import WEEKDAYS
+
+ONE_DAY = timedelta(days=1)
+
+# One day of a schedule; ``trip`` is its Trip row if materialised
+Occurrence = namedtuple('Occurrence', 'day schedule trip')
+
+
+class InvalidSchedule(ValueError):
+    """Raised for malformed schedules and days a schedule does not run on."""
+
+
+def parse_weekdays(value):
+    """``['MO', 'WE']`` -> weekday bitmask (Monday is bit 0)."""
+    if not isinstance(value, list) or not value:
+        raise InvalidSchedule(f'weekdays must be a non-empty list of {", ".join(WEEKDAYS)}')
+    mask = 0
+    for day in value:
+        if not isinstance(day, str) or day.upper() not in WEEKDAYS:
+            raise InvalidSchedule(f'Unknown weekday {day!r}: use {", ".join(WEEKDAYS)}')
+        mask |= 1 << WEEKDAYS.index(day.upper())
+    return mask
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidSchedule(f'Invalid date {value!r}: use YYYY-MM-DD')
+
+
+def parse_clock_window(value):
+    """``{'from': '07:30', 'until': '07:45'}`` -> ``(time, time)``; None if ``value`` is None."""
+    if value is None:
+        return None
+    try:
+        start, end = time.fromisoformat(value['from']), time.fromisoformat(value['until'])
+    except (KeyError, TypeError, ValueError):
+        raise InvalidSchedule('A daily window must be {"from": "HH:MM", "until": "HH:MM"}')
+    if end < start:
+        raise InvalidSchedule('A daily window must not end before it starts')
+    return start, end
+
+
+def occurrence_dates(weekdays, starts_on, ends_on, start, end):
+    """The days of ``[start, end]`` a schedule runs on, one at a time."""
+    day = max(start, starts_on)
+    last = min(end, ends_on)
+    while day <= last:
+        if weekdays >> day.weekday() & 1:
+            yield day
+        day += ONE_DAY
+
+
+def runs_on(schedule, day):
+    return (schedule.status == 'active' and schedule.starts_on <= day <= schedule.ends_on
+            and bool(schedule.weekdays >> day.weekday() & 1))
+
+
+def _utc(day, clock, zone):
+    local = datetime.combine(day, clock, tzinfo=zone)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def windows_on(schedule, day, zone):
+    """``{kind: (start, end)}`` of a day of the schedule, as naive UTC datetimes."""
+    windows = {}
+    for kind in ('departure', 'arrival'):
+        start, end = getattr(schedule, f'{kind}_from'), getattr(schedule, f'{kind}_until')
+        windows[kind] = (_utc(day, start, zone), _utc(day, end, zone)) if start and end else None
+    return windows
+
+
+def _expand(schedule, start, end, materialised):
+    for day in occurrence_dates(schedule.weekdays, schedule.starts_on, schedule.ends_on, start, end):
+        yield Occurrence(day, schedule, materialised.get((schedule.id, day)))
+
+
+def occurrences(school_id, start, end, driver_id=None):
+    """The :class:`Occurrence` of the active schedules in ``[start, end]``, by date.
+
+    Two queries, both limited to the range: the schedules overlapping it
+    and the days of theirs already materialised.
+    """
+    query = select(TripSchedule).where(
+        TripSchedule.school_id == school_id, TripSchedule.status == 'active',
+        TripSchedule.starts_on <= end, TripSchedule.ends_on >= start,
+    )
+    if driver_id is not None:
+        query = query.where(TripSchedule.driver_id == driver_id)
+    schedules = db.session.execute(query.order_by(TripSchedule.id)).scalars().all()
+    if not schedules:
+        return iter(())
+    materialised = {
+        (trip.schedule_id, trip.occurs_on): trip
+        for trip in db.session.execute(
+            select(Trip).where(Trip.schedule_id.in_([s.id for s in schedules]),
+                               Trip.occurs_on >= start, Trip.occurs_on <= end)
+        ).scalars()
+    }
+    return heapq.merge(
+        *(_expand(schedule, start, end, materialised) for schedule in schedules),
+        key=lambda occurrence: (occurrence.day, occurrence.schedule.id),
+    )
+
+
+def occurrence_dict(occurrence, zone, with_origin=False):
+    """Same shape as ``Trip.to_dict``; ``code`` is None until the day is materialised."""
+    if occurrence.trip is not None:
+        return occurrence.trip.to_dict(with_origin)
+    schedule = occurrence.schedule
+    windows = windows_on(schedule, occurrence.day, zone)
+    data = {
+        'code': None,
+        'driver_id': schedule.driver_id,
+        'school_id': schedule.school_id,
+        'licence_plate': schedule.licence_plate,
+        'status': 'open',
+        **{
+            kind: {'from': window[0].isoformat(), 'until': window[1].isoformat()} if window else None
+            for kind, window in windows.items()
+        },
+        'schedule_id': schedule.id,
+        'occurs_on': occurrence.day.isoformat(),
+        'created_at': None,
+    }
+    if with_origin:
+        data['origin'] = {'lat': schedule.origin_lat, 'lon': schedule.origin_lon}
+    return data
+
+
+def materialise(schedule, day, zone):
+    """The ``Trip`` of a day of the schedule, stored now if it was not yet.
+
+    Flushed, not committed. Safe against another worker materialising the
+    same day: the unique (schedule_id, occurs_on) decides, and the loser
+    reads the winner's row.
+    """
+    query = select(Trip).filter_by(schedule_id=schedule.id, occurs_on=day)
+    trip = db.session.execute(query).scalar_one_or_none()
+    if trip is not None:
+        return trip
+    if not runs_on(schedule, day):
+        raise InvalidSchedule(f'Schedule {schedule.id} does not run on {day.isoformat()}')
+    trip = Trip(
+        driver_id=schedule.driver_id, school_id=schedule.school_id, licence_plate=schedule.licence_plate,
+        origin_lat=schedule.origin_lat, origin_lon=schedule.origin_lon,
+        schedule_id=schedule.id, occurs_on=day,
+    )
+    for kind, window in windows_on(schedule, day, zone).items():
+        if window is not None:
+            setattr(trip, f'{kind}_from', window[0])
+            setattr(trip, f'{kind}_until', window[1])
+    try:
+        with db.session.begin_nested():
+            db.session.add(trip)
+    except IntegrityError:
+        trip = db.session.execute(query).scalar_one()
+    return trip
+
+
+def schedule_zone():
+    return ZoneInfo(current_app.config['SCHEDULE_TIMEZONE'])
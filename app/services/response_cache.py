@@ -0,0 +1,124 @@
+"""
+Cache of serialised read responses with strong validators.
+
+An entry holds the response bytes for one request (path + query string)
+together with the data version it was built from: ``store.version()`` is a
+cheap token (file inode/size/mtime for the JSON-Lines files, row counts for
+the database) that changes whenever the data does, including writes made by
+other worker processes. A request whose version still matches is answered
+from the cache, and one carrying the entry's ETag in ``If-None-Match`` gets a
+bodyless 304, without reading or serialising a single user.
+
+The write paths also call :meth:`ResponseCache.invalidate` so this worker
+drops its entries straight away.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+
+from .metrics import register_metrics
+
+
+class CachedResponse:
+    __slots__ = ('version', 'body', 'mimetype', 'etag', 'last_modified')
+
+    def __init__(self, version, body, mimetype):
+        self.version = version
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        # Nothing changed since the entry was built, so it is a safe upper bound
+        self.last_modified = int(time.time())
+
+
+class ResponseCache:
+    """LRU of :class:`CachedResponse` keyed by request."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+        self._invalidations = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+
+    def respond(self, entry):
+        """Build the (possibly 304) response for ``entry`` and the current request."""
+        response = Response(entry.body, mimetype=entry.mimetype)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self._not_modified += 1
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'not_modified': self._not_modified,
+                'invalidations': self._invalidations,
+            }
+
+
+def request_key():
+    """Cache key for the current request: path plus normalised query string."""
+    return request.path, tuple(sorted(request.args.items(multi=True)))
+
+
+def cached_response(version, build, mimetype='application/json'):
+    """Serve the current request from the cache, calling ``build()`` for the body on a miss.
+
+    ``build`` returns the response bytes for data at ``version``.
+    """
+    cache = get_response_cache()
+    key = request_key()
+    entry = cache.get(key, version)
+    if entry is None:
+        entry = CachedResponse(version, build(), mimetype)
+        cache.put(key, entry)
+    return cache.respond(entry)
+
+
+def init_response_cache(app):
+    cache = ResponseCache(app.config.get('RESPONSE_CACHE_SIZE', 256))
+    app.extensions['response_cache'] = cache
+    register_metrics(app, 'response_cache', cache.stats)
+    return cache
+
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
@@ -0,0 +1,206 @@
+"""
+Pickup order of the passengers of a trip.
+
+A trip starts at the driver's origin, stops at the pickup point of every
+assigned :class:`TripRequest` and ends at the school. The order is found
+with a nearest-neighbour tour improved by 2-opt (reversing a stretch of
+the route while that shortens it), on great-circle distances.
+
+:func:`distance_matrices` computes the matrices of many trips at once:
+with NumPy installed the haversine runs on one padded ``(trips, n, n)``
+array, otherwise point by point. :func:`plan_routes` plans every trip
+with passengers in one batch and stores the order in
+``TripRequest.stop_order`` (``flask plan-routes``); the trip API reuses
+it while no passenger was added since.
+"""
+
+import time
+
+from sqlalchemy import select, update
+
+from .. import db
+from ..models import School, Trip, TripRequest
+from .matching import EARTH_RADIUS_KM, haversine_km
+
+try:
+    import numpy as np
+except ImportError:  # Pure-Python matrices, same results
+    np = None
+
+
+def _matrices_numpy(point_lists):
+    size = max(len(points) for points in point_lists)
+    lat = np.zeros((len(point_lists), size))
+    lon = np.zeros((len(point_lists), size))
+    for i, points in enumerate(point_lists):
+        lat[i, :len(points)], lon[i, :len(points)] = zip(*points)
+    lat, lon = np.radians(lat), np.radians(lon)
+    dlat = lat[:, :, None] - lat[:, None, :]
+    dlon = lon[:, :, None] - lon[:, None, :]
+    a = (np.sin(dlat / 2) ** 2
+         + np.cos(lat)[:, :, None] * np.cos(lat)[:, None, :] * np.sin(dlon / 2) ** 2)
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    # Plain lists: the heuristics read single elements, much faster than on arrays
+    return [distances[i, :len(points), :len(points)].tolist() for i, points in enumerate(point_lists)]
+
+
+def _matrix_python(points):
+    n = len(points)
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            matrix[i][j] = matrix[j][i] = haversine_km(*points[i], *points[j])
+    return matrix
+
+
+def distance_matrices(point_lists):
+    """Great-circle distance matrix (lists of lists, km) of each list of ``(lat, lon)``."""
+    if not point_lists:
+        return []
+    if np is not None:
+        return _matrices_numpy(point_lists)
+    return [_matrix_python(points) for points in point_lists]
+
+
+def route_length(route, matrix):
+    return sum(matrix[a][b] for a, b in zip(route, route[1:]))
+
+
+def nearest_neighbour(matrix):
+    """Route from point 0 to the last point, always driving to the closest unvisited stop."""
+    end = len(matrix) - 1
+    route = [0]
+    left = set(range(1, end))
+    while left:
+        row = matrix[route[-1]]
+        stop = min(left, key=row.__getitem__)
+        route.append(stop)
+        left.remove(stop)
+    if end > 0:
+        route.append(end)
+    return route
+
+
+def two_opt(route, matrix):
+    """Improve ``route`` (first and last point fixed) by reversing stretches while it gets shorter."""
+    route = list(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(route) - 2):
+            for j in range(i + 1, len(route) - 1):
+                a, b, c, d = route[i - 1], route[i], route[j], route[j + 1]
+                if matrix[a][c] + matrix[b][d] < matrix[a][b] + matrix[c][d] - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+    return route
+
+
+def plan(matrix):
+    """Order of the stops ``1 .. n-2`` between point 0 and point ``n-1``."""
+    return two_opt(nearest_neighbour(matrix), matrix)[1:-1]
+
+
+def _trips_with_passengers(codes=None):
+    """``{code: (origin, school, [(request id, pickup point, (lat, lon), stop_order)])}``."""
+    query = (
+        select(Trip.code, Trip.origin_lat, Trip.origin_lon, School.latitude, School.longitude,
+               TripRequest.id, TripRequest.pickup_point, TripRequest.pickup_lat, TripRequest.pickup_lon,
+               TripRequest.stop_order)
+        .join(School, School.id == Trip.school_id)
+        .join(TripRequest, TripRequest.trip_code == Trip.code)
+        .where(TripRequest.status == 'assigned', TripRequest.pickup_lat.is_not(None),
+               TripRequest.pickup_lon.is_not(None), School.latitude.is_not(None))
+        .order_by(Trip.code, TripRequest.id)
+    )
+    if codes is not None:
+        query = query.where(Trip.code.in_(codes))
+    trips = {}
+    for code, lat, lon, school_lat, school_lon, request_id, point, pickup_lat, pickup_lon, order in (
+        db.session.execute(query)
+    ):
+        trip = trips.setdefault(code, ((lat, lon), (school_lat, school_lon), []))
+        trip[2].append((request_id, point, (pickup_lat, pickup_lon), order))
+    return trips
+
+
+def _plan_trips(trips):
+    """``{code: [stop index in the trip's list, in driving order]}``."""
+    codes = list(trips)
+    matrices = distance_matrices([
+        [origin, *(stop[2] for stop in stops), school] for origin, school, stops in trips.values()
+    ])
+    return {code: [stop - 1 for stop in plan(matrix)] for code, matrix in zip(codes, matrices)}
+
+
+def _route(origin, school, stops, order):
+    points = [origin, *(stops[i][2] for i in order), school]
+    return {
+        'origin': {'lat': origin[0], 'lon': origin[1]},
+        'stops': [
+            {'request_id': stops[i][0], 'pickup_point': stops[i][1],
+             'lat': stops[i][2][0], 'lon': stops[i][2][1]}
+            for i in order
+        ],
+        'school': {'lat': school[0], 'lon': school[1]},
+        'distance_km': round(sum(haversine_km(*a, *b) for a, b in zip(points, points[1:])), 3),
+    }
+
+
+def trip_route(code):
+    """Ordered route of trip ``code``; None if the trip or its school's coordinates are missing.
+
+    Uses the stored ``stop_order`` when every passenger has one, plans the
+    trip otherwise.
+    """
+    trips = _trips_with_passengers([code])
+    if code not in trips:
+        row = db.session.execute(
+            select(Trip.origin_lat, Trip.origin_lon, School.latitude, School.longitude)
+            .join(School, School.id == Trip.school_id)
+            .where(Trip.code == code)
+        ).one_or_none()
+        if row is None or row[2] is None or row[3] is None:
+            return None
+        return _route((row[0], row[1]), (row[2], row[3]), [], [])
+    origin, school, stops = trips[code]
+    if all(stop[3] is not None for stop in stops):
+        order = sorted(range(len(stops)), key=lambda i: stops[i][3])
+    else:
+        order = _plan_trips(trips)[code]
+    return _route(origin, school, stops, order)
+
+
+def plan_routes(batch_size=5000):
+    """Plan every trip with passengers and store the pickup order.
+
+    Returns the number of trips and stops, and the seconds spent loading,
+    planning and writing.
+    """
+    started = time.perf_counter()
+    trips = _trips_with_passengers()
+    loaded = time.perf_counter()
+    orders = {}
+    codes = list(trips)
+    # Matrices of a batch of trips are built together
+    for start in range(0, len(codes), batch_size):
+        batch = {code: trips[code] for code in codes[start:start + batch_size]}
+        orders.update(_plan_trips(batch))
+    planned = time.perf_counter()
+
+    rows = [
+        {'id': trips[code][2][stop][0], 'stop_order': position}
+        for code, order in orders.items()
+        for position, stop in enumerate(order)
+    ]
+    if rows:
+        db.session.execute(update(TripRequest), rows)
+    db.session.commit()
+    return {
+        'trips': len(trips),
+        'stops': len(rows),
+        'numpy': np is not None,
+        'load_seconds': loaded - started,
+        'plan_seconds': planned - loaded,
+        'write_seconds': time.perf_counter() - planned,
+    }
@@ -0,0 +1,232 @@
+"""
+Time windows of trips.
+
+A trip may say when it leaves (``departure_from`` .. ``departure_until``)
+and when it reaches the school (``arrival_from`` .. ``arrival_until``); a
+passenger who must be at school between 07:30 and 07:55 matches the trips
+whose arrival window overlaps that one.
+
+:class:`IntervalTree` is a treap ordered by window start where every node
+also keeps the latest end of its subtree, so an overlap query skips the
+subtrees that end too early or start too late: it visits O(log n) nodes
+plus O(log n) per window found, and inserts and removals cost O(log n)
+(expected). :class:`TripWindows` keeps one tree per school and kind of
+window; :class:`matching.TripMatcher` updates it with the location index.
+"""
+
+import random
+from datetime import datetime, timezone
+
+
+class InvalidWindow(ValueError):
+    """Raised for a time window missing a bound, unparsable or reversed."""
+
+
+def parse_time(value):
+    """ISO 8601 text -> naive UTC datetime (the database convention)."""
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidWindow(f'Invalid time {value!r}: use ISO 8601, e.g. 2026-10-19T07:30')
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def parse_window(value):
+    """``{'from': .., 'until': ..}`` -> ``(start, end)``; None if ``value`` is None."""
+    if value is None:
+        return None
+    if not isinstance(value, dict) or 'from' not in value or 'until' not in value:
+        raise InvalidWindow('A time window must be {"from": <ISO 8601>, "until": <ISO 8601>}')
+    start, end = parse_time(value['from']), parse_time(value['until'])
+    if end < start:
+        raise InvalidWindow('A time window must not end before it starts')
+    return start, end
+
+
+def windows_of(row):
+    """``{kind: (start, end)}`` of the windows a trip or request (or a row of one) has."""
+    windows = {}
+    for kind in TripWindows.KINDS:
+        start, end = getattr(row, f'{kind}_from'), getattr(row, f'{kind}_until')
+        if start is not None and end is not None:
+            windows[kind] = (start, end)
+    return windows
+
+
+def windows_fit(trip_windows, windows):
+    """Whether ``trip_windows`` has a window of every kind in ``windows``, overlapping it.
+
+    Both map kinds to ``(start, end)``; a kind the trip has no window of never fits.
+    """
+    for kind, (start, end) in windows.items():
+        window = trip_windows.get(kind)
+        if window is None or window[0] > end or start > window[1]:
+            return False
+    return True
+
+
+class _Node:
+    __slots__ = ('sort_key', 'start', 'end', 'key', 'priority', 'max_end', 'left', 'right')
+
+    def __init__(self, start, end, key, priority):
+        self.sort_key = (start, key)
+        self.start = start
+        self.end = end
+        self.key = key
+        self.priority = priority
+        self.max_end = end
+        self.left = None
+        self.right = None
+
+
+def _update(node):
+    node.max_end = node.end
+    if node.left is not None and node.left.max_end > node.max_end:
+        node.max_end = node.left.max_end
+    if node.right is not None and node.right.max_end > node.max_end:
+        node.max_end = node.right.max_end
+
+
+def _split(node, sort_key):
+    """Split into the nodes before ``sort_key`` and the others."""
+    if node is None:
+        return None, None
+    if node.sort_key < sort_key:
+        left, right = _split(node.right, sort_key)
+        node.right = left
+        _update(node)
+        return node, right
+    left, right = _split(node.left, sort_key)
+    node.left = right
+    _update(node)
+    return left, node
+
+
+def _merge(left, right):
+    """Join two treaps, every node of ``left`` sorting before ``right``."""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _insert(node, new):
+    if node is None:
+        return new
+    if new.priority > node.priority:
+        new.left, new.right = _split(node, new.sort_key)
+        _update(new)
+        return new
+    if new.sort_key < node.sort_key:
+        node.left = _insert(node.left, new)
+    else:
+        node.right = _insert(node.right, new)
+    _update(node)
+    return node
+
+
+def _remove(node, sort_key):
+    if node is None:
+        return None
+    if node.sort_key == sort_key:
+        return _merge(node.left, node.right)
+    if sort_key < node.sort_key:
+        node.left = _remove(node.left, sort_key)
+    else:
+        node.right = _remove(node.right, sort_key)
+    _update(node)
+    return node
+
+
+class IntervalTree:
+    """Closed intervals ``[start, end]``, each with a unique key."""
+
+    def __init__(self, seed=None):
+        self._root = None
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, start, end, key):
+        self._root = _insert(self._root, _Node(start, end, key, self._random.random()))
+        self._size += 1
+
+    def remove(self, start, end, key):
+        """Remove an interval added with the same arguments."""
+        self._root = _remove(self._root, (start, key))
+        self._size -= 1
+
+    def overlapping(self, start, end):
+        """Keys of the intervals sharing at least one instant with ``[start, end]``."""
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None or node.max_end < start:
+                continue
+            stack.append(node.left)
+            if node.start <= end:
+                if node.end >= start:
+                    found.append(node.key)
+                stack.append(node.right)
+        return found
+
+
+class TripWindows:
+    """The departure and arrival windows of the open trips, per school."""
+
+    KINDS = ('departure', 'arrival')
+
+    def __init__(self):
+        self._trees = {}
+        # code -> (school_id, {kind: (start, end)})
+        self._trips = {}
+
+    def __len__(self):
+        return len(self._trips)
+
+    def add(self, code, school_id, windows):
+        """Index (or re-index) a trip; ``windows`` maps kinds to ``(start, end)`` or None."""
+        self.remove(code)
+        windows = {kind: window for kind, window in windows.items() if window is not None}
+        if not windows:
+            return
+        for kind, (start, end) in windows.items():
+            tree = self._trees.get((school_id, kind))
+            if tree is None:
+                tree = self._trees[school_id, kind] = IntervalTree()
+            tree.add(start, end, code)
+        self._trips[code] = (school_id, windows)
+
+    def remove(self, code):
+        entry = self._trips.pop(code, None)
+        if entry is None:
+            return
+        school_id, windows = entry
+        for kind, (start, end) in windows.items():
+            tree = self._trees[school_id, kind]
+            tree.remove(start, end, code)
+            if not tree:
+                del self._trees[school_id, kind]
+
+    def overlapping(self, school_id, windows):
+        """Codes of the trips to ``school_id`` whose windows overlap all of ``windows``."""
+        codes = None
+        for kind, (start, end) in windows.items():
+            tree = self._trees.get((school_id, kind))
+            found = set(tree.overlapping(start, end)) if tree is not None else set()
+            codes = found if codes is None else codes & found
+            if not codes:
+                break
+        return codes if codes is not None else set()
@@ -0,0 +1,309 @@
+"""
+Hash-sharded user files.
+
+With ``USER_SHARDS`` = N > 1 the users are spread over N shards by a stable
+hash of the username: shard ``i`` holds ``drivers.i.json`` and
+``passengers.i.json`` with their own index, Bloom filter and lock
+(``users.i.lock``), so registrations of different usernames rarely wait
+for each other and no file grows past 1/N of the users.
+
+Emails are the second unique key, and the shard of a user says nothing
+about where its email lives. Every email is therefore *claimed* in an
+``emails.j.json`` file, sharded by a hash of the email: a line
+``{"email": ..., "username": ..., "_at": ...}`` names the user holding it,
+a tombstone releases it. A registration claims its email before writing
+the user, so a lookup or uniqueness check touches exactly one shard per
+key: the username shard and the email claim shard. A claim left behind by
+a registration that never completed (crash, duplicate username) stops
+counting once its owner does not carry the email and it is older than
+:data:`CLAIM_GRACE` seconds.
+
+With N = 1 (the default) nothing changes: the plain files, one lock, no
+claims. Changing N needs an offline :func:`reshard` (``flask reshard``).
+"""
+
+import hashlib
+import os
+import time
+
+from flask import current_app
+
+from .jsonl_writer import encode_line, get_writer
+from .user_store import (
+    BLOOM_SUFFIX,
+    DELETED,
+    INDEX_SUFFIX,
+    ROLES,
+    UserExists,
+    UserStore,
+    get_index,
+    refresh_file,
+    shard_path,
+    user_blooms,
+    user_files,
+)
+
+CLAIM_KEYS = ('email',)
+# Set on a claim line: when it was taken (seconds since the epoch)
+CLAIMED_AT = '_at'
+# Seconds a claim holds its email before its owner's record carries it
+CLAIM_GRACE = 60.0
+# scan_users() positions: shard number above, byte offset in the shard below
+_OFFSET_BITS = 40
+_OFFSET_MASK = (1 << _OFFSET_BITS) - 1
+_RESHARD_SUFFIX = '.reshard'
+
+
+def shard_of(value, shards):
+    """Stable shard number of ``value`` (the same in every process and release)."""
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % shards
+
+
+def shard_ids(shards):
+    """Shard numbers for ``shards``; ``[None]`` for the unsharded layout."""
+    return [None] if shards <= 1 else list(range(shards))
+
+
+def shard_files(testing=False, shards=1):
+    """``[(shard, {role: path})]`` of the user files for ``shards`` shards."""
+    return [
+        (shard, {role: shard_path(path, shard) for role, path in user_files(testing).items()})
+        for shard in shard_ids(shards)
+    ]
+
+
+def claims_file(testing=False):
+    return 'test_emails.json' if testing else 'emails.json'
+
+
+def claim_files(testing=False, shards=1):
+    """The email claim files for ``shards`` shards (none when unsharded)."""
+    if shards <= 1:
+        return []
+    return [shard_path(claims_file(testing), shard) for shard in range(shards)]
+
+
+class EmailClaims:
+    """One shard of the email -> username claims."""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._index = get_index(path, CLAIM_KEYS)
+
+    def owner(self, email):
+        """The live claim on ``email``, or None."""
+        return self._index.get('email', email)
+
+    def _current(self, email, accepted):
+        # Lines accepted earlier in the same batch are not indexed yet
+        for other in reversed(accepted):
+            if other.get('email') == email:
+                return None if other.get(DELETED) else other
+        return self._index.get('email', email)
+
+    def _append(self, record, check):
+        get_writer(self.path, fsync=self.fsync).append(record, check)
+        self._index.refresh_after_write()
+
+    def claim(self, email, username, holds):
+        """Claim ``email`` for ``username``; UserExists if someone else holds it.
+
+        ``holds(claim)`` tells whether another user's existing claim still
+        counts. Runs under the lock of this claim file. Returns False when
+        ``username`` already held the claim (nothing written).
+        """
+        def check(record, accepted):
+            current = self._current(email, accepted)
+            if current is not None:
+                if current.get('username') == username:
+                    raise _Claimed(email)
+                if holds(current):
+                    raise UserExists(email)
+
+        try:
+            self._append({'email': email, 'username': username, CLAIMED_AT: time.time()}, check)
+        except _Claimed:
+            return False
+        return True
+
+    def release(self, email, username):
+        """Drop the claim of ``username`` on ``email``; no-op if it holds no claim."""
+        def check(record, accepted):
+            current = self._current(email, accepted)
+            if current is None or current.get('username') != username:
+                raise _Claimed(email)
+
+        try:
+            self._append({'email': email, 'username': username, DELETED: True}, check)
+        except _Claimed:
+            pass
+
+
+class _Claimed(Exception):
+    """Internal: the claim is already in the requested state, nothing to write."""
+
+
+class ShardedUserStore:
+    """:class:`UserStore` interface over username shards plus email claims."""
+
+    def __init__(self, shards, claims, grace=CLAIM_GRACE):
+        self.shards = list(shards)
+        self.claims = list(claims)
+        self.grace = grace
+
+    def _shard(self, username):
+        return self.shards[shard_of(username, len(self.shards))]
+
+    def _claims(self, email):
+        return self.claims[shard_of(email, len(self.claims))]
+
+    def _holds(self, claim):
+        """True while ``claim`` still reserves its email."""
+        if time.time() - claim.get(CLAIMED_AT, 0) < self.grace:
+            # The registration that took it may still be writing the user
+            return True
+        record, _ = self.find_by_username(claim.get('username'))
+        return record is not None and record.get('email') == claim.get('email')
+
+    def find_by_username(self, username):
+        if username is None:
+            return None, None
+        return self._shard(username).find_by_username(username)
+
+    def exists(self, username=None, email=None):
+        if username is not None and self._shard(username).exists(username=username):
+            return True
+        if email is not None:
+            claim = self._claims(email).owner(email)
+            return claim is not None and self._holds(claim)
+        return False
+
+    def add(self, role, record):
+        """Claim the email, then write the user to its shard (which checks the username)."""
+        username, email = record.get('username'), record.get('email')
+        taken = email is not None and self._claims(email).claim(email, username, self._holds)
+        try:
+            self._shard(username).add(role, record)
+        except BaseException:
+            # Only a claim this call took: an existing user keeps its own
+            if taken:
+                self._claims(email).release(email, username)
+            raise
+
+    def update(self, role, username, changes):
+        shard = self._shard(username)
+        old, _ = shard.find_by_username(username)
+        new_email = changes.get('email')
+        moved = old is not None and new_email is not None and new_email != old.get('email')
+        taken = moved and self._claims(new_email).claim(new_email, username, self._holds)
+        try:
+            shard.update(role, username, changes)
+        except BaseException:
+            if taken:
+                self._claims(new_email).release(new_email, username)
+            raise
+        if moved and old.get('email') is not None:
+            self._claims(old['email']).release(old['email'], username)
+
+    def delete(self, role, username):
+        shard = self._shard(username)
+        old, _ = shard.find_by_username(username)
+        shard.delete(role, username)
+        if old is not None and old.get('email') is not None:
+            self._claims(old['email']).release(old['email'], username)
+
+    def scan_users(self, role, after=None, limit=None):
+        """Like :meth:`UserStore.scan_users`; positions carry the shard number."""
+        first, offset = (0, None) if after is None else (after >> _OFFSET_BITS, after & _OFFSET_MASK)
+        for number in range(first, len(self.shards)):
+            for position, record in self.shards[number].scan_users(role, offset, limit):
+                yield (number << _OFFSET_BITS) | position, record
+            offset = None
+
+    def scan_generation(self, role):
+        return [shard.scan_generation(role) for shard in self.shards]
+
+    def iter_users(self):
+        for role in ROLES:
+            for _, record in self.scan_users(role):
+                yield role, record
+
+    def version(self):
+        return tuple(shard.version() for shard in self.shards)
+
+
+def sharded_user_store(testing, shards):
+    """The :class:`ShardedUserStore` of the current application."""
+    fsync = current_app.config.get('USER_FILE_FSYNC', True)
+    mirror = dict(shard_files(False, shards)) if testing else {}
+    stores = [
+        UserStore(files, mirror=mirror.get(shard), blooms=user_blooms(files),
+                  fsync=fsync, shard=shard)
+        for shard, files in shard_files(testing, shards)
+    ]
+    claims = [EmailClaims(path, fsync) for path in claim_files(testing, shards)]
+    return ShardedUserStore(stores, claims)
+
+
+def _remove(path):
+    for name in (path, path + INDEX_SUFFIX, path + BLOOM_SUFFIX):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def _write_all(path, records):
+    with open(path, 'wb') as f:
+        for record in records:
+            f.write(encode_line(record))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def reshard(testing=False, old_shards=1, new_shards=1):
+    """Move the users from ``old_shards`` to ``new_shards`` shards. Offline only.
+
+    Copies the live version of every user into the new shard files (and
+    rebuilds the email claims), swaps them in with renames and removes the
+    old files with their indexes and Bloom filters. No worker may write the
+    user files while this runs. Returns ``{role: [users per new shard]}``.
+    """
+    old_layout = shard_files(testing, old_shards)
+    new_layout = shard_files(testing, new_shards)
+    buckets = {role: [[] for _ in new_layout] for role in ROLES}
+    claims = [[] for _ in claim_files(testing, new_shards)]
+    now = time.time()
+    for _, files in old_layout:
+        for role, path in files.items():
+            for _, record in get_index(path).iter_live('username'):
+                username = record['username']
+                buckets[role][shard_of(username, len(new_layout))].append(record)
+                email = record.get('email')
+                if claims and email is not None:
+                    claims[shard_of(email, len(claims))].append(
+                        {'email': email, 'username': username, CLAIMED_AT: now}
+                    )
+
+    targets = {}
+    for number, (_, files) in enumerate(new_layout):
+        for role, path in files.items():
+            targets[path] = buckets[role][number]
+    for number, path in enumerate(claim_files(testing, new_shards)):
+        targets[path] = claims[number]
+    for path, records in targets.items():
+        _write_all(path + _RESHARD_SUFFIX, records)
+
+    for path in targets:
+        # The indexes and filters notice the new inode and rebuild
+        os.replace(path + _RESHARD_SUFFIX, path)
+        refresh_file(path)
+    old_paths = [path for _, files in old_layout for path in files.values()]
+    old_paths += claim_files(testing, old_shards)
+    for path in old_paths:
+        if path not in targets:
+            _remove(path)
+            refresh_file(path)
+    return {role: [len(bucket) for bucket in buckets[role]] for role in ROLES}
@@ -0,0 +1,273 @@
+"""
+Database-backed user and school stores.
+
+Same interface as the JSON-Lines stores in ``user_store``, served through
+``db.session`` so lookups use the unique indexes on ``username``, ``email``
+and ``mechanical_code`` and uniqueness is enforced transactionally.
+"""
+
+import os
+
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from ..models import Driver, Passenger, School, UserVersion
+from .user_store import ROLES, UserExists, UserInUse, _parse_line
+
+MODELS = {'driver': Driver, 'passenger': Passenger}
+
+
+def _school_id(name):
+    if not name:
+        return None
+    return db.session.execute(select(School.id).filter_by(name=name)).scalar_one_or_none()
+
+
+def bump_user_version():
+    """Record a change to existing users, in the caller's transaction."""
+    bumped = db.session.execute(update(UserVersion).values(version=UserVersion.version + 1)).rowcount
+    if not bumped:
+        # Tables made by create_all() rather than the migration start without the row
+        db.session.add(UserVersion(id=1, version=1))
+
+
+class SqlUserStore:
+    """Drivers and passengers stored in the ``driver`` / ``passenger`` tables."""
+
+    def find_by_username(self, username):
+        """Return ``(record, role)`` for ``username``; drivers are checked first."""
+        if username is None:
+            return None, None
+        for role in ROLES:
+            user = db.session.execute(
+                select(MODELS[role]).filter_by(username=username)
+            ).scalar_one_or_none()
+            if user is not None:
+                return user.to_dict(), role
+        return None, None
+
+    def exists(self, username=None, email=None):
+        """True if any user of either role already uses ``username`` or ``email``."""
+        for model in MODELS.values():
+            conditions = []
+            if username is not None:
+                conditions.append(model.username == username)
+            if email is not None:
+                conditions.append(model.email == email)
+            if not conditions:
+                return False
+            found = db.session.execute(
+                select(model.id).where(or_(*conditions)).limit(1)
+            ).first()
+            if found is not None:
+                return True
+        return False
+
+    def add(self, role, record):
+        user = MODELS[role].from_dict(record)
+        if role == 'passenger':
+            user.school_id = _school_id(user.attending_school)
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            raise UserExists(record.get('username')) from e
+
+    def update(self, role, username, changes):
+        """Apply ``changes`` (keys as in the JSON records) to ``username``."""
+        model = MODELS[role]
+        user = db.session.execute(select(model).filter_by(username=username)).scalar_one_or_none()
+        if user is None:
+            raise KeyError(username)
+        columns = model.columns_from_dict({**user.to_dict(), **changes})
+        for column, value in columns.items():
+            if column != 'created_at' or value is not None:
+                setattr(user, column, value)
+        bump_user_version()
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            raise UserExists(username) from e
+
+    def delete(self, role, username):
+        model = MODELS[role]
+        user = db.session.execute(select(model).filter_by(username=username)).scalar_one_or_none()
+        if user is None:
+            raise KeyError(username)
+        # A new user may take the deleted id, leaving count and highest id as they were
+        bump_user_version()
+        db.session.delete(user)
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            # Trips, schedules, requests or reviews still point at the row
+            db.session.rollback()
+            raise UserInUse(username) from e
+
+    def scan_users(self, role, after=None, limit=None):
+        """Yield ``(id, record)`` for the users of ``role`` with an id above ``after``."""
+        model = MODELS[role]
+        query = select(model).order_by(model.id)
+        if after is not None:
+            query = query.where(model.id > after)
+        if limit:
+            query = query.limit(limit)
+        users = db.session.execute(query.execution_options(yield_per=500)).scalars()
+        for user in users:
+            yield user.id, user.to_dict()
+
+    def scan_generation(self, role):
+        # Ids never move
+        return 0
+
+    def iter_users(self):
+        """Yield ``(role, record)`` for every user, drivers first, in insertion order."""
+        for role in ROLES:
+            for _, record in self.scan_users(role):
+                yield role, record
+
+    def version(self):
+        """Row count and highest id of both tables plus the ``user_version`` row.
+
+        Inserts change the counts, updates and deletions bump the row: writes
+        from any worker change the token.
+        """
+        counts = tuple(
+            tuple(db.session.execute(select(func.count(model.id), func.max(model.id))).one())
+            for model in MODELS.values()
+        )
+        return counts, db.session.execute(select(UserVersion.version)).scalar() or 0
+
+
+class SqlSchoolStore:
+    """Schools stored in the ``school`` table."""
+
+    def exists(self, school_name=None, email=None, mechanical_code=None):
+        conditions = []
+        if school_name is not None:
+            conditions.append(School.name == school_name)
+        if email is not None:
+            conditions.append(School.email == email)
+        if mechanical_code is not None:
+            conditions.append(School.mechanical_code == mechanical_code)
+        if not conditions:
+            return False
+        return db.session.execute(
+            select(School.id).where(or_(*conditions)).limit(1)
+        ).first() is not None
+
+    def add(self, record):
+        db.session.add(School.from_dict(record))
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            raise UserExists(record.get('school_name')) from e
+
+    def iter_schools(self):
+        schools = db.session.execute(
+            select(School).order_by(School.id).execution_options(yield_per=500)
+        ).scalars()
+        for school in schools:
+            yield school.to_dict()
+
+
+def _read_records(paths):
+    """Records of the file ``paths``, or of each file in turn for a list (shards)."""
+    records = []
+    for path in [paths] if isinstance(paths, str) else paths:
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                records.extend(record for record in map(_parse_line, f) if record is not None)
+    return records
+
+
+def _latest_by(records, key):
+    """Keep the last record for every value of ``key``, like the JSON stores do."""
+    latest = {}
+    for record in records:
+        if record.get(key) is not None:
+            latest[record[key]] = record
+    return list(latest.values())
+
+
+def _existing(model, *columns):
+    seen = {column: set() for column in columns}
+    rows = db.session.execute(select(*(getattr(model, column) for column in columns)))
+    for row in rows:
+        for column, value in zip(columns, row):
+            if value is not None:
+                seen[column].add(value)
+    return seen
+
+
+def _bulk_insert(model, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(model), rows[start:start + batch_size])
+        db.session.commit()
+
+
+def _select_new(candidates, seen, required):
+    """Drop rows missing ``required`` columns or colliding with ``seen`` values."""
+    rows = []
+    skipped = 0
+    for row in candidates:
+        if any(row.get(column) is None for column in required) or any(
+            row.get(column) in values for column, values in seen.items()
+            if row.get(column) is not None
+        ):
+            skipped += 1
+            continue
+        for column, values in seen.items():
+            if row.get(column) is not None:
+                values.add(row[column])
+        rows.append(row)
+    return rows, skipped
+
+
+def import_json_files(drivers_path, passengers_path, schools_path, batch_size=500):
+    """Load the JSON-Lines files into the database in batched inserts.
+
+    Users already present (same username, email or unique code) are skipped,
+    so the import can be re-run safely. The user paths may be lists (one file
+    per shard). Returns ``{table: (imported, skipped)}``.
+    """
+    result = {}
+
+    schools = [
+        School.columns_from_dict(record)
+        for record in _latest_by(_read_records(schools_path), 'school_name')
+        if all(record.get(key) for key in ('address', 'email', 'representative', 'mechanical_code'))
+    ]
+    rows, skipped = _select_new(
+        schools, _existing(School, 'name', 'email', 'mechanical_code'), ('name',)
+    )
+    _bulk_insert(School, rows, batch_size)
+    result['school'] = (len(rows), skipped)
+
+    school_ids = dict(db.session.execute(select(School.name, School.id)).all())
+
+    paths = {'driver': drivers_path, 'passenger': passengers_path}
+    unique = {'driver': ('username', 'email', 'licenseid'), 'passenger': ('username', 'email')}
+    for role in ROLES:
+        model = MODELS[role]
+        candidates = []
+        missing = 0
+        for record in _latest_by(_read_records(paths[role]), 'username'):
+            if not record.get('password'):
+                missing += 1
+                continue
+            row = model.columns_from_dict(record)
+            if role == 'passenger':
+                row['school_id'] = school_ids.get(row['attending_school'])
+            candidates.append(row)
+        rows, skipped = _select_new(
+            candidates, _existing(model, *unique[role]), ('username', 'password_hash')
+        )
+        _bulk_insert(model, rows, batch_size)
+        result[role] = (len(rows), skipped + missing)
+
+    return result
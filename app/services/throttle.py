@@ -0,0 +1,165 @@
+"""
+Login throttling.
+
+Every ``/api/login`` attempt takes a token from a bucket for the client IP
+and one for the username; an empty bucket answers 429 with Retry-After
+before any lookup or password hash is done, so a credential-stuffing burst
+cannot keep every CPU busy with scrypt. Buckets live in LRUs of bounded
+size: past ``LOGIN_THROTTLE_MAX_KEYS`` the least recently seen key is
+forgotten (and starts again with a full bucket).
+
+Usernames that turned out not to exist are remembered for
+``LOGIN_UNKNOWN_TTL`` seconds so repeated attempts on them skip the store.
+The route still verifies the password against a dummy hash in that case,
+so an unknown username takes as long to reject as a wrong password.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, jsonify
+
+from .metrics import register_metrics
+
+
+class LoginThrottled(Exception):
+    """Raised when a login attempt is over its rate limit."""
+
+    def __init__(self, retry_after):
+        super().__init__('Too many login attempts')
+        self.retry_after = retry_after
+
+
+def throttled_response(error):
+    response = jsonify({'error': 'Too many login attempts, please retry later'})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+
+class RateLimiter:
+    """Token buckets (``burst`` tokens, refilled at ``per_minute``) per key, LRU bounded."""
+
+    def __init__(self, per_minute, burst, max_keys=10_000, clock=time.monotonic):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key):
+        """Take a token for ``key``; return 0, or the seconds until one is available."""
+        if not self.rate:
+            return 0
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = max(1, math.ceil((1 - tokens) / self.rate))
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class NegativeCache:
+    """Keys known to be absent, each for ``ttl`` seconds, LRU bounded."""
+
+    def __init__(self, ttl, max_keys=10_000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.clock = clock
+        self._expiry = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            expiry = self._expiry.get(key)
+            if expiry is None:
+                return False
+            if expiry <= self.clock():
+                del self._expiry[key]
+                return False
+            return True
+
+    def add(self, key):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._expiry.pop(key, None)
+            self._expiry[key] = self.clock() + self.ttl
+            if len(self._expiry) > self.max_keys:
+                self._expiry.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._expiry.pop(key, None)
+
+    def __len__(self):
+        return len(self._expiry)
+
+
+class LoginGuard:
+    """Per-IP and per-username limits plus the unknown-username cache."""
+
+    def __init__(self, ip_per_minute=30, ip_burst=30, user_per_minute=5, user_burst=10,
+                 unknown_ttl=5, max_keys=10_000, clock=time.monotonic):
+        self.by_ip = RateLimiter(ip_per_minute, ip_burst, max_keys, clock)
+        self.by_username = RateLimiter(user_per_minute, user_burst, max_keys, clock)
+        self.unknown = NegativeCache(unknown_ttl, max_keys, clock)
+        self._lock = threading.Lock()
+        self._throttled = 0
+        self._unknown_hits = 0
+
+    def check(self, ip, username):
+        """Take a token for ``ip`` and ``username`` or raise :class:`LoginThrottled`."""
+        wait = self.by_ip.consume(ip) or self.by_username.consume(username)
+        if wait:
+            with self._lock:
+                self._throttled += 1
+            raise LoginThrottled(wait)
+
+    def is_unknown(self, username):
+        found = username in self.unknown
+        if found:
+            with self._lock:
+                self._unknown_hits += 1
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ip_keys': len(self.by_ip),
+                'username_keys': len(self.by_username),
+                'unknown_usernames': len(self.unknown),
+                'throttled': self._throttled,
+                'unknown_hits': self._unknown_hits,
+            }
+
+
+def init_login_guard(app):
+    config = app.config
+    guard = LoginGuard(
+        ip_per_minute=config.get('LOGIN_IP_PER_MINUTE', 30),
+        ip_burst=config.get('LOGIN_IP_BURST', 30),
+        user_per_minute=config.get('LOGIN_USER_PER_MINUTE', 5),
+        user_burst=config.get('LOGIN_USER_BURST', 10),
+        unknown_ttl=config.get('LOGIN_UNKNOWN_TTL', 5),
+        max_keys=config.get('LOGIN_THROTTLE_MAX_KEYS', 10_000),
+    )
+    app.extensions['login_guard'] = guard
+    register_metrics(app, 'login_throttle', guard.stats)
+    return guard
+
+
+def get_login_guard():
+    return current_app.extensions['login_guard']
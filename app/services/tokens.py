@@ -0,0 +1,269 @@
+"""
+Refresh tokens.
+
+``/api/login`` checks the password (a full scrypt verification) once and
+returns a short-lived access token (``JWT_ACCESS_TOKEN_EXPIRES``) with a
+refresh token (``JWT_REFRESH_TOKEN_EXPIRES``); ``/api/refresh`` trades the
+refresh token for a new pair, checked with the token's HMAC signature and
+one lookup instead of the password hash.
+
+Refresh tokens rotate: each is good for one refresh. The tokens issued
+from one login form a family (the ``fam`` claim) and :class:`TokenStore`
+keeps the ``jti`` of the family's current token, in a SQLite file
+(``TOKEN_STORE_PATH``) shared by the workers. Rotating is one
+compare-and-swap ``UPDATE``, so two workers cannot both accept the same
+token; presenting an already used token ends the whole login, since
+either the client or a thief holds a copy.
+
+Logging out revokes tokens before they expire: ``/api/logout`` records the
+token's ``jti`` until its ``exp`` in the same file, and its family until
+the family's last access token expires (:func:`end_family`, also used for
+reused refresh tokens). The blocklist loader of flask_jwt_extended asks
+:meth:`TokenStore.is_revoked` about both claims on every protected
+request. Each worker keeps the revoked ``jti`` in a dict, so the check is
+a lookup. At most every ``sync_interval`` seconds (``TOKEN_REVOCATION_SYNC``)
+``PRAGMA data_version`` tells it whether another worker has written to the
+file, and then it reads only the rows added since (by id): a logout reaches
+the other workers within that delay, its own worker at once. Entries
+leave the dict through a heap ordered by expiry as soon as their token
+could not be used anyway, and expired rows and families are deleted from
+the file every ``PURGE_INTERVAL`` seconds.
+
+Changing the password or deleting the account ends every login of the user
+(:func:`end_user_sessions`), so a stolen refresh token stops working then
+too, and a user registered again under the same name does not inherit them.
+"""
+
+import heapq
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from flask import current_app
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jti
+
+from .. import jwt
+from .metrics import register_metrics
+
+
+class TokenStore:
+    """Token state shared by the workers, in one SQLite file."""
+
+    PURGE_INTERVAL = 300.0
+
+    def __init__(self, path, sync_interval=1.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._db = None
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+        # jti -> exp of the revoked tokens, the same by expiry, last row read
+        self._revoked = {}
+        self._expiries = []
+        self._last_id = 0
+        self._data_version = None
+        self._next_sync = 0.0
+        self._issued = 0
+        self._rotated = 0
+        self._reused = 0
+        self._denied = 0
+
+    def _open(self):
+        """The connection, created with the file on first use. Call under the lock."""
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS refresh_family ('
+                'family TEXT PRIMARY KEY, jti TEXT NOT NULL, username TEXT NOT NULL, expires REAL NOT NULL)'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS refresh_family_username ON refresh_family (username)')
+            # AUTOINCREMENT: ids never go back after the newest rows are purged
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS revoked ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, jti TEXT NOT NULL UNIQUE, expires REAL NOT NULL)'
+            )
+            self._db = db
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + self.PURGE_INTERVAL
+            self._db.execute('DELETE FROM refresh_family WHERE expires < ?', (now,))
+            self._db.execute('DELETE FROM revoked WHERE expires < ?', (now,))
+        return self._db
+
+    def _remember(self, jti, expires):
+        if jti not in self._revoked:
+            self._revoked[jti] = expires
+            heapq.heappush(self._expiries, (expires, jti))
+
+    def _sync(self, now):
+        """Load the revocations other workers wrote since the last sync. Call under the lock."""
+        if now >= self._next_sync:
+            self._next_sync = now + self.sync_interval
+            db = self._open()
+            version = db.execute('PRAGMA data_version').fetchone()[0]
+            if version != self._data_version:
+                self._data_version = version
+                rows = db.execute('SELECT id, jti, expires FROM revoked WHERE id > ? ORDER BY id', (self._last_id,))
+                for row_id, jti, expires in rows:
+                    self._last_id = row_id
+                    if expires >= now:
+                        self._remember(jti, expires)
+        expiries = self._expiries
+        while expiries and expiries[0][0] < now:
+            del self._revoked[heapq.heappop(expiries)[1]]
+
+    def revoke(self, jti, expires):
+        """Refuse the token ``jti`` from now until ``expires``, in every worker."""
+        with self._lock:
+            # _last_id stays: rows of other workers may sit below this one
+            self._open().execute('INSERT OR IGNORE INTO revoked (jti, expires) VALUES (?, ?)', (jti, expires))
+            self._remember(jti, expires)
+
+    def is_revoked(self, jti, family=None):
+        """Whether the token ``jti``, or the login ``family`` it belongs to, was revoked."""
+        with self._lock:
+            self._sync(time.time())
+            if jti in self._revoked or (family is not None and _family_key(family) in self._revoked):
+                self._denied += 1
+                return True
+            return False
+
+    def start_family(self, family, jti, username, expires):
+        with self._lock:
+            self._open().execute('INSERT INTO refresh_family VALUES (?, ?, ?, ?)', (family, jti, username, expires))
+            self._issued += 1
+
+    def rotate(self, family, old_jti, new_jti, expires):
+        """Make ``new_jti`` the family's token if ``old_jti`` still is; else revoke the family.
+
+        Returns whether the rotation happened.
+        """
+        with self._lock:
+            db = self._open()
+            rotated = db.execute(
+                'UPDATE refresh_family SET jti = ?, expires = ? WHERE family = ? AND jti = ? AND expires >= ?',
+                (new_jti, expires, family, old_jti, time.time()),
+            ).rowcount == 1
+            if rotated:
+                self._rotated += 1
+            else:
+                db.execute('DELETE FROM refresh_family WHERE family = ?', (family,))
+                self._reused += 1
+            return rotated
+
+    def revoke_family(self, family):
+        with self._lock:
+            self._open().execute('DELETE FROM refresh_family WHERE family = ?', (family,))
+
+    def revoke_user_families(self, username):
+        """Delete the families of every login of ``username``; return their ids."""
+        with self._lock:
+            db = self._open()
+            # One transaction: a rotation in another worker waits for the delete
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                families = [
+                    family for family, in db.execute('SELECT family FROM refresh_family WHERE username = ?', (username,))
+                ]
+                db.execute('DELETE FROM refresh_family WHERE username = ?', (username,))
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            return families
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'families_started': self._issued,
+                'refreshes': self._rotated,
+                'refused_refreshes': self._reused,
+                'revoked': len(self._revoked),
+                'refused_revoked': self._denied,
+            }
+
+
+def _family_key(family):
+    # Families share the denylist with the jti, which never contain ':'
+    return f'fam:{family}'
+
+
+def _refresh_expiry():
+    return time.time() + current_app.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds()
+
+
+def issue_tokens(username, role):
+    """``(access token, refresh token)`` for a new login."""
+    claims = {'role': role, 'fam': uuid.uuid4().hex}
+    refresh_token = create_refresh_token(identity=username, additional_claims=claims)
+    get_token_store().start_family(claims['fam'], get_jti(refresh_token), username, _refresh_expiry())
+    return create_access_token(identity=username, additional_claims=claims), refresh_token
+
+
+def refresh_tokens(claims):
+    """``(access token, refresh token)`` for the claims of a valid refresh token, or None if
+    the token was already used or its family revoked (then no token of the family works)."""
+    family = claims.get('fam')
+    if not family:
+        return None
+    username, new_claims = claims['sub'], {'role': claims.get('role'), 'fam': family}
+    refresh_token = create_refresh_token(identity=username, additional_claims=new_claims)
+    if not get_token_store().rotate(family, claims['jti'], get_jti(refresh_token), _refresh_expiry()):
+        end_family(family)
+        return None
+    return create_access_token(identity=username, additional_claims=new_claims), refresh_token
+
+
+def end_family(family):
+    """End a login: no more refreshes, and none of its tokens, access tokens included, works.
+
+    Without the family row no new access token can be issued, so the denylist
+    entry only has to outlive the newest access token issued until now.
+    """
+    store = get_token_store()
+    store.revoke_family(family)
+    store.revoke(_family_key(family), time.time() + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds())
+
+
+def end_user_sessions(username):
+    """End every login of ``username``: after a password change or the account's deletion."""
+    for family in get_token_store().revoke_user_families(username):
+        end_family(family)
+
+
+def revoke_session(claims):
+    """Log out: refuse the token of ``claims`` until it expires and end its login."""
+    get_token_store().revoke(claims['jti'], claims['exp'])
+    if claims.get('fam'):
+        end_family(claims['fam'])
+
+
+def _token_revoked(jwt_header, jwt_payload):
+    return get_token_store().is_revoked(jwt_payload['jti'], jwt_payload.get('fam'))
+
+
+def init_token_store(app):
+    store = TokenStore(
+        app.config.get('TOKEN_STORE_PATH', 'tokens.db'),
+        app.config.get('TOKEN_REVOCATION_SYNC', 1.0),
+    )
+    app.extensions['token_store'] = store
+    register_metrics(app, 'tokens', store.stats)
+    jwt.token_in_blocklist_loader(_token_revoked)
+    return store
+
+
+def get_token_store():
+    return current_app.extensions['token_store']
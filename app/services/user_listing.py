@@ -0,0 +1,103 @@
+"""
+Paging and projection for ``GET /api/users``.
+
+Users are listed role by role (drivers first) in storage order. A cursor is
+an opaque token naming the role and the store position of the last user
+returned; the store resumes right after it, so every page costs the same
+however deep into the list it is. The cursor also carries the store's scan
+generation for the role (the file's inode): after a compaction rewrote the
+file its positions point at other records, and the cursor is refused as
+stale instead of serving the wrong page.
+"""
+
+import base64
+import binascii
+import json
+
+from .user_store import ROLES
+
+
+class InvalidQuery(ValueError):
+    """Raised for malformed listing parameters."""
+
+
+def encode_cursor(role, position, generation):
+    raw = json.dumps([role, position, generation], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        role, position, generation = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidQuery('Invalid cursor')
+    if role not in ROLES or not isinstance(position, int):
+        raise InvalidQuery('Invalid cursor')
+    return role, position, generation
+
+
+def parse_fields(value):
+    """Return the requested field names, or None for every field."""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    if not fields:
+        raise InvalidQuery('Invalid fields')
+    return fields
+
+
+def parse_roles(value):
+    if not value:
+        return ROLES
+    if value not in ROLES:
+        raise InvalidQuery('Invalid role. Must be "driver" or "passenger"')
+    return (value,)
+
+
+def public_user(role, record, fields=None):
+    """The user as exposed by the API: with its role, never the password hash."""
+    user = dict(record)
+    user.pop('password', None)
+    user['role'] = role
+    if fields is not None:
+        user = {field: user[field] for field in fields if field in user}
+    return user
+
+
+def iter_listing(store, roles=ROLES, cursor=None, limit=None):
+    """Return an iterator of ``(role, position, record)`` resuming after ``cursor``.
+
+    The parameters are validated up front; records are then pulled from the
+    store lazily as the caller consumes them, nothing is materialised.
+    """
+    start_role, after, generation = decode_cursor(cursor) if cursor else (None, None, None)
+    if start_role is not None and start_role not in roles:
+        raise InvalidQuery('Cursor does not match the role filter')
+    if start_role is not None:
+        if generation != store.scan_generation(start_role):
+            raise InvalidQuery('Stale cursor: the user list was compacted, start from the first page')
+        roles = roles[roles.index(start_role):]
+    return _iter_roles(store, roles, after, limit)
+
+
+def _iter_roles(store, roles, after, limit):
+    for role in roles:
+        for position, record in store.scan_users(role, after, limit):
+            yield role, position, record
+        # Only the first role resumes mid-way
+        after = None
+
+
+def page(store, roles=ROLES, cursor=None, limit=100, fields=None):
+    """Return one page of users and the cursor for the next one (None at the end)."""
+    # Taken before reading: a compaction during the scan makes the cursor stale
+    generations = {role: store.scan_generation(role) for role in roles}
+    users = []
+    last = None
+    for role, position, record in iter_listing(store, roles, cursor, limit + 1):
+        if len(users) == limit:
+            return users, encode_cursor(*last, generations[last[0]])
+        users.append(public_user(role, record, fields))
+        last = (role, position)
+    return users, None
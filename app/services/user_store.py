@@ -0,0 +1,914 @@
+"""
+Indexed access to the JSON-Lines user files (drivers.json / passengers.json).
+
+Every data file has a companion SQLite index next to it (``drivers.json.idx``)
+mapping ``username`` and ``email`` to the byte offset and length of the line
+holding the record, so a lookup is a single indexed query plus a ``seek``.
+A freshly started worker can answer its first login straight from the
+sidecar without scanning the data file.
+
+The sidecar remembers how many bytes of the data file it covers. Lines
+appended after that point (by this or another worker, or left behind by a
+crash between the two writes) are indexed on the next access, and the
+sidecar is rebuilt from scratch when it is missing, unreadable or describes
+a different file (other inode, different leading bytes or last covered
+bytes, or more bytes than the file holds). A worker starting up therefore
+loads the sidecar and replays only the lines appended since it was last
+written. Every record read through the sidecar is checked against
+the key it was looked up by, so a stale entry triggers a rebuild instead of
+returning the wrong user.
+Records that have been read are kept in memory, so hot lookups never touch
+the disk.
+
+When a username appears on several lines the last one wins: updates append
+a new version of the record and deletions a tombstone. The JSON-only login
+used to stop at the first matching line, so a file holding an accidental
+duplicate now logs in with the later record.
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+
+from flask import current_app
+
+from .bloom import BloomFilter
+from .jsonl_scan import find_last
+from .jsonl_writer import decode_line, get_writer, writer_stats
+from .metrics import register_metrics
+
+logger = logging.getLogger(__name__)
+
+ROLES = ('driver', 'passenger')
+USER_KEYS = ('username', 'email')
+SCHOOL_KEYS = ('school_name', 'email', 'mechanical_code')
+
+INDEX_SUFFIX = '.idx'
+USERS_LOCK = 'users.lock'
+# Set on the tombstone line that records a deletion
+DELETED = '_deleted'
+BLOOM_SUFFIX = '.bloom'
+INDEX_VERSION = 2
+# Leading bytes checksummed to tell a replaced data file from an appended one
+HEAD_BYTES = 4096
+# Bytes before the covered size checksummed to tell a file whose end was
+# truncated and written again from one that only grew
+TAIL_BYTES = 4096
+
+_BLOOM_MAGIC = b'PCB2'
+# magic, fp rate, capacity, inode, covered size, head length, head crc,
+# tail length, tail crc, items
+_BLOOM_HEADER = struct.Struct('<4sdQQQQIQIQ')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    PRIMARY KEY (key, value)
+);
+CREATE INDEX IF NOT EXISTS entries_by_offset ON entries (key, offset);
+"""
+
+# Later lines win, so an appended record supersedes older ones even when two
+# workers index overlapping tails in a different order.
+_UPSERT = """
+INSERT INTO entries (key, value, offset, length) VALUES (?, ?, ?, ?)
+ON CONFLICT (key, value) DO UPDATE
+SET offset = excluded.offset, length = excluded.length
+WHERE excluded.offset > entries.offset
+"""
+
+
+def user_files(testing=False):
+    """Return the ``{role: filename}`` mapping used by the routes."""
+    if testing:
+        return {'driver': 'test_drivers.json', 'passenger': 'test_passengers.json'}
+    return {'driver': 'drivers.json', 'passenger': 'passengers.json'}
+
+
+def school_file(testing=False):
+    return 'test_schools.json' if testing else 'schools.json'
+
+
+class UserExists(Exception):
+    """Raised by a store when a write would break a uniqueness constraint."""
+
+
+class UserInUse(Exception):
+    """Raised by a store when a user still referenced by other rows is deleted."""
+
+
+# Record on a line, None if blank, invalid or failing its checksum
+_parse_line = decode_line
+
+
+def shard_path(path, shard):
+    """``drivers.json`` -> ``drivers.3.json`` for shard 3; ``path`` itself when unsharded."""
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f'{root}.{shard}{ext}'
+
+
+def users_lock_path(path, shard=None):
+    """Lock shared by the user files (of one shard) in the directory of ``path``.
+
+    Drivers and passengers share one lock so a username or email cannot be
+    claimed by two registrations of different roles at the same time.
+    """
+    return shard_path(os.path.join(os.path.dirname(os.path.abspath(path)), USERS_LOCK), shard)
+
+
+def _ends_line(path, size):
+    if size == 0:
+        return True
+    with open(path, 'rb') as f:
+        f.seek(size - 1)
+        return f.read(1) == b'\n'
+
+
+def _head_crc(path, length):
+    with open(path, 'rb') as f:
+        return zlib.crc32(f.read(length))
+
+
+def _tail_crc(path, end, length):
+    """CRC of the ``length`` bytes ending at byte ``end`` (a covered size)."""
+    with open(path, 'rb') as f:
+        f.seek(end - length)
+        return zlib.crc32(f.read(length))
+
+
+class JsonlIndex:
+    """One JSON-Lines file plus its on-disk offset index."""
+
+    def __init__(self, path, keys=USER_KEYS):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.keys = tuple(keys)
+        self._lock = threading.RLock()
+        self._db = None
+        # How the sidecar was attached and how many bytes were parsed on top
+        self._loads = 0
+        self._rebuilds = 0
+        self._replayed = 0
+        # Set while lookups fall back to scanning the file (see get())
+        self._scanning = False
+        self._reset()
+
+    def _reset(self):
+        self._cache = {key: {} for key in self.keys}
+        self._inode = None
+        self._size = 0
+        self._mtime = None
+
+    def _stat(self):
+        try:
+            return os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+    def _connect(self):
+        if self._db is None:
+            try:
+                self._db = sqlite3.connect(
+                    self.index_path, isolation_level=None, check_same_thread=False
+                )
+                self._db.executescript(_SCHEMA)
+            except sqlite3.DatabaseError:
+                # Not a database any more: throw it away, it is rebuilt below
+                if self._db is not None:
+                    self._db.close()
+                self._db = None
+                os.remove(self.index_path)
+                return self._connect()
+        return self._db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _scan(self, offset):
+        """Parse complete lines from ``offset``; return the new offset and index rows."""
+        rows = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Partial line still being written by another process
+                    break
+                record = _parse_line(line)
+                if record is not None:
+                    for key in self.keys:
+                        value = record.get(key)
+                        if value is not None:
+                            self._cache[key][value] = record
+                            rows.append((key, value, offset, len(line)))
+                offset += len(line)
+        return offset, rows
+
+    def _rebuild(self, st):
+        self._rebuilds += 1
+        self._cache = {key: {} for key in self.keys}
+        offset, rows = self._scan(0)
+        head = min(offset, HEAD_BYTES)
+        tail = min(offset, TAIL_BYTES)
+        with self._transaction() as db:
+            db.execute('DELETE FROM entries')
+            db.execute('DELETE FROM meta')
+            db.executemany(_UPSERT, rows)
+            db.executemany('INSERT INTO meta (name, value) VALUES (?, ?)', [
+                ('version', INDEX_VERSION),
+                ('inode', st.st_ino),
+                ('size', offset),
+                ('head', head),
+                ('head_crc', _head_crc(self.path, head)),
+                ('tail', tail),
+                ('tail_crc', _tail_crc(self.path, offset, tail)),
+            ])
+        return offset
+
+    def _open(self, st):
+        """Attach to the sidecar, rebuilding it unless it describes ``st``."""
+        meta = dict(self._connect().execute('SELECT name, value FROM meta'))
+        size = meta.get('size')
+        if (meta.get('version') != INDEX_VERSION or meta.get('inode') != st.st_ino
+                or size is None or size > st.st_size or not _ends_line(self.path, size)
+                or meta.get('head_crc') != _head_crc(self.path, meta.get('head', 0))
+                or meta.get('tail_crc') != _tail_crc(self.path, size, meta.get('tail', 0))):
+            size = self._rebuild(st)
+        else:
+            self._loads += 1
+        self._size = size
+
+    def _index_tail(self):
+        offset, rows = self._scan(self._size)
+        if offset != self._size:
+            with self._transaction() as db:
+                db.executemany(_UPSERT, rows)
+                covered = db.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()
+                # Another worker may already have indexed further
+                if covered is None or offset > covered[0]:
+                    tail = min(offset, TAIL_BYTES)
+                    db.executemany('UPDATE meta SET value = ? WHERE name = ?', [
+                        (offset, 'size'),
+                        (tail, 'tail'),
+                        (_tail_crc(self.path, offset, tail), 'tail_crc'),
+                    ])
+            self._replayed += offset - self._size
+            self._size = offset
+
+    def _read_at(self, offset, length):
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            line = f.read(length)
+        if not line.endswith(b'\n'):
+            return None
+        return _parse_line(line)
+
+    def refresh(self):
+        """Bring the index up to date with the file on disk."""
+        with self._lock:
+            st = self._stat()
+            if st is None:
+                if self._inode is not None:
+                    self._reset()
+                if self._db is not None:
+                    # The sidecar may be removed with the data file (resharding)
+                    self._db.close()
+                    self._db = None
+                return
+            if (st.st_ino, st.st_size, st.st_mtime_ns) == (self._inode, self._size, self._mtime):
+                return
+            if st.st_ino != self._inode or st.st_size < self._size or st.st_size == self._size:
+                self._reset()
+                self._open(st)
+            if st.st_size > self._size:
+                self._index_tail()
+            self._inode = st.st_ino
+            self._mtime = st.st_mtime_ns
+
+    def get(self, key, value):
+        """Return the live record whose ``key`` equals ``value``, or None.
+
+        Deleted records (tombstones) are not returned, and neither is an old
+        version found through a secondary key (e.g. an email the user has
+        since changed).
+        """
+        if value is None:
+            return None
+        try:
+            self.refresh()
+        except (sqlite3.Error, OSError):
+            # Sidecar unusable (read-only directory, disk full, ...): answer
+            # from the data file itself rather than fail the request
+            if not self._scanning:
+                logger.warning('index of %s unavailable, scanning the file', self.path,
+                               exc_info=True)
+                self._scanning = True
+            return self._live(key, value, lambda k, v: find_last(self.path, k, v))
+        self._scanning = False
+        with self._lock:
+            if self._inode is None:
+                return None
+            return self._live(key, value, self._lookup)
+
+    def _live(self, key, value, lookup):
+        record = lookup(key, value)
+        if record is None or record.get(DELETED):
+            return None
+        primary = self.keys[0]
+        if key != primary and record.get(primary) is not None:
+            record = lookup(primary, record[primary])
+            if record is None or record.get(DELETED) or record.get(key) != value:
+                return None
+        return record
+
+    def _lookup(self, key, value):
+        """Latest line indexed under ``key`` = ``value`` (may be a tombstone). Call under the lock."""
+        record = self._cache[key].get(value)
+        if record is None:
+            row = self._db.execute(
+                'SELECT offset, length FROM entries WHERE key = ? AND value = ?',
+                (key, value),
+            ).fetchone()
+            if row is not None:
+                record = self._read_at(*row)
+                if record is None or record.get(key) != value:
+                    # The sidecar no longer matches the data file
+                    self._size = self._rebuild(self._stat())
+                    return self._cache[key].get(value)
+                self._cache[key][value] = record
+        return record
+
+    def version(self):
+        """``(inode, size, mtime)`` of the data file, or None if it does not exist."""
+        st = self._stat()
+        return None if st is None else (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def stats(self):
+        """Sidecar loads and full rebuilds so far, and the bytes parsed on top of a sidecar."""
+        with self._lock:
+            return {
+                'indexed_bytes': self._size,
+                'sidecar_loads': self._loads,
+                'rebuilds': self._rebuilds,
+                'replayed_bytes': self._replayed,
+                'scanning': self._scanning,
+            }
+
+    def records(self):
+        """Return every record in file order."""
+        if self._stat() is None:
+            return []
+        records = []
+        with open(self.path, 'rb') as f:
+            for line in f:
+                record = _parse_line(line)
+                if record is not None:
+                    records.append(record)
+        return records
+
+    def iter_live(self, key, after=-1, chunk=500):
+        """Yield ``(offset, record)`` for the latest record of every ``key`` value.
+
+        Records come in file order starting after byte ``after``, so the
+        offset of the last record seen works as a resumable cursor. Lines
+        superseded by a later version of the same ``key`` are skipped without
+        being read, and deleted records are skipped.
+        """
+        self.refresh()
+        while True:
+            with self._lock:
+                if self._inode is None:
+                    return
+                rows = self._db.execute(
+                    'SELECT value, offset, length FROM entries '
+                    'WHERE key = ? AND offset > ? ORDER BY offset LIMIT ?',
+                    (key, after, chunk),
+                ).fetchall()
+            if not rows:
+                return
+            with open(self.path, 'rb') as f:
+                for value, offset, length in rows:
+                    f.seek(offset)
+                    line = f.read(length)
+                    record = _parse_line(line) if line.endswith(b'\n') else None
+                    if record is not None and record.get(key) == value and not record.get(DELETED):
+                        yield offset, record
+            after = rows[-1][1]
+
+    def live_rows(self, key):
+        """``{offset: length}`` of the latest line of every ``key`` value (tombstones included)."""
+        self.refresh()
+        with self._lock:
+            if self._inode is None:
+                return {}
+            return dict(self._db.execute(
+                'SELECT offset, length FROM entries WHERE key = ?', (key,)
+            ))
+
+    def append(self, record, check=None):
+        """Append ``record`` through the file's writer and index it."""
+        get_writer(self.path).append(record, check)
+        # Indexes our line along with anything another process appended
+        self.refresh_after_write()
+
+    def refresh_after_write(self):
+        """:meth:`refresh` after an append; sidecar errors are left to the next lookup."""
+        try:
+            self.refresh()
+        except (sqlite3.Error, OSError):
+            pass
+
+
+class JsonlBloom:
+    """Bloom filter over the ``keys`` of one JSON-Lines file, saved next to it.
+
+    Like the sidecar index it records how many bytes of the data file it
+    covers (plus inode and checksums of the leading and last covered bytes),
+    so lines appended by any worker are added on the next check and a saved
+    filter that describes another file is rebuilt. The filter only ever says "maybe" or "no": a
+    "no" lets the caller skip the exact lookup.
+    """
+
+    def __init__(self, path, keys=USER_KEYS, fp_rate=0.01, capacity=100_000, save_every=1000):
+        self.path = path
+        self.bloom_path = path + BLOOM_SUFFIX
+        self.keys = tuple(keys)
+        self.fp_rate = fp_rate
+        self.capacity = capacity
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._filter = None
+        self._inode = None
+        self._size = 0
+        self._head = 0
+        self._head_crc = 0
+        self._unsaved = 0
+        self._absent = 0
+        self._maybe = 0
+        self._false_positives = 0
+
+    @staticmethod
+    def _item(key, value):
+        return f'{key}\0{value}'
+
+    def _add_lines(self, offset):
+        """Add complete lines from ``offset``; return the offset reached."""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                record = _parse_line(line)
+                if record is not None:
+                    for key in self.keys:
+                        value = record.get(key)
+                        if value is not None:
+                            self._filter.add(self._item(key, value))
+                            self._unsaved += 1
+                offset += len(line)
+        return offset
+
+    def _rebuild(self, st, capacity):
+        self._filter = BloomFilter(capacity, self.fp_rate)
+        self._inode = st.st_ino
+        self._size = self._add_lines(0)
+        if self._filter.count > capacity:
+            return self._rebuild(st, self._filter.count * 2)
+        self._head = min(self._size, HEAD_BYTES)
+        self._head_crc = _head_crc(self.path, self._head)
+        self.save()
+
+    def _load(self, st):
+        """Attach to the saved filter if it describes a prefix of the file ``st``."""
+        try:
+            with open(self.bloom_path, 'rb') as f:
+                header = f.read(_BLOOM_HEADER.size)
+                magic, fp_rate, capacity, inode, size, head, head_crc, tail, tail_crc, count = (
+                    _BLOOM_HEADER.unpack(header)
+                )
+                bits = f.read()
+        except (OSError, struct.error):
+            return False
+        if (magic != _BLOOM_MAGIC or fp_rate != self.fp_rate or inode != st.st_ino
+                or size > st.st_size or not _ends_line(self.path, size)
+                or head_crc != _head_crc(self.path, head)
+                or tail_crc != _tail_crc(self.path, size, tail)):
+            return False
+        try:
+            self._filter = BloomFilter(capacity, fp_rate, bits, count)
+        except ValueError:
+            return False
+        self._inode, self._size, self._head, self._head_crc = inode, size, head, head_crc
+        return True
+
+    def save(self):
+        """Write the filter next to the data file (atomically)."""
+        if self._filter is None:
+            return
+        tail = min(self._size, TAIL_BYTES)
+        tail_crc = _tail_crc(self.path, self._size, tail)
+        tmp = self.bloom_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_BLOOM_HEADER.pack(
+                _BLOOM_MAGIC, self.fp_rate, self._filter.capacity, self._inode,
+                self._size, self._head, self._head_crc, tail, tail_crc, self._filter.count,
+            ))
+            f.write(self._filter.bits)
+        os.replace(tmp, self.bloom_path)
+        self._unsaved = 0
+
+    def refresh(self):
+        """Bring the filter up to date with the file on disk."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._filter = None
+                self._inode = None
+                return
+            if self._filter is None or st.st_ino != self._inode or st.st_size < self._size:
+                if self._filter is not None or not self._load(st):
+                    self._rebuild(st, self.capacity)
+            if st.st_size > self._size:
+                self._size = self._add_lines(self._size)
+                if self._filter.count > self._filter.capacity:
+                    # Too full for the configured rate: start over, twice as big
+                    self._rebuild(os.stat(self.path), self._filter.count * 2)
+                elif self._unsaved >= self.save_every:
+                    self.save()
+
+    def might_contain(self, key, value):
+        """False if no record has ``key`` equal to ``value``; True if one may have."""
+        if value is None:
+            return False
+        self.refresh()
+        with self._lock:
+            found = self._filter is not None and self._item(key, value) in self._filter
+            if found:
+                self._maybe += 1
+            else:
+                self._absent += 1
+            return found
+
+    def false_positive(self):
+        """Record that a "maybe" answer turned out to be absent."""
+        with self._lock:
+            self._false_positives += 1
+
+    def stats(self):
+        with self._lock:
+            bloom = self._filter
+            return {
+                'items': bloom.count if bloom else 0,
+                'capacity': bloom.capacity if bloom else 0,
+                'bits': bloom.size if bloom else 0,
+                'hashes': bloom.hashes if bloom else 0,
+                'fp_rate': self.fp_rate,
+                'estimated_fp_rate': bloom.estimated_fp_rate() if bloom else 0.0,
+                'definitely_absent': self._absent,
+                'maybe_present': self._maybe,
+                'false_positives': self._false_positives,
+            }
+
+
+class UserStore:
+    """Drivers and passengers behind a single lookup interface.
+
+    ``mirror`` optionally names a second set of files every new user is also
+    appended to (the test configuration mirrors into the main files so manual
+    inspection uses the same filenames as the original application).
+    """
+
+    def __init__(self, files, mirror=None, blooms=None, fsync=True, shard=None):
+        self.files = dict(files)
+        self.mirror = dict(mirror) if mirror else {}
+        self.fsync = fsync
+        # Set when the files are one shard of a ShardedUserStore: selects the lock
+        self.shard = shard
+        self._indexes = {role: get_index(path) for role, path in self.files.items()}
+        # Optional {role: JsonlBloom} consulted before the indexes in exists()
+        self._blooms = dict(blooms) if blooms else {}
+
+    def find_by_username(self, username):
+        """Return ``(record, role)`` for ``username``; drivers are checked first.
+
+        Within a file the last line for ``username`` wins (see the module docstring).
+        """
+        for role in ROLES:
+            record = self._indexes[role].get('username', username)
+            if record is not None:
+                return record, role
+        return None, None
+
+    def exists(self, username=None, email=None):
+        """True if any user of either role already uses ``username`` or ``email``."""
+        for role, index in self._indexes.items():
+            bloom = self._blooms.get(role)
+            for key, value in (('username', username), ('email', email)):
+                if value is None:
+                    continue
+                if bloom is not None and not bloom.might_contain(key, value):
+                    continue
+                if index.get(key, value) is not None:
+                    return True
+                if bloom is not None:
+                    bloom.false_positive()
+        return False
+
+    def _check_unique(self, record, accepted):
+        """Writer check: reject ``record`` if its username or email is taken."""
+        username, email = record.get('username'), record.get('email')
+        for other in accepted:
+            if ((username is not None and other.get('username') == username)
+                    or (email is not None and other.get('email') == email)):
+                raise UserExists(username)
+        if self.exists(username=username, email=email):
+            raise UserExists(username)
+
+    def _write(self, files, role, record, check=None):
+        path = files[role]
+        get_writer(path, users_lock_path(path, self.shard), self.fsync).append(record, check)
+        get_index(path).refresh_after_write()
+
+    def add(self, role, record):
+        """Append a new user, raising :class:`UserExists` if the username or email is taken.
+
+        Uniqueness is checked again under the write lock, so concurrent
+        registrations in any worker cannot both claim the same identifier.
+        """
+        self._write(self.files, role, record, self._check_unique)
+        self._write_mirror(role, record)
+
+    def _write_mirror(self, role, record):
+        mirror = self.mirror.get(role)
+        if mirror and mirror != self.files[role]:
+            try:
+                self._write(self.mirror, role, record)
+            except OSError:
+                # Only the primary file is authoritative
+                logger.warning('could not mirror %s %r to %s', role, record.get('username'),
+                               mirror, exc_info=True)
+
+    def update(self, role, username, changes):
+        """Store a new version of ``username`` with ``changes`` applied.
+
+        The files are append-only: the new version is appended and supersedes
+        the previous line in every lookup (see :func:`compaction.compact_file`
+        for reclaiming the space). Raises KeyError if the user does not exist
+        and :class:`UserExists` if a changed email is already taken.
+        """
+        index = self._indexes[role]
+        record = index.get('username', username)
+        if record is None:
+            raise KeyError(username)
+        record = {**record, **changes}
+        email = record.get('email')
+
+        def check(new, accepted):
+            # Under the write lock: the user must still exist and a new email
+            # must not belong to anyone else
+            if index.get('username', username) is None:
+                raise KeyError(username)
+            if 'email' in changes and email is not None:
+                for other in accepted:
+                    if other.get('email') == email and other.get('username') != username:
+                        raise UserExists(email)
+                for other_index in self._indexes.values():
+                    owner = other_index.get('email', email)
+                    if owner is not None and owner.get('username') != username:
+                        raise UserExists(email)
+
+        self._write(self.files, role, record, check)
+        self._write_mirror(role, record)
+
+    def delete(self, role, username):
+        """Delete ``username`` by appending a tombstone; KeyError if there is no such user."""
+        index = self._indexes[role]
+        record = index.get('username', username)
+        if record is None:
+            raise KeyError(username)
+        tombstone = {'username': username, 'email': record.get('email'), DELETED: True}
+
+        def check(new, accepted):
+            if index.get('username', username) is None:
+                raise KeyError(username)
+
+        self._write(self.files, role, tombstone, check)
+        self._write_mirror(role, tombstone)
+
+    def scan_users(self, role, after=None, limit=None):
+        """Yield ``(position, record)`` for the users of ``role`` past ``position`` ``after``."""
+        chunk = min(limit, 500) if limit else 500
+        return self._indexes[role].iter_live('username', -1 if after is None else after, chunk)
+
+    def scan_generation(self, role):
+        """The inode of the ``role`` file: a compaction, which moves every offset, changes it."""
+        version = self._indexes[role].version()
+        return 0 if version is None else version[0]
+
+    def iter_users(self):
+        """Yield ``(role, record)`` for the current version of every user, drivers first."""
+        for role in ROLES:
+            for _, record in self.scan_users(role):
+                yield role, record
+
+    def version(self):
+        """Cheap token that changes whenever either file does (see ``response_cache``)."""
+        return tuple(self._indexes[role].version() for role in ROLES)
+
+
+class SchoolStore:
+    """Schools file indexed on name, email and mechanical code."""
+
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._index = get_index(path, SCHOOL_KEYS)
+
+    def exists(self, school_name=None, email=None, mechanical_code=None):
+        return (
+            self._index.get('school_name', school_name) is not None
+            or self._index.get('email', email) is not None
+            or self._index.get('mechanical_code', mechanical_code) is not None
+        )
+
+    def _check_unique(self, record, accepted):
+        """Writer check: reject ``record`` if its name, email or code is taken."""
+        values = {key: record.get(key) for key in SCHOOL_KEYS}
+        if self.exists(**values) or any(
+            value is not None and other.get(key) == value
+            for other in accepted for key, value in values.items()
+        ):
+            raise UserExists(record.get('school_name'))
+
+    def add(self, record):
+        """Append a new school, raising :class:`UserExists` if name, email or code is taken."""
+        get_writer(self.path, fsync=self.fsync).append(record, self._check_unique)
+        self._index.refresh_after_write()
+
+    def iter_schools(self):
+        return iter(self._index.records())
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_index(path, keys=USER_KEYS):
+    """Return the process-wide :class:`JsonlIndex` for ``path``."""
+    key = (os.path.abspath(path), tuple(keys))
+    with _registry_lock:
+        index = _registry.get(key)
+        if index is None:
+            index = _registry[key] = JsonlIndex(key[0], keys)
+        return index
+
+
+_blooms = {}
+
+
+def refresh_file(path):
+    """Bring this process' indexes and filters of ``path`` up to date (after a rewrite)."""
+    path = os.path.abspath(path)
+    with _registry_lock:
+        indexes = [index for (index_path, _), index in _registry.items() if index_path == path]
+        blooms = [bloom for (bloom_path, _), bloom in _blooms.items() if bloom_path == path]
+    for item in indexes + blooms:
+        item.refresh()
+
+
+def get_bloom(path, fp_rate=0.01, capacity=100_000):
+    """Return the process-wide :class:`JsonlBloom` for ``path``."""
+    key = (os.path.abspath(path), fp_rate)
+    with _registry_lock:
+        bloom = _blooms.get(key)
+        if bloom is None:
+            bloom = _blooms[key] = JsonlBloom(key[0], USER_KEYS, fp_rate, capacity)
+        return bloom
+
+
+def user_blooms(files):
+    """``{role: JsonlBloom}`` for ``files`` as configured, empty when disabled."""
+    fp_rate = current_app.config.get('USER_BLOOM_FP_RATE')
+    if not fp_rate:
+        return {}
+    capacity = current_app.config.get('USER_BLOOM_CAPACITY', 100_000)
+    return {role: get_bloom(path, fp_rate, capacity) for role, path in files.items()}
+
+
+def init_user_files(app):
+    """Startup work for the JSON-Lines files.
+
+    Truncates records torn by a crash, attaches the sidecar indexes (only
+    the lines appended since they were written are parsed), then loads (or
+    rebuilds) the Bloom filters of the user files (of every shard).
+    """
+    if app.config.get('USER_STORE_BACKEND') == 'sql':
+        return
+    from .sharding import CLAIM_KEYS, claim_files, shard_files
+
+    testing = bool(app.config.get('TESTING'))
+    fsync = app.config.get('USER_FILE_FSYNC', True)
+    shards = app.config.get('USER_SHARDS', 1)
+    layout = shard_files(testing, shards)
+    for shard, files in layout:
+        for path in files.values():
+            get_writer(path, users_lock_path(path, shard), fsync).repair()
+    for path in claim_files(testing, shards) + [school_file(testing)]:
+        get_writer(path, fsync=fsync).repair()
+    register_metrics(app, 'user_writes', writer_stats)
+
+    indexes = [get_index(path) for _, files in layout for path in files.values()]
+    indexes += [get_index(path, CLAIM_KEYS) for path in claim_files(testing, shards)]
+    indexes.append(get_index(school_file(testing), SCHOOL_KEYS))
+    for index in indexes:
+        try:
+            index.refresh()
+        except (sqlite3.Error, OSError):
+            # Lookups scan the file until the sidecar can be written (see JsonlIndex.get)
+            logger.warning('could not load the index of %s', index.path, exc_info=True)
+    register_metrics(app, 'user_index', lambda: {
+        os.path.basename(index.path): index.stats() for index in indexes
+    })
+
+    if not app.config.get('USER_BLOOM_FP_RATE'):
+        return
+    blooms = {}
+    with app.app_context():
+        for shard, files in layout:
+            for role, bloom in user_blooms(files).items():
+                blooms[role if shard is None else f'{role}.{shard}'] = bloom
+    for bloom in blooms.values():
+        bloom.refresh()
+    register_metrics(app, 'user_bloom', lambda: {
+        name: bloom.stats() for name, bloom in blooms.items()
+    })
+
+
+@atexit.register
+def _save_blooms():
+    for bloom in list(_blooms.values()):
+        with bloom._lock:
+            if bloom._unsaved:
+                try:
+                    bloom.save()
+                except OSError:
+                    pass
+
+
+def _use_database():
+    return current_app.config.get('USER_STORE_BACKEND') == 'sql'
+
+
+def get_user_store():
+    """Return the user store for the current application."""
+    backend = current_app.config.get('USER_STORE_BACKEND')
+    if backend == 'sql':
+        from .sql_store import SqlUserStore
+        return SqlUserStore()
+    testing = bool(current_app.config.get('TESTING'))
+    shards = current_app.config.get('USER_SHARDS', 1)
+    if shards > 1:
+        from .sharding import sharded_user_store
+        store = sharded_user_store(testing, shards)
+    else:
+        files = user_files(testing)
+        store = UserStore(
+            files,
+            mirror=user_files() if testing else None,
+            blooms=user_blooms(files),
+            fsync=current_app.config.get('USER_FILE_FSYNC', True),
+        )
+    if backend == 'dual':
+        from .migration import dual_write_store
+        return dual_write_store(store)
+    return store
+
+
+def get_school_store():
+    """Return the school store for the current application."""
+    if _use_database():
+        from .sql_store import SqlSchoolStore
+        return SqlSchoolStore()
+    return SchoolStore(
+        school_file(bool(current_app.config.get('TESTING'))),
+        fsync=current_app.config.get('USER_FILE_FSYNC', True),
+    )
@@ -0,0 +1,97 @@
+"""
+Signup latency with and without the username/email Bloom filter.
+
+Generates ``--users`` drivers and passengers in a temporary directory, then
+times ``POST /api/register`` for new users and ``UserStore.exists`` alone,
+once with ``USER_BLOOM_FP_RATE=0`` (index lookups only) and once with the
+filter. Password hashing is set to a single PBKDF2 round so the numbers show
+the storage path rather than the hash.
+
+    python benchmarks/bloom_signup.py --users 1000000
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.services.user_store import get_user_store  # noqa: E402
+
+
+def write_users(count):
+    for role, filename in (('driver', 'drivers.json'), ('passenger', 'passengers.json')):
+        with open(filename, 'w') as f:
+            for i in range(role == 'passenger', count, 2):
+                f.write(json.dumps({
+                    'username': f'user{i}',
+                    'email': f'user{i}@example.com',
+                    'password': 'pbkdf2:sha256:1$salt$hash',
+                }) + '\n')
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return '%.3f ms median, %.3f ms p95' % (
+        statistics.median(samples) * 1000, samples[int(len(samples) * 0.95)] * 1000
+    )
+
+
+def run(label, fp_rate, signups, offset):
+    app = create_app({
+        'USER_BLOOM_FP_RATE': fp_rate,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1',
+    })
+    client = app.test_client()
+    with app.app_context():
+        store = get_user_store()
+        # Warm up: build the sidecar indexes (and the filter) outside the timings
+        store.exists(username='warmup', email='warmup@example.com')
+
+        checks = []
+        for i in range(signups):
+            started = time.perf_counter()
+            store.exists(username=f'probe{offset + i}', email=f'probe{offset + i}@example.com')
+            checks.append(time.perf_counter() - started)
+
+    requests = []
+    for i in range(signups):
+        name = f'new{offset + i}'
+        started = time.perf_counter()
+        response = client.post('/api/register', json={
+            'username': name,
+            'email': f'{name}@example.com',
+            'password': 'BenchPassword1',
+            'role': 'driver',
+            'phonenumber': '3330000000',
+            'age': '30',
+            'licenseid': 'LIC00001',
+        })
+        requests.append(time.perf_counter() - started)
+        assert response.status_code == 201, response.get_json()
+    print(f'{label:>10}: exists() {summary(checks)}; POST /api/register {summary(requests)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--signups', type=int, default=2000)
+    parser.add_argument('--fp-rate', type=float, default=0.01)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        started = time.perf_counter()
+        write_users(args.users)
+        print(f'{args.users} users written in {time.perf_counter() - started:.1f}s')
+        run('no filter', 0, args.signups, 0)
+        run('bloom', args.fp_rate, args.signups, args.signups)
+
+
+if __name__ == '__main__':
+    main()
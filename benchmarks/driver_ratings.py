@@ -0,0 +1,85 @@
+"""
+Driver ratings: incremental aggregates against recomputing the average.
+
+Adds ``--reviews`` reviews spread over ``--drivers`` drivers on an
+in-memory SQLite database, once with ``ratings.add_review`` (one O(1)
+UPDATE of the driver's count, sum and score) and once recomputing the
+driver's average from all their reviews after each insert, then times
+``ratings.reconcile`` over the result.
+
+    python benchmarks/driver_ratings.py --reviews 20000 --drivers 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, update  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import Driver, Passenger, Review, School, Trip  # noqa: E402
+from app.services import ratings  # noqa: E402
+
+
+def setup(drivers, reviews):
+    db.drop_all()
+    db.create_all()
+    db.session.add(School(name='ITT', address='Via Ugo Foscolo 51', email='itt@example.com',
+                          representative='R', mechanical_code='FOTF010008'))
+    db.session.execute(db.insert(Driver), [
+        {'id': i + 1, 'username': f'driver{i}', 'password_hash': 'x'} for i in range(drivers)])
+    db.session.execute(db.insert(Trip), [
+        {'code': i + 1, 'driver_id': i + 1, 'school_id': 1, 'origin_lat': 44.1, 'origin_lon': 12.2}
+        for i in range(drivers)])
+    db.session.execute(db.insert(Passenger), [
+        {'id': i + 1, 'username': f'passenger{i}', 'password_hash': 'x'} for i in range(reviews)])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--drivers', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    stream = [(rng.randint(1, args.drivers), passenger + 1, rng.randint(1, 5)) for passenger in range(args.reviews)]
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    with app.app_context():
+        prior_mean, prior_weight = app.config['RATING_PRIOR_MEAN'], app.config['RATING_PRIOR_WEIGHT']
+        setup(args.drivers, args.reviews)
+        started = time.perf_counter()
+        for code, passenger_id, stars in stream:
+            ratings.add_review(db.session.get(Trip, code), passenger_id, stars)
+            db.session.commit()
+        incremental = time.perf_counter() - started
+        started = time.perf_counter()
+        result = ratings.reconcile()
+        reconciled = time.perf_counter() - started
+
+        setup(args.drivers, args.reviews)
+        started = time.perf_counter()
+        for code, passenger_id, stars in stream:
+            trip = db.session.get(Trip, code)
+            db.session.add(Review(trip_code=code, driver_id=trip.driver_id, passenger_id=passenger_id, stars=stars))
+            db.session.flush()
+            count, stars_sum = db.session.execute(
+                select(func.count(Review.id), func.sum(Review.stars)).where(Review.driver_id == trip.driver_id)
+            ).one()
+            db.session.execute(update(Driver).where(Driver.id == trip.driver_id).values(
+                rating=ratings.smoothed(stars_sum, count, prior_mean, prior_weight)))
+            db.session.commit()
+        recomputed = time.perf_counter() - started
+
+    print(f'{args.reviews} reviews of {args.drivers} drivers')
+    print(f'  incremental: {incremental / args.reviews * 1e6:7.1f} us/review')
+    print(f'  recompute:   {recomputed / args.reviews * 1e6:7.1f} us/review')
+    print(f"  reconcile:   {reconciled * 1000:7.1f} ms ({result['drivers']} drivers, {result['corrected']} corrected)")
+
+
+if __name__ == '__main__':
+    main()
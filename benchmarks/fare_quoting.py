@@ -0,0 +1,92 @@
+"""
+Fare quoting: per-driver loop against column arrays, and cache hits.
+
+Prices ``--candidates`` random drivers for ``--quotes`` pickup points, as
+``pricing.quote`` does after matching: once driver by driver (one dict and
+one distance per driver, as a naive endpoint would) and once with
+``pricing.quote_columns`` (NumPy when installed, else one list per column).
+Then times a browsing passenger hitting ``pricing.QuoteCache`` with the
+same pickup on every keystroke.
+
+    python benchmarks/fare_quoting.py --candidates 200 --quotes 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import pricing  # noqa: E402
+from app.services.matching import haversine_km  # noqa: E402
+
+CENTER = (44.1391, 12.2431)
+
+
+def random_point(rng, spread):
+    return CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+
+
+def quote_loop(pickup, school, drivers, speed_kmh, rating_weight):
+    ride_km = haversine_km(*pickup, *school)
+    quotes = []
+    for driver in drivers:
+        to_pickup = haversine_km(*driver['origin'], *pickup)
+        quotes.append({
+            'fare': round(driver['priceperkm'] * ride_km, 2),
+            'pickup_minutes': to_pickup / speed_kmh * 60,
+            'arrival_minutes': (to_pickup + ride_km) / speed_kmh * 60,
+            'rating': driver['rating'],
+        })
+    cheapest = min(q['fare'] for q in quotes)
+    for q in quotes:
+        q['score'] = (rating_weight * min(max(q['rating'], 0), 5) / 5
+                      + (1 - rating_weight) * (cheapest + 0.01) / (q['fare'] + 0.01))
+    return quotes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--candidates', type=int, default=200)
+    parser.add_argument('--quotes', type=int, default=2000)
+    parser.add_argument('--spread', type=float, default=0.1, help='degrees around Cesena')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    school = CENTER
+    drivers = [{'origin': random_point(rng, args.spread), 'priceperkm': rng.uniform(0.1, 0.8),
+                'rating': rng.uniform(1, 5)} for _ in range(args.candidates)]
+    origins = [d['origin'] for d in drivers]
+    prices = [d['priceperkm'] for d in drivers]
+    ratings = [d['rating'] for d in drivers]
+    pickups = [random_point(rng, args.spread) for _ in range(args.quotes)]
+    print(f"{args.quotes} quotes over {args.candidates} drivers, "
+          f"{'NumPy' if pricing.np is not None else 'pure-Python'} columns")
+
+    started = time.perf_counter()
+    for pickup in pickups:
+        quote_loop(pickup, school, drivers, 30.0, 0.3)
+    looped = time.perf_counter()
+    for pickup in pickups:
+        pricing.quote_columns(pickup, school, origins, prices, ratings, 30.0, 0.3)
+    columns = time.perf_counter()
+    print(f'  per-driver loop {(looped - started) / args.quotes * 1e6:8.1f} us/quote')
+    print(f'  column arrays   {(columns - looped) / args.quotes * 1e6:8.1f} us/quote')
+
+    cache = pricing.QuoteCache()
+    key = (1, round(pickups[0][0], pricing.KEY_DECIMALS), round(pickups[0][1], pricing.KEY_DECIMALS),
+           tuple(range(args.candidates)))
+    started = time.perf_counter()
+    for _ in range(args.quotes):
+        if cache.get(key) is None:
+            cache.put(key, pricing.quote_columns(pickups[0], school, origins, prices, ratings, 30.0, 0.3))
+    cached = time.perf_counter()
+    stats = cache.stats()
+    print(f"  cached keystrokes {(cached - started) / args.quotes * 1e6:6.1f} us/quote "
+          f"({stats['hits']} hits, {stats['misses']} misses)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Offline geocoding: gazetteer lookup vs persistent cache vs in-memory LRU.
+
+Builds a synthetic gazetteer of ``--streets`` streets with ``--numbers``
+house numbers each, then geocodes ``--queries`` pickup points (a mix of
+existing and interpolated house numbers, as free text) three times: cold
+(every address goes to the gazetteer), from the persistent cache of a new
+geocoder (a restarted worker) and from the LRU.
+
+    python benchmarks/geocoding.py --streets 5000 --numbers 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.geocoding import Geocoder, import_gazetteer  # noqa: E402
+
+
+def timed(geocoder, queries):
+    started = time.perf_counter()
+    found = sum(geocoder.geocode(text) is not None for text in queries)
+    return (time.perf_counter() - started) / len(queries) * 1e6, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--streets', type=int, default=5_000)
+    parser.add_argument('--numbers', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'extract.tsv')
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write('street\thousenumber\tcity\tlat\tlon\n')
+            for street in range(args.streets):
+                lat, lon = 44.0 + rng.random() * 0.3, 12.0 + rng.random() * 0.4
+                # Every other number is missing, to be interpolated
+                for number in range(1, args.numbers + 1, 2):
+                    f.write(f'Via Strada {street}\t{number}\tCesena\t{lat + number * 1e-5}\t{lon}\n')
+        gazetteer = os.path.join(tmp, 'gazetteer.db')
+        started = time.perf_counter()
+        imported, _ = import_gazetteer(source, gazetteer)
+        print(f'{imported} addresses imported in {time.perf_counter() - started:.1f} s, '
+              f'{os.path.getsize(gazetteer) / 1e6:.1f} MB')
+
+        queries = [f'V. Strada {rng.randrange(args.streets)} {rng.randint(1, args.numbers)}, Cesena'
+                   for _ in range(args.queries)]
+        cache = os.path.join(tmp, 'cache.db')
+        cold, found = timed(Geocoder(gazetteer, cache, cache_size=len(queries)), queries)
+        restarted = Geocoder(gazetteer, cache, cache_size=len(queries))
+        persistent, _ = timed(restarted, queries)
+        lru, _ = timed(restarted, queries)
+        print(f'{args.queries} queries, {found} found')
+        print(f'  gazetteer        {cold:8.1f} us per address')
+        print(f'  persistent cache {persistent:8.1f} us ({cold / persistent:.1f}x)')
+        print(f'  LRU              {lru:8.1f} us ({cold / lru:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
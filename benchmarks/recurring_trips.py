@@ -0,0 +1,84 @@
+"""
+Recurring trips: lazy expansion against one stored trip per day.
+
+Creates ``--schedules`` weekday schedules over a school year on an
+in-memory SQLite database and times listing one week with
+``recurrence.occurrences``, then materialises the same year eagerly (one
+``Trip`` per day, what storing occurrences up front would cost) and times
+the same week read from the table.
+
+    python benchmarks/recurring_trips.py --schedules 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, time as clock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db  # noqa: E402
+from app.models import Driver, School, Trip, TripSchedule  # noqa: E402
+from app.services import recurrence  # noqa: E402
+
+STARTS_ON, ENDS_ON = date(2026, 9, 14), date(2027, 6, 6)
+WEEK = (date(2026, 10, 19), date(2026, 10, 25))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--schedules', type=int, default=2000)
+    args = parser.parse_args()
+
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    rng = random.Random(1)
+    with app.app_context():
+        db.create_all()
+        db.session.add(School(name='ITT', address='Via Ugo Foscolo 51', email='itt@example.com',
+                              representative='R', mechanical_code='FOTF010008', latitude=44.1391, longitude=12.2431))
+        db.session.execute(db.insert(Driver), [
+            {'id': i + 1, 'username': f'driver{i}', 'password_hash': 'x'} for i in range(args.schedules)])
+        db.session.execute(db.insert(TripSchedule), [{
+            'driver_id': i + 1, 'school_id': 1, 'weekdays': 0b11111,
+            'origin_lat': 44.1391 + rng.uniform(-0.1, 0.1), 'origin_lon': 12.2431 + rng.uniform(-0.1, 0.1),
+            'starts_on': STARTS_ON, 'ends_on': ENDS_ON,
+            'arrival_from': clock(7, 40), 'arrival_until': clock(7, 50),
+        } for i in range(args.schedules)])
+        db.session.commit()
+        zone = recurrence.schedule_zone()
+
+        started = time.perf_counter()
+        week = [recurrence.occurrence_dict(o, zone) for o in recurrence.occurrences(1, *WEEK)]
+        listed = time.perf_counter() - started
+        stored = db.session.execute(db.select(db.func.count(Trip.code))).scalar()
+        print(f'{args.schedules} schedules, one week: {len(week)} trips')
+        print(f'  lazy:  {listed * 1000:7.1f} ms, {stored} trip rows stored')
+
+        started = time.perf_counter()
+        rows = []
+        for schedule in db.session.execute(db.select(TripSchedule)).scalars():
+            for day in recurrence.occurrence_dates(schedule.weekdays, schedule.starts_on, schedule.ends_on,
+                                                   STARTS_ON, ENDS_ON):
+                windows = recurrence.windows_on(schedule, day, zone)
+                rows.append({
+                    'driver_id': schedule.driver_id, 'school_id': 1, 'origin_lat': schedule.origin_lat,
+                    'origin_lon': schedule.origin_lon, 'arrival_from': windows['arrival'][0],
+                    'arrival_until': windows['arrival'][1],
+                })
+        db.session.execute(db.insert(Trip), rows)
+        db.session.commit()
+        materialised = time.perf_counter() - started
+        start_utc, end_utc = recurrence._utc(WEEK[0], clock(0), zone), recurrence._utc(WEEK[1], clock(23, 59), zone)
+        started = time.perf_counter()
+        week = db.session.execute(
+            db.select(Trip).where(Trip.arrival_from >= start_utc, Trip.arrival_from <= end_utc)
+        ).scalars().all()
+        read = time.perf_counter() - started
+        print(f'  eager: {read * 1000:7.1f} ms for the week ({len(week)} trips), '
+              f'{len(rows)} trip rows stored in {materialised:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
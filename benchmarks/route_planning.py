@@ -0,0 +1,61 @@
+"""
+Route planning: distance matrices and nearest-neighbour + 2-opt for a morning.
+
+Generates ``--trips`` trips around Cesena with 1 to ``--max-stops`` pickups
+each and times building their distance matrices (one batch, as
+``routing.plan_routes`` does: NumPy when installed, else point by point)
+and ordering the pickups, against keeping the order the requests came in.
+
+    python benchmarks/route_planning.py --trips 25000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import routing  # noqa: E402
+
+CENTER = (44.1391, 12.2431)
+
+
+def random_point(rng, spread):
+    return CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--trips', type=int, default=25_000)
+    parser.add_argument('--max-stops', type=int, default=7)
+    parser.add_argument('--spread', type=float, default=0.1, help='degrees around Cesena')
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    point_lists = []
+    for _ in range(args.trips):
+        school = random_point(rng, args.spread / 3)
+        stops = [random_point(rng, args.spread) for _ in range(rng.randint(1, args.max_stops))]
+        point_lists.append([random_point(rng, args.spread), *stops, school])
+    stops = sum(len(points) - 2 for points in point_lists)
+    print(f"{args.trips} trips, {stops} pickups, "
+          f"{'NumPy' if routing.np is not None else 'pure-Python'} distance matrices")
+
+    started = time.perf_counter()
+    matrices = routing.distance_matrices(point_lists)
+    built = time.perf_counter()
+    routes = [[0, *routing.plan(matrix), len(matrix) - 1] for matrix in matrices]
+    planned = time.perf_counter()
+
+    as_requested = sum(routing.route_length(list(range(len(matrix))), matrix) for matrix in matrices)
+    nearest = sum(routing.route_length(routing.nearest_neighbour(matrix), matrix) for matrix in matrices)
+    optimised = sum(routing.route_length(route, matrix) for route, matrix in zip(routes, matrices))
+    print(f'  matrices {built - started:6.2f} s, nearest neighbour + 2-opt {planned - built:6.2f} s')
+    print(f'  total km: request order {as_requested:,.0f}, nearest neighbour {nearest:,.0f}, '
+          f'+ 2-opt {optimised:,.0f} ({1 - optimised / as_requested:.1%} shorter than request order)')
+
+
+if __name__ == '__main__':
+    main()
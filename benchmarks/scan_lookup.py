@@ -0,0 +1,83 @@
+"""
+Index-free username lookup: ``json.loads`` on every line vs the mmap scanner.
+
+Writes ``--lines`` users to a temporary JSON-Lines file and times looking up
+users near the start, in the middle, near the end and one that does not
+exist, with the line-by-line loop the routes used before the indexes
+(decode every line, stop at the first match) and with
+``jsonl_scan.find_last`` (search the bytes backwards, decode the candidate).
+
+    python benchmarks/scan_lookup.py --lines 1000000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.jsonl_scan import find_last  # noqa: E402
+from app.services.jsonl_writer import decode_line, encode_line  # noqa: E402
+
+
+def loads_loop(path, username):
+    with open(path, 'rb') as f:
+        for line in f:
+            # json.loads plus the checksum check, as every line is stored now
+            user = decode_line(line)
+            if user is not None and user.get('username') == username:
+                return user
+    return None
+
+
+def scan(path, username):
+    return find_last(path, 'username', username)
+
+
+def timed(function, path, username, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(path, username)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--lines', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'drivers.json')
+        with open(path, 'wb') as f:
+            for i in range(args.lines):
+                f.write(encode_line({
+                    'username': f'user{i}',
+                    'email': f'user{i}@example.com',
+                    'password': 'pbkdf2:sha256:1$salt$hash',
+                    'phonenumber': '3330000000',
+                    'age': '30',
+                }))
+        print(f'{args.lines} lines, {os.path.getsize(path)} bytes')
+
+        targets = {
+            'start': f'user{args.lines // 100}',
+            'middle': f'user{args.lines // 2}',
+            'end': f'user{args.lines - args.lines // 100}',
+            'missing': 'nobody',
+        }
+        for label, username in targets.items():
+            assert loads_loop(path, username) == scan(path, username)
+            loop_ms = timed(loads_loop, path, username, args.repeat)
+            scan_ms = timed(scan, path, username, args.repeat)
+            print(f'{label:>8}: json.loads loop {loop_ms:9.2f} ms, mmap scan {scan_ms:8.2f} ms '
+                  f'({loop_ms / scan_ms:6.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Batch seat allocation: solve time and seat utilisation.
+
+For each size, stores ``--requests-per-trip`` times fewer trips than requests
+(vehicles of 3 to 8 seats, some with an accessible one) around Cesena to
+``--schools`` schools in a temporary SQLite database, then runs
+``allocation.allocate_pending`` as ``flask allocate-seats`` does and
+reports the time spent loading, solving and writing back, and how many
+seats were filled.
+
+    python benchmarks/seat_allocation.py --sizes 1000 10000 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import Driver, Passenger, School, Trip, TripRequest, Vehicle  # noqa: E402
+from app.services.allocation import allocate_pending  # noqa: E402
+
+CENTER = (44.1391, 12.2431)
+
+
+def random_point(rng, spread):
+    return CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+
+
+def populate(size, args, rng):
+    trips = max(1, int(size / args.requests_per_trip))
+    db.session.execute(insert(School), [
+        {'id': i + 1, 'name': f'School {i}', 'address': 'Cesena', 'email': f'school{i}@example.com',
+         'representative': 'Rossi', 'mechanical_code': f'FO{i:08d}',
+         'latitude': point[0], 'longitude': point[1]}
+        for i, point in enumerate(random_point(rng, args.spread / 3) for _ in range(args.schools))
+    ])
+    db.session.execute(insert(Driver), [
+        {'id': i + 1, 'username': f'driver{i}', 'password_hash': 'hash'} for i in range(trips)
+    ])
+    db.session.execute(insert(Vehicle), [
+        {'driver_id': i + 1, 'licence_plate': f'PL{i:07d}', 'model': 'car', 'color': 'grey', 'fuel': 'petrol',
+         'seats_number': rng.randint(3, 8), 'handicap_seats': int(rng.random() < 0.2), 'cv': 90, 'kw': 66}
+        for i in range(trips)
+    ])
+    db.session.execute(insert(Trip), [
+        {'code': i + 1, 'driver_id': i + 1, 'school_id': rng.randint(1, args.schools),
+         'origin_lat': lat, 'origin_lon': lon, 'status': 'open'}
+        for i, (lat, lon) in enumerate(random_point(rng, args.spread) for _ in range(trips))
+    ])
+    db.session.execute(insert(Passenger), [
+        {'id': i + 1, 'username': f'passenger{i}', 'password_hash': 'hash'} for i in range(size)
+    ])
+    db.session.execute(insert(TripRequest), [
+        {'passenger_id': i + 1, 'school_id': rng.randint(1, args.schools), 'pickup_lat': lat, 'pickup_lon': lon,
+         'handicap': rng.random() < 0.03, 'status': 'pending'}
+        for i, (lat, lon) in enumerate(random_point(rng, args.spread) for _ in range(size))
+    ])
+    db.session.commit()
+    return trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--schools', type=int, default=20)
+    parser.add_argument('--requests-per-trip', type=float, default=4.0)
+    parser.add_argument('--spread', type=float, default=0.2, help='degrees around Cesena')
+    parser.add_argument('--max-detour', type=float, default=3.0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = random.Random(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            app = create_app({
+                'TESTING': True,
+                'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                'USER_STORE_BACKEND': 'sql',
+            })
+            with app.app_context():
+                db.create_all()
+                started = time.perf_counter()
+                trips = populate(size, args, rng)
+                populated = time.perf_counter() - started
+                result = allocate_pending(
+                    max_detour_km=args.max_detour,
+                    cell_km=app.config['MATCH_CELL_KM'],
+                    candidates=app.config['ALLOCATION_CANDIDATES'],
+                )
+                db.session.remove()
+        print(f"{size:>7} requests, {trips:>6} trips (populated in {populated:.1f} s): "
+              f"load {result['load_seconds']:6.2f} s, solve {result['solve_seconds']:6.2f} s, "
+              f"write {result['write_seconds']:6.2f} s; {result['assigned']} assigned, "
+              f"{result['seats_used']}/{result['seats']} seats ({result['utilisation']:.1%}), "
+              f"{result['rounds']} rounds")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Worker startup time with and without the persisted index sidecars.
+
+Generates ``--users`` drivers and passengers in a temporary directory and
+times ``create_app()`` (which attaches the indexes and Bloom filters of the
+user and school files) in a fresh process for three cases:
+
+  cold       no sidecars: every line is parsed and the indexes rebuilt
+  snapshot   sidecars cover the whole file: nothing is parsed
+  tail       sidecars cover all but ``--tail`` appended lines: only those
+             are parsed
+
+    python benchmarks/startup_index.py --users 1000000
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def write_users(start, count, mode='w'):
+    for role, filename in (('driver', 'drivers.json'), ('passenger', 'passengers.json')):
+        with open(filename, mode) as f:
+            for i in range(start + (role == 'passenger'), start + count, 2):
+                f.write(json.dumps({
+                    'username': f'user{i}',
+                    'email': f'user{i}@example.com',
+                    'password': 'pbkdf2:sha256:1$salt$hash',
+                }) + '\n')
+
+
+def child():
+    """Body of the timed process: one create_app(), elapsed seconds on stdout."""
+    started = time.perf_counter()
+    from app import create_app
+
+    app = create_app({'USER_COMPACT_INTERVAL': 0})
+    elapsed = time.perf_counter() - started
+    with app.test_client() as client:
+        indexes = client.get('/api/metrics').get_json()['user_index']
+    replayed = sum(stats['replayed_bytes'] for stats in indexes.values())
+    rebuilds = sum(stats['rebuilds'] for stats in indexes.values())
+    print(json.dumps({'seconds': elapsed, 'replayed': replayed, 'rebuilds': rebuilds}))
+
+
+def start_worker():
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child'],
+        check=True, capture_output=True, text=True, cwd=os.getcwd(),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def remove_sidecars():
+    for path in glob.glob('*.json.idx') + glob.glob('*.json.bloom'):
+        os.remove(path)
+
+
+def report(label, runs):
+    seconds = [run['seconds'] for run in runs]
+    print(f'{label:>9}: {statistics.median(seconds) * 1000:9.1f} ms median '
+          f'({runs[0]["rebuilds"]} rebuilds, {runs[0]["replayed"]} bytes replayed)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--tail', type=int, default=1000, help='Lines appended after the snapshot.')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        write_users(0, args.users)
+        print(f'{args.users} users, {sum(map(os.path.getsize, glob.glob("*.json")))} bytes')
+
+        cold = []
+        for _ in range(args.repeat):
+            remove_sidecars()
+            cold.append(start_worker())
+        report('cold', cold)
+
+        report('snapshot', [start_worker() for _ in range(args.repeat)])
+
+        tail = []
+        for i in range(args.repeat):
+            # Sidecars written before the appends, as after a deploy
+            remove_sidecars()
+            start_worker()
+            write_users(args.users + i * args.tail, args.tail, mode='a')
+            tail.append(start_worker())
+        report('tail', tail)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Renewing a session: password login against a refresh token.
+
+Registers one passenger in a temporary directory with the configured
+password hash (scrypt by default), then times ``--requests`` calls of
+``POST /api/login`` and as many ``POST /api/refresh`` calls, each with the
+refresh token returned by the previous one.
+
+    python benchmarks/token_refresh.py --requests 50
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+
+CREDENTIALS = {'username': 'mario', 'password': 'TestPassword123'}
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return '%.3f ms median, %.3f ms p95' % (
+        statistics.median(samples) * 1000, samples[int(len(samples) * 0.95)] * 1000
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        # No throttling: every login below is the same user
+        app = create_app({'LOGIN_USER_PER_MINUTE': 0, 'LOGIN_IP_PER_MINUTE': 0})
+        client = app.test_client()
+        client.post('/api/register', json={
+            **CREDENTIALS, 'email': 'mario@example.com', 'role': 'passenger',
+            'phonenumber': '3330000000', 'age': '30', 'attending_school': 'ITT',
+        })
+
+        logins = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = client.post('/api/login', json=CREDENTIALS)
+            logins.append(time.perf_counter() - started)
+            assert response.status_code == 200
+        refresh_token = response.get_json()['refresh_token']
+
+        refreshes = []
+        for _ in range(args.requests):
+            started = time.perf_counter()
+            response = client.post('/api/refresh', headers={'Authorization': f'Bearer {refresh_token}'})
+            refreshes.append(time.perf_counter() - started)
+            assert response.status_code == 200
+            refresh_token = response.get_json()['refresh_token']
+
+        print(f"{app.config['PASSWORD_HASH_METHOD']}, {args.requests} requests each")
+        print(f'  login:   {summary(logins)}')
+        print(f'  refresh: {summary(refreshes)}')
+        app.extensions['token_store'].close()
+
+
+if __name__ == '__main__':
+    main()
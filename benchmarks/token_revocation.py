@@ -0,0 +1,72 @@
+"""
+Revocation checks: in-memory denylist against a query per request.
+
+Revokes ``--revoked`` tokens in a temporary token store, then times
+``--checks`` calls of ``TokenStore.is_revoked`` (what the blocklist loader
+runs on every protected request) and the same lookups as one ``SELECT``
+each. A second store stands for another worker and logs out ``--writes``
+times during the checks; the checking store looks for its writes every
+``--sync-interval`` seconds (``TOKEN_REVOCATION_SYNC``, 0 for every check).
+
+    python benchmarks/token_revocation.py --revoked 100000 --sync-interval 0
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.tokens import TokenStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--revoked', type=int, default=100_000)
+    parser.add_argument('--checks', type=int, default=100_000)
+    parser.add_argument('--writes', type=int, default=100)
+    parser.add_argument('--sync-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'tokens.db')
+        expires = time.time() + 3600
+        writer = TokenStore(path)
+        db = writer._open()
+        db.execute('BEGIN')
+        db.executemany('INSERT INTO revoked (jti, expires) VALUES (?, ?)',
+                       ((uuid.uuid4().hex, expires) for _ in range(args.revoked)))
+        db.execute('COMMIT')
+
+        store = TokenStore(path, args.sync_interval)
+        started = time.perf_counter()
+        store.is_revoked('warm-up')
+        print(f'{args.revoked} revoked tokens loaded in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        jtis = [uuid.uuid4().hex for _ in range(args.checks)]
+        every = max(args.checks // max(args.writes, 1), 1)
+        started = time.perf_counter()
+        for i, jti in enumerate(jtis):
+            if i % every == 0:
+                writer.revoke(uuid.uuid4().hex, expires)
+            store.is_revoked(jti)
+        memory = time.perf_counter() - started
+
+        reader = TokenStore(path)._open()
+        started = time.perf_counter()
+        for jti in jtis:
+            reader.execute('SELECT 1 FROM revoked WHERE jti = ? AND expires >= ?', (jti, time.time())).fetchone()
+        query = time.perf_counter() - started
+
+        print(f'  in memory: {memory / args.checks * 1e6:6.2f} us per check '
+              f'({args.writes} logouts from another worker, synced every {args.sync_interval:g} s)')
+        print(f'  query:     {query / args.checks * 1e6:6.2f} us per check')
+        writer.close()
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
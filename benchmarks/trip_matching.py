@@ -0,0 +1,87 @@
+"""
+Trip matching: grid index vs computing the detour of every open trip.
+
+Generates ``--trips`` random trips around Cesena to ``--schools`` schools and
+times building the ``TripIndex`` and answering ``--queries`` random pickup
+points with it and with a linear scan over the trips of the school.
+
+    python benchmarks/trip_matching.py --trips 50000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.matching import TripIndex, detour_km  # noqa: E402
+
+CENTER = (44.1391, 12.2431)
+
+
+def random_point(rng, spread):
+    return CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+
+
+def linear_scan(trips, schools, school_id, pickup, max_detour, limit):
+    matches = []
+    for code, (trip_school, origin) in trips.items():
+        if trip_school == school_id:
+            detour = detour_km(origin, schools[school_id], pickup)
+            if detour <= max_detour:
+                matches.append((max(detour, 0.0), code))
+    matches.sort()
+    return matches[:limit]
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return statistics.median(samples) * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--trips', type=int, default=50_000)
+    parser.add_argument('--schools', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--spread', type=float, default=0.3, help='degrees around Cesena')
+    parser.add_argument('--cell-km', type=float, default=1.0)
+    parser.add_argument('--max-detour', type=float, default=2.0)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    schools = {i: random_point(rng, args.spread / 3) for i in range(args.schools)}
+    trips = {code: (rng.randrange(args.schools), random_point(rng, args.spread))
+             for code in range(args.trips)}
+
+    started = time.perf_counter()
+    index = TripIndex(args.cell_km)
+    for code, (school_id, origin) in trips.items():
+        index.add(code, school_id, origin, schools[school_id])
+    print(f'{args.trips} trips, {args.schools} schools: index built in '
+          f'{time.perf_counter() - started:.2f} s, {index.stats()["cells"]} cells')
+
+    queries = [(rng.randrange(args.schools), random_point(rng, args.spread)) for _ in range(args.queries)]
+    index_times, scan_times = [], []
+    for school_id, pickup in queries:
+        started = time.perf_counter()
+        found = index.match(school_id, pickup, args.max_detour)
+        index_times.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        expected = linear_scan(trips, schools, school_id, pickup, args.max_detour, 20)
+        scan_times.append(time.perf_counter() - started)
+        assert [code for _, code in found] == [code for _, code in expected]
+
+    index_median, index_p95 = percentiles(index_times)
+    scan_median, scan_p95 = percentiles(scan_times)
+    print(f'  linear scan: median {scan_median:8.2f} ms, p95 {scan_p95:8.2f} ms')
+    print(f'  grid index:  median {index_median:8.2f} ms, p95 {index_p95:8.2f} ms '
+          f'({scan_median / index_median:.1f}x), '
+          f'{index.stats()["candidates_per_query"]:.0f} candidates per query')
+
+
+if __name__ == '__main__':
+    main()
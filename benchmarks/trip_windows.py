@@ -0,0 +1,69 @@
+"""
+Trip windows: interval tree against a scan of every trip.
+
+Spreads ``--trips`` arrival windows (10 to 30 minutes) over ``--days``
+school mornings and times ``--queries`` passenger windows of 25 minutes
+with ``schedule.IntervalTree`` and with a list scan, plus inserting and
+removing trips as the matcher does on every sync.
+
+    python benchmarks/trip_windows.py --trips 100000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.schedule import IntervalTree  # noqa: E402
+
+DAY = 24 * 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--trips', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    # Minutes since the first morning, arrivals between 07:00 and 08:30
+    windows = []
+    for _ in range(args.trips):
+        start = rng.randrange(args.days) * DAY + rng.uniform(7 * 60, 8.5 * 60)
+        windows.append((start, start + rng.uniform(10, 30)))
+    queries = []
+    for _ in range(args.queries):
+        start = rng.randrange(args.days) * DAY + rng.uniform(7 * 60, 8.5 * 60)
+        queries.append((start, start + 25))
+
+    started = time.perf_counter()
+    tree = IntervalTree(seed=1)
+    for code, (start, end) in enumerate(windows):
+        tree.add(start, end, code)
+    built = time.perf_counter()
+    found = sum(len(tree.overlapping(start, end)) for start, end in queries)
+    queried = time.perf_counter()
+    scanned = sum(
+        sum(1 for a, b in windows if a <= end and b >= start) for start, end in queries[:200]
+    )
+    scan = (time.perf_counter() - queried) / min(200, len(queries))
+    assert scanned == sum(len(tree.overlapping(start, end)) for start, end in queries[:200])
+
+    updated = time.perf_counter()
+    for code in range(0, args.trips, 10):
+        tree.remove(*windows[code], code)
+        tree.add(*windows[code], code)
+    churn = (time.perf_counter() - updated) / len(range(0, args.trips, 10))
+
+    print(f'{args.trips} trips over {args.days} mornings, {found / args.queries:.0f} trips per query window')
+    print(f'  tree: build {built - started:5.2f} s, {(queried - built) / args.queries * 1e6:8.1f} us/query, '
+          f'{churn * 1e6:5.1f} us per remove + add')
+    print(f'  scan: {scan * 1e6:8.1f} us/query')
+
+
+if __name__ == '__main__':
+    main()
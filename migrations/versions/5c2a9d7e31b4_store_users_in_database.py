@@ -0,0 +1,94 @@
+"""Store users in database
+
+Revision ID: 5c2a9d7e31b4
+Revises: 14f1108361ec
+Create Date: 2026-10-17 09:12:40.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2a9d7e31b4'
+down_revision = '14f1108361ec'
+branch_labels = None
+depends_on = None
+
+# The unique constraints of the first revision were created without a name,
+# batch mode needs a naming convention to be able to drop them on SQLite.
+naming_convention = {
+    "uq": "uq_%(table_name)s_%(column_0_name)s",
+}
+
+
+def upgrade():
+    with op.batch_alter_table('driver', naming_convention=naming_convention) as batch_op:
+        batch_op.add_column(sa.Column('username', sa.String(length=80), nullable=False, server_default=''))
+        batch_op.add_column(sa.Column('license_file', sa.String(length=255), nullable=True))
+        batch_op.drop_constraint('uq_driver_name', type_='unique')
+        batch_op.drop_constraint('uq_driver_surname', type_='unique')
+        batch_op.drop_constraint('uq_driver_phonenumber', type_='unique')
+        batch_op.alter_column('name', existing_type=sa.String(length=80), nullable=True)
+        batch_op.alter_column('surname', existing_type=sa.String(length=80), nullable=True)
+        batch_op.alter_column('age', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('email', existing_type=sa.String(length=120), nullable=True)
+        batch_op.alter_column('phonenumber', existing_type=sa.String(length=120), nullable=True)
+        batch_op.alter_column('licenseid', existing_type=sa.String(length=120), nullable=True)
+        batch_op.alter_column('password_hash', existing_type=sa.String(length=120), type_=sa.String(length=255))
+        batch_op.create_unique_constraint('uq_driver_username', ['username'])
+
+    with op.batch_alter_table('passenger', naming_convention=naming_convention) as batch_op:
+        batch_op.add_column(sa.Column('username', sa.String(length=80), nullable=False, server_default=''))
+        batch_op.add_column(sa.Column('attending_school', sa.String(length=120), nullable=True))
+        batch_op.drop_constraint('uq_passenger_name', type_='unique')
+        batch_op.drop_constraint('uq_passenger_surname', type_='unique')
+        batch_op.drop_constraint('uq_passenger_phonenumber', type_='unique')
+        batch_op.alter_column('name', existing_type=sa.String(length=80), nullable=True)
+        batch_op.alter_column('surname', existing_type=sa.String(length=80), nullable=True)
+        batch_op.alter_column('age', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('email', existing_type=sa.String(length=120), nullable=True)
+        batch_op.alter_column('phonenumber', existing_type=sa.String(length=120), nullable=True)
+        batch_op.alter_column('school_id', existing_type=sa.Integer(), nullable=True)
+        batch_op.alter_column('password_hash', existing_type=sa.String(length=120), type_=sa.String(length=255))
+        batch_op.create_unique_constraint('uq_passenger_username', ['username'])
+
+    with op.batch_alter_table('school') as batch_op:
+        batch_op.add_column(sa.Column('city', sa.String(length=80), nullable=True))
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'))
+
+
+def downgrade():
+    with op.batch_alter_table('school') as batch_op:
+        batch_op.drop_column('status')
+        batch_op.drop_column('city')
+
+    with op.batch_alter_table('passenger', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('uq_passenger_username', type_='unique')
+        batch_op.alter_column('password_hash', existing_type=sa.String(length=255), type_=sa.String(length=120))
+        batch_op.alter_column('school_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('phonenumber', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('email', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('age', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('surname', existing_type=sa.String(length=80), nullable=False)
+        batch_op.alter_column('name', existing_type=sa.String(length=80), nullable=False)
+        batch_op.create_unique_constraint('uq_passenger_phonenumber', ['phonenumber'])
+        batch_op.create_unique_constraint('uq_passenger_surname', ['surname'])
+        batch_op.create_unique_constraint('uq_passenger_name', ['name'])
+        batch_op.drop_column('attending_school')
+        batch_op.drop_column('username')
+
+    with op.batch_alter_table('driver', naming_convention=naming_convention) as batch_op:
+        batch_op.drop_constraint('uq_driver_username', type_='unique')
+        batch_op.alter_column('password_hash', existing_type=sa.String(length=255), type_=sa.String(length=120))
+        batch_op.alter_column('licenseid', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('phonenumber', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('email', existing_type=sa.String(length=120), nullable=False)
+        batch_op.alter_column('age', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('surname', existing_type=sa.String(length=80), nullable=False)
+        batch_op.alter_column('name', existing_type=sa.String(length=80), nullable=False)
+        batch_op.create_unique_constraint('uq_driver_phonenumber', ['phonenumber'])
+        batch_op.create_unique_constraint('uq_driver_surname', ['surname'])
+        batch_op.create_unique_constraint('uq_driver_name', ['name'])
+        batch_op.drop_column('license_file')
+        batch_op.drop_column('username')
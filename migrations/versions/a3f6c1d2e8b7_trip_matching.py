@@ -0,0 +1,49 @@
+"""Trip origin and school, school coordinates
+
+Revision ID: a3f6c1d2e8b7
+Revises: 5c2a9d7e31b4
+Create Date: 2026-10-17 15:02:11.804115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f6c1d2e8b7'
+down_revision = '5c2a9d7e31b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('school') as batch_op:
+        batch_op.add_column(sa.Column('latitude', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('longitude', sa.Float(), nullable=True))
+
+    # No trips could be created before this revision, the table is empty
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.add_column(sa.Column('school_id', sa.Integer(), nullable=False))
+        batch_op.add_column(sa.Column('origin_lat', sa.Float(), nullable=False))
+        batch_op.add_column(sa.Column('origin_lon', sa.Float(), nullable=False))
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='open'))
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key('fk_trip_school_id_school', 'school', ['school_id'], ['id'])
+        batch_op.create_index('ix_trip_updated_at', ['updated_at'])
+
+
+def downgrade():
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.drop_index('ix_trip_updated_at')
+        batch_op.drop_constraint('fk_trip_school_id_school', type_='foreignkey')
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('created_at')
+        batch_op.drop_column('status')
+        batch_op.drop_column('origin_lon')
+        batch_op.drop_column('origin_lat')
+        batch_op.drop_column('school_id')
+
+    with op.batch_alter_table('school') as batch_op:
+        batch_op.drop_column('longitude')
+        batch_op.drop_column('latitude')
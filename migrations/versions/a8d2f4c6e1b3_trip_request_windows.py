@@ -0,0 +1,32 @@
+"""Departure and arrival windows of trip requests
+
+Revision ID: a8d2f4c6e1b3
+Revises: f5c1b8e3a9d7
+Create Date: 2026-10-17 23:12:48.530417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d2f4c6e1b3'
+down_revision = 'f5c1b8e3a9d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trip_request') as batch_op:
+        batch_op.add_column(sa.Column('departure_from', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('departure_until', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('arrival_from', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('arrival_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('trip_request') as batch_op:
+        batch_op.drop_column('arrival_until')
+        batch_op.drop_column('arrival_from')
+        batch_op.drop_column('departure_until')
+        batch_op.drop_column('departure_from')
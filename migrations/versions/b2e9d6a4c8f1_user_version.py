@@ -0,0 +1,30 @@
+"""Version row of the driver and passenger tables
+
+Revision ID: b2e9d6a4c8f1
+Revises: a8d2f4c6e1b3
+Create Date: 2026-10-18 10:41:07.215384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e9d6a4c8f1'
+down_revision = 'a8d2f4c6e1b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    user_version = op.create_table(
+        'user_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.bulk_insert(user_version, [{'id': 1, 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('user_version')
@@ -0,0 +1,76 @@
+"""Trip requests with their own id, pickup coordinates and status; trip vehicle
+
+Revision ID: b7d4e2f9a1c6
+Revises: a3f6c1d2e8b7
+Create Date: 2026-10-17 17:40:26.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d4e2f9a1c6'
+down_revision = 'a3f6c1d2e8b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.add_column(sa.Column('licence_plate', sa.String(length=80), nullable=True))
+        batch_op.create_foreign_key('fk_trip_licence_plate_vehicle', 'vehicle', ['licence_plate'], ['licence_plate'])
+
+    # trip_code was the primary key (one request per trip): the table is
+    # rebuilt, existing rows become requests assigned to their trip
+    op.create_table('trip_request_new',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('trip_code', sa.Integer(), nullable=True),
+    sa.Column('passenger_id', sa.Integer(), nullable=False),
+    sa.Column('school_id', sa.Integer(), nullable=False),
+    sa.Column('pickup_point', sa.String(length=120), nullable=True),
+    sa.Column('pickup_lat', sa.Float(), nullable=True),
+    sa.Column('pickup_lon', sa.Float(), nullable=True),
+    sa.Column('handicap', sa.Boolean(), nullable=False, server_default=sa.false()),
+    sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['passenger_id'], ['passenger.id'], ),
+    sa.ForeignKeyConstraint(['school_id'], ['school.id'], ),
+    sa.ForeignKeyConstraint(['trip_code'], ['trip.code'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        "INSERT INTO trip_request_new (trip_code, passenger_id, school_id, pickup_point, status) "
+        "SELECT trip_request.trip_code, trip_request.passenger_id, trip.school_id, "
+        "trip_request.pickup_point, 'assigned' "
+        "FROM trip_request JOIN trip ON trip.code = trip_request.trip_code"
+    )
+    op.drop_table('trip_request')
+    op.rename_table('trip_request_new', 'trip_request')
+    with op.batch_alter_table('trip_request') as batch_op:
+        batch_op.create_index('ix_trip_request_trip_code', ['trip_code'])
+        batch_op.create_index('ix_trip_request_status', ['status'])
+        batch_op.create_index('ix_trip_request_created_at', ['created_at'])
+
+
+def downgrade():
+    op.create_table('trip_request_old',
+    sa.Column('trip_code', sa.Integer(), nullable=False),
+    sa.Column('passenger_id', sa.Integer(), nullable=False),
+    sa.Column('pickup_point', sa.String(length=120), nullable=False),
+    sa.ForeignKeyConstraint(['passenger_id'], ['passenger.id'], ),
+    sa.ForeignKeyConstraint(['trip_code'], ['trip.code'], ),
+    sa.PrimaryKeyConstraint('trip_code')
+    )
+    # Only one request per trip fits the old table: keep the first one
+    op.execute(
+        "INSERT INTO trip_request_old (trip_code, passenger_id, pickup_point) "
+        "SELECT trip_code, passenger_id, COALESCE(pickup_point, '') FROM trip_request "
+        "WHERE id IN (SELECT MIN(id) FROM trip_request WHERE trip_code IS NOT NULL GROUP BY trip_code)"
+    )
+    op.drop_table('trip_request')
+    op.rename_table('trip_request_old', 'trip_request')
+
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.drop_constraint('fk_trip_licence_plate_vehicle', type_='foreignkey')
+        batch_op.drop_column('licence_plate')
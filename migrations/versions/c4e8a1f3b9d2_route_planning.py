@@ -0,0 +1,26 @@
+"""Pickup order of trip requests
+
+Revision ID: c4e8a1f3b9d2
+Revises: b7d4e2f9a1c6
+Create Date: 2026-10-17 19:12:47.530661
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1f3b9d2'
+down_revision = 'b7d4e2f9a1c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trip_request') as batch_op:
+        batch_op.add_column(sa.Column('stop_order', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('trip_request') as batch_op:
+        batch_op.drop_column('stop_order')
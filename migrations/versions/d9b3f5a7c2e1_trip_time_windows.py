@@ -0,0 +1,32 @@
+"""Departure and arrival windows of trips
+
+Revision ID: d9b3f5a7c2e1
+Revises: c4e8a1f3b9d2
+Create Date: 2026-10-17 20:41:09.218734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9b3f5a7c2e1'
+down_revision = 'c4e8a1f3b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.add_column(sa.Column('departure_from', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('departure_until', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('arrival_from', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('arrival_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.drop_column('arrival_until')
+        batch_op.drop_column('arrival_from')
+        batch_op.drop_column('departure_until')
+        batch_op.drop_column('departure_from')
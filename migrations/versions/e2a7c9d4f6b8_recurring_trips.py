@@ -0,0 +1,54 @@
+"""Recurring trips, materialised occurrences
+
+Revision ID: e2a7c9d4f6b8
+Revises: d9b3f5a7c2e1
+Create Date: 2026-10-17 21:26:51.604392
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7c9d4f6b8'
+down_revision = 'd9b3f5a7c2e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('trip_schedule',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('driver_id', sa.Integer(), nullable=False),
+    sa.Column('school_id', sa.Integer(), nullable=False),
+    sa.Column('origin_lat', sa.Float(), nullable=False),
+    sa.Column('origin_lon', sa.Float(), nullable=False),
+    sa.Column('licence_plate', sa.String(length=80), nullable=True),
+    sa.Column('weekdays', sa.Integer(), nullable=False),
+    sa.Column('starts_on', sa.Date(), nullable=False),
+    sa.Column('ends_on', sa.Date(), nullable=False),
+    sa.Column('departure_from', sa.Time(), nullable=True),
+    sa.Column('departure_until', sa.Time(), nullable=True),
+    sa.Column('arrival_from', sa.Time(), nullable=True),
+    sa.Column('arrival_until', sa.Time(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False, server_default='active'),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['driver_id'], ['driver.id'], ),
+    sa.ForeignKeyConstraint(['licence_plate'], ['vehicle.licence_plate'], ),
+    sa.ForeignKeyConstraint(['school_id'], ['school.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.add_column(sa.Column('schedule_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('occurs_on', sa.Date(), nullable=True))
+        batch_op.create_foreign_key('fk_trip_schedule_id_trip_schedule', 'trip_schedule', ['schedule_id'], ['id'])
+        batch_op.create_unique_constraint('uq_trip_schedule_id_occurs_on', ['schedule_id', 'occurs_on'])
+
+
+def downgrade():
+    with op.batch_alter_table('trip') as batch_op:
+        batch_op.drop_constraint('uq_trip_schedule_id_occurs_on', type_='unique')
+        batch_op.drop_constraint('fk_trip_schedule_id_trip_schedule', type_='foreignkey')
+        batch_op.drop_column('occurs_on')
+        batch_op.drop_column('schedule_id')
+    op.drop_table('trip_schedule')
@@ -0,0 +1,51 @@
+"""Driver reviews and rating aggregates
+
+Revision ID: f5c1b8e3a9d7
+Revises: e2a7c9d4f6b8
+Create Date: 2026-10-17 22:08:37.941126
+
+"""
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c1b8e3a9d7'
+down_revision = 'e2a7c9d4f6b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('review',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('trip_code', sa.Integer(), nullable=False),
+    sa.Column('driver_id', sa.Integer(), nullable=False),
+    sa.Column('passenger_id', sa.Integer(), nullable=False),
+    sa.Column('stars', sa.Integer(), nullable=False),
+    sa.Column('comment', sa.String(length=500), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['driver_id'], ['driver.id'], ),
+    sa.ForeignKeyConstraint(['passenger_id'], ['passenger.id'], ),
+    sa.ForeignKeyConstraint(['trip_code'], ['trip.code'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('trip_code', 'passenger_id', name='uq_review_trip_code_passenger_id')
+    )
+    with op.batch_alter_table('review') as batch_op:
+        batch_op.create_index('ix_review_driver_id', ['driver_id'])
+    with op.batch_alter_table('driver') as batch_op:
+        batch_op.add_column(sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('rating_sum', sa.Integer(), nullable=False, server_default='0'))
+    # No reviews yet: every driver's smoothed score is the prior mean
+    op.execute(sa.text('UPDATE driver SET rating = :mean').bindparams(
+        mean=float(current_app.config['RATING_PRIOR_MEAN'])))
+
+
+def downgrade():
+    with op.batch_alter_table('driver') as batch_op:
+        batch_op.drop_column('rating_sum')
+        batch_op.drop_column('rating_count')
+    with op.batch_alter_table('review') as batch_op:
+        batch_op.drop_index('ix_review_driver_id')
+    op.drop_table('review')
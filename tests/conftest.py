@@ -6,7 +6,62 @@ import pytest
 import os
 import json
 import tempfile
-from app import create_app
+from app import create_app, db
+from app.models import Driver, Passenger, School, Trip
+
+# Cesena, where the test school is
+CENTER = (44.1391, 12.2431)
+
+
+def write_lines(path, records):
+    """Scrive i record come JSON-Lines in coda al file."""
+    with open(path, 'a') as f:
+        for record in records:
+            json.dump(record, f)
+            f.write('\n')
+
+
+def register_and_login(client, username, role, **extra):
+    """Registra un utente e restituisce l'header con il suo access token."""
+    client.post('/api/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'TestPassword123',
+        'role': role, 'phonenumber': '3330000000', 'age': '30', **extra,
+    })
+    token = client.post('/api/login', json={'username': username, 'password': 'TestPassword123'}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+def add_school(**columns):
+    """Aggiunge alla sessione la scuola di prova (ITT Blaise Pascal, in CENTER)."""
+    school = School(**{
+        'name': 'ITT Blaise Pascal', 'address': 'Via Ugo Foscolo 51, Cesena', 'email': 'itt@example.com',
+        'representative': 'Rossi', 'mechanical_code': 'FOTF010008', 'latitude': CENTER[0], 'longitude': CENTER[1],
+        **columns,
+    })
+    db.session.add(school)
+    return school
+
+
+def add_driver(username='mario', **columns):
+    """Aggiunge alla sessione un autista senza password utilizzabile."""
+    driver = Driver(username=username, password_hash='hash', **columns)
+    db.session.add(driver)
+    return driver
+
+
+def add_passenger(username, **columns):
+    """Aggiunge alla sessione un passeggero senza password utilizzabile."""
+    passenger = Passenger(username=username, password_hash='hash', **columns)
+    db.session.add(passenger)
+    return passenger
+
+
+def add_trip(driver_id, origin, school_id=1, **columns):
+    """Salva un viaggio aperto da ``origin`` alla scuola."""
+    trip = Trip(driver_id=driver_id, school_id=school_id, origin_lat=origin[0], origin_lon=origin[1], **columns)
+    db.session.add(trip)
+    db.session.commit()
+    return trip
 
 
 @pytest.fixture
@@ -63,3 +118,26 @@ def existing_driver_data():
         'type': 'driver'
     }
 
+
+
+@pytest.fixture
+def app_config():
+    """Configurazione aggiuntiva di ``sql_app``: i moduli la ridefiniscono se serve."""
+    return {}
+
+
+@pytest.fixture
+def sql_app(tmp_path, monkeypatch, app_config):
+    """App con utenti e viaggi su database in memoria, dentro il suo app context."""
+    monkeypatch.chdir(tmp_path)
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'USER_STORE_BACKEND': 'sql',
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        **app_config,
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
@@ -0,0 +1,254 @@
+"""
+Test per l'assegnazione dei posti alle richieste di passaggio.
+"""
+
+import random
+from datetime import datetime
+
+import pytest
+
+from app import db
+from app.models import Trip, TripRequest, Vehicle
+from app.services.allocation import Request, SeatAllocator, allocate_pending, passenger_seats
+
+from .conftest import CENTER, add_driver, add_passenger, add_school, register_and_login
+
+
+class TestSeatAllocator:
+    """Test per l'algoritmo di assegnazione in memoria."""
+
+    def test_passenger_seats(self):
+        """Test posti offerti: il conducente non conta, gli accessibili sono fra i posti."""
+        assert passenger_seats(5, 1) == (4, 1)
+        assert passenger_seats(2, 3) == (1, 1)
+        assert passenger_seats(0, 0) == (0, 0)
+
+    def test_respects_capacity(self):
+        """Test che nessun viaggio riceva più passeggeri dei posti liberi."""
+        rng = random.Random(3)
+        allocator = SeatAllocator(candidates=2)
+        seats = {}
+        for code in range(30):
+            seats[code] = rng.randint(1, 4)
+            origin = (CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1))
+            allocator.add_trip(code, 1, origin, CENTER, seats[code])
+        requests = [
+            Request(i, 1, (CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1)), False)
+            for i in range(200)
+        ]
+        assigned = allocator.allocate(requests, 3.0)
+
+        per_trip = {}
+        for code, detour in assigned.values():
+            per_trip[code] = per_trip.get(code, 0) + 1
+            assert detour <= 3.0
+        assert all(per_trip[code] <= seats[code] for code in per_trip)
+        # More requests than seats: every seat near someone gets used
+        assert allocator.stats()['seats_used'] == len(assigned)
+        assert allocator.stats()['rounds'] > 1
+
+    def test_smallest_detour_wins(self):
+        """Test che l'unico posto vada alla richiesta con la deviazione minore."""
+        allocator = SeatAllocator()
+        allocator.add_trip(1, 1, (44.10, 12.20), CENTER, 1)
+        assigned = allocator.allocate([
+            Request('far', 1, (44.13, 12.20), False),
+            Request('near', 1, (44.12, 12.22), False),
+        ], 5.0)
+        assert list(assigned) == ['near']
+
+    def test_handicap_seats(self):
+        """Test che i posti accessibili vadano prima a chi ne ha bisogno."""
+        allocator = SeatAllocator()
+        allocator.add_trip(1, 1, (44.10, 12.20), CENTER, 2, accessible=1)
+        allocator.add_trip(2, 1, (44.10, 12.21), CENTER, 4)
+        assigned = allocator.allocate([
+            Request('a', 1, (44.11, 12.21), False),
+            Request('b', 1, (44.11, 12.21), False),
+            Request('wheelchair', 1, (44.12, 12.22), True),
+            Request('wheelchair 2', 1, (44.12, 12.22), True),
+        ], 5.0)
+        assert assigned['wheelchair'][0] == 1
+        assert 'wheelchair 2' not in assigned
+        assert sorted(code for code, _ in assigned.values()).count(1) == 2
+
+    def test_request_windows(self):
+        """Test richieste con finestra: solo viaggi con una finestra dello stesso tipo sovrapposta."""
+        allocator = SeatAllocator()
+        seven = (datetime(2026, 10, 19, 7, 0), datetime(2026, 10, 19, 7, 30))
+        eight = (datetime(2026, 10, 19, 8, 0), datetime(2026, 10, 19, 8, 30))
+        allocator.add_trip(1, 1, (44.10, 12.20), CENTER, 3, windows={'departure': seven})
+        allocator.add_trip(2, 1, (44.10, 12.20), CENTER, 3)
+        assigned = allocator.allocate([
+            Request('seven', 1, (44.12, 12.22), False, {'departure': seven}),
+            Request('eight', 1, (44.12, 12.22), False, {'departure': eight}),
+            Request('arrival', 1, (44.12, 12.22), False, {'arrival': seven}),
+            Request('any', 1, (44.12, 12.22), False),
+        ], 5.0)
+        assert assigned['seven'][0] == 1
+        assert 'eight' not in assigned and 'arrival' not in assigned
+        assert 'any' in assigned
+
+    def test_other_schools_are_ignored(self):
+        """Test che le richieste vadano solo ai viaggi verso la propria scuola."""
+        allocator = SeatAllocator()
+        allocator.add_trip(1, 2, (44.10, 12.20), CENTER, 3)
+        assert allocator.allocate([Request(1, 1, (44.12, 12.22), False)], 5.0) == {}
+
+
+@pytest.fixture
+def app(sql_app):
+    """App con scuola, autisti, veicoli e passeggeri su database in memoria."""
+    add_school()
+    for i in (1, 2):
+        add_driver(f'driver{i}')
+    db.session.add(Vehicle(
+        driver_id=1, licence_plate='AA000AA', model='Panda', color='white', fuel='petrol',
+        seats_number=3, handicap_seats=1, cv=70, kw=51,
+    ))
+    db.session.add(Vehicle(
+        driver_id=2, licence_plate='BB000BB', model='Multipla', color='green', fuel='diesel',
+        seats_number=6, handicap_seats=0, cv=115, kw=85,
+    ))
+    for i in range(10):
+        add_passenger(f'passenger{i}')
+    db.session.commit()
+    return sql_app
+
+
+def add_request(passenger_id, pickup, handicap=False, created_at=None):
+    trip_request = TripRequest(
+        passenger_id=passenger_id, school_id=1, pickup_lat=pickup[0], pickup_lon=pickup[1],
+        handicap=handicap, created_at=created_at or datetime.utcnow(),
+    )
+    db.session.add(trip_request)
+    return trip_request
+
+
+class TestAllocatePending:
+    """Test per il job di assegnazione sul database."""
+
+    def test_assigns_and_writes_back(self, app):
+        """Test assegnazione con i posti dei veicoli, scrittura e secondo giro."""
+        db.session.add(Trip(driver_id=1, school_id=1, origin_lat=44.10, origin_lon=12.20))
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.11, origin_lon=12.21, licence_plate='BB000BB'))
+        for i in range(8):
+            add_request(i + 1, (44.12, 12.22), handicap=(i == 0))
+        db.session.commit()
+
+        result = allocate_pending(max_detour_km=5.0)
+        # Panda: 2 posti (1 accessibile), Multipla: 5 posti
+        assert result['requests'] == 8 and result['assigned'] == 7
+        assert result['seats'] == 7 and result['utilisation'] == 1.0
+        requests = db.session.execute(db.select(TripRequest)).scalars().all()
+        assert sum(r.status == 'assigned' for r in requests) == 7
+        assert next(r for r in requests if r.handicap).trip_code == 1
+
+        # Trips are full: the pending request stays pending
+        result = allocate_pending(max_detour_km=5.0)
+        assert result['requests'] == 1 and result['assigned'] == 0
+
+    def test_time_window(self, app):
+        """Test che vengano considerate solo le richieste della finestra indicata."""
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20))
+        add_request(1, (44.12, 12.22), created_at=datetime(2026, 10, 16, 7, 0))
+        add_request(2, (44.12, 12.22), created_at=datetime(2026, 10, 17, 7, 0))
+        db.session.commit()
+
+        result = allocate_pending(since=datetime(2026, 10, 17), until=datetime(2026, 10, 18))
+        assert result['requests'] == 1 and result['assigned'] == 1
+        assert db.session.get(TripRequest, 1).status == 'pending'
+        assert db.session.get(TripRequest, 2).trip_code == 1
+
+    def test_past_trips_are_skipped(self, app):
+        """Test che i viaggi già partiti o di giorni passati non ricevano passeggeri."""
+        now = datetime(2026, 10, 19, 9, 0)
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20,
+                            departure_from=datetime(2026, 10, 19, 6, 30), departure_until=datetime(2026, 10, 19, 7, 0)))
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20,
+                            occurs_on=datetime(2026, 10, 18).date()))
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20,
+                            arrival_from=datetime(2026, 10, 20, 7, 30), arrival_until=datetime(2026, 10, 20, 8, 0)))
+        add_request(1, (44.12, 12.22))
+        db.session.commit()
+
+        result = allocate_pending(now=now)
+        assert result['trips'] == 1 and result['assigned'] == 1
+        assert db.session.get(TripRequest, 1).trip_code == 3
+
+    def test_cli(self, app):
+        """Test del comando flask allocate-seats."""
+        db.session.add(Trip(driver_id=1, school_id=1, origin_lat=44.10, origin_lon=12.20))
+        add_request(1, (44.12, 12.22))
+        db.session.commit()
+        output = app.test_cli_runner().invoke(args=['allocate-seats']).output
+        assert '1 of 1 requests assigned' in output
+
+
+class TestTripRequestEndpoints:
+    """Test per /api/trips/requests."""
+
+    def test_request_and_allocation(self, app):
+        """Test richiesta di un posto e stato dopo l'assegnazione."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        response = client.post('/api/trips/requests', headers=passenger, json={
+            'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22}, 'pickup_point': 'Via Roma 1',
+        })
+        assert response.status_code == 201
+        request_id = response.get_json()['request']['id']
+        assert response.get_json()['request']['status'] == 'pending'
+
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20))
+        db.session.commit()
+        allocate_pending()
+        data = client.get(f'/api/trips/requests/{request_id}', headers=passenger).get_json()['request']
+        assert data['status'] == 'assigned' and data['trip_code'] == 1
+
+        other = register_and_login(client, 'daisy', 'passenger', attending_school='ITT Blaise Pascal')
+        assert client.get(f'/api/trips/requests/{request_id}', headers=other).status_code == 404
+
+    def test_request_with_window(self, app):
+        """Test richiesta con finestra di arrivo: assegnata solo a un viaggio compatibile."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        response = client.post('/api/trips/requests', headers=passenger, json={
+            'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22},
+            'arrival': {'from': '2099-10-19T07:30:00', 'until': '2099-10-19T08:00:00'},
+        })
+        assert response.status_code == 201
+        assert response.get_json()['request']['arrival'] == {
+            'from': '2099-10-19T07:30:00', 'until': '2099-10-19T08:00:00',
+        }
+        assert client.post('/api/trips/requests', headers=passenger, json={
+            'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22}, 'arrival': {'from': 'soon'},
+        }).status_code == 400
+
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20))
+        db.session.commit()
+        assert allocate_pending()['assigned'] == 0
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20,
+                            arrival_from=datetime(2099, 10, 19, 7, 45), arrival_until=datetime(2099, 10, 19, 8, 15)))
+        db.session.commit()
+        assert allocate_pending()['assigned'] == 1
+        assert db.session.get(TripRequest, 1).trip_code == 2
+
+    @pytest.mark.parametrize('data, status', [
+        ({'school_id': 1, 'pickup': {'lat': 44.1}}, 400),
+        ({'school_id': 1, 'pickup': {'lat': 44.1, 'lon': 12.2}, 'handicap': 'yes'}, 400),
+        ({'school_id': 99, 'pickup': {'lat': 44.1, 'lon': 12.2}}, 404),
+    ])
+    def test_invalid_requests(self, app, data, status):
+        """Test richieste non valide."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        assert client.post('/api/trips/requests', headers=passenger, json=data).status_code == status
+
+    def test_drivers_cannot_request(self, app):
+        """Test che solo i passeggeri possano chiedere un posto."""
+        client = app.test_client()
+        driver = register_and_login(client, 'luigi', 'driver', licenseid='LIC00001')
+        response = client.post('/api/trips/requests', headers=driver, json={
+            'school_id': 1, 'pickup': {'lat': 44.1, 'lon': 12.2},
+        })
+        assert response.status_code == 403
@@ -0,0 +1,204 @@
+"""
+Test per modifica e cancellazione degli utenti (versioni e tombstone),
+per la compattazione dei file e per gli endpoint del profilo.
+"""
+
+import json
+import os
+
+import pytest
+
+from app import create_app
+from app.services.compaction import compact_file
+from app.services.user_store import UserExists, UserStore, get_index
+
+
+@pytest.fixture
+def files(tmp_path):
+    return {
+        'driver': str(tmp_path / 'drivers.json'),
+        'passenger': str(tmp_path / 'passengers.json'),
+    }
+
+
+@pytest.fixture
+def store(files):
+    store = UserStore(files, fsync=False)
+    store.add('driver', {'username': 'mario', 'email': 'mario@example.com', 'password': 'hash'})
+    store.add('passenger', {'username': 'luigi', 'email': 'luigi@example.com', 'password': 'hash'})
+    return store
+
+
+class TestUpdateAndDelete:
+    """Test per nuove versioni e tombstone."""
+
+    def test_delete_hides_user(self, store):
+        """Test che un utente cancellato sparisca da ricerche e liste."""
+        store.delete('driver', 'mario')
+
+        assert store.find_by_username('mario') == (None, None)
+        assert not store.exists(username='mario')
+        assert not store.exists(email='mario@example.com')
+        assert [record['username'] for _, record in store.iter_users()] == ['luigi']
+        with pytest.raises(KeyError):
+            store.delete('driver', 'mario')
+
+    def test_deleted_username_can_register_again(self, store):
+        """Test riutilizzo di username ed email dopo la cancellazione."""
+        store.delete('driver', 'mario')
+
+        store.add('passenger', {'username': 'mario', 'email': 'mario@example.com', 'password': 'new'})
+
+        assert store.find_by_username('mario')[1] == 'passenger'
+
+    def test_changed_email_is_released(self, store):
+        """Test che la vecchia email torni libera dopo una modifica."""
+        store.update('driver', 'mario', {'email': 'super@example.com'})
+
+        assert not store.exists(email='mario@example.com')
+        assert store.exists(email='super@example.com')
+        assert store.find_by_username('mario')[0]['email'] == 'super@example.com'
+
+    def test_email_of_another_user_is_rejected(self, store):
+        """Test che non si possa prendere l'email di un altro utente."""
+        with pytest.raises(UserExists):
+            store.update('driver', 'mario', {'email': 'luigi@example.com'})
+        store.update('driver', 'mario', {'email': 'mario@example.com', 'age': '31'})
+
+
+class TestCompaction:
+    """Test per la riscrittura dei file."""
+
+    def test_compact_keeps_live_records(self, store, files):
+        """Test che restino solo le versioni correnti degli utenti non cancellati."""
+        for age in range(5):
+            store.update('driver', 'mario', {'age': str(age)})
+        store.add('driver', {'username': 'peach', 'email': 'peach@example.com', 'password': 'hash'})
+        store.delete('driver', 'peach')
+        with open(files['driver'], 'a') as f:
+            f.write('not json\n')
+        inode = os.stat(files['driver']).st_ino
+
+        before, after = compact_file(files['driver'], fsync=False)
+
+        assert after < before
+        assert os.stat(files['driver']).st_ino != inode
+        with open(files['driver']) as f:
+            lines = [json.loads(line) for line in f]
+        assert [(line['username'], line['age']) for line in lines] == [('mario', '4')]
+        # Indice ricostruito sul nuovo file
+        assert store.find_by_username('mario')[0]['age'] == '4'
+        assert not store.exists(username='peach')
+        assert get_index(files['driver']).live_rows('username') == {0: os.path.getsize(files['driver'])}
+
+    def test_min_garbage(self, store, files):
+        """Test che un file con poco spazio da recuperare non venga riscritto."""
+        assert compact_file(files['driver'], fsync=False) is None
+        store.update('driver', 'mario', {'age': '30'})
+
+        assert compact_file(files['driver'], min_garbage=0.9, fsync=False) is None
+        assert compact_file(files['driver'], min_garbage=0.3, fsync=False) is not None
+
+    def test_appends_after_compaction(self, store, files):
+        """Test che le scritture successive finiscano nel file compattato."""
+        store.update('driver', 'mario', {'age': '30'})
+        compact_file(files['driver'], fsync=False)
+
+        store.add('driver', {'username': 'toad', 'password': 'hash'})
+
+        assert store.find_by_username('toad')[1] == 'driver'
+        assert [record['username'] for _, record in store.iter_users()] == ['mario', 'toad', 'luigi']
+
+    def test_compactor_starts_with_first_request(self, tmp_path, monkeypatch):
+        """Test app senza richieste (comandi CLI): nessun thread di compattazione e nessun file di lock creato."""
+        monkeypatch.chdir(tmp_path)
+        app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'USER_COMPACT_INTERVAL': 3600})
+        compactor = app.extensions['user_compactor']
+        assert not compactor.is_alive()
+        assert os.listdir(tmp_path) == []
+
+        app.test_client().get('/api/metrics')
+        app.test_client().get('/api/metrics')
+        assert compactor.is_alive()
+        compactor.stop()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    app = create_app({'TESTING': True, 'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000'})
+    client = app.test_client()
+    for username, role, extra in (
+        ('mario', 'driver', {'licenseid': 'LIC00001'}),
+        ('luigi', 'passenger', {'attending_school': 'ITT Blaise Pascal'}),
+    ):
+        client.post('/api/register', json={
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'TestPassword123',
+            'role': role,
+            'phonenumber': '3330000000',
+            'age': '30',
+            **extra,
+        })
+    return client
+
+
+def auth(client, username='mario', password='TestPassword123'):
+    token = client.post('/api/login', json={'username': username, 'password': password}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+
+class TestProfileEndpoints:
+    """Test per GET/PATCH/DELETE /api/profile."""
+
+    def test_requires_token(self, client):
+        """Test che il profilo richieda il token."""
+        assert client.get('/api/profile').status_code == 401
+
+    def test_get_and_update(self, client):
+        """Test lettura e modifica del profilo."""
+        headers = auth(client)
+        assert client.get('/api/profile', headers=headers).get_json()['user']['email'] == 'mario@example.com'
+
+        response = client.patch('/api/profile', headers=headers, json={'phonenumber': '3339999999'})
+
+        assert response.status_code == 200
+        assert response.get_json()['user']['phonenumber'] == '3339999999'
+        assert 'password' not in response.get_json()['user']
+
+    @pytest.mark.parametrize('data, status', [
+        ({'username': 'other'}, 400),
+        ({'attending_school': 'Altro'}, 400),
+        ({'email': 'luigi@example.com'}, 409),
+        ({'password': 'NewPassword123', 'current_password': 'wrong'}, 403),
+        ({'phonenumber': ''}, 400),
+        ({'email': 12345}, 400),
+        ({'email': ['mario@example.com']}, 400),
+        ({'password': 12345678, 'current_password': 'TestPassword123'}, 400),
+        (['email'], 400),
+    ])
+    def test_invalid_updates(self, client, data, status):
+        """Test modifiche non consentite."""
+        assert client.patch('/api/profile', headers=auth(client), json=data).status_code == status
+
+    def test_change_password(self, client):
+        """Test cambio password con verifica di quella attuale."""
+        response = client.patch('/api/profile', headers=auth(client), json={
+            'password': 'NewPassword123', 'current_password': 'TestPassword123',
+        })
+
+        assert response.status_code == 200
+        assert client.post('/api/login', json={'username': 'mario', 'password': 'NewPassword123'}).status_code == 200
+
+    def test_delete(self, client):
+        """Test cancellazione dell'account."""
+        headers = auth(client)
+
+        assert client.delete('/api/profile', headers=headers).status_code == 200
+
+        # The deletion also ends the login the token belongs to
+        assert client.get('/api/profile', headers=headers).status_code == 401
+        assert client.post('/api/login', json={'username': 'mario', 'password': 'TestPassword123'}).status_code == 401
+        usernames = [user['username'] for user in client.get('/api/users').get_json()['users']]
+        assert usernames == ['luigi']
@@ -0,0 +1,163 @@
+"""
+Test per la geocodifica offline (gazetteer, normalizzazione e cache).
+"""
+
+import gzip
+import os
+
+import pytest
+
+from app import db
+from app.models import School, TripRequest
+from app.services.geocoding import Address, Geocoder, import_gazetteer, normalise
+
+from .conftest import register_and_login
+
+EXTRACT = """street\thousenumber\tcity\tlat\tlon
+Piazzale Macrelli\t100\tCesena\t44.1445\t12.2495
+Via Ugo Foscolo\t51\tCesena\t44.1391\t12.2431
+Via Roma\t2\tCesena\t44.1300\t12.2400
+Via Roma\t10\tCesena\t44.1340\t12.2440
+Via Roma\t5\tCesena\t44.1500\t12.2600
+Via Roma\t12/A\tCesena\t44.1350\t12.2450
+Via Roma\t1\tForlì\t44.2200\t12.0400
+Via senza numero\t\tCesena\t44.0\t12.0
+"""
+
+
+@pytest.fixture
+def gazetteer(tmp_path):
+    source = tmp_path / 'extract.tsv'
+    source.write_text(EXTRACT, encoding='utf-8')
+    path = str(tmp_path / 'gazetteer.db')
+    assert import_gazetteer(str(source), path) == (7, 1)
+    return path
+
+
+class TestNormalise:
+    """Test per la normalizzazione degli indirizzi."""
+
+    @pytest.mark.parametrize('text, address', [
+        ('Piazzale Macrelli 100, Cesena', Address('piazzale macrelli', 100, '', 'cesena')),
+        ('P.le Macrelli, 100, 47521 Cesena (FC)', Address('piazzale macrelli', 100, '', 'cesena')),
+        ('v. Roma n. 12/A, Forlì', Address('via roma', 12, 'a', 'forli')),
+        ('VIA  ROMA 12 bis , cesena', Address('via roma', 12, 'bis', 'cesena')),
+        ('Corso Carlo V 3', Address('corso carlo v', 3, '', '')),
+        ('Via 4 Novembre', Address('via 4 novembre', None, '', '')),
+    ])
+    def test_normalise(self, text, address):
+        """Test abbreviazioni, accenti, numero civico, CAP e provincia."""
+        assert normalise(text) == address
+
+    @pytest.mark.parametrize('text', ['', ' , ', None, 42])
+    def test_empty(self, text):
+        """Test testi vuoti o non validi."""
+        assert normalise(text) is None
+
+
+class TestGeocoder:
+    """Test per le ricerche nel gazetteer e le cache."""
+
+    def test_lookup(self, gazetteer, tmp_path):
+        """Test civico esatto, interpolazione sullo stesso lato, via e città non indicata."""
+        geocoder = Geocoder(gazetteer, str(tmp_path / 'cache.db'))
+        location = geocoder.geocode('P.le Macrelli 100, Cesena')
+        assert (location.lat, location.lon, location.precision) == (44.1445, 12.2495, 'address')
+        # 6 is between 2 and 10 (even side), 5 is on the other side
+        location = geocoder.geocode('Via Roma 6, Cesena')
+        assert location.precision == 'interpolated'
+        assert (location.lat, location.lon) == pytest.approx((44.1320, 12.2420))
+        assert geocoder.geocode('Via Roma 12/A, Cesena')[:2] == (44.1350, 12.2450)
+        assert geocoder.geocode('Via Roma, Cesena').precision == 'street'
+        # Only one city has Via Ugo Foscolo
+        assert geocoder.geocode('Via Ugo Foscolo 51')[:2] == (44.1391, 12.2431)
+        # Via Roma exists in two cities
+        assert geocoder.geocode('Via Roma 1') is None
+        assert geocoder.geocode('Via Inesistente 1, Cesena') is None
+
+    def test_caches(self, gazetteer, tmp_path):
+        """Test LRU limitata e cache persistente condivisa fra istanze."""
+        cache = str(tmp_path / 'cache.db')
+        geocoder = Geocoder(gazetteer, cache, cache_size=2)
+        for text in ('Via Roma 2, Cesena', 'via roma 2 , CESENA', 'Via Roma 10, Cesena',
+                     'Via Roma 5, Cesena', 'Via Nessuna 1, Cesena', 'Via Nessuna 1, Cesena'):
+            geocoder.geocode(text)
+        stats = geocoder.stats()
+        # The second spelling is a new LRU key, but the same normalised address
+        assert stats['lookups'] == 4 and stats['cache_hits'] == 1 and stats['hits'] == 1
+        assert stats['entries'] == 2
+
+        other = Geocoder(gazetteer, cache)
+        assert other.geocode('Via Roma 2, Cesena')[:2] == (44.1300, 12.2400)
+        assert other.geocode('Via Nessuna 1, Cesena') is None
+        assert other.stats()['cache_hits'] == 2 and other.stats()['lookups'] == 0
+
+    def test_new_gazetteer_empties_caches(self, gazetteer, tmp_path):
+        """Test che un nuovo import del gazetteer invalidi entrambe le cache."""
+        cache = str(tmp_path / 'cache.db')
+        geocoder = Geocoder(gazetteer, cache)
+        assert geocoder.geocode('Via Nuova 1, Cesena') is None
+
+        source = tmp_path / 'extract.tsv.gz'
+        with gzip.open(source, 'wt', encoding='utf-8') as f:
+            f.write(EXTRACT + 'Via Nuova\t1\tCesena\t44.16\t12.26\n')
+        import_gazetteer(str(source), gazetteer)
+        assert geocoder.geocode('Via Nuova 1, Cesena')[:2] == (44.16, 12.26)
+        assert Geocoder(gazetteer, cache).geocode('Via Nuova 1, Cesena') is not None
+
+    def test_without_gazetteer(self, tmp_path):
+        """Test che senza gazetteer nulla venga risolto né scritto su disco."""
+        geocoder = Geocoder(str(tmp_path / 'missing.db'), str(tmp_path / 'cache.db'))
+        assert geocoder.geocode('Via Roma 2, Cesena') is None
+        assert not os.path.exists(tmp_path / 'cache.db')
+
+
+@pytest.fixture
+def app_config(gazetteer):
+    return {'GAZETTEER_PATH': gazetteer}
+
+
+@pytest.fixture
+def app(sql_app):
+    """App su database in memoria con il gazetteer di prova."""
+    return sql_app
+
+
+class TestGeocodedEndpoints:
+    """Test per indirizzi risolti da register-school e dalle richieste di passaggio."""
+
+    def test_school_and_pickup_addresses(self, app):
+        """Test coordinate della scuola e del punto di raccolta da indirizzi testuali."""
+        client = app.test_client()
+        response = client.post('/api/register-school', json={
+            'school_name': 'ITT Blaise Pascal', 'address': 'Piazzale Macrelli 100, Cesena',
+            'email': 'itt@example.com', 'representative': 'Rossi', 'mechanical_code': 'FOTF010008',
+        })
+        assert response.status_code == 201
+        school = db.session.execute(db.select(School)).scalar_one()
+        assert (school.latitude, school.longitude) == (44.1445, 12.2495)
+
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        response = client.post('/api/trips/requests', headers=passenger, json={
+            'school_id': school.id, 'pickup_point': 'Via Roma 6, Cesena',
+        })
+        assert response.status_code == 201
+        trip_request = db.session.get(TripRequest, response.get_json()['request']['id'])
+        assert trip_request.pickup_point == 'Via Roma 6, Cesena'
+        assert (trip_request.pickup_lat, trip_request.pickup_lon) == pytest.approx((44.1320, 12.2420))
+
+        response = client.post('/api/trips/requests', headers=passenger, json={
+            'school_id': school.id, 'pickup_point': 'Via Inesistente 1, Cesena',
+        })
+        assert response.status_code == 400
+
+    def test_geocode_schools_command(self, app):
+        """Test del comando flask geocode-schools."""
+        db.session.add(School(name='A', address='Via Ugo Foscolo 51', city='Cesena', email='a@example.com',
+                              representative='R', mechanical_code='A1'))
+        db.session.add(School(name='B', address='Via Ignota 3', email='b@example.com',
+                              representative='R', mechanical_code='B1'))
+        db.session.commit()
+        output = app.test_cli_runner().invoke(args=['geocode-schools']).output
+        assert '1 of 2 schools geocoded' in output and 'not found: B' in output
+        assert db.session.execute(db.select(School).filter_by(name='A')).scalar_one().latitude == 44.1391
@@ -0,0 +1,151 @@
+"""
+Test per il pool di hashing delle password con controllo di ammissione.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.services.hashing import HashingBusy, PasswordHasher, calibrate
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, queue_size=1, retry_after=3)
+    yield hasher
+    hasher.shutdown()
+
+
+def blocking_task(started, release):
+    def task():
+        started.set()
+        release.wait(5)
+        return 'done'
+    return task
+
+
+class TestPasswordHasher:
+    """Test per l'esecutore di hashing."""
+
+    def test_generate_and_check(self, hasher):
+        """Test hashing e verifica attraverso il pool."""
+        pwhash = hasher.generate('TestPassword123')
+
+        assert pwhash.startswith('scrypt:')
+        assert hasher.check(pwhash, 'TestPassword123') is True
+        assert hasher.check(pwhash, 'WrongPassword') is False
+        assert hasher.stats()['completed'] == 3
+
+    def test_dummy_hash_made_at_startup(self, hasher):
+        """Test hash fittizio pronto dall'avvio: uno username sconosciuto costa una sola verifica."""
+        assert hasher._dummy_hash.result(5).startswith('scrypt:')
+
+        assert hasher.check_dummy('WrongPassword') is False
+        assert hasher.stats()['completed'] == 1
+
+    def test_rejects_when_full(self, hasher):
+        """Test rifiuto immediato quando worker e coda sono occupati."""
+        started, release = threading.Event(), threading.Event()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(hasher.run(blocking_task(started, release))))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        deadline = time.monotonic() + 5
+        while hasher.stats()['queue_depth'] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Un task in esecuzione e uno in coda: il terzo viene rifiutato
+        with pytest.raises(HashingBusy) as excinfo:
+            hasher.run(lambda: None)
+        assert excinfo.value.retry_after == 3
+        stats = hasher.stats()
+        assert stats['running'] == 1
+        assert stats['queue_depth'] == 1
+        assert stats['rejected'] == 1
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert results == ['done', 'done']
+        assert hasher.run(lambda: 'again') == 'again'
+
+
+class TestBusyResponses:
+    """Test delle risposte 503 con Retry-After."""
+
+    def test_login_returns_503_when_busy(self, tmp_path, monkeypatch):
+        """Test che il login risponda 503 se il pool è saturo."""
+        monkeypatch.chdir(tmp_path)
+        app = create_app({'TESTING': True})
+        hasher = app.extensions['password_hasher']
+
+        def busy(*args):
+            raise HashingBusy(2)
+        monkeypatch.setattr(hasher, 'run', busy)
+        with open('test_drivers.json', 'w') as f:
+            f.write('{"username": "mario", "password": "scrypt:32768:8:1$salt$hash"}\n')
+
+        response = app.test_client().post('/api/login', json={'username': 'mario', 'password': 'x' * 8})
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '2'
+
+    def test_metrics_endpoint(self):
+        """Test esposizione delle metriche di hashing."""
+        app = create_app({'TESTING': True})
+
+        metrics = app.test_client().get('/api/metrics').get_json()
+
+        assert metrics['password_hashing']['queue_depth'] == 0
+        assert 'hash_ms_p95' in metrics['password_hashing']
+
+
+class TestRehashOnLogin:
+    """Test per l'aggiornamento trasparente degli hash al login."""
+
+    def test_needs_rehash(self):
+        """Test riconoscimento di hash con parametri diversi da quelli configurati."""
+        hasher = PasswordHasher(workers=1, method='scrypt')
+
+        assert not hasher.needs_rehash('scrypt:32768:8:1$salt$hash')
+        assert hasher.needs_rehash('scrypt:16384:8:1$salt$hash')
+        assert hasher.needs_rehash('pbkdf2:sha256:600000$salt$hash')
+        hasher.shutdown()
+
+    def test_outdated_hash_is_upgraded(self, tmp_path, monkeypatch):
+        """Test che un login riuscito riscriva l'hash con i parametri correnti."""
+        monkeypatch.chdir(tmp_path)
+        app = create_app({'TESTING': True, 'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:2000'})
+        old_hash = generate_password_hash('TestPassword123', 'pbkdf2:sha256:1000')
+        with open('test_passengers.json', 'w') as f:
+            json.dump({'username': 'luigi', 'password': old_hash}, f)
+            f.write('\n')
+        client = app.test_client()
+
+        login = {'username': 'luigi', 'password': 'TestPassword123'}
+        assert client.post('/api/login', json=login).status_code == 200
+
+        with open('test_passengers.json') as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 2
+        assert lines[-1]['password'].startswith('pbkdf2:sha256:2000$')
+        # La nuova versione sostituisce la vecchia in login e lista utenti
+        assert client.post('/api/login', json=login).status_code == 200
+        assert len(client.get('/api/users').get_json()['users']) == 1
+        with open('test_passengers.json') as f:
+            assert len(f.readlines()) == 2
+
+    def test_calibrate(self):
+        """Test della calibrazione dei parametri scrypt."""
+        timings, recommended = calibrate(10_000, min_log2_n=10, max_log2_n=11, samples=1)
+
+        assert [method for method, _ in timings] == ['scrypt:1024:8:1', 'scrypt:2048:8:1']
+        assert recommended == 'scrypt:2048:8:1'
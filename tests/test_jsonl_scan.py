@@ -0,0 +1,141 @@
+"""
+Test per la ricerca senza indice nei file JSON-Lines (mmap + confronto di byte)
+e per il suo utilizzo quando l'indice su disco non è disponibile.
+"""
+
+import json
+import os
+
+import pytest
+
+from app import create_app
+from app.services.jsonl_scan import find_last
+from app.services.jsonl_writer import encode_line
+from app.services.user_store import INDEX_SUFFIX, SchoolStore, UserStore, get_index
+
+
+def write_raw(path, lines):
+    with open(path, 'ab') as f:
+        for line in lines:
+            f.write(line if isinstance(line, bytes) else line.encode('utf-8'))
+
+
+class TestFindLast:
+    """Test per find_last."""
+
+    @pytest.mark.parametrize('username', [
+        'mario',
+        'ma"rio',
+        'back\\slash',
+        'caffè',
+        'tab\tand\nnewline',
+        '日本',
+    ])
+    def test_escaping(self, tmp_path, username):
+        """Test valori con virgolette, backslash, caratteri di controllo e non ASCII."""
+        path = str(tmp_path / 'drivers.json')
+        write_raw(path, [encode_line({'username': 'other'}), encode_line({'username': username, 'age': 1})])
+
+        assert find_last(path, 'username', username) == {'username': username, 'age': 1}
+        assert find_last(path, 'username', username[:-1]) is None
+
+    def test_legacy_formats(self, tmp_path):
+        """Test righe senza checksum, senza spazi o con UTF-8 non escapato."""
+        path = str(tmp_path / 'drivers.json')
+        write_raw(path, [
+            json.dumps({'username': 'compatto'}, separators=(',', ':')) + '\n',
+            json.dumps({'username': 'però'}, ensure_ascii=False) + '\n',
+        ])
+
+        assert find_last(path, 'username', 'compatto') is not None
+        assert find_last(path, 'username', 'però') is not None
+
+    def test_decoys_are_skipped(self, tmp_path):
+        """Test che oggetti annidati e valori simili non vengano restituiti."""
+        path = str(tmp_path / 'drivers.json')
+        write_raw(path, [
+            encode_line({'username': 'mario', 'age': 1}),
+            encode_line({'username': 'luigi', 'friend': {'username': 'mario'}}),
+            encode_line({'username': 'luigi', 'note': '"username": "mario"'}),
+            encode_line({'username': 'mariolino'}),
+        ])
+
+        assert find_last(path, 'username', 'mario') == {'username': 'mario', 'age': 1}
+
+    def test_last_line_wins(self, tmp_path):
+        """Test che venga restituita l'ultima riga, tombstone comprese, e ignorate quelle incomplete o corrotte."""
+        path = str(tmp_path / 'drivers.json')
+        corrupt = encode_line({'username': 'mario', 'age': 3}).replace(b'"age": 3', b'"age": 4')
+        write_raw(path, [
+            encode_line({'username': 'mario', 'age': 1}),
+            encode_line({'username': 'mario', '_deleted': True}),
+            encode_line({'username': 'mario', 'age': 2}),
+            corrupt,
+            encode_line({'username': 'mario', 'age': 5})[:-1],
+        ])
+
+        assert find_last(path, 'username', 'mario') == {'username': 'mario', 'age': 2}
+
+    def test_missing_and_empty_file(self, tmp_path):
+        """Test file inesistente o vuoto."""
+        path = str(tmp_path / 'drivers.json')
+        assert find_last(path, 'username', 'mario') is None
+        open(path, 'w').close()
+        assert find_last(path, 'username', 'mario') is None
+
+
+@pytest.fixture
+def broken_sidecars(tmp_path):
+    """File dati il cui indice SQLite non può essere creato (una directory al suo posto)."""
+    paths = {name: str(tmp_path / f'{name}.json') for name in ('drivers', 'passengers', 'schools')}
+    for path in paths.values():
+        os.mkdir(path + INDEX_SUFFIX)
+    return paths
+
+
+class TestIndexFallback:
+    """Test per le ricerche quando l'indice su disco non è utilizzabile."""
+
+    def test_store_scans_the_file(self, broken_sidecars):
+        """Test ricerca, unicità, modifiche e cancellazioni senza indice."""
+        store = UserStore({'driver': broken_sidecars['drivers'], 'passenger': broken_sidecars['passengers']},
+                          fsync=False)
+        store.add('driver', {'username': 'mario', 'email': 'mario@example.com'})
+        store.update('driver', 'mario', {'email': 'super@example.com'})
+        store.add('passenger', {'username': 'luigi', 'email': 'luigi@example.com'})
+        store.delete('passenger', 'luigi')
+
+        assert store.find_by_username('mario')[0]['email'] == 'super@example.com'
+        assert store.exists(email='super@example.com')
+        assert not store.exists(email='mario@example.com')
+        assert not store.exists(username='luigi')
+        assert get_index(broken_sidecars['drivers']).stats()['scanning'] is True
+
+    def test_school_duplicates(self, broken_sidecars):
+        """Test controllo dei duplicati delle scuole senza indice."""
+        store = SchoolStore(broken_sidecars['schools'], fsync=False)
+        store.add({'school_name': 'ITT', 'email': 'itt@example.com', 'mechanical_code': 'MI001'})
+
+        assert store.exists(mechanical_code='MI001')
+        assert not store.exists(school_name='Liceo')
+
+    def test_routes(self, tmp_path, monkeypatch):
+        """Test registrazione e login quando l'indice non è disponibile."""
+        monkeypatch.chdir(tmp_path)
+        for name in ('test_drivers.json', 'test_passengers.json', 'test_schools.json'):
+            os.mkdir(name + INDEX_SUFFIX)
+        client = create_app({'TESTING': True, 'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000'}).test_client()
+        data = {
+            'username': 'mario', 'email': 'mario@example.com', 'password': 'TestPassword123',
+            'role': 'driver', 'phonenumber': '3330000000', 'age': '30', 'licenseid': 'LIC00001',
+        }
+        school = {
+            'school_name': 'ITT', 'address': 'Via Roma 1', 'email': 'itt@example.com',
+            'representative': 'Rossi', 'mechanical_code': 'MI001',
+        }
+
+        assert client.post('/api/register', json=data).status_code == 201
+        assert client.post('/api/register', json={**data, 'username': 'wario'}).status_code == 409
+        assert client.post('/api/login', json={'username': 'mario', 'password': 'TestPassword123'}).status_code == 200
+        assert client.post('/api/register-school', json=school).status_code == 201
+        assert client.post('/api/register-school', json=school).status_code == 409
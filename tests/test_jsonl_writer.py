@@ -0,0 +1,209 @@
+"""
+Test per il percorso di scrittura dei file JSON-Lines: checksum, lock,
+group commit e riparazione della coda.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+
+from app.services.jsonl_writer import FileLock, JsonlWriter, decode_line, encode_line, get_writer, writer_stats
+from app.services.user_store import UserExists, UserStore
+
+
+@pytest.fixture
+def writer(tmp_path):
+    return JsonlWriter(str(tmp_path / 'drivers.json'), FileLock(str(tmp_path / 'users.lock')))
+
+
+def read_lines(path):
+    with open(path, 'rb') as f:
+        return f.readlines()
+
+
+def append_many(path, lock_path, start, count):
+    writer = JsonlWriter(path, FileLock(lock_path), fsync=False)
+    for i in range(start, start + count):
+        writer.append({'username': f'user{i}', 'padding': 'x' * 500})
+
+
+class TestChecksums:
+    """Test per il formato delle righe con checksum."""
+
+    def test_round_trip(self):
+        """Test codifica e decodifica di un record."""
+        record = {'username': 'mario', 'email': 'mario@example.com', 'age': 30}
+        line = encode_line(record)
+
+        assert line.endswith(b'"}\n')
+        assert json.loads(line)['_crc']
+        assert decode_line(line) == record
+
+    def test_corrupted_line_is_rejected(self):
+        """Test che una riga alterata venga scartata."""
+        line = encode_line({'username': 'mario'})
+
+        assert decode_line(line.replace(b'mario', b'wario')) is None
+
+    def test_legacy_line_is_accepted(self):
+        """Test compatibilità con le righe senza checksum."""
+        assert decode_line(b'{"username": "mario"}\n') == {'username': 'mario'}
+        assert decode_line(b'\n') is None
+
+
+class TestRepair:
+    """Test per la riparazione della coda del file."""
+
+    def test_torn_record_is_truncated(self, writer):
+        """Test troncamento di un record scritto a metà."""
+        writer.append({'username': 'mario'})
+        with open(writer.path, 'ab') as f:
+            f.write(encode_line({'username': 'luigi'})[:15])
+
+        assert writer.repair()
+        assert [decode_line(line)['username'] for line in read_lines(writer.path)] == ['mario']
+
+    def test_bad_checksum_on_last_record_is_truncated(self, writer):
+        """Test troncamento di un ultimo record con checksum errato."""
+        writer.append({'username': 'mario'})
+        with open(writer.path, 'ab') as f:
+            f.write(encode_line({'username': 'luigi'}).replace(b'luigi', b'peach'))
+
+        assert writer.repair()
+        assert len(read_lines(writer.path)) == 1
+
+    def test_complete_record_without_newline_is_kept(self, writer):
+        """Test che un record completo senza a capo venga solo terminato."""
+        with open(writer.path, 'wb') as f:
+            f.write(b'{"username": "mario"}')
+
+        assert writer.repair()
+        assert read_lines(writer.path) == [b'{"username": "mario"}\n']
+        assert not writer.repair()
+
+    def test_append_repairs_first(self, writer):
+        """Test che un append dopo un crash non si attacchi alla riga troncata."""
+        with open(writer.path, 'wb') as f:
+            f.write(b'{"username": "ma')
+
+        writer.append({'username': 'luigi'})
+
+        assert [decode_line(line) for line in read_lines(writer.path)] == [{'username': 'luigi'}]
+
+
+class TestGroupCommit:
+    """Test per gli append concorrenti."""
+
+    def test_concurrent_appends_are_batched(self, writer):
+        """Test che append concorrenti condividano write e fsync."""
+        threads = [
+            threading.Thread(target=writer.append, args=({'username': f'user{i}'},))
+            for i in range(50)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        lines = read_lines(writer.path)
+        assert len(lines) == 50
+        assert all(decode_line(line) is not None for line in lines)
+        stats = writer.stats()
+        assert stats['records'] == 50
+        assert stats['batches'] <= 50
+
+    def test_check_sees_earlier_records_of_the_batch(self, writer):
+        """Test che il controllo veda i record già accettati nello stesso batch."""
+        def unique(record, accepted):
+            if any(other['username'] == record['username'] for other in accepted):
+                raise UserExists(record['username'])
+
+        errors = []
+
+        def register(username):
+            try:
+                writer.append({'username': username}, unique)
+            except UserExists as e:
+                errors.append(e)
+
+        with writer.lock:
+            # Il primo append resta bloccato sul lock, gli altri due si accodano
+            leader = threading.Thread(target=register, args=('luigi',))
+            leader.start()
+            while not writer._flushing:
+                time.sleep(0.001)
+            followers = [threading.Thread(target=register, args=('mario',)) for _ in range(2)]
+            for thread in followers:
+                thread.start()
+            while len(writer._pending) < 2:
+                time.sleep(0.001)
+        for thread in [leader] + followers:
+            thread.join()
+
+        assert [decode_line(line)['username'] for line in read_lines(writer.path)] == ['luigi', 'mario']
+        assert len(errors) == 1
+        assert writer.stats()['batches'] == 2
+
+    def test_concurrent_processes_do_not_interleave(self, tmp_path):
+        """Test che processi diversi non mescolino le righe."""
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            pytest.skip('fork non disponibile')
+        path, lock_path = str(tmp_path / 'drivers.json'), str(tmp_path / 'users.lock')
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=append_many, args=(path, lock_path, n * 100, 100))
+            for n in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        records = [decode_line(line) for line in read_lines(path)]
+        assert len(records) == 400
+        assert all(record is not None for record in records)
+
+    def test_stats_without_paths(self, tmp_path):
+        """Test statistiche per nome di file, senza percorsi, sommate fra cartelle diverse."""
+        for directory in ('primary', 'mirror'):
+            (tmp_path / directory).mkdir()
+            get_writer(str(tmp_path / directory / 'writer_stats.json'), fsync=False).append({'username': 'mario'})
+
+        stats = writer_stats()
+        assert stats['writer_stats.json']['records'] == 2
+        assert not any(os.sep in name or str(tmp_path) in name for name in stats)
+
+
+class TestUniqueRegistration:
+    """Test per il controllo dei duplicati sotto lock."""
+
+    def test_same_username_in_two_roles_at_once(self, tmp_path):
+        """Test che due registrazioni concorrenti dello stesso username non passino entrambe."""
+        files = {
+            'driver': str(tmp_path / 'drivers.json'),
+            'passenger': str(tmp_path / 'passengers.json'),
+        }
+        store = UserStore(files, fsync=False)
+        results = []
+        barrier = threading.Barrier(8)
+
+        def register(n):
+            barrier.wait()
+            try:
+                store.add('driver' if n % 2 else 'passenger', {'username': 'mario', 'email': f'{n}@example.com'})
+                results.append('ok')
+            except UserExists:
+                results.append('exists')
+
+        threads = [threading.Thread(target=register, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count('ok') == 1
+        assert len(list(store.iter_users())) == 1
@@ -0,0 +1,183 @@
+"""
+Test per l'abbinamento fra passeggeri e viaggi (indice a griglia e endpoint).
+"""
+
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import db
+from app.services.matching import TripIndex, TripMatcher, detour_km, haversine_km
+
+from .conftest import CENTER, add_driver, add_school, add_trip, register_and_login
+
+
+def random_point(rng, spread=0.15):
+    return CENTER[0] + rng.uniform(-spread, spread), CENTER[1] + rng.uniform(-spread, spread)
+
+
+class TestTripIndex:
+    """Test per l'indice in memoria."""
+
+    def test_haversine(self):
+        """Test distanza nota (Cesena - Bologna, circa 77 km in linea d'aria)."""
+        assert haversine_km(*CENTER, 44.4949, 11.3426) == pytest.approx(81.5, abs=1.5)
+        assert detour_km(CENTER, (44.2, 12.3), CENTER) == pytest.approx(0, abs=1e-9)
+
+    def test_same_result_as_full_scan(self):
+        """Test che l'indice trovi esattamente i viaggi di una scansione completa."""
+        rng = random.Random(7)
+        schools = {1: random_point(rng), 2: random_point(rng)}
+        trips = {code: (rng.choice([1, 2]), random_point(rng)) for code in range(2000)}
+        index = TripIndex(cell_km=0.5)
+        for code, (school_id, origin) in trips.items():
+            index.add(code, school_id, origin, schools[school_id])
+
+        for _ in range(50):
+            pickup = random_point(rng)
+            expected = sorted(
+                (detour_km(origin, schools[1], pickup), code)
+                for code, (school_id, origin) in trips.items()
+                if school_id == 1 and detour_km(origin, schools[1], pickup) <= 2.0
+            )
+            found = index.match(1, pickup, 2.0, limit=len(trips))
+            assert [code for _, code in found] == [code for _, code in expected]
+        assert index.stats()['candidates_per_query'] < 2000
+
+    def test_remove(self):
+        """Test rimozione e reindicizzazione di un viaggio."""
+        index = TripIndex()
+        index.add(1, 1, (44.10, 12.20), CENTER)
+        assert index.match(1, (44.12, 12.22), 1.0)
+
+        index.add(1, 1, (44.20, 12.30), CENTER)
+        assert not index.match(1, (44.12, 12.22), 1.0)
+        index.remove(1)
+        assert len(index) == 0
+        assert index.stats()['cells'] == 0
+
+
+@pytest.fixture
+def app(sql_app):
+    """App con utenti e viaggi su database in memoria."""
+    add_school()
+    add_school(name='Liceo', address='Via Roma 1', email='liceo@example.com', representative='Bianchi',
+               mechanical_code='FOPS000001', latitude=None, longitude=None)
+    add_driver('mario')
+    db.session.commit()
+    return sql_app
+
+
+class TestTripMatcher:
+    """Test per l'allineamento dell'indice con il database."""
+
+    def test_follows_database_changes(self, app):
+        """Test viaggi aggiunti, chiusi e cancellati dopo la prima ricerca."""
+        matcher = TripMatcher()
+        pickup = (44.13, 12.23)
+        first = add_trip(1, (44.10, 12.20))
+        assert [code for _, code in matcher.match(1, pickup, 3.0)] == [first.code]
+
+        second = add_trip(1, (44.11, 12.21))
+        assert {code for _, code in matcher.match(1, pickup, 3.0)} == {first.code, second.code}
+
+        first.status = 'closed'
+        db.session.commit()
+        assert [code for _, code in matcher.match(1, pickup, 3.0)] == [second.code]
+
+        db.session.delete(second)
+        db.session.commit()
+        assert matcher.match(1, pickup, 3.0) == []
+        assert matcher.stats()['reloads'] == 2
+
+    def test_late_commit_with_earlier_stamp(self, app):
+        """Test viaggio chiuso da una transazione con timestamp anteriore all'ultima sincronizzazione."""
+        matcher = TripMatcher()
+        pickup = (44.13, 12.23)
+        trip = add_trip(1, (44.10, 12.20))
+        assert [code for _, code in matcher.match(1, pickup, 3.0)] == [trip.code]
+
+        # Stamped before the sync above by another worker, committed after it
+        trip.status = 'closed'
+        trip.updated_at = matcher._synced - timedelta(seconds=2)
+        db.session.commit()
+        assert matcher.match(1, pickup, 3.0) == []
+        assert matcher.stats()['reloads'] == 1
+
+    def test_past_trips_are_not_offered(self, app):
+        """Test viaggi già partiti o di giorni passati: esclusi subito o appena la finestra si chiude."""
+        matcher = TripMatcher()
+        pickup = (44.13, 12.23)
+        now = datetime(2026, 10, 19, 7, 0)
+        leaving = add_trip(1, (44.10, 12.20), departure_from=now, departure_until=now + timedelta(minutes=30))
+        add_trip(1, (44.11, 12.21), departure_from=now - timedelta(hours=1), departure_until=now - timedelta(minutes=1))
+        today = add_trip(1, (44.12, 12.22), occurs_on=date(2026, 10, 19))
+        add_trip(1, (44.12, 12.22), occurs_on=date(2026, 10, 18))
+
+        def codes(now):
+            return {code for _, code in matcher.match(1, pickup, 3.0, now=now)}
+
+        assert codes(now) == {leaving.code, today.code}
+        assert codes(now + timedelta(hours=1)) == {today.code}
+        # Mezzanotte a Roma (ora legale) sono le 22:00 UTC
+        assert codes(datetime(2026, 10, 19, 21, 59)) == {today.code}
+        assert codes(datetime(2026, 10, 19, 22, 0)) == set()
+        assert matcher.stats()['reloads'] == 1
+
+
+class TestTripEndpoints:
+    """Test per /api/trips e /api/trips/match."""
+
+    def test_publish_and_match(self, app):
+        """Test pubblicazione di un viaggio e ricerca da parte di un passeggero."""
+        client = app.test_client()
+        driver = register_and_login(client, 'luigi', 'driver', licenseid='LIC00001')
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+
+        response = client.post('/api/trips', headers=driver, json={
+            'school_id': 1, 'origin': {'lat': 44.10, 'lon': 12.20},
+        })
+        assert response.status_code == 201
+        code = response.get_json()['trip']['code']
+        seen = client.get(f'/api/trips/{code}', headers=passenger).get_json()['trip']
+        assert seen['status'] == 'open' and 'origin' not in seen
+        other = register_and_login(client, 'wario', 'driver', licenseid='LIC00002')
+        assert 'origin' not in client.get(f'/api/trips/{code}', headers=other).get_json()['trip']
+        own = client.get(f'/api/trips/{code}', headers=driver).get_json()['trip']
+        assert own['origin'] == {'lat': 44.10, 'lon': 12.20}
+
+        response = client.post('/api/trips/match', headers=passenger, json={
+            'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22},
+        })
+        assert response.status_code == 200
+        [trip] = response.get_json()['trips']
+        assert trip['code'] == code and trip['driver'] == 'luigi'
+        assert 0 <= trip['detour_km'] < 1
+        far = client.post('/api/trips/match', headers=passenger, json={
+            'school_id': 1, 'pickup': {'lat': 44.30, 'lon': 12.50}, 'max_detour_km': 2,
+        })
+        assert far.get_json()['trips'] == []
+
+    @pytest.mark.parametrize('data, status', [
+        ({'school_id': 1, 'origin': {'lat': 95, 'lon': 12.2}}, 400),
+        ({'school_id': 1, 'origin': 'Cesena'}, 400),
+        ({'origin': {'lat': 44.1, 'lon': 12.2}}, 400),
+        ({'school_id': 99, 'origin': {'lat': 44.1, 'lon': 12.2}}, 404),
+        ({'school_id': 2, 'origin': {'lat': 44.1, 'lon': 12.2}}, 409),
+    ])
+    def test_invalid_trips(self, app, data, status):
+        """Test viaggi non validi."""
+        client = app.test_client()
+        driver = register_and_login(client, 'luigi', 'driver', licenseid='LIC00001')
+        assert client.post('/api/trips', headers=driver, json=data).status_code == status
+
+    def test_passengers_cannot_publish(self, app):
+        """Test che solo gli autisti possano pubblicare viaggi."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        response = client.post('/api/trips', headers=passenger, json={
+            'school_id': 1, 'origin': {'lat': 44.1, 'lon': 12.2},
+        })
+        assert response.status_code == 403
+        assert client.post('/api/trips/match', json={'school_id': 1}).status_code == 401
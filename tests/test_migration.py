@@ -0,0 +1,145 @@
+"""
+Test per la migrazione online dai file JSON al database.
+"""
+
+import json
+import os
+import threading
+
+import pytest
+
+from app import create_app, db
+from app.models import Driver
+from app.services.migration import backfill, check_parity, parity_ok
+
+from .conftest import write_lines
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App in modalità 'dual' su database in memoria."""
+    monkeypatch.chdir(tmp_path)
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'USER_STORE_BACKEND': 'dual',
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def files():
+    return {'driver': 'test_drivers.json', 'passenger': 'test_passengers.json'}
+
+
+def drivers(count, start=0):
+    return [
+        {'username': f'driver{i}', 'password': 'hash', 'email': f'driver{i}@example.com'}
+        for i in range(start, start + count)
+    ]
+
+
+class TestDualWrite:
+    """Test per la doppia scrittura in fase di registrazione."""
+
+    def test_register_writes_both_stores(self, app, files):
+        """Test che la registrazione scriva sia su file che su database."""
+        response = app.test_client().post('/api/register', json={
+            'username': 'dualuser',
+            'email': 'dualuser@example.com',
+            'password': 'TestPassword123',
+            'role': 'driver',
+            'phonenumber': '3330000000',
+            'age': '30',
+            'licenseid': 'LIC00001',
+        })
+
+        assert response.status_code == 201
+        with open(files['driver']) as f:
+            assert json.loads(f.readline())['username'] == 'dualuser'
+        assert db.session.query(Driver).one().username == 'dualuser'
+        assert parity_ok(check_parity(files))
+
+    def test_reads_follow_config_switch(self, app, files):
+        """Test che le letture passino al database solo con USER_READS_FROM_DB."""
+        write_lines(files['driver'], drivers(1))
+        client = app.test_client()
+
+        assert len(client.get('/api/users').get_json()['users']) == 1
+
+        app.config['USER_READS_FROM_DB'] = True
+        assert client.get('/api/users').get_json()['users'] == []
+
+        backfill(files, 'checkpoint.json')
+        assert len(client.get('/api/users').get_json()['users']) == 1
+
+
+class TestBackfill:
+    """Test per il backfill a blocchi con checkpoint."""
+
+    def test_backfill_is_resumable(self, app, files):
+        """Test ripresa del backfill dal checkpoint."""
+        write_lines(files['driver'], drivers(5))
+
+        assert backfill(files, 'checkpoint.json', batch_size=2) == {
+            'driver': (5, 0), 'passenger': (0, 0),
+        }
+        write_lines(files['driver'], drivers(2, start=5))
+
+        # Solo le righe nuove vengono copiate
+        assert backfill(files, 'checkpoint.json', batch_size=2)['driver'] == (2, 0)
+        assert db.session.query(Driver).count() == 7
+        assert parity_ok(check_parity(files))
+
+    def test_backfill_restarts_after_compaction(self, app, files):
+        """Test file riscritto dalla compattazione: il backfill riparte dall'inizio."""
+        write_lines(files['driver'], drivers(4))
+        backfill(files, 'checkpoint.json')
+        # Rewritten file (new inode) longer than the old offset
+        write_lines('compacted.json', drivers(3, start=4) + drivers(3, start=1))
+        os.replace('compacted.json', files['driver'])
+
+        assert backfill(files, 'checkpoint.json')['driver'] == (6, 0)
+        assert db.session.query(Driver).count() == 7
+
+    def test_backfill_stops_between_batches(self, app, files):
+        """Test interruzione e ripresa del backfill."""
+        write_lines(files['driver'], drivers(4))
+        stop = threading.Event()
+        stop.set()
+
+        assert backfill(files, 'checkpoint.json', batch_size=2, stop=stop)['driver'] == (0, 0)
+        assert backfill(files, 'checkpoint.json', batch_size=2)['driver'] == (4, 0)
+
+    def test_latest_line_wins(self, app, files):
+        """Test che l'ultima riga di uno username aggiorni il database."""
+        write_lines(files['driver'], [{'username': 'mario', 'password': 'old'}])
+        backfill(files, 'checkpoint.json')
+        write_lines(files['driver'], [{'username': 'mario', 'password': 'new'}])
+        backfill(files, 'checkpoint.json')
+
+        assert db.session.query(Driver).one().password_hash == 'new'
+
+
+class TestParity:
+    """Test per il controllo di consistenza."""
+
+    def test_detects_differences(self, app, files):
+        """Test rilevazione di record mancanti, in eccesso e diversi."""
+        write_lines(files['driver'], drivers(3))
+        backfill(files, 'checkpoint.json')
+
+        user = db.session.query(Driver).filter_by(username='driver0').one()
+        user.email = 'changed@example.com'
+        db.session.delete(db.session.query(Driver).filter_by(username='driver1').one())
+        db.session.add(Driver(username='ghost', password_hash='hash'))
+        db.session.commit()
+
+        report = check_parity(files)
+        assert not parity_ok(report)
+        assert report['driver']['mismatched'] == ['driver0']
+        assert report['driver']['missing'] == ['driver1']
+        assert report['driver']['extra'] == ['ghost']
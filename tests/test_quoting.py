@@ -0,0 +1,128 @@
+"""
+Test per i preventivi delle tariffe (prezzo al km, ETA e punteggio).
+"""
+
+import random
+
+import pytest
+
+from app import db
+from app.models import Driver, Trip
+from app.services import pricing
+from app.services.matching import haversine_km
+from app.services.pricing import QuoteCache, quote_columns
+
+from .conftest import CENTER, add_driver, add_school, register_and_login
+
+
+class TestQuoteColumns:
+    """Test per il calcolo a colonne di tariffe, ETA e punteggi."""
+
+    def test_columns(self):
+        """Test tariffa, minuti e punteggio di due autisti."""
+        pickup, school = (44.12, 12.22), CENTER
+        ride_km = haversine_km(*pickup, *school)
+        columns = quote_columns(pickup, school, [(44.10, 12.20), (44.11, 12.21)],
+                                [0.5, 0.25], [5.0, 2.5], speed_kmh=30, rating_weight=0.4)
+        assert columns['fare'] == [round(0.5 * ride_km, 2), round(0.25 * ride_km, 2)]
+        to_pickup = haversine_km(44.10, 12.20, *pickup)
+        assert columns['pickup_minutes'][0] == pytest.approx(to_pickup * 2)
+        assert columns['arrival_minutes'][0] == pytest.approx((to_pickup + ride_km) * 2)
+        # The cheapest driver gets the whole price share
+        assert columns['score'][1] == pytest.approx(0.4 * 0.5 + 0.6)
+        assert columns['score'][0] == pytest.approx(
+            0.4 + 0.6 * (columns['fare'][1] + 0.01) / (columns['fare'][0] + 0.01))
+
+    def test_free_rides_and_empty(self):
+        """Test autisti con prezzo nullo, valutazioni fuori scala e nessun candidato."""
+        columns = quote_columns((44.12, 12.22), CENTER, [(44.10, 12.20)] * 2, [0.0, 0.0], [7.0, -1.0])
+        assert columns['fare'] == [0.0, 0.0]
+        assert columns['score'] == pytest.approx([1.0, 0.7])
+        assert quote_columns((44.12, 12.22), CENTER, [], [], []) == {
+            'fare': [], 'pickup_minutes': [], 'arrival_minutes': [], 'score': []}
+
+    def test_numpy_columns(self):
+        """Test che le colonne calcolate con NumPy coincidano con quelle in Python."""
+        pytest.importorskip('numpy')
+        rng = random.Random(1)
+        origins = [(CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1)) for _ in range(50)]
+        prices = [rng.uniform(0, 1) for _ in origins]
+        ratings = [rng.uniform(0, 5) for _ in origins]
+        args = ((44.12, 12.22), CENTER, origins, prices, ratings, 30.0, 0.3)
+        fast, slow = pricing._columns_numpy(*args), pricing._columns_python(*args)
+        for column in slow:
+            assert fast[column] == pytest.approx(slow[column], abs=1e-9)
+
+
+class TestQuoteCache:
+    """Test per la cache LRU dei preventivi."""
+
+    def test_lru_and_ttl(self, monkeypatch):
+        """Test espulsione della voce meno recente e scadenza."""
+        now = [0.0]
+        monkeypatch.setattr(pricing.time, 'monotonic', lambda: now[0])
+        cache = QuoteCache(max_entries=2, ttl=10)
+        cache.put('a', [1])
+        cache.put('b', [2])
+        assert cache.get('a') == [1]
+        cache.put('c', [3])
+        assert cache.get('b') is None and cache.get('c') == [3]
+        now[0] = 11
+        assert cache.get('a') is None
+        assert cache.stats() == {'entries': 2, 'max_entries': 2, 'hits': 2, 'misses': 2}
+
+
+@pytest.fixture
+def app(sql_app):
+    """App con tre viaggi verso la stessa scuola su database in memoria."""
+    add_school()
+    for i, (price, rating) in enumerate([(0.30, 4.0), (0.20, 3.0), (0.60, 5.0)]):
+        add_driver(f'driver{i}', priceperkm=price, rating=rating)
+        db.session.add(Trip(driver_id=i + 1, school_id=1, origin_lat=44.10, origin_lon=12.20 + i * 0.001))
+    db.session.commit()
+    return sql_app
+
+
+class TestQuoteEndpoint:
+    """Test per l'endpoint POST /api/trips/quote."""
+
+    def test_quotes(self, app):
+        """Test preventivi ordinati per punteggio e riuso della cache."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        body = {'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22}}
+        response = client.post('/api/trips/quote', headers=passenger, json=body)
+        assert response.status_code == 200
+        data = response.get_json()
+        ride_km = haversine_km(44.12, 12.22, *CENTER)
+        assert data['distance_km'] == pytest.approx(ride_km, abs=1e-3)
+        assert [q['driver'] for q in data['quotes']] == ['driver1', 'driver0', 'driver2']
+        assert data['quotes'][0]['fare'] == round(0.20 * ride_km, 2)
+        assert data['quotes'][0]['arrival_minutes'] > data['quotes'][0]['pickup_minutes'] > 0
+
+        # Same point within 10 m: served from the cache, even if a price changes
+        db.session.get(Driver, 3).priceperkm = 0.01
+        db.session.commit()
+        body['pickup'] = {'lat': 44.12001, 'lon': 12.22001}
+        assert client.post('/api/trips/quote', headers=passenger, json=body).get_json()['quotes'] == data['quotes']
+        assert app.extensions['quote_cache'].stats()['hits'] == 1
+
+        # A new trip changes the candidate set
+        db.session.add(Trip(driver_id=3, school_id=1, origin_lat=44.10, origin_lon=12.21))
+        db.session.commit()
+        quotes = client.post('/api/trips/quote', headers=passenger, json={**body, 'limit': 2}).get_json()['quotes']
+        assert [q['driver'] for q in quotes] == ['driver2', 'driver2']
+
+    def test_errors(self, app):
+        """Test richieste non valide, scuola inesistente e nessun viaggio vicino."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        pickup = {'lat': 44.12, 'lon': 12.22}
+        assert client.post('/api/trips/quote', headers=passenger, json={'pickup': pickup}).status_code == 400
+        assert client.post('/api/trips/quote', headers=passenger,
+                           json={'school_id': 9, 'pickup': pickup}).status_code == 404
+        assert client.post('/api/trips/quote', headers=passenger,
+                           json={'school_id': 1, 'pickup': pickup, 'limit': 0}).status_code == 400
+        response = client.post('/api/trips/quote', headers=passenger,
+                               json={'school_id': 1, 'pickup': {'lat': 45.0, 'lon': 9.0}})
+        assert response.status_code == 200 and response.get_json()['quotes'] == []
@@ -0,0 +1,124 @@
+"""
+Test per le recensioni e la valutazione incrementale degli autisti.
+"""
+
+import pytest
+
+from app import db
+from app.models import Driver, Review, Trip, TripRequest
+from app.services.ratings import InvalidReview, add_review, reconcile, smoothed
+
+from .conftest import add_driver, add_passenger, add_school, register_and_login
+
+
+@pytest.fixture
+def app_config():
+    return {'RATING_PRIOR_MEAN': 3.0, 'RATING_PRIOR_WEIGHT': 2}
+
+
+@pytest.fixture
+def app(sql_app):
+    """App con due autisti, un viaggio ciascuno e tre passeggeri su database in memoria."""
+    add_school()
+    for i in range(2):
+        add_driver(f'driver{i}')
+        db.session.add(Trip(driver_id=i + 1, school_id=1, origin_lat=44.10, origin_lon=12.20))
+    for i in range(3):
+        add_passenger(f'passenger{i}')
+    db.session.commit()
+    return sql_app
+
+
+class TestAggregates:
+    """Test per l'aggiornamento incrementale e la riconciliazione."""
+
+    def test_smoothed(self):
+        """Test media bayesiana: senza recensioni vale la media a priori."""
+        assert smoothed(0, 0, 3.5, 5) == 3.5
+        assert smoothed(5, 1, 3.5, 5) == pytest.approx(3.75)
+        assert smoothed(480, 100, 3.5, 5) > smoothed(5, 1, 3.5, 5)
+
+    def test_add_review(self, app):
+        """Test conteggio, somma e punteggio aggiornati a ogni recensione."""
+        trip = db.session.get(Trip, 1)
+        add_review(trip, 1, 5)
+        add_review(trip, 2, 4, 'Puntuale')
+        db.session.commit()
+        driver = db.session.get(Driver, 1)
+        assert (driver.rating_count, driver.rating_sum) == (2, 9)
+        assert driver.rating == pytest.approx((2 * 3.0 + 9) / 4)
+        assert db.session.get(Driver, 2).rating_count == 0
+
+    def test_unreviewed(self, app):
+        """Test autista senza recensioni: vale la media a priori, sopra chi ha una recensione da 1."""
+        assert db.session.get(Driver, 2).rating == 3.0
+        add_review(db.session.get(Trip, 1), 1, 1)
+        db.session.commit()
+        assert db.session.get(Driver, 1).rating < db.session.get(Driver, 2).rating
+
+        # Rows stored before the default: fixed by the reconciliation
+        db.session.get(Driver, 2).rating = 0.0
+        db.session.commit()
+        assert reconcile() == {'drivers': 2, 'corrected': 1}
+        assert db.session.get(Driver, 2).rating == 3.0
+
+    @pytest.mark.parametrize('stars, comment', [(0, None), (6, None), (4.5, None), (True, None), ('5', None),
+                                                (5, 'x' * 501)])
+    def test_invalid(self, app, stars, comment):
+        """Test stelle fuori intervallo o non intere e commenti troppo lunghi."""
+        with pytest.raises(InvalidReview):
+            add_review(db.session.get(Trip, 1), 1, stars, comment)
+
+    def test_reconcile(self, app):
+        """Test che la riconciliazione corregga gli aggregati divergenti."""
+        trip = db.session.get(Trip, 1)
+        for passenger_id, stars in [(1, 5), (2, 3), (3, 1)]:
+            add_review(trip, passenger_id, stars)
+        add_review(db.session.get(Trip, 2), 1, 4)
+        db.session.commit()
+        assert reconcile() == {'drivers': 2, 'corrected': 0}
+
+        # A review deleted by hand, and a stale count
+        db.session.execute(db.delete(Review).where(Review.stars == 1))
+        db.session.get(Driver, 2).rating_count = 7
+        db.session.commit()
+        assert reconcile() == {'drivers': 2, 'corrected': 2}
+        driver = db.session.get(Driver, 1)
+        assert (driver.rating_count, driver.rating_sum, driver.rating) == (2, 8, pytest.approx(14 / 4))
+        assert db.session.get(Driver, 2).rating_count == 1
+
+        db.session.execute(db.delete(Review))
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=['reconcile-ratings']).output
+        assert '2 drivers checked, 2 corrected' in result
+        assert db.session.get(Driver, 1).rating == 3.0
+
+
+class TestReviewEndpoint:
+    """Test per l'endpoint POST /api/trips/<code>/reviews."""
+
+    def test_review(self, app):
+        """Test recensione di un passeggero del viaggio, una sola volta."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        db.session.add(TripRequest(trip_code=1, passenger_id=4, school_id=1, status='assigned'))
+        db.session.commit()
+        response = client.post('/api/trips/1/reviews', headers=passenger, json={'stars': 5, 'comment': 'Ottimo'})
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['review']['stars'] == 5 and data['review']['driver_id'] == 1
+        assert data['driver'] == {'username': 'driver0', 'rating': pytest.approx(11 / 3), 'rating_count': 1}
+        assert client.post('/api/trips/1/reviews', headers=passenger, json={'stars': 1}).status_code == 409
+
+    def test_errors(self, app):
+        """Test permessi, viaggio inesistente e stelle non valide."""
+        client = app.test_client()
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        driver = register_and_login(client, 'mario', 'driver', licenseid='LIC00001')
+        assert client.post('/api/trips/1/reviews', headers=passenger, json={'stars': 5}).status_code == 403
+        assert client.post('/api/trips/1/reviews', headers=driver, json={'stars': 5}).status_code == 403
+        assert client.post('/api/trips/9/reviews', headers=passenger, json={'stars': 5}).status_code == 404
+        db.session.add(TripRequest(trip_code=1, passenger_id=4, school_id=1, status='assigned'))
+        db.session.commit()
+        assert client.post('/api/trips/1/reviews', headers=passenger, json={'stars': 9}).status_code == 400
+        assert db.session.get(Driver, 1).rating_count == 0
@@ -0,0 +1,235 @@
+"""
+Test per i viaggi ricorrenti espansi su richiesta.
+"""
+
+import itertools
+import threading
+from datetime import date, datetime
+
+import pytest
+
+from app import create_app, db
+from app.models import Trip, TripRequest, Vehicle
+from app.services.recurrence import InvalidSchedule, occurrence_dates, parse_weekdays
+
+from .conftest import add_school, register_and_login
+
+# Same calendar (and change to winter time) as 2026/27, but never in the past:
+# booking and matching leave out the days already gone
+WEEK = {'school_id': 1, 'from': '2082-10-19', 'until': '2082-10-25'}
+
+
+class TestExpansion:
+    """Test per le date generate da una ricorrenza."""
+
+    def test_weekdays(self):
+        """Test giorni della settimana, limiti della ricorrenza e dell'intervallo."""
+        mask = parse_weekdays(['mo', 'WE', 'FR'])
+        days = list(occurrence_dates(mask, date(2082, 10, 21), date(2082, 10, 30),
+                                     date(2082, 10, 1), date(2082, 10, 28)))
+        assert days == [date(2082, 10, 21), date(2082, 10, 23), date(2082, 10, 26), date(2082, 10, 28)]
+
+    def test_lazy(self):
+        """Test che l'espansione produca le date una alla volta, anche su intervalli enormi."""
+        days = occurrence_dates(parse_weekdays(['SU']), date.min, date.max, date.min, date.max)
+        assert list(itertools.islice(days, 2)) == [date(1, 1, 7), date(1, 1, 14)]
+
+    @pytest.mark.parametrize('value', [[], ['XX'], 'MO', None])
+    def test_invalid_weekdays(self, value):
+        """Test giorni della settimana non validi."""
+        with pytest.raises(InvalidSchedule):
+            parse_weekdays(value)
+
+
+@pytest.fixture
+def app(sql_app):
+    """App con una scuola su database in memoria."""
+    add_school()
+    db.session.commit()
+    return sql_app
+
+
+@pytest.fixture
+def schedule(app):
+    """Un autista con un'auto da tre posti e un viaggio ricorrente nei giorni feriali per l'anno scolastico."""
+    client = app.test_client()
+    driver = register_and_login(client, 'mario', 'driver', licenseid='LIC00001')
+    db.session.add(Vehicle(driver_id=1, licence_plate='AB123CD', model='Panda', color='rosso', fuel='benzina',
+                           seats_number=3, handicap_seats=0, cv=70, kw=51))
+    db.session.commit()
+    response = client.post('/api/trips/schedules', headers=driver, json={
+        'school_id': 1, 'origin': {'lat': 44.10, 'lon': 12.20},
+        'weekdays': ['MO', 'TU', 'WE', 'TH', 'FR'], 'starts_on': '2082-09-14', 'ends_on': '2083-06-06',
+        'arrival': {'from': '07:40', 'until': '07:50'},
+    })
+    assert response.status_code == 201
+    return client, driver, response.get_json()['schedule']
+
+
+class TestRecurringTrips:
+    """Test per ricorrenze, elenco delle occorrenze, prenotazioni ed eccezioni."""
+
+    def test_list_week_without_materialising(self, schedule):
+        """Test elenco di una settimana senza scrivere viaggi, con l'ora legale."""
+        client, driver, created = schedule
+        assert created['weekdays'] == ['MO', 'TU', 'WE', 'TH', 'FR']
+        trips = client.get('/api/trips/occurrences', headers=driver, query_string=WEEK).get_json()['trips']
+        assert [t['occurs_on'] for t in trips] == [f'2082-10-{d}' for d in range(19, 24)]
+        assert all(t['code'] is None and t['status'] == 'open' for t in trips)
+        assert trips[0]['origin'] == {'lat': 44.10, 'lon': 12.20}
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        seen = client.get('/api/trips/occurrences', headers=passenger, query_string=WEEK).get_json()['trips']
+        assert all('origin' not in t for t in seen)
+        # 07:40 in Rome is 05:40 UTC in summer time, 06:40 UTC after 25 October
+        assert trips[0]['arrival'] == {'from': '2082-10-19T05:40:00', 'until': '2082-10-19T05:50:00'}
+        later = client.get('/api/trips/occurrences', headers=driver, query_string={
+            **WEEK, 'from': '2082-10-26', 'until': '2082-10-26'}).get_json()['trips']
+        assert later[0]['arrival']['from'] == '2082-10-26T06:40:00'
+        assert db.session.execute(db.select(db.func.count(Trip.code))).scalar() == 0
+
+    def test_book_occurrence(self, schedule, app):
+        """Test prenotazione di un giorno: viaggio materializzato, richiesta assegnata, posti esauriti."""
+        client, driver, created = schedule
+        occurrence = {'schedule_id': created['id'], 'date': '2082-10-20'}
+        codes = []
+        for name in ('peach', 'daisy'):
+            passenger = register_and_login(client, name, 'passenger', attending_school='ITT Blaise Pascal')
+            response = client.post('/api/trips/requests', headers=passenger, json={
+                'pickup': {'lat': 44.12, 'lon': 12.22}, 'occurrence': occurrence})
+            assert response.status_code == 201
+            assert response.get_json()['request']['status'] == 'assigned'
+            codes.append(response.get_json()['request']['trip_code'])
+        assert codes[0] == codes[1]
+        trip = db.session.get(Trip, codes[0])
+        assert (trip.occurs_on, trip.arrival_from) == (date(2082, 10, 20), datetime(2082, 10, 20, 5, 40))
+
+        # Two passenger seats only
+        passenger = register_and_login(client, 'rosalina', 'passenger', attending_school='ITT Blaise Pascal')
+        response = client.post('/api/trips/requests', headers=passenger, json={
+            'pickup': {'lat': 44.12, 'lon': 12.22}, 'occurrence': occurrence})
+        assert response.status_code == 409
+        assert db.session.execute(db.select(db.func.count(TripRequest.id))).scalar() == 2
+
+        trips = client.get('/api/trips/occurrences', headers=driver, query_string=WEEK).get_json()['trips']
+        assert [t['code'] for t in trips] == [None, codes[0], None, None, None]
+        assert db.session.execute(db.select(db.func.count(Trip.code))).scalar() == 1
+
+        # The materialised day is an ordinary open trip for matching
+        matches = client.post('/api/trips/match', headers=passenger, json={
+            'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22},
+            'arrival': {'from': '2082-10-20T07:30+02:00', 'until': '2082-10-20T07:55+02:00'},
+        }).get_json()['trips']
+        assert [m['code'] for m in matches] == codes[:1]
+
+    def test_booking_checks(self, schedule):
+        """Test prenotazione di un giorno passato, doppia o con finestre che non si sovrappongono."""
+        client, _, created = schedule
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+
+        def book(day, **windows):
+            return client.post('/api/trips/requests', headers=passenger, json={
+                'pickup': {'lat': 44.12, 'lon': 12.22},
+                'occurrence': {'schedule_id': created['id'], 'date': day}, **windows})
+
+        response = book('2020-10-20')
+        assert response.status_code == 400 and 'past' in response.get_json()['error']
+        assert book('2082-10-20', arrival={'from': '2082-10-20T08:30+02:00', 'until': '2082-10-20T09:00+02:00'}
+                    ).status_code == 400
+        # The schedule has no departure window
+        assert book('2082-10-20', departure={'from': '2082-10-20T07:00+02:00', 'until': '2082-10-20T07:30+02:00'}
+                    ).status_code == 400
+        assert book('2082-10-20', arrival={'from': '2082-10-20T07:30+02:00', 'until': '2082-10-20T07:45+02:00'}
+                    ).status_code == 201
+        assert book('2082-10-20').status_code == 409
+        assert db.session.execute(db.select(db.func.count(TripRequest.id))).scalar() == 1
+
+    def test_cancel_occurrence(self, schedule):
+        """Test eccezione: un giorno annullato resta nell'elenco e non si può prenotare."""
+        client, driver, created = schedule
+        url = f"/api/trips/schedules/{created['id']}/occurrences/2082-10-21/cancel"
+        response = client.post(url, headers=driver)
+        assert response.status_code == 200 and response.get_json()['trip']['status'] == 'cancelled'
+        assert client.post(url, headers=driver).status_code == 409
+        trips = client.get('/api/trips/occurrences', headers=driver, query_string=WEEK).get_json()['trips']
+        assert [t['status'] for t in trips] == ['open', 'open', 'cancelled', 'open', 'open']
+
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        response = client.post('/api/trips/requests', headers=passenger, json={
+            'pickup': {'lat': 44.12, 'lon': 12.22},
+            'occurrence': {'schedule_id': created['id'], 'date': '2082-10-21'},
+        })
+        assert response.status_code == 409
+
+    def test_errors(self, schedule):
+        """Test giorni fuori ricorrenza, intervalli troppo lunghi e permessi."""
+        client, driver, created = schedule
+        other = register_and_login(client, 'luigi', 'driver', licenseid='LIC00002')
+        base = f"/api/trips/schedules/{created['id']}/occurrences"
+        # A Sunday, and a day after the end of the school year
+        assert client.post(f'{base}/2082-10-25/cancel', headers=driver).status_code == 400
+        assert client.post(f'{base}/2083-06-07/cancel', headers=driver).status_code == 400
+        assert client.post(f'{base}/2082-10-20/cancel', headers=other).status_code == 403
+        assert client.post('/api/trips/schedules/9/occurrences/2082-10-20/cancel', headers=driver).status_code == 404
+        assert client.get('/api/trips/occurrences', headers=driver, query_string={
+            **WEEK, 'until': '2083-06-06'}).status_code == 400
+        assert client.post('/api/trips/schedules', headers=driver, json={
+            'school_id': 1, 'origin': {'lat': 44.10, 'lon': 12.20}, 'weekdays': ['MO'],
+            'starts_on': '2083-06-06', 'ends_on': '2082-09-14'}).status_code == 400
+        # The origin is the driver's only
+        seen = client.get(f"/api/trips/schedules/{created['id']}", headers=other).get_json()['schedule']
+        assert seen == {key: value for key, value in created.items() if key != 'origin'}
+        assert client.get(f"/api/trips/schedules/{created['id']}", headers=driver).get_json()['schedule'] == created
+
+
+class TestConcurrentBookings:
+    """Test per le prenotazioni concorrenti su database in file."""
+
+    def test_no_overbooking(self, tmp_path, monkeypatch):
+        """Test prenotazioni concorrenti dello stesso giorno: mai più passeggeri dei posti."""
+        monkeypatch.chdir(tmp_path)
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'trips.db'}",
+            'USER_STORE_BACKEND': 'sql',
+            'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        })
+        with app.app_context():
+            db.create_all()
+            add_school()
+            db.session.commit()
+            client = app.test_client()
+            driver = register_and_login(client, 'mario', 'driver', licenseid='LIC00001')
+            db.session.add(Vehicle(driver_id=1, licence_plate='AB123CD', model='Panda', color='rosso', fuel='benzina',
+                                   seats_number=3, handicap_seats=0, cv=70, kw=51))
+            db.session.commit()
+            schedule_id = client.post('/api/trips/schedules', headers=driver, json={
+                'school_id': 1, 'origin': {'lat': 44.10, 'lon': 12.20}, 'weekdays': ['TU'],
+                'starts_on': '2082-09-14', 'ends_on': '2083-06-06',
+            }).get_json()['schedule']['id']
+            passengers = [register_and_login(client, f'passenger{i}', 'passenger', attending_school='ITT Blaise Pascal')
+                          for i in range(8)]
+            db.session.remove()
+
+        barrier = threading.Barrier(len(passengers))
+        statuses = []
+
+        def book(headers):
+            barrier.wait()
+            response = app.test_client().post('/api/trips/requests', headers=headers, json={
+                'pickup': {'lat': 44.12, 'lon': 12.22},
+                'occurrence': {'schedule_id': schedule_id, 'date': '2082-10-20'},
+            })
+            statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=book, args=(headers,)) for headers in passengers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with app.app_context():
+            assigned = db.session.execute(
+                db.select(db.func.count(TripRequest.id)).where(TripRequest.status == 'assigned')).scalar()
+            db.session.remove()
+        assert assigned == statuses.count(201) == 2
+        assert sorted(statuses) == [201, 201] + [409] * (len(passengers) - 2)
@@ -0,0 +1,132 @@
+"""
+Test per l'ordine di raccolta dei passeggeri (routing dei viaggi).
+"""
+
+import random
+
+import pytest
+
+from app import db
+from app.models import Passenger, Trip, TripRequest
+from app.services import routing
+from app.services.matching import haversine_km
+from app.services.routing import distance_matrices, nearest_neighbour, plan, plan_routes, route_length, two_opt
+
+from .conftest import CENTER, add_driver, add_passenger, add_school, register_and_login
+
+
+def random_points(rng, n):
+    return [(CENTER[0] + rng.uniform(-0.1, 0.1), CENTER[1] + rng.uniform(-0.1, 0.1)) for _ in range(n)]
+
+
+class TestHeuristics:
+    """Test per matrici delle distanze, nearest neighbour e 2-opt."""
+
+    def test_distance_matrices(self):
+        """Test matrici di viaggi con numero di punti diverso."""
+        rng = random.Random(1)
+        lists = [random_points(rng, 2), random_points(rng, 5)]
+        matrices = distance_matrices(lists)
+        assert [len(m) for m in matrices] == [2, 5]
+        for points, matrix in zip(lists, matrices):
+            for i, a in enumerate(points):
+                for j, b in enumerate(points):
+                    assert matrix[i][j] == pytest.approx(haversine_km(*a, *b), abs=1e-9)
+        assert distance_matrices([]) == []
+
+    def test_numpy_matrices(self):
+        """Test che le matrici calcolate con NumPy coincidano con quelle in Python."""
+        pytest.importorskip('numpy')
+        rng = random.Random(2)
+        lists = [random_points(rng, n) for n in (2, 4, 9)]
+        for fast, slow in zip(routing._matrices_numpy(lists), map(routing._matrix_python, lists)):
+            assert len(fast) == len(slow)
+            for fast_row, slow_row in zip(fast, slow):
+                assert fast_row == pytest.approx(slow_row, abs=1e-9)
+
+    def test_two_opt_removes_crossing(self):
+        """Test che 2-opt elimini un percorso che si incrocia."""
+        # Origine, due fermate in ordine incrociato, scuola
+        points = [(0.0, 0.0), (0.0, 0.02), (0.01, 0.0), (0.01, 0.02)]
+        matrix = distance_matrices([points])[0]
+        assert two_opt([0, 1, 2, 3], matrix) == [0, 2, 1, 3]
+
+    def test_plan_improves_nearest_neighbour(self):
+        """Test che il piano non sia peggiore del nearest neighbour e resti 2-opt ottimo."""
+        rng = random.Random(3)
+        for _ in range(100):
+            matrix = distance_matrices([random_points(rng, rng.randint(2, 10))])[0]
+            route = [0, *plan(matrix), len(matrix) - 1]
+            assert sorted(route) == list(range(len(matrix)))
+            assert route_length(route, matrix) <= route_length(nearest_neighbour(matrix), matrix) + 1e-9
+            assert two_opt(route, matrix) == route
+
+
+@pytest.fixture
+def app(sql_app):
+    """App con un viaggio e tre passeggeri assegnati su database in memoria."""
+    add_school()
+    add_driver('mario')
+    db.session.add(Trip(driver_id=1, school_id=1, origin_lat=44.10, origin_lon=12.20))
+    # Inserted out of driving order
+    for i, pickup in enumerate([(44.13, 12.23), (44.11, 12.21), (44.12, 12.22)]):
+        add_passenger(f'passenger{i}')
+        db.session.add(TripRequest(
+            trip_code=1, passenger_id=i + 1, school_id=1, status='assigned',
+            pickup_point=f'Stop {i}', pickup_lat=pickup[0], pickup_lon=pickup[1],
+        ))
+    db.session.commit()
+    return sql_app
+
+
+class TestPlanRoutes:
+    """Test per il piano dei percorsi sul database e l'endpoint del percorso."""
+
+    def test_plan_routes_stores_order(self, app):
+        """Test che il job salvi l'ordine di raccolta."""
+        result = plan_routes()
+        assert result['trips'] == 1 and result['stops'] == 3
+        orders = {r.id: r.stop_order for r in db.session.execute(db.select(TripRequest)).scalars()}
+        assert orders == {2: 0, 3: 1, 1: 2}
+
+    def test_route_endpoint(self, app):
+        """Test del percorso ordinato, anche dopo l'aggiunta di un passeggero."""
+        client = app.test_client()
+        driver = register_and_login(client, 'luigi', 'driver', licenseid='LIC00001')
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20))
+        db.session.execute(db.update(TripRequest).values(trip_code=2))
+        db.session.commit()
+        plan_routes()
+
+        response = client.get('/api/trips/2/route', headers=driver)
+        assert response.status_code == 200
+        route = response.get_json()['route']
+        assert [stop['pickup_point'] for stop in route['stops']] == ['Stop 1', 'Stop 2', 'Stop 0']
+        assert route['distance_km'] == pytest.approx(
+            haversine_km(44.10, 12.20, *CENTER), abs=0.05)
+
+        # A new passenger without a stored order: the trip is planned again
+        db.session.add(Passenger(username='late', password_hash='hash'))
+        db.session.add(TripRequest(trip_code=2, passenger_id=4, school_id=1, status='assigned',
+                                   pickup_point='Stop 3', pickup_lat=44.105, pickup_lon=12.205))
+        db.session.commit()
+        route = client.get('/api/trips/2/route', headers=driver).get_json()['route']
+        assert [stop['pickup_point'] for stop in route['stops']] == ['Stop 3', 'Stop 1', 'Stop 2', 'Stop 0']
+
+    def test_route_permissions(self, app):
+        """Test che solo l'autista del viaggio veda il percorso."""
+        client = app.test_client()
+        driver = register_and_login(client, 'luigi', 'driver', licenseid='LIC00001')
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        assert client.get('/api/trips/1/route', headers=driver).status_code == 403
+        assert client.get('/api/trips/1/route', headers=passenger).status_code == 403
+        assert client.get('/api/trips/99/route', headers=driver).status_code == 404
+
+    def test_trip_without_passengers(self, app):
+        """Test percorso di un viaggio senza passeggeri."""
+        client = app.test_client()
+        driver = register_and_login(client, 'luigi', 'driver', licenseid='LIC00001')
+        db.session.add(Trip(driver_id=2, school_id=1, origin_lat=44.10, origin_lon=12.20))
+        db.session.commit()
+        route = client.get('/api/trips/2/route', headers=driver).get_json()['route']
+        assert route['stops'] == []
@@ -0,0 +1,157 @@
+"""
+Test per le finestre orarie dei viaggi (albero degli intervalli e abbinamento).
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import TripRequest
+from app.services.schedule import IntervalTree, InvalidWindow, TripWindows, parse_window
+
+from .conftest import add_school, register_and_login
+
+# Dates far enough ahead that matching never takes the trips below for past ones
+MORNING = datetime(2082, 10, 19, 7, 0)
+
+
+def at(minutes):
+    return MORNING + timedelta(minutes=minutes)
+
+
+class TestIntervalTree:
+    """Test per l'albero degli intervalli."""
+
+    def test_against_scan(self):
+        """Test sovrapposizioni confrontate con una scansione, con inserimenti e rimozioni."""
+        rng = random.Random(1)
+        tree, intervals = IntervalTree(seed=1), {}
+        for key in range(2000):
+            start = rng.uniform(0, 1000)
+            intervals[key] = (start, start + rng.uniform(0, 30))
+            tree.add(*intervals[key], key)
+        for key in rng.sample(sorted(intervals), 700):
+            tree.remove(*intervals.pop(key), key)
+        assert len(tree) == len(intervals)
+        for _ in range(200):
+            start = rng.uniform(-50, 1050)
+            end = start + rng.uniform(0, 40)
+            expected = {key for key, (a, b) in intervals.items() if a <= end and b >= start}
+            assert sorted(tree.overlapping(start, end)) == sorted(expected)
+
+    def test_bounds_and_empty(self):
+        """Test estremi inclusi, intervalli puntiformi e albero vuoto."""
+        tree = IntervalTree()
+        assert tree.overlapping(0, 10) == []
+        tree.add(5, 10, 'a')
+        tree.add(10, 10, 'b')
+        tree.add(5, 7, 'c')
+        assert sorted(tree.overlapping(10, 20)) == ['a', 'b']
+        assert tree.overlapping(0, 4) == []
+        tree.remove(5, 10, 'a')
+        assert tree.overlapping(8, 9) == []
+
+
+class TestTripWindows:
+    """Test per le finestre dei viaggi per scuola e la validazione."""
+
+    def test_overlapping(self):
+        """Test finestre di partenza e arrivo combinate e scuole diverse."""
+        windows = TripWindows()
+        windows.add(1, 1, {'departure': (at(0), at(10)), 'arrival': (at(30), at(40))})
+        windows.add(2, 1, {'departure': None, 'arrival': (at(50), at(60))})
+        windows.add(3, 2, {'arrival': (at(30), at(40))})
+        windows.add(4, 1, {'departure': None, 'arrival': None})
+        assert windows.overlapping(1, {'arrival': (at(30), at(55))}) == {1, 2}
+        assert windows.overlapping(1, {'arrival': (at(30), at(55)), 'departure': (at(5), at(6))}) == {1}
+        # Re-indexing replaces the old windows
+        windows.add(1, 1, {'arrival': (at(90), at(95))})
+        assert windows.overlapping(1, {'arrival': (at(30), at(40))}) == set()
+        windows.remove(2)
+        assert len(windows) == 2
+        assert windows.overlapping(1, {'arrival': (at(0), at(100))}) == {1}
+
+    @pytest.mark.parametrize('value', [
+        {'from': '2082-10-19T07:30'}, {'from': 'ieri', 'until': '2082-10-19T07:55'},
+        {'from': '2082-10-19T07:55', 'until': '2082-10-19T07:30'}, '07:30-07:55',
+    ])
+    def test_invalid(self, value):
+        """Test finestre incomplete, non valide o invertite."""
+        with pytest.raises(InvalidWindow):
+            parse_window(value)
+
+    def test_timezone(self):
+        """Test conversione in UTC degli orari con fuso."""
+        assert parse_window({'from': '2082-10-19T07:30+02:00', 'until': '2082-10-19T07:55'}) == (
+            datetime(2082, 10, 19, 5, 30), datetime(2082, 10, 19, 7, 55))
+
+
+@pytest.fixture
+def app(sql_app):
+    """App con una scuola su database in memoria."""
+    add_school()
+    db.session.commit()
+    return sql_app
+
+
+class TestScheduledTrips:
+    """Test per i viaggi con orari, l'abbinamento per orario e l'annullamento."""
+
+    def test_match_by_arrival(self, app):
+        """Test che l'abbinamento combini posizione e finestra di arrivo."""
+        client = app.test_client()
+        driver = register_and_login(client, 'mario', 'driver', licenseid='LIC00001')
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        origin = {'lat': 44.10, 'lon': 12.20}
+        codes = []
+        for arrival in [('07:20', '07:35'), ('07:40', '07:50'), ('08:00', '08:10'), None]:
+            body = {'school_id': 1, 'origin': origin}
+            if arrival:
+                body['arrival'] = {'from': f'2082-10-19T{arrival[0]}', 'until': f'2082-10-19T{arrival[1]}'}
+            response = client.post('/api/trips', headers=driver, json=body)
+            assert response.status_code == 201
+            codes.append(response.get_json()['trip']['code'])
+        assert response.get_json()['trip']['arrival'] is None
+
+        body = {'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22}}
+        trips = client.post('/api/trips/match', headers=passenger, json=body).get_json()['trips']
+        assert sorted(t['code'] for t in trips) == codes
+        body['arrival'] = {'from': '2082-10-19T07:30', 'until': '2082-10-19T07:55'}
+        trips = client.post('/api/trips/match', headers=passenger, json=body).get_json()['trips']
+        assert sorted(t['code'] for t in trips) == codes[:2]
+        quotes = client.post('/api/trips/quote', headers=passenger, json=body).get_json()['quotes']
+        assert sorted(q['code'] for q in quotes) == codes[:2]
+        # Right time, wrong place
+        body['pickup'] = {'lat': 45.0, 'lon': 9.0}
+        assert client.post('/api/trips/match', headers=passenger, json=body).get_json()['trips'] == []
+
+        body['arrival'] = {'from': '2082-10-19T07:55'}
+        assert client.post('/api/trips/match', headers=passenger, json=body).status_code == 400
+
+    def test_cancel(self, app):
+        """Test annullamento: il viaggio non viene più abbinato e le richieste tornano in attesa."""
+        client = app.test_client()
+        driver = register_and_login(client, 'mario', 'driver', licenseid='LIC00001')
+        other = register_and_login(client, 'luigi', 'driver', licenseid='LIC00002')
+        passenger = register_and_login(client, 'peach', 'passenger', attending_school='ITT Blaise Pascal')
+        window = {'from': '2082-10-19T07:30', 'until': '2082-10-19T07:50'}
+        code = client.post('/api/trips', headers=driver, json={
+            'school_id': 1, 'origin': {'lat': 44.10, 'lon': 12.20}, 'arrival': window,
+        }).get_json()['trip']['code']
+        db.session.add(TripRequest(trip_code=code, passenger_id=1, school_id=1, status='assigned',
+                                   pickup_lat=44.12, pickup_lon=12.22, stop_order=0))
+        db.session.commit()
+        body = {'school_id': 1, 'pickup': {'lat': 44.12, 'lon': 12.22}, 'arrival': window}
+        assert len(client.post('/api/trips/match', headers=passenger, json=body).get_json()['trips']) == 1
+
+        assert client.post(f'/api/trips/{code}/cancel', headers=other).status_code == 403
+        response = client.post(f'/api/trips/{code}/cancel', headers=driver)
+        assert response.status_code == 200 and response.get_json()['trip']['status'] == 'cancelled'
+        assert client.post(f'/api/trips/{code}/cancel', headers=driver).status_code == 409
+        assert client.post('/api/trips/99/cancel', headers=driver).status_code == 404
+        assert client.post('/api/trips/match', headers=passenger, json=body).get_json()['trips'] == []
+        trip_request = db.session.get(TripRequest, 1)
+        assert (trip_request.trip_code, trip_request.status, trip_request.stop_order) == (None, 'pending', None)
+        assert app.extensions['trip_matcher'].stats()['scheduled'] == 0
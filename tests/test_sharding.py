@@ -0,0 +1,188 @@
+"""
+Test per la suddivisione degli utenti in shard (file per hash dello username),
+per le rivendicazioni delle email e per il comando di resharding.
+"""
+
+import json
+import os
+
+import pytest
+
+from app import create_app
+from app.services.sharding import (
+    EmailClaims,
+    ShardedUserStore,
+    claim_files,
+    reshard,
+    shard_files,
+    shard_of,
+)
+from app.services.user_store import UserExists, UserStore, get_index, users_lock_path
+
+SHARDS = 4
+
+
+def make_store(shards=SHARDS, grace=60.0):
+    stores = [UserStore(files, fsync=False, shard=shard) for shard, files in shard_files(True, shards)]
+    claims = [EmailClaims(path, fsync=False) for path in claim_files(True, shards)]
+    return ShardedUserStore(stores, claims, grace)
+
+
+def user(username, email=None):
+    return {'username': username, 'email': email or f'{username}@example.com', 'password': 'hash'}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return make_store()
+
+
+class TestShardedStore:
+    """Test per la ShardedUserStore."""
+
+    def test_shard_of_is_stable(self):
+        """Test che lo shard dipenda solo dal valore (niente hash() casuale)."""
+        assert shard_of('mario', 8) == shard_of('mario', 8)
+        assert {shard_of(f'user{i}', SHARDS) for i in range(100)} == set(range(SHARDS))
+
+    def test_users_land_in_their_shard(self, store):
+        """Test che ogni utente venga scritto solo nel file del proprio shard."""
+        for i in range(20):
+            store.add('driver', user(f'user{i}'))
+
+        for i in range(20):
+            username = f'user{i}'
+            path = f'test_drivers.{shard_of(username, SHARDS)}.json'
+            with open(path) as f:
+                assert username in f.read()
+            assert store.find_by_username(username)[1] == 'driver'
+        assert users_lock_path('test_drivers.json', 2).endswith('users.2.lock')
+
+    def test_uniqueness_across_shards(self, store):
+        """Test che username ed email restino unici fra tutti gli shard e i ruoli."""
+        store.add('driver', user('mario'))
+
+        with pytest.raises(UserExists):
+            store.add('passenger', user('mario', 'other@example.com'))
+        with pytest.raises(UserExists):
+            store.add('passenger', user('luigi', 'mario@example.com'))
+        assert store.exists(username='mario')
+        assert store.exists(email='mario@example.com')
+        assert not store.exists(username='luigi', email='luigi@example.com')
+
+    def test_failed_registration_keeps_owner_claim(self, store):
+        """Test che un duplicato dello username non liberi l'email del proprietario."""
+        store.add('driver', user('mario'))
+
+        with pytest.raises(UserExists):
+            store.add('driver', user('mario'))
+
+        with pytest.raises(UserExists):
+            store.add('passenger', user('wario', 'mario@example.com'))
+
+    def test_stale_claim_is_taken_over(self, tmp_path, monkeypatch):
+        """Test che una rivendicazione orfana scada dopo il periodo di grazia."""
+        monkeypatch.chdir(tmp_path)
+        store = make_store(grace=0)
+        store._claims('mario@example.com').claim('mario@example.com', 'ghost', store._holds)
+
+        assert not store.exists(email='mario@example.com')
+        store.add('driver', user('mario'))
+        assert store.exists(email='mario@example.com')
+
+    def test_update_and_delete_move_claims(self, store):
+        """Test che modifica e cancellazione aggiornino le email rivendicate."""
+        store.add('driver', user('mario'))
+        store.add('driver', user('luigi'))
+
+        with pytest.raises(UserExists):
+            store.update('driver', 'mario', {'email': 'luigi@example.com'})
+        store.update('driver', 'mario', {'email': 'super@example.com'})
+        store.delete('driver', 'luigi')
+
+        store.add('passenger', user('peach', 'mario@example.com'))
+        store.add('passenger', user('daisy', 'luigi@example.com'))
+        with pytest.raises(UserExists):
+            store.add('passenger', user('toad', 'super@example.com'))
+
+    def test_scan_users_resumes_across_shards(self, store):
+        """Test paginazione con posizioni che codificano lo shard."""
+        usernames = {f'user{i}' for i in range(30)}
+        for username in usernames:
+            store.add('passenger', user(username))
+
+        seen = []
+        after = None
+        while True:
+            rows = []
+            for position, record in store.scan_users('passenger', after):
+                rows.append((position, record))
+                if len(rows) == 7:
+                    break
+            if not rows:
+                break
+            seen += [record['username'] for _, record in rows]
+            after = rows[-1][0]
+
+        assert sorted(seen) == sorted(usernames)
+
+
+class TestReshard:
+    """Test per lo spostamento degli utenti fra numeri di shard diversi."""
+
+    def test_reshard_round_trip(self, tmp_path, monkeypatch):
+        """Test da file unico a 4 shard e ritorno, con le sole versioni correnti."""
+        monkeypatch.chdir(tmp_path)
+        single = UserStore({'driver': 'test_drivers.json', 'passenger': 'test_passengers.json'}, fsync=False)
+        for i in range(25):
+            single.add('driver' if i % 2 else 'passenger', user(f'user{i}'))
+        single.update('driver', 'user1', {'age': '40'})
+        single.delete('passenger', 'user0')
+
+        result = reshard(True, 1, SHARDS)
+
+        assert sum(result['driver']) == 12 and sum(result['passenger']) == 12
+        assert not os.path.exists('test_drivers.json')
+        sharded = make_store()
+        assert sharded.find_by_username('user1')[0]['age'] == '40'
+        assert sharded.find_by_username('user0') == (None, None)
+        assert sharded.exists(email='user3@example.com')
+        with pytest.raises(UserExists):
+            sharded.add('driver', user('wario', 'user5@example.com'))
+        sharded.add('driver', user('user0'))
+
+        reshard(True, SHARDS, 1)
+
+        assert not any(os.path.exists(path) for path in claim_files(True, SHARDS))
+        assert not os.path.exists('test_drivers.0.json')
+        single = UserStore({'driver': 'test_drivers.json', 'passenger': 'test_passengers.json'}, fsync=False)
+        assert single.find_by_username('user0')[1] == 'driver'
+        assert len(list(single.iter_users())) == 25
+        assert get_index('test_drivers.json').get('username', 'user1')['age'] == '40'
+
+
+class TestShardedApp:
+    """Test degli endpoint con USER_SHARDS > 1."""
+
+    def test_register_and_login(self, tmp_path, monkeypatch):
+        """Test registrazione, duplicati e login con gli utenti suddivisi in shard."""
+        monkeypatch.chdir(tmp_path)
+        app = create_app({
+            'TESTING': True, 'USER_SHARDS': SHARDS, 'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        })
+        client = app.test_client()
+        data = {
+            'username': 'mario', 'email': 'mario@example.com', 'password': 'TestPassword123',
+            'role': 'driver', 'phonenumber': '3330000000', 'age': '30', 'licenseid': 'LIC00001',
+        }
+
+        assert client.post('/api/register', json=data).status_code == 201
+        assert client.post('/api/register', json={**data, 'username': 'wario'}).status_code == 409
+        assert client.post('/api/register', json={**data, 'email': 'w@example.com'}).status_code == 409
+        response = client.post('/api/login', json={'username': 'mario', 'password': 'TestPassword123'})
+
+        assert response.status_code == 200
+        with open(f'test_drivers.{shard_of("mario", SHARDS)}.json') as f:
+            assert json.loads(f.readline())['username'] == 'mario'
+        assert [u['username'] for u in client.get('/api/users').get_json()['users']] == ['mario']
@@ -0,0 +1,220 @@
+"""
+Test per lo store su database (SQLAlchemy) e per l'import dei file JSON.
+"""
+
+import pytest
+from sqlalchemy import text
+
+from app import create_app, db
+from app.models import Driver, Passenger, School, UserVersion
+from app.services.sql_store import SqlSchoolStore, SqlUserStore, import_json_files
+from app.services.user_store import UserExists, UserInUse
+
+from .conftest import CENTER, add_school, add_trip, register_and_login, write_lines
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App configurata con backend SQL su database in memoria."""
+    monkeypatch.chdir(tmp_path)
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'USER_STORE_BACKEND': 'sql',
+    })
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+class TestSqlUserStore:
+    """Test per lo store degli utenti su database."""
+
+    def test_add_and_find(self, app):
+        """Test inserimento e ricerca per username."""
+        store = SqlUserStore()
+        store.add('driver', {'username': 'mario', 'password': 'hash', 'age': '30'})
+
+        record, role = store.find_by_username('mario')
+        assert role == 'driver'
+        assert record['password'] == 'hash'
+        assert record['age'] == 30
+        assert store.find_by_username('luigi') == (None, None)
+
+    def test_exists_across_roles(self, app):
+        """Test unicità di username ed email tra le due tabelle."""
+        store = SqlUserStore()
+        store.add('passenger', {'username': 'luigi', 'email': 'l@example.com', 'password': 'hash'})
+
+        assert store.exists(username='luigi')
+        assert store.exists(username='other', email='l@example.com')
+        assert not store.exists(username='other', email='o@example.com')
+
+    def test_update(self, app):
+        """Test aggiornamento di un utente esistente."""
+        store = SqlUserStore()
+        store.add('driver', {'username': 'mario', 'password': 'old', 'age': '30'})
+
+        store.update('driver', 'mario', {'password': 'new'})
+
+        record, _ = store.find_by_username('mario')
+        assert record['password'] == 'new'
+        assert record['age'] == 30
+        with pytest.raises(KeyError):
+            store.update('driver', 'luigi', {'password': 'new'})
+
+    def test_delete(self, app):
+        """Test cancellazione di un utente."""
+        store = SqlUserStore()
+        store.add('driver', {'username': 'mario', 'password': 'hash'})
+
+        store.delete('driver', 'mario')
+
+        assert store.find_by_username('mario') == (None, None)
+        with pytest.raises(KeyError):
+            store.delete('driver', 'mario')
+
+    def test_delete_referenced_user(self, app):
+        """Test cancellazione di un autista con viaggi: rifiutata e sessione ancora utilizzabile."""
+        db.session.execute(text('PRAGMA foreign_keys=ON'))
+        store = SqlUserStore()
+        store.add('driver', {'username': 'mario', 'password': 'hash'})
+        add_school()
+        add_trip(db.session.execute(db.select(Driver.id)).scalar_one(), CENTER)
+
+        with pytest.raises(UserInUse):
+            store.delete('driver', 'mario')
+
+        assert store.find_by_username('mario')[1] == 'driver'
+
+    def test_version_follows_updates_of_any_worker(self, app):
+        """Test versione: modifiche e cancellazioni la cambiano tramite la riga ``user_version``."""
+        store = SqlUserStore()
+        store.add('driver', {'username': 'mario', 'password': 'hash'})
+        before = store.version()
+
+        store.update('driver', 'mario', {'email': 'mario@example.com'})
+        assert store.version() != before
+        # Lo stesso valore che leggono gli altri worker
+        assert db.session.execute(db.select(UserVersion.version)).scalar_one() == 1
+
+        updated = store.version()
+        store.delete('driver', 'mario')
+        store.add('driver', {'username': 'luigi', 'password': 'hash'})
+        assert store.version() not in (before, updated)
+
+    def test_unique_violation_raises(self, app):
+        """Test che un duplicato venga rifiutato dal database."""
+        store = SqlUserStore()
+        store.add('driver', {'username': 'mario', 'password': 'hash'})
+
+        with pytest.raises(UserExists):
+            store.add('driver', {'username': 'mario', 'password': 'other'})
+
+    def test_passenger_linked_to_school(self, app):
+        """Test collegamento del passeggero alla scuola per nome."""
+        SqlSchoolStore().add({
+            'school_name': 'ITT Blaise Pascal',
+            'address': 'Piazzale Macrelli 100',
+            'email': 'dirigente@example.com',
+            'representative': 'Sauro Porfiri',
+            'mechanical_code': 'FOIS001001',
+        })
+        SqlUserStore().add('passenger', {
+            'username': 'luigi',
+            'password': 'hash',
+            'attending_school': 'ITT Blaise Pascal',
+        })
+
+        assert db.session.query(Passenger).one().school_id == db.session.query(School).one().id
+
+
+class TestImportJsonFiles:
+    """Test per l'import a blocchi dei file JSON-Lines."""
+
+    def test_import(self, app, tmp_path):
+        """Test import con duplicati e record incompleti."""
+        write_lines('drivers.json', [
+            {'username': 'mario', 'password': 'old', 'email': 'm@example.com'},
+            {'username': 'mario', 'password': 'new', 'email': 'm@example.com'},
+            {'username': 'toad', 'password': 'hash', 'email': 'm@example.com'},
+            {'username': 'nopassword'},
+        ])
+        write_lines('passengers.json', [
+            {'username': 'luigi', 'password': 'hash', 'attending_school': 'ITT Blaise Pascal'},
+        ])
+        write_lines('schools.json', [{
+            'school_name': 'ITT Blaise Pascal',
+            'address': 'Piazzale Macrelli 100',
+            'city': 'Cesena',
+            'email': 'dirigente@example.com',
+            'representative': 'Sauro Porfiri',
+            'mechanical_code': 'FOIS001001',
+            'status': 'pending',
+        }])
+
+        result = import_json_files('drivers.json', 'passengers.json', 'schools.json', batch_size=1)
+
+        assert result == {'school': (1, 0), 'driver': (1, 2), 'passenger': (1, 0)}
+        assert db.session.query(Driver).one().password_hash == 'new'
+        assert db.session.query(Passenger).one().school_id is not None
+
+        # Un secondo import non duplica nulla
+        result = import_json_files('drivers.json', 'passengers.json', 'schools.json')
+        assert result == {'school': (0, 1), 'driver': (0, 3), 'passenger': (0, 1)}
+
+
+class TestRoutesWithSqlBackend:
+    """Test delle route con backend SQL."""
+
+    def test_register_login_and_list(self, client):
+        """Test registrazione, login e lista utenti dal database."""
+        data = {
+            'username': 'sqluser',
+            'email': 'sqluser@example.com',
+            'password': 'TestPassword123',
+            'role': 'driver',
+            'phonenumber': '3330000000',
+            'age': '30',
+            'licenseid': 'LIC00001',
+        }
+        assert client.post('/api/register', json=data).status_code == 201
+        assert client.post('/api/register', json=data).status_code == 409
+
+        response = client.post('/api/login', json={'username': 'sqluser', 'password': 'TestPassword123'})
+        assert response.status_code == 200
+        assert response.get_json()['user']['role'] == 'driver'
+
+        users = client.get('/api/users').get_json()['users']
+        assert [user['username'] for user in users] == ['sqluser']
+        assert 'password' not in users[0]
+
+    def test_delete_profile_with_trips(self, app, client):
+        """Test DELETE /api/profile di un autista con viaggi: 409 e account ancora presente."""
+        db.session.execute(text('PRAGMA foreign_keys=ON'))
+        headers = register_and_login(client, 'sqluser', 'driver', licenseid='LIC00001')
+        add_school()
+        add_trip(db.session.execute(db.select(Driver.id)).scalar_one(), CENTER)
+
+        assert client.delete('/api/profile', headers=headers).status_code == 409
+        assert client.get('/api/profile', headers=headers).status_code == 200
+
+    def test_register_school(self, client):
+        """Test registrazione scuola e controllo duplicati."""
+        data = {
+            'school_name': 'Liceo Righi',
+            'address': 'Piazza Aldo Moro',
+            'email': 'dirigente@righi.example.com',
+            'representative': 'Luigi Verdi',
+            'mechanical_code': 'FOPS002002',
+        }
+        assert client.post('/api/register-school', json=data).status_code == 201
+
+        duplicate = dict(data, school_name='Altro', email='altro@example.com')
+        assert client.post('/api/register-school', json=duplicate).status_code == 409
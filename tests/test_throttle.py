@@ -0,0 +1,164 @@
+"""
+Test per il rate limiting del login e la cache degli username sconosciuti.
+"""
+
+import json
+
+import pytest
+
+from app import create_app
+from app.services.throttle import LoginGuard, LoginThrottled, NegativeCache, RateLimiter
+
+
+class Clock:
+    """Orologio manuale per i test."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter:
+    """Test per i token bucket."""
+
+    def test_burst_then_refill(self):
+        """Test esaurimento del bucket e ricarica nel tempo."""
+        clock = Clock()
+        limiter = RateLimiter(per_minute=6, burst=2, clock=clock)
+
+        assert limiter.consume('ip') == 0
+        assert limiter.consume('ip') == 0
+        assert limiter.consume('ip') == 10
+        clock.now = 10
+        assert limiter.consume('ip') == 0
+
+    def test_keys_are_independent_and_bounded(self):
+        """Test bucket separati per chiave e limite di memoria LRU."""
+        limiter = RateLimiter(per_minute=1, burst=1, max_keys=2, clock=Clock())
+
+        assert limiter.consume('a') == 0
+        assert limiter.consume('b') == 0
+        assert limiter.consume('a') > 0
+        limiter.consume('c')
+        assert len(limiter) == 2
+
+    def test_zero_rate_disables(self):
+        """Test che un tasso nullo disattivi il limite."""
+        limiter = RateLimiter(per_minute=0, burst=0)
+        assert all(limiter.consume('ip') == 0 for _ in range(100))
+
+
+class TestNegativeCache:
+    """Test per la cache degli username sconosciuti."""
+
+    def test_ttl(self):
+        """Test scadenza delle voci."""
+        clock = Clock()
+        cache = NegativeCache(ttl=5, clock=clock)
+        cache.add('ghost')
+
+        assert 'ghost' in cache
+        clock.now = 5
+        assert 'ghost' not in cache
+
+    def test_guard_checks_ip_first(self):
+        """Test che un IP bloccato non consumi il bucket dello username."""
+        guard = LoginGuard(ip_per_minute=1, ip_burst=1, user_per_minute=1, user_burst=1, clock=Clock())
+        guard.check('1.2.3.4', 'mario')
+
+        with pytest.raises(LoginThrottled):
+            guard.check('1.2.3.4', 'luigi')
+        guard.check('5.6.7.8', 'luigi')
+        assert guard.stats()['throttled'] == 1
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return create_app({
+        'TESTING': True,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'LOGIN_USER_BURST': 3,
+        'LOGIN_IP_BURST': 5,
+    })
+
+
+class TestLoginThrottling:
+    """Test del rate limiting sulla route di login."""
+
+    def test_username_limit_returns_429(self, app):
+        """Test 429 con Retry-After dopo troppi tentativi sullo stesso username."""
+        client = app.test_client()
+        login = {'username': 'mario', 'password': 'WrongPassword'}
+
+        assert [client.post('/api/login', json=login).status_code for _ in range(3)] == [401] * 3
+        response = client.post('/api/login', json=login)
+
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) > 0
+
+    def test_ip_limit_across_usernames(self, app):
+        """Test limite per IP anche cambiando username."""
+        client = app.test_client()
+
+        codes = [
+            client.post('/api/login', json={'username': f'user{i}', 'password': 'x' * 8}).status_code
+            for i in range(6)
+        ]
+
+        assert codes == [401] * 5 + [429]
+
+    def test_forwarded_for_only_behind_trusted_proxies(self, app):
+        """Test IP del client da X-Forwarded-For solo con TRUSTED_PROXIES."""
+        def codes(client):
+            return [
+                client.post('/api/login', json={'username': f'user{i}', 'password': 'x' * 8},
+                            headers={'X-Forwarded-For': f'10.0.0.{i}'}).status_code
+                for i in range(6)
+            ]
+
+        # Spoofed headers do not open new buckets
+        assert codes(app.test_client()) == [401] * 5 + [429]
+        proxied = create_app({
+            'TESTING': True, 'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000', 'LOGIN_IP_BURST': 5, 'TRUSTED_PROXIES': 1,
+        })
+        assert codes(proxied.test_client()) == [401] * 6
+
+    def test_unknown_username_skips_store_but_hashes(self, app, monkeypatch):
+        """Test che uno username sconosciuto in cache non tocchi lo store ma verifichi un hash fittizio."""
+        client = app.test_client()
+        hasher = app.extensions['password_hasher']
+        login = {'username': 'ghost', 'password': 'WrongPassword'}
+        assert client.post('/api/login', json=login).status_code == 401
+
+        monkeypatch.setattr(
+            'app.services.user_store.UserStore.find_by_username',
+            lambda *args: pytest.fail('store lookup for a cached unknown username'),
+        )
+        completed = hasher.stats()['completed']
+        assert client.post('/api/login', json=login).status_code == 401
+
+        assert hasher.stats()['completed'] == completed + 1
+        assert client.get('/api/metrics').get_json()['login_throttle']['unknown_hits'] == 1
+
+    def test_registration_clears_unknown_username(self, app):
+        """Test che registrarsi con uno username appena cercato permetta subito il login."""
+        client = app.test_client()
+        login = {'username': 'newbie', 'password': 'TestPassword123'}
+        assert client.post('/api/login', json=login).status_code == 401
+
+        client.post('/api/register', json={
+            'username': 'newbie',
+            'email': 'newbie@example.com',
+            'password': 'TestPassword123',
+            'role': 'passenger',
+            'phonenumber': '3330000000',
+            'age': '17',
+            'attending_school': 'ITT Blaise Pascal',
+        })
+
+        assert client.post('/api/login', json=login).status_code == 200
+        with open('test_passengers.json') as f:
+            assert json.loads(f.readline())['username'] == 'newbie'
@@ -0,0 +1,193 @@
+"""
+Test per i refresh token a rotazione e la revoca dei token al logout.
+"""
+
+import time
+
+import pytest
+
+from app import create_app
+from app.services.tokens import TokenStore
+from app.services.user_store import get_user_store
+
+
+class TestTokenStore:
+    """Test per lo store delle famiglie di refresh token e dei token revocati."""
+
+    def test_rotation(self, tmp_path):
+        """Test rotazione: ogni token vale una volta, il riuso revoca la famiglia."""
+        store = TokenStore(str(tmp_path / 'tokens.db'))
+        expires = time.time() + 60
+        store.start_family('f', 'a', 'mario', expires)
+        assert store.rotate('f', 'a', 'b', expires)
+        assert not store.rotate('f', 'a', 'c', expires)
+        # The legitimate holder of 'b' is logged out too
+        assert not store.rotate('f', 'b', 'c', expires)
+        stats = store.stats()
+        assert (stats['families_started'], stats['refreshes'], stats['refused_refreshes']) == (1, 1, 2)
+
+    def test_expired_and_shared(self, tmp_path):
+        """Test famiglie scadute e stato condiviso fra processi che usano lo stesso file."""
+        path = str(tmp_path / 'tokens.db')
+        first, second = TokenStore(path), TokenStore(path)
+        first.start_family('old', 'a', 'mario', time.time() - 1)
+        first.start_family('f', 'a', 'mario', time.time() + 60)
+        assert not second.rotate('old', 'a', 'b', time.time() + 60)
+        assert second.rotate('f', 'a', 'b', time.time() + 60)
+        assert not first.rotate('f', 'a', 'c', time.time() + 60)
+        first.close()
+        second.close()
+
+    def test_revocations_shared_and_persistent(self, tmp_path):
+        """Test revoche viste dagli altri processi e dopo un riavvio."""
+        path = str(tmp_path / 'tokens.db')
+        first, second = TokenStore(path, sync_interval=0), TokenStore(path, sync_interval=0)
+        assert not second.is_revoked('a')
+        first.revoke('a', time.time() + 60)
+        assert first.is_revoked('a') and second.is_revoked('a')
+        assert not second.is_revoked('b')
+        first.close()
+        assert TokenStore(path).is_revoked('a')
+
+    def test_expired_revocations_evicted(self, tmp_path):
+        """Test revoche di token già scaduti: tolte dalla memoria al controllo successivo."""
+        store = TokenStore(str(tmp_path / 'tokens.db'))
+        store.revoke('old', time.time() - 1)
+        store.revoke('new', time.time() + 60)
+        assert not store.is_revoked('old')
+        assert store.is_revoked('new')
+        assert store.stats()['revoked'] == 1
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return create_app({
+        'TESTING': True,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'TOKEN_STORE_PATH': str(tmp_path / 'tokens.db'),
+    })
+
+
+def login(client, username='mario'):
+    client.post('/api/register', json={
+        'username': username, 'email': f'{username}@example.com', 'password': 'TestPassword123',
+        'role': 'passenger', 'phonenumber': '3330000000', 'age': '30', 'attending_school': 'ITT',
+    })
+    response = client.post('/api/login', json={'username': username, 'password': 'TestPassword123'})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+class TestRefreshEndpoint:
+    """Test per /api/refresh."""
+
+    def test_refresh(self, app):
+        """Test nuova coppia di token senza password; i tipi di token non si scambiano."""
+        client = app.test_client()
+        tokens = login(client)
+        response = client.post('/api/refresh', headers=bearer(tokens['refresh_token']))
+        assert response.status_code == 200
+        refreshed = response.get_json()
+        assert refreshed['refresh_token'] != tokens['refresh_token']
+
+        claims = client.get('/api/protected', headers=bearer(refreshed['access_token'])).get_json()['user_claims']
+        assert (claims['sub'], claims['role'], claims['type']) == ('mario', 'passenger', 'access')
+        assert claims['exp'] - claims['iat'] == 15 * 60
+        assert client.post('/api/refresh', headers=bearer(tokens['access_token'])).status_code == 422
+        assert client.get('/api/protected', headers=bearer(tokens['refresh_token'])).status_code == 422
+
+    def test_reuse_revokes_family(self, app):
+        """Test riuso di un refresh token: rifiutato, e la sessione rubata smette di funzionare."""
+        client = app.test_client()
+        first = login(client)
+        stolen = first['refresh_token']
+        current = client.post('/api/refresh', headers=bearer(stolen)).get_json()['refresh_token']
+        assert client.post('/api/refresh', headers=bearer(stolen)).status_code == 401
+        assert client.post('/api/refresh', headers=bearer(current)).status_code == 401
+        assert client.get('/api/protected', headers=bearer(first['access_token'])).status_code == 401
+
+        # Other logins are not affected
+        other = login(client)['refresh_token']
+        assert client.post('/api/refresh', headers=bearer(other)).status_code == 200
+
+    def test_password_change_ends_every_login(self, app):
+        """Test cambio password: i token di tutti i login precedenti, anche quello usato, non valgono più."""
+        client = app.test_client()
+        stolen, current = login(client), login(client)
+        response = client.patch('/api/profile', headers=bearer(current['access_token']), json={
+            'password': 'NewPassword123', 'current_password': 'TestPassword123'})
+        assert response.status_code == 200
+
+        for tokens in (stolen, current):
+            assert client.post('/api/refresh', headers=bearer(tokens['refresh_token'])).status_code == 401
+            assert client.get('/api/protected', headers=bearer(tokens['access_token'])).status_code == 401
+        response = client.post('/api/login', json={'username': 'mario', 'password': 'NewPassword123'})
+        assert client.post('/api/refresh', headers=bearer(response.get_json()['refresh_token'])).status_code == 200
+
+    def test_registered_again_after_deletion(self, app):
+        """Test account cancellato e registrato di nuovo con lo stesso nome: i vecchi token non valgono."""
+        client = app.test_client()
+        stolen, current = login(client), login(client)
+        assert client.delete('/api/profile', headers=bearer(current['access_token'])).status_code == 200
+        login(client)
+
+        assert client.post('/api/refresh', headers=bearer(stolen['refresh_token'])).status_code == 401
+        assert client.get('/api/protected', headers=bearer(stolen['access_token'])).status_code == 401
+
+    def test_deleted_user(self, app):
+        """Test utente cancellato: il refresh non funziona più."""
+        client = app.test_client()
+        tokens = login(client)
+        with app.app_context():
+            get_user_store().delete('passenger', 'mario')
+        assert client.post('/api/refresh', headers=bearer(tokens['refresh_token'])).status_code == 401
+
+
+class TestLogout:
+    """Test per /api/logout."""
+
+    def test_logout_revokes_session(self, app):
+        """Test logout: access token rifiutato, refresh token dello stesso login inutilizzabile."""
+        client = app.test_client()
+        tokens = login(client)
+        assert client.get('/api/protected', headers=bearer(tokens['access_token'])).status_code == 200
+        assert client.post('/api/logout', headers=bearer(tokens['access_token'])).status_code == 200
+        assert client.get('/api/protected', headers=bearer(tokens['access_token'])).status_code == 401
+        assert client.post('/api/refresh', headers=bearer(tokens['refresh_token'])).status_code == 401
+
+        # Other logins of the same user go on
+        other = login(client)
+        assert client.get('/api/protected', headers=bearer(other['access_token'])).status_code == 200
+
+    def test_logout_with_refresh_token(self, app):
+        """Test logout con il refresh token e senza token."""
+        client = app.test_client()
+        tokens = login(client)
+        assert client.post('/api/logout', headers=bearer(tokens['refresh_token'])).status_code == 200
+        assert client.post('/api/refresh', headers=bearer(tokens['refresh_token'])).status_code == 401
+        assert client.get('/api/protected', headers=bearer(tokens['access_token'])).status_code == 401
+        assert client.post('/api/logout').status_code == 401
+
+    def test_logout_ends_earlier_access_tokens(self, app):
+        """Test logout: anche gli access token di refresh precedenti dello stesso login sono rifiutati."""
+        client = app.test_client()
+        tokens = login(client)
+        refreshed = client.post('/api/refresh', headers=bearer(tokens['refresh_token'])).get_json()
+        assert client.post('/api/logout', headers=bearer(refreshed['access_token'])).status_code == 200
+        assert client.get('/api/protected', headers=bearer(tokens['access_token'])).status_code == 401
+
+    def test_shared_across_workers(self, app, tmp_path):
+        """Test logout su un worker rispettato da un altro che usa lo stesso file."""
+        other_worker = create_app({
+            'TESTING': True, 'TOKEN_STORE_PATH': str(tmp_path / 'tokens.db'), 'TOKEN_REVOCATION_SYNC': 0,
+        })
+        tokens = login(app.test_client())
+        headers = bearer(tokens['access_token'])
+        assert other_worker.test_client().get('/api/protected', headers=headers).status_code == 200
+        app.test_client().post('/api/logout', headers=headers)
+        assert other_worker.test_client().get('/api/protected', headers=headers).status_code == 401
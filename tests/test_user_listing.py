@@ -0,0 +1,214 @@
+"""
+Test per la lista utenti paginata e in streaming (GET /api/users).
+"""
+
+import json
+
+import pytest
+
+from app import create_app
+from app.services.compaction import compact_file
+from app.services.user_listing import InvalidQuery, decode_cursor, encode_cursor
+
+from .conftest import write_lines
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Client con tre driver e due passeggeri nei file di test."""
+    monkeypatch.chdir(tmp_path)
+    write_lines('test_drivers.json', [
+        {'username': f'driver{i}', 'email': f'd{i}@example.com', 'password': 'hash'}
+        for i in range(3)
+    ])
+    write_lines('test_passengers.json', [
+        {'username': f'passenger{i}', 'email': f'p{i}@example.com', 'password': 'hash'}
+        for i in range(2)
+    ])
+    return create_app({'TESTING': True}).test_client()
+
+
+def usernames(users):
+    return [user['username'] for user in users]
+
+
+class TestCursor:
+    """Test per la codifica del cursore."""
+
+    def test_round_trip(self):
+        """Test codifica e decodifica."""
+        assert decode_cursor(encode_cursor('passenger', 1234, 56)) == ('passenger', 1234, 56)
+
+    def test_invalid(self):
+        """Test cursori malformati."""
+        for token in ('not-a-cursor', encode_cursor('admin', 1, 0)):
+            with pytest.raises(InvalidQuery):
+                decode_cursor(token)
+
+
+class TestPagination:
+    """Test per la paginazione con cursore."""
+
+    def test_default_page_returns_everyone(self, client):
+        """Test che la pagina predefinita contenga tutti gli utenti."""
+        body = client.get('/api/users').get_json()
+
+        assert usernames(body['users']) == [
+            'driver0', 'driver1', 'driver2', 'passenger0', 'passenger1',
+        ]
+        assert body['next_cursor'] is None
+        assert all('password' not in user for user in body['users'])
+
+    def test_pages_across_roles(self, client):
+        """Test che il cursore attraversi il passaggio da driver a passeggeri."""
+        seen = []
+        cursor = None
+        while True:
+            query = {'limit': 2}
+            if cursor:
+                query['cursor'] = cursor
+            body = client.get('/api/users', query_string=query).get_json()
+            assert len(body['users']) <= 2
+            seen.extend(usernames(body['users']))
+            cursor = body['next_cursor']
+            if cursor is None:
+                break
+
+        assert seen == ['driver0', 'driver1', 'driver2', 'passenger0', 'passenger1']
+
+    def test_new_users_do_not_shift_pages(self, client):
+        """Test che una registrazione tra due pagine non duplichi né salti utenti."""
+        first = client.get('/api/users', query_string={'limit': 2}).get_json()
+        write_lines('test_drivers.json', [{'username': 'late', 'password': 'hash'}])
+
+        second = client.get('/api/users', query_string={
+            'limit': 2, 'cursor': first['next_cursor'],
+        }).get_json()
+
+        assert usernames(second['users']) == ['driver2', 'late']
+
+    def test_fields_and_role(self, client):
+        """Test proiezione dei campi e filtro per ruolo."""
+        body = client.get('/api/users', query_string={
+            'role': 'passenger', 'fields': 'username,role,password',
+        }).get_json()
+
+        assert body['users'] == [
+            {'username': 'passenger0', 'role': 'passenger'},
+            {'username': 'passenger1', 'role': 'passenger'},
+        ]
+
+    @pytest.mark.parametrize('query', [
+        {'limit': 0},
+        {'limit': 'abc'},
+        {'limit': 100000},
+        {'role': 'admin'},
+        {'cursor': 'garbage'},
+        {'fields': ' , '},
+    ])
+    def test_invalid_parameters(self, client, query):
+        """Test parametri non validi."""
+        assert client.get('/api/users', query_string=query).status_code == 400
+
+    def test_cursor_must_match_role(self, client):
+        """Test cursore di un ruolo escluso dal filtro."""
+        body = client.get('/api/users', query_string={'limit': 1}).get_json()
+
+        response = client.get('/api/users', query_string={
+            'role': 'passenger', 'cursor': body['next_cursor'],
+        })
+        assert response.status_code == 400
+
+    def test_stale_cursor_after_compaction(self, client):
+        """Test cursore emesso prima di una compattazione: rifiutato invece di saltare utenti."""
+        first = client.get('/api/users', query_string={'limit': 1}).get_json()
+        write_lines('test_drivers.json', [{'username': 'driver0', '_deleted': True}])
+        assert compact_file('test_drivers.json', fsync=False) is not None
+
+        for query in ({'limit': 1}, {'format': 'ndjson'}):
+            response = client.get('/api/users', query_string={**query, 'cursor': first['next_cursor']})
+            assert response.status_code == 400
+        assert usernames(client.get('/api/users').get_json()['users'])[:2] == ['driver1', 'driver2']
+
+
+class TestNdjson:
+    """Test per lo streaming NDJSON."""
+
+    def test_stream_all(self, client):
+        """Test streaming di tutti gli utenti, un oggetto per riga."""
+        response = client.get('/api/users', query_string={'format': 'ndjson', 'fields': 'username'})
+
+        assert response.mimetype == 'application/x-ndjson'
+        lines = response.get_data(as_text=True).splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {'username': name}
+            for name in ('driver0', 'driver1', 'driver2', 'passenger0', 'passenger1')
+        ]
+
+    def test_accept_header_and_limit(self, client):
+        """Test negoziazione tramite Accept e limite sullo stream."""
+        response = client.get(
+            '/api/users',
+            query_string={'limit': 2},
+            headers={'Accept': 'application/x-ndjson'},
+        )
+
+        assert response.mimetype == 'application/x-ndjson'
+        assert len(response.get_data(as_text=True).splitlines()) == 2
+
+
+class TestConditionalResponses:
+    """Test per ETag, 304 e cache delle pagine serializzate."""
+
+    def test_etag_and_304(self, client):
+        """Test che un If-None-Match valido riceva 304 senza corpo."""
+        first = client.get('/api/users')
+        etag = first.headers['ETag']
+
+        assert not etag.startswith('W/')
+        assert 'Last-Modified' in first.headers
+        second = client.get('/api/users', headers={'If-None-Match': etag})
+        assert second.status_code == 304
+        assert second.get_data() == b''
+
+    def test_repeated_polls_hit_the_cache(self, client, monkeypatch):
+        """Test che le richieste ripetute non rileggano lo store."""
+        client.get('/api/users', query_string={'limit': 2})
+
+        def fail(*args, **kwargs):
+            raise AssertionError('store read on a cache hit')
+        monkeypatch.setattr('app.services.user_store.UserStore.scan_users', fail)
+
+        assert client.get('/api/users', query_string={'limit': 2}).status_code == 200
+        stats = client.get('/api/metrics').get_json()['response_cache']
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+
+    def test_external_write_changes_etag(self, client):
+        """Test che un append da un altro processo invalidi la pagina."""
+        etag = client.get('/api/users').headers['ETag']
+        write_lines('test_passengers.json', [{'username': 'late', 'password': 'hash'}])
+
+        response = client.get('/api/users', headers={'If-None-Match': etag})
+
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+        assert 'late' in usernames(response.get_json()['users'])
+
+    def test_register_invalidates(self, client):
+        """Test che la registrazione svuoti la cache."""
+        client.get('/api/users')
+        client.post('/api/register', json={
+            'username': 'newdriver',
+            'email': 'new@example.com',
+            'password': 'TestPassword123',
+            'role': 'driver',
+            'phonenumber': '3330000000',
+            'age': '30',
+            'licenseid': 'LIC00001',
+        })
+
+        stats = client.get('/api/metrics').get_json()['response_cache']
+        assert stats['invalidations'] == 1
+        assert stats['entries'] == 0
+        assert 'newdriver' in usernames(client.get('/api/users').get_json()['users'])
@@ -0,0 +1,341 @@
+"""
+Test per lo store indicizzato degli utenti (drivers.json / passengers.json).
+"""
+
+import json
+import os
+import sqlite3
+
+import pytest
+
+from app.services.bloom import BloomFilter
+from app.services.user_store import BLOOM_SUFFIX, INDEX_SUFFIX, JsonlBloom, JsonlIndex, UserStore
+
+from .conftest import write_lines
+
+
+@pytest.fixture
+def files(tmp_path):
+    """File temporanei per driver e passeggeri."""
+    return {
+        'driver': str(tmp_path / 'drivers.json'),
+        'passenger': str(tmp_path / 'passengers.json'),
+    }
+
+
+class TestJsonlIndex:
+    """Test per l'indice su un singolo file."""
+
+    def test_lookup_by_username_and_email(self, tmp_path):
+        """Test ricerca per username ed email."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [
+            {'username': 'mario', 'email': 'mario@example.com'},
+            {'username': 'luigi'},
+        ])
+        index = JsonlIndex(path)
+
+        assert index.get('username', 'mario')['email'] == 'mario@example.com'
+        assert index.get('email', 'mario@example.com')['username'] == 'mario'
+        assert index.get('username', 'peach') is None
+        assert index.get('email', None) is None
+
+    def test_missing_file(self, tmp_path):
+        """Test che un file inesistente risulti vuoto."""
+        index = JsonlIndex(str(tmp_path / 'missing.json'))
+        assert index.get('username', 'mario') is None
+        assert index.records() == []
+
+    def test_external_append_is_picked_up(self, tmp_path):
+        """Test che le righe aggiunte da un altro processo vengano indicizzate."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}])
+        index = JsonlIndex(path)
+        assert index.get('username', 'luigi') is None
+
+        write_lines(path, [{'username': 'luigi'}])
+
+        assert index.get('username', 'luigi') is not None
+        assert len(index.records()) == 2
+
+    def test_rewritten_file_is_reloaded(self, tmp_path):
+        """Test che un file riscritto venga ricaricato da zero."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}, {'username': 'luigi'}])
+        index = JsonlIndex(path)
+        assert index.get('username', 'mario') is not None
+
+        os.remove(path)
+        write_lines(path, [{'username': 'peach'}])
+
+        assert index.get('username', 'mario') is None
+        assert index.get('username', 'peach') is not None
+
+    def test_append_and_invalid_lines(self, tmp_path):
+        """Test append e righe non valide ignorate."""
+        path = str(tmp_path / 'drivers.json')
+        with open(path, 'w') as f:
+            f.write('not json\n\n')
+        index = JsonlIndex(path)
+
+        index.append({'username': 'mario', 'email': 'm@example.com'})
+
+        assert index.get('email', 'm@example.com')['username'] == 'mario'
+        assert len(index.records()) == 1
+        with open(path) as f:
+            assert json.loads(f.readlines()[-1])['username'] == 'mario'
+
+
+class TestSidecarIndex:
+    """Test per l'indice su disco accanto al file dati."""
+
+    def sidecar_size(self, path):
+        with sqlite3.connect(path + INDEX_SUFFIX) as db:
+            return db.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def test_sidecar_is_created_and_covers_file(self, tmp_path):
+        """Test creazione dell'indice su disco."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}, {'username': 'luigi'}])
+        JsonlIndex(path).refresh()
+
+        assert os.path.exists(path + INDEX_SUFFIX)
+        assert self.sidecar_size(path) == os.path.getsize(path)
+
+    def test_cold_worker_reads_through_sidecar(self, tmp_path):
+        """Test che un nuovo worker risponda dall'indice senza rileggere il file."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}, {'username': 'luigi', 'email': 'l@example.com'}])
+        JsonlIndex(path).refresh()
+
+        cold = JsonlIndex(path)
+        cold._scan = None  # qualsiasi scansione del file farebbe fallire il test
+
+        assert cold.get('email', 'l@example.com')['username'] == 'luigi'
+        assert cold.get('username', 'peach') is None
+
+    def test_tail_written_without_index_is_recovered(self, tmp_path):
+        """Test che righe non indicizzate (es. crash tra le due scritture) vengano recuperate."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}])
+        JsonlIndex(path).refresh()
+        write_lines(path, [{'username': 'luigi'}])
+
+        assert JsonlIndex(path).get('username', 'luigi') is not None
+        assert self.sidecar_size(path) == os.path.getsize(path)
+
+    def test_stale_sidecar_is_rebuilt(self, tmp_path):
+        """Test ricostruzione dell'indice se il file dati è stato sostituito."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}, {'username': 'luigi'}])
+        JsonlIndex(path).refresh()
+
+        os.remove(path)
+        write_lines(path, [{'username': 'peach'}, {'username': 'daisy'}, {'username': 'toad'}])
+
+        index = JsonlIndex(path)
+        assert index.get('username', 'mario') is None
+        assert index.get('username', 'toad') is not None
+
+    def test_corrupt_sidecar_is_rebuilt(self, tmp_path):
+        """Test ricostruzione dell'indice se il file indice è illeggibile."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}])
+        with open(path + INDEX_SUFFIX, 'wb') as f:
+            f.write(b'garbage' * 1000)
+
+        assert JsonlIndex(path).get('username', 'mario') is not None
+
+    def test_startup_replays_only_the_tail(self, tmp_path):
+        """Test che un nuovo worker carichi l'indice e analizzi solo le righe aggiunte."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': f'user{i}'} for i in range(100)])
+        JsonlIndex(path).refresh()
+        size = os.path.getsize(path)
+        write_lines(path, [{'username': 'mario'}])
+
+        index = JsonlIndex(path)
+        index.refresh()
+
+        assert index.stats() == {
+            'indexed_bytes': os.path.getsize(path),
+            'sidecar_loads': 1,
+            'rebuilds': 0,
+            'replayed_bytes': os.path.getsize(path) - size,
+            'scanning': False,
+        }
+        assert index.get('username', 'mario') is not None
+
+    def test_rewritten_tail_is_detected(self, tmp_path):
+        """Test ricostruzione se la fine del file coperto è stata troncata e riscritta."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': f'user{i:04}'} for i in range(300)])
+        write_lines(path, [{'username': 'luigi'}])
+        JsonlIndex(path).refresh()
+        with open(path, 'r+') as f:
+            lines = f.readlines()
+            f.seek(0)
+            f.truncate()
+            f.writelines(lines[:-1])
+        # Stessa lunghezza della riga sostituita: dimensione e inizio del file invariati
+        write_lines(path, [{'username': 'peach'}])
+
+        index = JsonlIndex(path)
+
+        assert index.get('username', 'peach') is not None
+        assert index.stats()['rebuilds'] == 1
+
+    def test_latest_line_wins(self, tmp_path):
+        """Test che l'ultima riga per uno username sia quella restituita."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario', 'age': 1}])
+        JsonlIndex(path).append({'username': 'mario', 'age': 2})
+
+        assert JsonlIndex(path).get('username', 'mario')['age'] == 2
+
+
+class TestBloomFilter:
+    """Test per il filtro di Bloom davanti al controllo dei duplicati."""
+
+    def test_no_false_negatives(self):
+        """Test che ogni elemento inserito venga trovato e il tasso di falsi positivi sia vicino a quello configurato."""
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'user{i}')
+
+        assert all(f'user{i}' in bloom for i in range(1000))
+        false_positives = sum(f'other{i}' in bloom for i in range(10000))
+        assert false_positives < 300
+        assert bloom.estimated_fp_rate() == pytest.approx(0.01, rel=0.5)
+
+    def test_saved_next_to_file_and_reloaded(self, tmp_path):
+        """Test salvataggio su disco e riutilizzo a freddo."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario', 'email': 'mario@example.com'}])
+        JsonlBloom(path).refresh()
+        assert os.path.exists(path + BLOOM_SUFFIX)
+
+        write_lines(path, [{'username': 'luigi'}])
+        bloom = JsonlBloom(path)
+
+        assert bloom.might_contain('username', 'mario')
+        assert bloom.might_contain('email', 'mario@example.com')
+        # Riga aggiunta dopo il salvataggio: recuperata dalla coda
+        assert bloom.might_contain('username', 'luigi')
+        assert not bloom.might_contain('email', 'mario')
+
+    def test_stale_filter_is_rebuilt(self, tmp_path):
+        """Test ricostruzione se il file salvato descrive un altro file."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': 'mario'}, {'username': 'luigi'}])
+        JsonlBloom(path).refresh()
+        with open(path, 'w') as f:
+            f.write(json.dumps({'username': 'peach'}) + '\n')
+
+        bloom = JsonlBloom(path)
+
+        assert bloom.might_contain('username', 'peach')
+        assert bloom.stats()['items'] == 1
+
+    def test_grows_past_capacity(self, tmp_path):
+        """Test ridimensionamento quando il filtro supera la capacità."""
+        path = str(tmp_path / 'drivers.json')
+        write_lines(path, [{'username': f'user{i}'} for i in range(50)])
+
+        bloom = JsonlBloom(path, capacity=10)
+        bloom.refresh()
+
+        assert bloom.stats()['capacity'] >= 50
+        assert all(bloom.might_contain('username', f'user{i}') for i in range(50))
+
+    def test_store_skips_lookup_when_absent(self, files, monkeypatch):
+        """Test che exists() non interroghi l'indice per identificativi nuovi."""
+        write_lines(files['driver'], [{'username': 'mario', 'email': 'm@example.com'}])
+        blooms = {role: JsonlBloom(path) for role, path in files.items()}
+        store = UserStore(files, blooms=blooms)
+
+        assert store.exists(username='mario')
+        monkeypatch.setattr(JsonlIndex, 'get', lambda *args: pytest.fail('index lookup'))
+        assert not store.exists(username='luigi', email='l@example.com')
+        assert blooms['driver'].stats()['definitely_absent'] == 2
+
+
+class TestUserStore:
+    """Test per lo store che unisce driver e passeggeri."""
+
+    def test_find_by_username_prefers_drivers(self, files):
+        """Test che i driver vengano cercati per primi."""
+        write_lines(files['driver'], [{'username': 'mario'}])
+        write_lines(files['passenger'], [{'username': 'mario'}, {'username': 'luigi'}])
+        store = UserStore(files)
+
+        assert store.find_by_username('mario')[1] == 'driver'
+        assert store.find_by_username('luigi')[1] == 'passenger'
+        assert store.find_by_username('peach') == (None, None)
+
+    def test_duplicate_username_latest_line_wins(self, files):
+        """Test username ripetuto senza versione: vale l'ultima riga, non la prima."""
+        write_lines(files['passenger'], [
+            {'username': 'luigi', 'email': 'old@example.com'},
+            {'username': 'luigi', 'email': 'new@example.com'},
+        ])
+
+        assert UserStore(files).find_by_username('luigi')[0]['email'] == 'new@example.com'
+        # Same answer from a cold worker reading through the sidecar
+        assert UserStore(files).find_by_username('luigi')[0]['email'] == 'new@example.com'
+
+    def test_exists_across_roles(self, files):
+        """Test unicità di username ed email tra i due ruoli."""
+        write_lines(files['passenger'], [{'username': 'luigi', 'email': 'l@example.com'}])
+        store = UserStore(files)
+
+        assert store.exists(username='luigi')
+        assert store.exists(username='other', email='l@example.com')
+        assert not store.exists(username='other', email='o@example.com')
+
+    def test_add_and_iter_users(self, files):
+        """Test aggiunta utenti e iterazione nell'ordine dei file."""
+        store = UserStore(files)
+        store.add('passenger', {'username': 'luigi'})
+        store.add('driver', {'username': 'mario'})
+
+        assert [(role, user['username']) for role, user in store.iter_users()] == [
+            ('driver', 'mario'),
+            ('passenger', 'luigi'),
+        ]
+
+
+class TestRoutesUseStore:
+    """Test di integrazione tra route e store."""
+
+    @pytest.fixture
+    def client(self, app, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        return app.test_client()
+
+    def test_register_then_login(self, client):
+        """Test registrazione seguita da login e controllo duplicati."""
+        data = {
+            'username': 'storeuser',
+            'email': 'storeuser@example.com',
+            'password': 'TestPassword123',
+            'role': 'passenger',
+            'phonenumber': '3330000000',
+            'age': '18',
+            'attending_school': 'ITT Blaise Pascal',
+        }
+        assert client.post('/api/register', json=data).status_code == 201
+
+        duplicate = dict(data, username='another')
+        assert client.post('/api/register', json=duplicate).status_code == 409
+
+        response = client.post('/api/login', json={
+            'username': 'storeuser',
+            'password': 'TestPassword123',
+        })
+        assert response.status_code == 200
+        assert response.get_json()['user']['role'] == 'passenger'
+
+        users = client.get('/api/users').get_json()['users']
+        assert [user['username'] for user in users] == ['storeuser']
+        assert 'password' not in users[0]